@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+bench_scanner.py — сравнение встроенного сканера (services/scanner.py) и list_backups.sh
+Строит синтетическое дерево бэкапов (по умолчанию 10 000 файлов) во временном каталоге
+и замеряет оба способа обхода. Запуск: python3 benchmarks/bench_scanner.py [--files N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from services.scanner import scan_backups  # noqa: E402
+
+ARTIFACTS = ["backup.dump", "backup.sql.gz", "backup.sql.zst"]
+
+
+def build_tree(root: Path, files: int, ibs: int) -> None:
+    """Синтетическое хранилище: ibs каталогов ИБ, по одному артефакту на метку времени"""
+    for i in range(files):
+        ib = f"ib_{i % ibs:02d}_2025"
+        n = i // ibs
+        label = f"2025{1 + n // 2000 % 12:02d}{1 + n // 60 % 28:02d}_{n // 60 % 24:02d}{n % 60:02d}00"
+        backup_dir = root / ib / label
+        backup_dir.mkdir(parents=True, exist_ok=True)
+        with open(backup_dir / ARTIFACTS[i % len(ARTIFACTS)], "wb") as f:
+            f.truncate(1024 * (1 + i % 64))  # Разреженный файл — размер без записи данных
+
+
+def run_engine_scan(root: Path) -> list:
+    env = dict(os.environ, BACKUP_ROOT=str(root))
+    result = subprocess.run(["bash", str(ROOT_DIR / "engines" / "list_backups.sh")],
+                            env=env, capture_output=True, text=True, check=True)
+    return [line.split("\t") for line in result.stdout.splitlines()[1:] if line]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк обхода хранилища бэкапов")
+    parser.add_argument("--files", type=int, default=10000, help="Число файлов бэкапов")
+    parser.add_argument("--ibs", type=int, default=14, help="Число каталогов ИБ")
+    parser.add_argument("--skip-engine", action="store_true", help="Не запускать list_backups.sh")
+    parsed = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_scanner_") as tmp:
+        root = Path(tmp)
+        build_tree(root, parsed.files, parsed.ibs)
+        print(f"📁 Синтетическое дерево: {parsed.files} файлов, {parsed.ibs} ИБ ({root})")
+
+        started = time.perf_counter()
+        native = list(scan_backups(root))
+        native_sec = time.perf_counter() - started
+        print(f"   scanner.py (os.scandir): {native_sec:8.3f} с, {len(native)} записей")
+
+        if parsed.skip_engine:
+            return 0
+
+        started = time.perf_counter()
+        engine = run_engine_scan(root)
+        engine_sec = time.perf_counter() - started
+        print(f"   list_backups.sh:         {engine_sec:8.3f} с, {len(engine)} записей")
+        print(f"   Ускорение: {engine_sec / native_sec:.0f}x")
+
+        native_set = {(r["path"], r["file_type"], r["size_bytes"]) for r in native}
+        engine_set = {(p[4], p[2], int(p[3])) for p in engine}
+        if native_set != engine_set:
+            print(f"❌ Расхождение записей: {len(native_set ^ engine_set)}", file=sys.stderr)
+            return 1
+        print("✅ Записи совпадают")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
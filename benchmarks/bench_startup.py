@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+bench_startup.py — регрессионный замер холодного старта ib_1c
+Запускает orchestrator.py в новом процессе (по умолчанию `storage --help`) под
+python -X importtime: медиана времени запуска, импорты проекта, запрещённые
+на горячем пути модули. Сверяет реестр commands.COMMANDS с каталогом commands/
+и с completion/ib_1c.bash. Код возврата 1 — бюджет превышен или сверка не прошла.
+Запуск: python3 benchmarks/bench_startup.py [--runs N] [--budget-ms 50] [-- storage --help]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from commands import COMMANDS  # noqa: E402
+
+# Справка команды не должна тянуть сервисы, движки и пулы процессов/потоков
+FORBIDDEN = ("services.", "asyncio", "subprocess", "concurrent.futures", "argparse", "pathlib")
+
+IMPORT_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def run_once(args: list, env: dict) -> tuple:
+    """Один запуск: (секунды, {модуль: (self мкс, cumulative мкс, глубина)})"""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", str(ROOT_DIR / "orchestrator.py")] + args,
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    seconds = time.perf_counter() - started
+    imports = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_RE.match(line)
+        if match:
+            imports[match.group(4)] = (int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2)
+    return seconds, imports
+
+
+def run_once_bare() -> float:
+    """Запуск пустого интерпретатора — нижняя граница времени старта"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"])
+    return time.perf_counter() - started
+
+
+def check_registry() -> list:
+    """Расхождения реестра команд с commands/*.py и completion/ib_1c.bash"""
+    problems = []
+    modules = {p.stem for p in (ROOT_DIR / "commands").glob("*.py") if not p.name.startswith("_")}
+    if modules != set(COMMANDS):
+        problems.append(f"commands/*.py {sorted(modules)} ≠ COMMANDS {sorted(COMMANDS)}")
+    completion = (ROOT_DIR / "completion" / "ib_1c.bash").read_text(encoding="utf-8")
+    match = re.search(r'^_IB_1C_COMMANDS="([^"]*)"', completion, re.M)
+    if not match or set(match.group(1).split()) != set(COMMANDS):
+        problems.append("completion/ib_1c.bash: _IB_1C_COMMANDS не совпадает с COMMANDS")
+    for name in COMMANDS:
+        if f"_IB_1C_FLAGS_{name}=" not in completion:
+            problems.append(f"completion/ib_1c.bash: нет _IB_1C_FLAGS_{name}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта ib_1c")
+    parser.add_argument("--runs", type=int, default=15, help="Число запусков")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="Бюджет медианы запуска, мс")
+    parser.add_argument("command", nargs="*", default=["storage", "--help"],
+                        help="Аргументы ib_1c (по умолчанию: storage --help)")
+    parsed = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as tmp:
+        # Свой кэш справки: первый запуск — промах, остальные — попадание
+        env = dict(os.environ, XDG_CACHE_HOME=tmp, METRICS_ENABLED="0")
+        first_sec, _ = run_once(parsed.command, env)
+        runs = [run_once(parsed.command, env) for _ in range(parsed.runs)]
+
+    baseline = statistics.median(run_once_bare() for _ in range(max(3, parsed.runs // 3)))
+    median = statistics.median(sec for sec, _ in runs)
+    imports = runs[-1][1]
+    print(f"🚀 ib_1c {' '.join(parsed.command)}: {parsed.runs} запусков")
+    print(f"   первый (промах кэша справки): {first_sec * 1000:7.1f} мс")
+    print(f"   медиана:                      {median * 1000:7.1f} мс (бюджет {parsed.budget_ms:.0f} мс)")
+    print(f"   пустой интерпретатор:         {baseline * 1000:7.1f} мс")
+
+    project = sorted(((name, v) for name, v in imports.items()
+                      if name.split(".")[0] in ("commands", "core", "services", "utils")),
+                     key=lambda item: item[1][1], reverse=True)
+    top_level = sum(cumulative for _, cumulative, depth in imports.values() if depth == 0)
+    print(f"   импорт модулей: {top_level / 1000:.1f} мс (модулей: {len(imports)})")
+    for name, (own, cumulative, _) in project[:10]:
+        print(f"     {name:<32} {own / 1000:6.1f} / {cumulative / 1000:6.1f} мс")
+
+    forbidden = sorted(name for name in imports if name.startswith(FORBIDDEN))
+    if parsed.command[-1:] in (["--help"], ["-h"]) and forbidden:
+        print(f"❌ Справка импортирует тяжёлые модули: {', '.join(forbidden)}", file=sys.stderr)
+        failed = True
+    if median * 1000 > parsed.budget_ms:
+        print(f"❌ Медиана {median * 1000:.1f} мс больше бюджета {parsed.budget_ms:.0f} мс", file=sys.stderr)
+        failed = True
+
+    problems = check_registry()
+    for problem in problems:
+        print(f"❌ {problem}", file=sys.stderr)
+    if not failed and not problems:
+        print("✅ В бюджете, реестр команд совпадает")
+    return 1 if failed or problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
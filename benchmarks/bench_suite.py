@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+bench_suite.py — воспроизводимый набор замеров storage / rm / prune и движков обхода хранилища
+Строит синтетическое хранилище (synthetic_tree.py) и замеряет на нём:
+  Python (каждый прогон — в новом процессе, как запуск ib_1c из cron/мониторинга):
+    storage_report — StorageMonitor.get_full_report (по каталогу)
+    storage_scan   — StorageMonitor.scan_backups_list (обход диска scanner.py)
+    storage_cli    — commands.storage.main (таблица ib_1c storage)
+    storage_ndjson — commands.storage.main --format ndjson (потоковый вывод для мониторинга)
+    catalog_reindex, prune_plan (retention_service.plan_retention), rm_plan (RmService.plan_removal)
+  Движки: list_backups.sh, count_backups.sh, prune.sh --dry-run, rm.sh --all --dry-run --older-than;
+  с --backup-gb — backup.sh --format dump с fake_pg_dump.py (конвейер бэкапа без PostgreSQL).
+Результат — JSON (медиана, минимум, максимум, все прогоны, число обработанных записей,
+пиковая память Python-замеров); --compare СТАРЫЙ.json сравнивает медианы, код возврата 1 —
+замедление больше --threshold или память больше бюджета (RSS_BUDGET_MB, --rss-budget-mb).
+Запуск: python3 benchmarks/bench_suite.py [--ibs 14 --labels 60] [--repeat 5] [--output bench_suite.json]
+        [--compare base.json] [--cases storage_report,rm_sh_dry_run] [--backup-gb 1 --backup-rate-mb 200]
+        [--rss-budget-mb 64]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+ENGINES_DIR = ROOT_DIR / "engines"
+
+# Каталоги проекта, которые движки находят через $SCRIPT_DIR/.. (chunk_store.py, trash_store.py)
+SANDBOX_LINKS = ("services", "core", "utils")
+
+# Пиковая память потоковых замеров по умолчанию, МБ: от числа бэкапов не зависит
+# (на 100 тыс. — около 20 МБ), превышение — регрессия потокового чтения каталога
+RSS_BUDGET_MB = {"storage_report": 64, "storage_ndjson": 64}
+
+
+# === Замеры в отдельном процессе (--worker): BACKUP_ROOT задан до импорта core.config ===
+
+def _worker_storage_report(_):
+    from services.storage_service import StorageMonitor
+    report = StorageMonitor().get_full_report(with_backups=False)
+    return sum(s["total_files"] for s in report["stats"])
+
+
+def _worker_storage_scan(_):
+    from services.storage_service import StorageMonitor
+    return len(StorageMonitor().scan_backups_list())
+
+
+def _worker_storage_cli(_):
+    from contextlib import redirect_stdout
+    from commands.storage import main
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        main([])
+
+
+class _LineCounter:
+    """stdout-заглушка: считает строки вывода, не храня их"""
+
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        self.lines += text.count("\n")
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def _worker_storage_ndjson(_):
+    from contextlib import redirect_stdout
+    from commands.storage import main
+
+    sink = _LineCounter()
+    with redirect_stdout(sink):
+        main(["--format", "ndjson"])
+    return sink.lines
+
+
+def _worker_catalog_reindex(_):
+    from services.catalog_service import BackupCatalog
+    return BackupCatalog().reindex()
+
+
+def _worker_prune_plan(_):
+    from services.retention_service import plan_retention
+    return sum(len(plan["delete"]) for plan in plan_retention())
+
+
+def _worker_rm_plan(older_than):
+    from services.rm_service import RmService
+    return len(RmService().plan_removal(None, older_than=older_than)["targets"])
+
+
+WORKERS = {
+    "storage_report": _worker_storage_report,
+    "storage_scan": _worker_storage_scan,
+    "storage_cli": _worker_storage_cli,
+    "storage_ndjson": _worker_storage_ndjson,
+    "catalog_reindex": _worker_catalog_reindex,
+    "prune_plan": _worker_prune_plan,
+    "rm_plan": _worker_rm_plan,
+}
+
+# Движки: аргументы и как посчитать обработанные записи по выводу (stdout + stderr)
+ENGINE_CASES = {
+    "list_backups_sh": (lambda ctx: ["bash", str(ENGINES_DIR / "list_backups.sh")],
+                        lambda out: max(0, out.count("\n", 0, out.find("\x00")) - 1)),
+    "count_backups_sh": (lambda ctx: ["bash", str(ENGINES_DIR / "count_backups.sh")],
+                         lambda out: max(0, out.count("\n", 0, out.find("\x00")) - 1)),
+    "prune_sh_dry_run": (lambda ctx: ["bash", str(ctx["sandbox"] / "engines" / "prune.sh"),
+                                      "--dry-run", "--keep-days", str(ctx["keep_days"])],
+                         lambda out: out.count("Симуляция: удалить")),
+    "rm_sh_dry_run": (lambda ctx: ["bash", str(ENGINES_DIR / "rm.sh"), "--all", "--dry-run",
+                                   "--older-than", ctx["older_than"]],
+                      lambda out: out.count("  → ")),
+}
+
+CASES = list(WORKERS) + list(ENGINE_CASES) + ["backup_pipeline"]
+
+
+def run_worker(case: str, arg: str) -> int:
+    started = time.perf_counter()
+    items = WORKERS[case](arg)
+    seconds = time.perf_counter() - started
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: ru_maxrss в кБ
+    print(json.dumps({"seconds": seconds, "items": items, "rss_mb": round(rss_mb, 1)}))
+    return 0
+
+
+# === Окружение прогона ===
+
+def make_sandbox(tmp: Path) -> Path:
+    """
+    Копия engines/ из симлинков со своим config/db_config.sh: prune.sh и backup.sh читают
+    конфиг рядом с собой, а хранилище и pg_dump берут из окружения прогона.
+    """
+    sandbox = tmp / "sandbox"
+    engines = sandbox / "engines"
+    (engines / "config").mkdir(parents=True)
+    for path in ENGINES_DIR.iterdir():
+        if path.is_file():
+            (engines / path.name).symlink_to(path)
+    (engines / "config" / "storage.sh").symlink_to(ENGINES_DIR / "config" / "storage.sh")
+    (engines / "config" / "db_config.sh").write_text(
+        "# Сгенерировано benchmarks/bench_suite.py: хранилище — BACKUP_ROOT из окружения\n"
+        'export PG_HOST="127.0.0.1" PG_PORT="5432" PG_USER="postgres" PGPASS_FILE="/dev/null"\n'
+        f'export PG_DUMP="{BENCH_DIR / "fake_pg_dump.py"}"\n', encoding="utf-8")
+    for name in SANDBOX_LINKS:
+        (sandbox / name).symlink_to(ROOT_DIR / name)
+    return sandbox
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "-C", str(ROOT_DIR), "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.TimeoutExpired):
+        return ""
+
+
+def time_case(case: str, ctx: dict, env: dict) -> dict:
+    """Один прогон: {"seconds", "items"} (+ "rss_mb" — пиковая память процесса Python-замера)"""
+    if case in WORKERS:
+        result = subprocess.run([sys.executable, str(Path(__file__).resolve()), "--worker", case,
+                                 "--worker-arg", ctx["older_than"]],
+                                env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip()[-500:] or f"код {result.returncode}")
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    if case == "backup_pipeline":
+        root = ctx["tmp"] / "pipeline"
+        shutil.rmtree(root, ignore_errors=True)
+        (root / "bench_ib").mkdir(parents=True)
+        started = time.perf_counter()
+        result = subprocess.run(["bash", str(ctx["sandbox"] / "engines" / "backup.sh"), "--ib", "bench_ib",
+                                 "--format", "dump", "--no-progress"],
+                                env=dict(env, BACKUP_ROOT=str(root), FAKE_PG_DUMP_GB=str(ctx["backup_gb"]),
+                                         FAKE_PG_DUMP_RATE_MB=str(ctx["backup_rate_mb"])),
+                                capture_output=True, text=True)
+        seconds = time.perf_counter() - started
+        if result.returncode != 0:
+            raise RuntimeError((result.stderr or result.stdout).strip()[-500:])
+        size = sum(p.stat().st_size for p in root.glob("bench_ib/*/backup.dump"))
+        return {"seconds": seconds, "items": size, "mb_s": round(size / 1024 ** 2 / seconds, 1)}
+
+    argv, count = ENGINE_CASES[case]
+    started = time.perf_counter()
+    result = subprocess.run(argv(ctx), env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError((result.stderr or result.stdout).strip()[-500:])
+    return {"seconds": seconds, "items": count(result.stdout + "\x00" + result.stderr)}
+
+
+def compare(results: dict, base: dict, threshold: float) -> bool:
+    """Сравнить медианы с базовым прогоном; True — есть замедление больше threshold"""
+    print(f"\n📊 Сравнение с {base.get('git_rev') or '?'} ({base.get('created_at', '?')})")
+    if base.get("tree") != results["tree"]:
+        print("⚠️  Параметры синтетического дерева отличаются — сравнение неточное")
+    regressed = False
+    for case, current in results["cases"].items():
+        old = base.get("cases", {}).get(case)
+        if not old or "median_sec" not in old or "median_sec" not in current:
+            continue
+        ratio = current["median_sec"] / old["median_sec"] if old["median_sec"] else 1.0
+        if ratio > 1 + threshold:
+            icon, regressed = "❌", True
+        elif ratio < 1 - threshold:
+            icon = "🚀"
+        else:
+            icon = "  "
+        print(f"   {icon} {case:<18} {old['median_sec'] * 1000:9.1f} → {current['median_sec'] * 1000:9.1f} мс "
+              f"({(ratio - 1) * 100:+.0f}%)")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Набор замеров ib_1c на синтетическом хранилище")
+    parser.add_argument("--ibs", type=int, default=14, help="Число ИБ")
+    parser.add_argument("--labels", type=int, default=60, help="Меток времени на ИБ")
+    parser.add_argument("--size-mb", type=float, default=2048, help="Средний размер бэкапа, МБ (разреженные файлы)")
+    parser.add_argument("--mix", default=None, help="Смесь форматов (см. synthetic_tree.py)")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно генератора дерева")
+    parser.add_argument("--tree", type=Path, help="Готовое хранилище вместо генерации (не изменяется, кроме каталога)")
+    parser.add_argument("--repeat", type=int, default=5, help="Прогонов на замер (плюс один прогревочный)")
+    parser.add_argument("--cases", help=f"Только эти замеры через запятую ({', '.join(CASES)})")
+    parser.add_argument("--keep-days", type=int, default=30, help="prune.sh --keep-days")
+    parser.add_argument("--backup-gb", type=float, default=0,
+                        help="Замерить backup.sh с fake_pg_dump.py на дампе такого объёма, ГБ (0 — пропустить)")
+    parser.add_argument("--backup-rate-mb", type=float, default=200, help="Скорость fake_pg_dump.py, МБ/с (0 — без лимита)")
+    parser.add_argument("--output", type=Path, default=Path("bench_suite.json"), help="Куда записать результаты (JSON)")
+    parser.add_argument("--compare", type=Path, metavar="JSON", help="Сравнить с результатами прошлого прогона")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимое замедление медианы (0.2 = 20%%)")
+    parser.add_argument("--rss-budget-mb", type=float, default=None,
+                        help="Пиковая память каждого Python-замера, МБ; больше — код возврата 1 "
+                             "(по умолчанию — RSS_BUDGET_MB для storage_report и storage_ndjson, 0 — не проверять)")
+    parser.add_argument("--worker", choices=list(WORKERS), help=argparse.SUPPRESS)
+    parser.add_argument("--worker-arg", default="", help=argparse.SUPPRESS)
+    parsed = parser.parse_args()
+
+    if parsed.worker:
+        sys.path.insert(0, str(ROOT_DIR))
+        return run_worker(parsed.worker, parsed.worker_arg)
+
+    sys.path.insert(0, str(BENCH_DIR))
+    from synthetic_tree import DEFAULT_MIX, build_tree
+
+    cases = parsed.cases.split(",") if parsed.cases else [c for c in CASES if c != "backup_pipeline"]
+    if parsed.backup_gb > 0 and "backup_pipeline" not in cases:
+        cases.append("backup_pipeline")
+    unknown = [c for c in cases if c not in CASES]
+    if unknown or parsed.repeat < 1:
+        parser.error(f"неизвестные замеры: {', '.join(unknown)}" if unknown else "--repeat должен быть ≥ 1")
+
+    tree_params = {"ibs": parsed.ibs, "labels": parsed.labels, "size_mb": parsed.size_mb,
+                   "mix": parsed.mix or DEFAULT_MIX, "seed": parsed.seed, "end": "20260201"}
+    with tempfile.TemporaryDirectory(prefix="bench_suite_") as tmp:
+        tmp = Path(tmp)
+        if parsed.tree:
+            root = parsed.tree.resolve()
+            tree_params = {"path": str(root)}
+        else:
+            root = tmp / "backups"
+            started = time.perf_counter()
+            tree_params.update(build_tree(root, parsed.ibs, parsed.labels, parsed.size_mb,
+                                          tree_params["mix"], parsed.seed, tree_params["end"]))
+            print(f"📁 Синтетическое хранилище: {tree_params['ibs']} ИБ, {tree_params['backups']} бэкап(ов), "
+                  f"{tree_params['size_bytes'] / 1024 ** 3:.0f} ГБ (разреженные) за {time.perf_counter() - started:.1f} с")
+
+        end = datetime.strptime(tree_params.get("end", datetime.now().strftime("%Y%m%d")), "%Y%m%d")
+        ctx = {
+            "tmp": tmp,
+            "sandbox": make_sandbox(tmp),
+            "keep_days": parsed.keep_days,
+            # Половина истории старше даты — rm планирует и удаляет примерно половину бэкапов
+            "older_than": (end - timedelta(days=parsed.labels // 2)).strftime("%Y%m%d"),
+            "backup_gb": parsed.backup_gb,
+            "backup_rate_mb": parsed.backup_rate_mb,
+        }
+        env = dict(os.environ, BACKUP_ROOT=str(root), BACKUP_USER=os.getenv("BACKUP_USER", "usr1cv8"),
+                   METRICS_ENABLED="0", IB_1C_LOCAL="1", PYTHONPATH=str(ROOT_DIR))
+        # Каталог бэкапов — как после storage --reindex: Python-замеры читают его, а не диск
+        time_case("catalog_reindex", ctx, env)
+
+        results = {
+            "suite": "ib_1c",
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "git_rev": git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": parsed.repeat,
+            "tree": tree_params,
+            "cases": {}
+        }
+        print(f"⏱️  Замеры: {parsed.repeat} прогонов + 1 прогревочный, медиана")
+        for case in cases:
+            try:
+                time_case(case, ctx, env)
+                runs = [time_case(case, ctx, env) for _ in range(parsed.repeat)]
+            except RuntimeError as e:
+                print(f"   ❌ {case:<18} {e}", file=sys.stderr)
+                results["cases"][case] = {"error": str(e)}
+                continue
+            seconds = [run["seconds"] for run in runs]
+            entry = {
+                "median_sec": round(statistics.median(seconds), 4),
+                "min_sec": round(min(seconds), 4),
+                "max_sec": round(max(seconds), 4),
+                "runs": [round(s, 4) for s in seconds],
+                "items": runs[-1]["items"]
+            }
+            if "mb_s" in runs[-1]:
+                entry["mb_s"] = statistics.median(run["mb_s"] for run in runs)
+            rss = ""
+            if "rss_mb" in runs[-1]:
+                entry["rss_mb"] = max(run["rss_mb"] for run in runs)
+                rss = f"; память {entry['rss_mb']:.0f} МБ"
+                budget = RSS_BUDGET_MB.get(case) if parsed.rss_budget_mb is None else parsed.rss_budget_mb
+                if budget and entry["rss_mb"] > budget:
+                    entry["rss_over_budget"] = True
+                    rss += f" ❌ > {budget:.0f} МБ"
+            results["cases"][case] = entry
+            print(f"   {case:<18} {entry['median_sec'] * 1000:9.1f} мс  (мин {entry['min_sec'] * 1000:.1f}, "
+                  f"макс {entry['max_sec'] * 1000:.1f}; записей: {entry['items']}{rss})")
+
+    parsed.output.write_text(json.dumps(results, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"💾 Результаты: {parsed.output}")
+
+    failed = any("error" in entry or entry.get("rss_over_budget") for entry in results["cases"].values())
+    if parsed.compare:
+        try:
+            base = json.loads(parsed.compare.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"❌ Не прочитать {parsed.compare}: {e}", file=sys.stderr)
+            return 1
+        failed = compare(results, base, parsed.threshold) or failed
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
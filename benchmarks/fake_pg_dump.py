@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+fake_pg_dump.py — имитация pg_dump для замеров конвейера бэкапа без PostgreSQL
+Принимает аргументы pg_dump (-F, -f, -j, -Z, -h, -p, -U, база — остальное игнорируется)
+и выдаёт FAKE_PG_DUMP_GB гигабайт с постоянной скоростью FAKE_PG_DUMP_RATE_MB МБ/с
+(0 — без ограничения): -Fc/-Fp — в stdout или в -f ФАЙЛ, -Fd — каталог -f с toc.dat и файлами таблиц.
+Поток детерминирован (FAKE_PG_DUMP_SEED): половина каждого блока — случайные байты, половина — строки COPY.
+Подключение к backup.sh: PG_DUMP=/путь/к/fake_pg_dump.py (в config/db_config.sh или окружении).
+"""
+
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import BinaryIO, List
+
+BLOCK = 1024 * 1024
+
+# Сжимаемая половина блока: строки COPY, похожие на данные таблиц 1С
+TEXT = b"".join(f"{n}\t\\\\x{n * 2654435761 % 2 ** 32:08x}\t2026-01-01 00:00:00\tNULL\t\\N\n".encode()
+                for n in range(4096))
+
+
+def parse_args(argv: List[str]) -> dict:
+    """Нужное из аргументов pg_dump: формат, файл/каталог вывода, число потоков"""
+    opts = {"format": "p", "file": None, "jobs": 1}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        value = argv[i + 1] if i + 1 < len(argv) else None
+        if arg in ("-F", "--format", "-f", "--file", "-j", "--jobs"):
+            key = {"-F": "format", "--format": "format", "-f": "file", "--file": "file"}.get(arg, "jobs")
+            opts[key] = value
+            i += 2
+            continue
+        if arg.startswith("-F") and len(arg) > 2:
+            opts["format"] = arg[2:]
+        elif arg.startswith(("--format=", "--file=", "--jobs=")):
+            key, _, val = arg[2:].partition("=")
+            opts[key] = val
+        elif arg in ("-h", "-p", "-U", "-Z", "--host", "--port", "--username", "--compress"):
+            i += 1
+        i += 1
+    opts["format"] = (opts["format"] or "p")[0]
+    opts["jobs"] = max(1, int(opts["jobs"] or 1))
+    return opts
+
+
+class Source:
+    """Детерминированный поток блоков по 1 МБ с постоянной скоростью"""
+
+    def __init__(self, total: int, rate_mb_s: float, seed: int):
+        self.total = total
+        self.rate = rate_mb_s * BLOCK
+        self.rng = random.Random(seed)
+        self.text = (TEXT * (BLOCK // 2 // len(TEXT) + 1))[:BLOCK // 2]
+        self.sent = 0
+        self.started = time.monotonic()
+
+    def write(self, out: BinaryIO, size: int) -> None:
+        """Выдать size байт в out, выдерживая скорость"""
+        end = min(self.total, self.sent + size)
+        while self.sent < end:
+            block = self.rng.randbytes(BLOCK // 2) + self.text
+            n = min(BLOCK, end - self.sent)
+            out.write(block[:n])
+            self.sent += n
+            if self.rate > 0:
+                ahead = self.sent / self.rate - (time.monotonic() - self.started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if "--version" in argv or "-V" in argv:
+        print("pg_dump (PostgreSQL) 15.0 (fake_pg_dump)")
+        return 0
+    opts = parse_args(argv)
+    total = int(float(os.getenv("FAKE_PG_DUMP_GB", "1")) * 1024 ** 3)
+    source = Source(total, float(os.getenv("FAKE_PG_DUMP_RATE_MB", "200")),
+                    int(os.getenv("FAKE_PG_DUMP_SEED", "1")))
+    try:
+        if opts["format"] == "d":
+            if not opts["file"]:
+                print("pg_dump: error: формат каталога требует -f", file=sys.stderr)
+                return 1
+            target = Path(opts["file"])
+            target.mkdir(parents=True)
+            with open(target / "toc.dat", "wb") as f:
+                f.write(b"PGDMP fake toc\n")
+            # Данные — по файлу на «таблицу», таблиц в 4 раза больше потоков
+            tables = opts["jobs"] * 4
+            for n in range(tables):
+                with open(target / f"{3001 + n}.dat", "wb") as f:
+                    source.write(f, total * (n + 1) // tables - source.sent)
+        elif opts["file"]:
+            with open(opts["file"], "wb") as f:
+                source.write(f, total)
+        else:
+            source.write(sys.stdout.buffer, total)
+            sys.stdout.buffer.flush()
+    except BrokenPipeError:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+synthetic_tree.py — генератор синтетического хранилища бэкапов (как /var/backups/1c)
+Дерево задаётся числом ИБ, числом меток времени на ИБ, размером бэкапа и смесью форматов;
+файлы разреженные (truncate — размер без записи данных), mtime = время метки.
+Одни и те же параметры и --seed дают одно и то же дерево (для сравнения прогонов).
+Запуск: python3 benchmarks/synthetic_tree.py КАТАЛОГ [--ibs 14] [--labels 60] [--size-mb 2048]
+        [--mix dump=6,sql_gz=2,sql_zst=1,dir=1,dedup=2] [--seed 1] [--end 20260201] [--catalog]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from services.chunk_store import CHUNK_DIGEST_SIZE, INDEX_VERSION, STORE_DIR, chunk_path  # noqa: E402
+
+MB = 1024 * 1024
+
+# Формат → артефакт в каталоге метки (как у backup.sh)
+FORMATS = {
+    "dump": "backup.dump",
+    "dir": "backup.dir",
+    "sql_gz": "backup.sql.gz",
+    "sql_zst": "backup.sql.zst",
+    "sql": "backup.sql",
+    "dt": "backup.dt",
+    "dedup": "backup.dump.idx",
+}
+
+DEFAULT_MIX = "dump=6,sql_gz=2,sql_zst=1,dir=1,dedup=2"
+
+# Доля сжатых данных, которую каждый дедуплицированный бэкап добавляет в хранилище кусков
+DEDUP_NEW_SHARE = 0.05
+
+# Каждый N-й бэкап помечен в манифесте как проверенный (storage --verify)
+VERIFIED_EVERY = 7
+
+
+def parse_mix(text: str) -> List[Tuple[str, int]]:
+    """«dump=6,sql_gz=2» → [("dump", 6), ("sql_gz", 2)]"""
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in FORMATS:
+            raise ValueError(f"неизвестный формат '{name}' (есть: {', '.join(FORMATS)})")
+        mix.append((name, int(weight or 1)))
+    if not any(weight > 0 for _, weight in mix):
+        raise ValueError("у смеси форматов нет ни одного веса > 0")
+    return mix
+
+
+def _sparse(path: Path, size: int, mtime: float) -> None:
+    with open(path, "wb") as f:
+        f.truncate(size)
+    os.utime(path, (mtime, mtime))
+
+
+def _chunk_hash(*parts: str) -> str:
+    return hashlib.blake2b("/".join(parts).encode("utf-8"), digest_size=CHUNK_DIGEST_SIZE).hexdigest()
+
+
+def _write_backup(backup_dir: Path, ib_name: str, label: str, fmt: str, size: int,
+                  mtime: float, base_chunk: Tuple[str, int]) -> None:
+    artifact = backup_dir / FORMATS[fmt]
+    if fmt == "dir":
+        artifact.mkdir()
+        _sparse(artifact / "toc.dat", 64 * 1024, mtime)
+        for n in range(4):
+            _sparse(artifact / f"{3001 + n}.dat.gz", size // 4, mtime)
+        os.utime(artifact, (mtime, mtime))
+    elif fmt == "dedup":
+        # Общий кусок ИБ + новый кусок этого бэкапа; логический размер — в заголовке индекса
+        store = backup_dir.parent / STORE_DIR
+        new_hash, new_size = _chunk_hash(ib_name, label), max(1, int(size * DEDUP_NEW_SHARE))
+        path = chunk_path(store, new_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _sparse(path, new_size, mtime)
+        header = {"version": INDEX_VERSION, "kind": "dedup_index", "format": "dump", "size_bytes": size,
+                  "hash_algo": "blake2b", "hash": _chunk_hash("stream", ib_name, label) * 2,
+                  "chunk_hash": f"blake2b-{CHUNK_DIGEST_SIZE * 8}", "compression": "zlib", "chunks": 2}
+        with open(artifact, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header, separators=(",", ":")) + "\n")
+            f.write(f"{base_chunk[0]} {base_chunk[1]}\n{new_hash} {max(1, size - base_chunk[1])}\n")
+        os.utime(artifact, (mtime, mtime))
+    else:
+        _sparse(artifact, size, mtime)
+
+    manifest = {"ib_name": ib_name, "timestamp": label, "format": "dump" if fmt == "dedup" else fmt,
+                "artifact": artifact.name, "size_bytes": size, "hash_algo": "blake2b",
+                "hash": _chunk_hash("artifact", ib_name, label) * 2, "started_at": int(mtime)}
+    if int(label[:8]) % VERIFIED_EVERY == 0:
+        manifest["verified_ok"] = True
+    with open(backup_dir / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.utime(backup_dir, (mtime, mtime))
+
+
+def build_tree(root: Path, ibs: int = 14, labels: int = 60, size_mb: float = 2048,
+               mix: str = DEFAULT_MIX, seed: int = 1, end: str = "20260201",
+               interval_hours: float = 24) -> Dict[str, int]:
+    """
+    Построить хранилище в root: ibs ИБ × labels меток (последняя — в день end, шаг interval_hours).
+
+    Размер ИБ — от 0.1 до 2 size_mb (случайно, но одинаково при одном seed), бэкапы ИБ
+    медленно растут к последней метке. Возвращает сводку: ИБ, бэкапы, артефакты, логический объём.
+    """
+    rng = random.Random(seed)
+    formats = parse_mix(mix)
+    names, weights = [name for name, _ in formats], [weight for _, weight in formats]
+    last = datetime.strptime(end, "%Y%m%d")
+    summary = {"ibs": ibs, "backups": 0, "size_bytes": 0}
+    for i in range(ibs):
+        ib_name = f"ib_{i:03d}_2025"
+        ib_path = Path(root) / ib_name
+        ib_path.mkdir(parents=True, exist_ok=True)
+        ib_size = size_mb * MB * rng.uniform(0.1, 2.0)
+        base_chunk = (_chunk_hash(ib_name, "base"), int(ib_size * 0.9))
+        base_written = False
+        # Ночное окно: ИБ стартуют с шагом в минуту, как у backup_scheduler
+        start = last + timedelta(hours=1, minutes=i % 240, seconds=rng.randrange(60))
+        for n in range(labels):
+            when = start - timedelta(hours=interval_hours * (labels - 1 - n))
+            label = when.strftime("%Y%m%d_%H%M%S")
+            fmt = rng.choices(names, weights)[0]
+            size = int(ib_size * (0.8 + 0.2 * n / max(1, labels - 1)) * rng.uniform(0.97, 1.03))
+            backup_dir = ib_path / label
+            backup_dir.mkdir(exist_ok=True)
+            if fmt == "dedup" and not base_written:
+                path = chunk_path(ib_path / STORE_DIR, base_chunk[0])
+                path.parent.mkdir(parents=True, exist_ok=True)
+                _sparse(path, int(base_chunk[1] * 0.3), when.timestamp())
+                base_written = True
+            _write_backup(backup_dir, ib_name, label, fmt, size, when.timestamp(), base_chunk)
+            summary["backups"] += 1
+            summary["size_bytes"] += size
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетическое хранилище бэкапов для бенчмарков")
+    parser.add_argument("root", type=Path, help="Каталог хранилища (создаётся)")
+    parser.add_argument("--ibs", type=int, default=14, help="Число ИБ")
+    parser.add_argument("--labels", type=int, default=60, help="Меток времени (бэкапов) на ИБ")
+    parser.add_argument("--size-mb", type=float, default=2048, help="Средний размер бэкапа, МБ (разреженные файлы)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Смесь форматов с весами (по умолчанию {DEFAULT_MIX})")
+    parser.add_argument("--interval-hours", type=float, default=24, help="Шаг между метками, ч")
+    parser.add_argument("--end", default="20260201", help="День последней метки, ГГГГММДД")
+    parser.add_argument("--seed", type=int, default=1, help="Зерно генератора")
+    parser.add_argument("--catalog", action="store_true", help="Построить каталог .catalog.jsonl (storage --reindex)")
+    parsed = parser.parse_args()
+
+    try:
+        summary = build_tree(parsed.root, parsed.ibs, parsed.labels, parsed.size_mb, parsed.mix,
+                             parsed.seed, parsed.end, parsed.interval_hours)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    print(f"📁 {parsed.root}: {summary['ibs']} ИБ, {summary['backups']} бэкап(ов), "
+          f"{summary['size_bytes'] / 1024 ** 3:.1f} ГБ (разреженные)")
+    if parsed.catalog:
+        from services.catalog_service import BackupCatalog
+
+        print(f"🔄 Каталог: {BackupCatalog(parsed.root).reindex()} артефакт(ов)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1 +1,21 @@
 # Инициализирован 2026-02-03 20:30:23
+"""
+Реестр команд ib_1c: имя → краткое описание.
+orchestrator.py берёт список команд отсюда, а не обходом каталога commands/ на каждый запуск.
+Новая команда — модуль commands/<имя>.py с main(args) и строка в COMMANDS
+(и в completion/ib_1c.bash; сверку делает benchmarks/bench_startup.py).
+"""
+
+COMMANDS = {
+    "backup": "Создать бэкап ИБ",
+    "daemon": "Демон: очередь заданий и локальный API",
+    "prune": "Ротация бэкапов по правилам GFS",
+    "restore": "Восстановить ИБ из бэкапа",
+    "rm": "Удалить бэкапы ИБ",
+    "sessions": "Завершить простаивающие сеансы 1С",
+    "storage": "Мониторинг хранилища бэкапов",
+    "upload": "Выгрузить новые бэкапы в облако",
+}
+
+# Команды, которые при запущенном демоне ставятся в его очередь (orchestrator.py → services/daemon_client.py)
+DAEMON_COMMANDS = ("backup", "prune", "rm", "upload")
@@ -6,8 +6,142 @@ CLI-адаптер для бэкапов — только парсинг арг
 
 import sys
 import argparse
-from services.backup_service import backup_multiple
-from core.config import load_ib_list  # ← добавляем импорт
+from core.config import load_ib_list, Config  # ← добавляем импорт
+from services.compression import CODECS, validate_level, benchmark_codecs
+from pathlib import Path
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, sec = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}ч {minutes:02d}м"
+    return f"{minutes}м {sec:02d}с" if minutes else f"{sec}с"
+
+
+def _format_prediction(result: dict) -> str:
+    """«прогноз X, факт Y» для бэкапа с прогнозом по истории"""
+    if not result.get("predicted_sec"):
+        return ""
+    actual = result.get("wall_seconds") or result.get("duration_sec", 0)
+    return f"прогноз {_format_duration(result['predicted_sec'])}, факт {_format_duration(actual)}"
+
+
+def _make_progress_printer(total: int):
+    """Колбэк прогресса для параллельного режима: старт/финиш и вывод backup.sh с префиксом ИБ, без pv"""
+    state = {"started": 0, "finished": 0}
+
+    def on_event(event, job, result=None):
+        size = job.get("size_bytes")
+        size_info = f", ~{size / (1024 ** 3):.1f} ГБ" if size else ""
+        if event == "start":
+            state["started"] += 1
+            print(f"▶️  [{state['started']}/{total}] {job['ib_name']} (хост {job['host']}{size_info})", flush=True)
+        elif event == "defer":
+            need = job.get("space_bytes", 0) / (1024 ** 3)
+            print(f"⏸️  {job['ib_name']} ждёт места на диске (нужно ~{need:.1f} ГБ)", flush=True)
+        elif event == "output":
+            if result["line"].strip():
+                print(f"   {job['ib_name']}: {result['line']}", flush=True)
+        elif event == "done":
+            state["finished"] += 1
+            mark = "✅" if result["success"] else "❌"
+            duration = _format_duration(result.get("duration_sec", 0))
+            cpu = result.get("user_seconds", 0) + result.get("sys_seconds", 0)
+            details = [f"CPU {_format_duration(cpu)}"] if cpu >= 1 else []
+            if _format_prediction(result):
+                details.append(_format_prediction(result))
+            details_info = f" ({'; '.join(details)})" if details else ""
+            print(f"{mark} [{state['finished']}/{total}] {job['ib_name']} — {duration}{details_info}", flush=True)
+        elif event == "upload_done":
+            if result["success"]:
+                print(f"☁️  {job['ib_name']}/{job['label']} выгружен: {result['size_bytes'] / (1024 ** 2):.0f} МБ "
+                      f"за {_format_duration(result['seconds'])} ({result['throughput_mb_s']:.1f} МБ/с)", flush=True)
+            else:
+                print(f"⚠️  {job['ib_name']}/{job['label']}: выгрузка не удалась — {result['error']}",
+                      file=sys.stderr, flush=True)
+
+    return on_event
+
+
+def run_compression_benchmark(sample: str, codec: str = None, level: int = None) -> int:
+    """Вывести таблицу скорости/степени сжатия кодеков на образце дампа"""
+    sample_path = Path(sample)
+    if not sample_path.is_file():
+        print(f"❌ Образец не найден: {sample_path}", file=sys.stderr)
+        return 1
+
+    print(f"\n🧪 Бенчмарк сжатия: {sample_path}")
+    results = benchmark_codecs(sample_path, [codec] if codec else None, level)
+    if results:
+        print(f"   Объём образца: {results[0]['input_bytes'] / (1024 ** 2):.1f} МБ\n")
+
+    print("┌──────────┬─────────┬──────────────┬──────────────┬──────────────┐")
+    print("│ Кодек    │ Уровень │ МБ/с         │ Сжатие       │ Результат    │")
+    print("├──────────┼─────────┼──────────────┼──────────────┼──────────────┤")
+    for row in results:
+        level_str = str(row["level"]) if row["level"] is not None else "—"
+        if "error" in row:
+            print(f"│ {row['codec']:<8} │ {level_str:<7} │ {'—':<12} │ {'—':<12} │ {'ошибка':<12} │")
+            continue
+        speed = f"{row['mb_per_sec']:.1f}" if row["mb_per_sec"] else "—"
+        ratio = f"{row['ratio']:.2f}x" if row["ratio"] else "—"
+        output = f"{row['output_bytes'] / (1024 ** 2):.1f} МБ"
+        print(f"│ {row['codec']:<8} │ {level_str:<7} │ {speed:<12} │ {ratio:<12} │ {output:<12} │")
+    print("└──────────┴─────────┴──────────────┴──────────────┴──────────────┘")
+
+    for row in results:
+        if "error" in row:
+            print(f"⚠️  {row['codec']}: {row['error']}")
+    return 0
+
+
+def check_ib_names(ib_names) -> bool:
+    """Все ли ИБ есть в кластере 1С — одной выборкой из кэша метаданных rac (до запуска бэкапов)"""
+    from services.rac_metadata import RacError, find_infobases, get_metadata
+
+    try:
+        _, missing = find_infobases(ib_names)
+    except RacError as e:
+        print(f"⚠️  Кластер 1С недоступен ({e}) — имена ИБ не проверены", file=sys.stderr)
+        return True
+    if not missing:
+        return True
+    import difflib
+
+    known = list(get_metadata()["infobases"])
+    for ib_name in missing:
+        hint = difflib.get_close_matches(ib_name, known, n=1)
+        print(f"❌ ИБ '{ib_name}' не найдена в кластере 1С" + (f" (возможно, {hint[0]})" if hint else ""),
+              file=sys.stderr)
+    print("   Бэкап не запущен ни для одной ИБ", file=sys.stderr)
+    return False
+
+
+def print_backup_plan(ib_list, format_type, parallel, per_host, compress) -> int:
+    """Таблица ожидаемого окна бэкапа: порядок запуска, длительности, итог"""
+    from services.backup_service import plan_backups
+
+    plan = plan_backups(ib_list, format_type, parallel, per_host, compress)
+    print(f"\n🗓️  План бэкапа {len(ib_list)} ИБ (формат: {format_type}): "
+          f"до {plan['max_parallel']} одновременно, до {plan['max_per_host']} на сервер PostgreSQL")
+    print("┌──────────────────────┬──────────┬──────────┬──────────┬──────────┬──────────────┐")
+    print("│ ИБ                   │ Размер   │ Старт    │ Длит.    │ Конец    │ Прогноз      │")
+    print("├──────────────────────┼──────────┼──────────┼──────────┼──────────┼──────────────┤")
+    for job in sorted(plan["jobs"], key=lambda j: (j["start_sec"], j["ib_name"])):
+        size = f"{job['size_bytes'] / (1024 ** 3):.1f} ГБ" if job["size_bytes"] else "?"
+        source = {
+            "history_ib": f"история ({job['samples']})",
+            "history_all": "история всех",
+            "formula": "≤ таймаут"
+        }[job["source"]]
+        print(f"│ {job['ib_name'][:20]:<20} │ {size:<8} │ +{_format_duration(job['start_sec']):<7} │ "
+              f"{_format_duration(job['duration_sec']):<8} │ +{_format_duration(job['end_sec']):<7} │ {source:<12} │")
+    print("└──────────────────────┴──────────┴──────────┴──────────┴──────────┴──────────────┘")
+    print(f"⏱️  Ожидаемое окно: {_format_duration(plan['window_sec'])}")
+    if any(j["source"] == "formula" for j in plan["jobs"]):
+        print("ℹ️  «≤ таймаут» — истории бэкапов ИБ мало, длительность оценена сверху по таймауту")
+    return 0
 
 
 def main(args=None):
@@ -15,18 +149,79 @@ def main(args=None):
         description="Создать бэкап информационных баз 1С",
         epilog="Примеры:\n"
                "  backup --format dump --ib artel_2025 oksana_2025\n"
-               "  backup --format dump --all"
+               "  backup --format dump --all\n"
+               "  backup --format dump --all --parallel 4 --per-host 2\n"
+               "  backup --format dump --all --parallel 4 --plan\n"
+               "  backup --format dir --ib artel_2025 --jobs 6\n"
+               "  backup --format dump --dedup --all\n"
+               "  backup --format sql --compress zstd --level 6 --ib artel_2025\n"
+               "  backup --bench-compress /var/backups/1c/artel_2025/20260207_143022/backup.sql.gz",
+        formatter_class=argparse.RawDescriptionHelpFormatter
     )
-    parser.add_argument("--format", choices=["dump", "sql"], required=True, help="Формат бэкапа")
+    parser.add_argument("--format", choices=["dump", "sql", "dir"],
+                        help="Формат бэкапа (dir — каталог pg_dump -Fd с параллельными потоками)")
     
     # Взаимоисключающие аргументы: --ib ИЛИ --all
-    group = parser.add_mutually_exclusive_group(required=True)
+    group = parser.add_mutually_exclusive_group()
     group.add_argument("--ib", nargs='+', metavar="ИМЯ", help="Имя ИБ (можно несколько)")
     group.add_argument("--all", action="store_true", help="Бэкап всех ИБ из ib_list.conf")
     
     parser.add_argument("--dry-run", action="store_true", help="Симуляция без реального бэкапа")
+    parser.add_argument("--plan", action="store_true",
+                        help="Показать ожидаемое окно бэкапа при заданной --parallel (прогноз по истории) без запуска")
+    parser.add_argument("--parallel", type=int, metavar="N", default=None,
+                        help=f"Одновременных бэкапов всего (по умолчанию {Config.BACKUP_MAX_PARALLEL}; 1 — последовательно)")
+    parser.add_argument("--per-host", type=int, metavar="N", default=None,
+                        help=f"Одновременных бэкапов на один сервер PostgreSQL (по умолчанию {Config.BACKUP_MAX_PER_HOST})")
+    parser.add_argument("--jobs", type=int, metavar="N", default=None,
+                        help="Потоков pg_dump для --format dir (по умолчанию — по размеру ИБ и свободным ядрам)")
+    parser.add_argument("--compress", choices=sorted(CODECS), default=None,
+                        help=f"Сжатие для --format sql (по умолчанию {Config.SQL_COMPRESS}; zstd/pigz — многопоточные)")
+    parser.add_argument("--level", type=int, metavar="N", default=None,
+                        help="Уровень сжатия (для dump/dir — pg_dump -Z)")
+    parser.add_argument("--dedup", action=argparse.BooleanOptionalAction, default=None,
+                        help="Дедуплицирующее хранилище для --format dump: в каталоге метки только индекс, "
+                             f"куски общие для всех бэкапов ИБ (по умолчанию {'вкл' if Config.BACKUP_DEDUP else 'выкл'})")
+    parser.add_argument("--make-room", action=argparse.BooleanOptionalAction, default=None,
+                        help="Если места под бэкап нет — удалить самые старые бэкапы (последние "
+                             f"{Config.SPACE_PRUNE_KEEP_LAST} у каждой ИБ остаются; по умолчанию "
+                             f"{'вкл' if Config.SPACE_AUTO_PRUNE else 'выкл'})")
+    parser.add_argument("--upload", action=argparse.BooleanOptionalAction, default=None,
+                        help=f"Выгружать каждый готовый бэкап в {Config.CLOUD_REMOTE} (ib_1c upload), пока снимаются "
+                             f"следующие (по умолчанию {'вкл' if Config.CLOUD_UPLOAD_AFTER_BACKUP else 'выкл'})")
+    parser.add_argument("--stream-upload", action=argparse.BooleanOptionalAction, default=None,
+                        help="Выгружать dump/sql в облако тем же проходом, что и запись на диск (без повторного "
+                             "чтения; для dir — выгрузка после бэкапа; по умолчанию "
+                             f"{'вкл' if Config.CLOUD_STREAM else 'выкл'})")
+    parser.add_argument("--bench-compress", metavar="ОБРАЗЕЦ", default=None,
+                        help="Сравнить кодеки на образце SQL-дампа (.sql/.sql.gz/.sql.zst): МБ/с и степень сжатия")
     
     parsed = parser.parse_args(args)
+
+    if parsed.bench_compress:
+        return run_compression_benchmark(parsed.bench_compress, parsed.compress, parsed.level)
+    if not parsed.format:
+        parser.error("требуется --format")
+    if not parsed.ib and not parsed.all:
+        parser.error("требуется --ib или --all")
+
+    if parsed.jobs is not None and parsed.format != "dir":
+        parser.error("--jobs применим только с --format dir")
+    if parsed.jobs is not None and parsed.jobs < 1:
+        parser.error("--jobs должен быть >= 1")
+    if parsed.compress and parsed.format != "sql":
+        parser.error("--compress применим только с --format sql")
+    if parsed.level is not None and parsed.format == "sql":
+        try:
+            validate_level(parsed.compress or Config.SQL_COMPRESS, parsed.level)
+        except ValueError as e:
+            parser.error(str(e))
+    elif parsed.level is not None and not 0 <= parsed.level <= 9:
+        parser.error("--level для dump/dir (pg_dump -Z) должен быть от 0 до 9")
+    if parsed.dedup and parsed.format != "dump":
+        parser.error("--dedup применим только с --format dump")
+    if parsed.dedup and parsed.level is not None:
+        parser.error("--dedup несовместим с --level (дамп пишется без сжатия, сжимаются куски)")
     
     # Получаем список ИБ в зависимости от режима
     if parsed.all:
@@ -36,11 +231,17 @@ def main(args=None):
         if not ib_list:
             print("❌ Нет ИБ для бэкапа в ib_list.conf (или все отфильтрованы как служебные)", file=sys.stderr)
             return 1
-        print(f"\n📦 Начало бэкапа {len(ib_list)} ИБ (формат: {parsed.format}) [режим --all]")
     else:
         ib_list = parsed.ib
-        print(f"\n📦 Начало бэкапа {len(ib_list)} ИБ (формат: {parsed.format})")
-    
+        if not check_ib_names(ib_list):
+            return 1
+
+    parallel = parsed.parallel if parsed.parallel is not None else Config.BACKUP_MAX_PARALLEL
+    if parsed.plan:
+        return print_backup_plan(ib_list, parsed.format, parallel, parsed.per_host, parsed.compress)
+
+    mode_info = " [режим --all]" if parsed.all else ""
+    print(f"\n📦 Начало бэкапа {len(ib_list)} ИБ (формат: {parsed.format}){mode_info}")
     print("=" * 70)
     
     if parsed.dry_run:
@@ -54,9 +255,43 @@ def main(args=None):
         print(f"✅ Симуляция завершена: {len(ib_list)}/{len(ib_list)} ИБ")
         return 0
     
-    # Вызов сервиса с потоковым выводом (прогресс отобразится напрямую)
-    results = backup_multiple(ib_list, parsed.format, dry_run=False)
+    # Последовательно — потоковый вывод pv напрямую; параллельно — построчный прогресс по ИБ
+    if parallel > 1 and len(ib_list) > 1:
+        print(f"⚙️  Параллельный режим: до {parallel} одновременно, "
+              f"до {parsed.per_host or Config.BACKUP_MAX_PER_HOST} на сервер PostgreSQL")
+    # Сервис (asyncio-движок, пул потоков) — только при реальном запуске, не для --help
+    from services.backup_service import backup_multiple
+
+    results = backup_multiple(
+        ib_list,
+        parsed.format,
+        dry_run=False,
+        max_parallel=parallel,
+        max_per_host=parsed.per_host,
+        on_event=_make_progress_printer(len(ib_list)),
+        jobs=parsed.jobs,
+        compress=parsed.compress,
+        level=parsed.level,
+        dedup=parsed.dedup,
+        make_room=parsed.make_room,
+        upload=parsed.upload,
+        stream=parsed.stream_upload
+    )
+
+    pruned = [backup for result in results for backup in result.get("pruned", [])]
+    if pruned:
+        freed = sum(backup["size_bytes"] for backup in pruned) / (1024 ** 3)
+        print(f"\n🧹 Удалено старых бэкапов ради места: {len(pruned)} (~{freed:.1f} ГБ)")
+        for backup in pruned:
+            print(f"   {backup['ib_name']}/{backup['label']}")
     
+    uploaded = [result["upload"] for result in results if result.get("upload")]
+    if uploaded:
+        failed_uploads = sum(1 for u in uploaded if not u["success"])
+        total_mb = sum(u["size_bytes"] for u in uploaded if u["success"]) / (1024 ** 2)
+        print(f"\n☁️  Выгружено в облако: {len(uploaded) - failed_uploads}/{len(uploaded)} ({total_mb:.0f} МБ)"
+              + (" — повторите: ib_1c upload" if failed_uploads else ""))
+
     errors = []
     for idx, result in enumerate(results, 1):
         ib_name = result["ib_name"]
@@ -66,7 +301,8 @@ def main(args=None):
             print(f"❌ Ошибка: {result['stderr'] or 'Неизвестная ошибка'}", file=sys.stderr)
             errors.append(ib_name)
         else:
-            print(f"\n[{idx}/{len(results)}] ✅ {ib_name}")
+            prediction = _format_prediction(result)
+            print(f"\n[{idx}/{len(results)}] ✅ {ib_name}" + (f" ({prediction})" if prediction else ""))
     
     print("\n" + "=" * 70)
     print(f"✅ Успешно: {len(results) - len(errors)}/{len(results)} ИБ")
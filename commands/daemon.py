@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+daemon.py — CLI-интерфейс ib_1c daemon (очередь заданий и локальный API)
+Вызывается через ib_1c daemon ... (единая точка входа)
+run — запустить демон в этом процессе (для systemd); status, jobs, cancel — клиент его API.
+Пока демон запущен, ib_1c backup/prune/rm/upload ставятся в его очередь (services.daemon_service).
+"""
+
+import sys
+import argparse
+import time
+from core.config import DAEMON_DB, DAEMON_HTTP, DAEMON_SOCKET
+
+STATE_ICONS = {"queued": "⏳", "running": "▶️ ", "done": "✅", "failed": "❌", "cancelled": "⏹️ "}
+
+
+def format_size(bytes_size: int) -> str:
+    if bytes_size == 0:
+        return "0B"
+    for unit in ["B", "K", "M", "G", "T"]:
+        if bytes_size < 1024:
+            return f"{bytes_size:.1f}{unit}"
+        bytes_size /= 1024
+    return f"{bytes_size:.1f}P"
+
+
+def format_job(job) -> str:
+    when = time.strftime("%d.%m %H:%M:%S", time.localtime(job["submitted_at"]))
+    line = f"   {STATE_ICONS.get(job['state'], '•')} #{job['id']:<5} {when}  {job['command']} {' '.join(job['args'])}"
+    if job["state"] == "running" and job["started_at"]:
+        line += f"  (идёт {time.time() - job['started_at']:.0f}с)"
+    elif job["finished_at"] and job["started_at"]:
+        line += f"  ({job['finished_at'] - job['started_at']:.0f}с, код {job['exit_code']})"
+    return line
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Демон ib_1c: единая очередь изменяющих команд и локальный API",
+        epilog=f"""Примеры:
+  ib_1c daemon run                 # в переднем плане (systemd: Type=simple)
+  ib_1c daemon status
+  ib_1c daemon jobs --all
+  ib_1c daemon cancel 42
+
+Сокет API — DAEMON_SOCKET ({DAEMON_SOCKET}), очередь — DAEMON_DB ({DAEMON_DB}).
+Выполнить команду мимо запущенного демона: IB_1C_LOCAL=1 ib_1c backup ...
+""",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="action", required=True, metavar="ДЕЙСТВИЕ")
+    run = sub.add_parser("run", help="Запустить демон (в переднем плане)")
+    run.add_argument("--socket", default=DAEMON_SOCKET, help="Unix-сокет API")
+    run.add_argument("--http", default=DAEMON_HTTP, metavar="ХОСТ:ПОРТ",
+                     help="Дополнительно слушать HTTP по TCP (по умолчанию DAEMON_HTTP, выключено; нужен DAEMON_TOKEN)")
+    sub.add_parser("status", help="Состояние демона: текущее задание, очередь, каталог")
+    jobs = sub.add_parser("jobs", help="Задания в очереди и выполняющиеся")
+    jobs.add_argument("--all", action="store_true", help="Вместе с завершёнными (последние 50)")
+    cancel = sub.add_parser("cancel", help="Отменить задание")
+    cancel.add_argument("job_id", type=int, metavar="ID", help="Номер задания")
+    parsed = parser.parse_args(args)
+
+    if parsed.action == "run":
+        from services.daemon_service import Daemon
+
+        try:
+            return Daemon(socket_path=parsed.socket, http=parsed.http).serve_forever()
+        except (OSError, RuntimeError) as e:
+            print(f"❌ Демон не запущен: {e}", file=sys.stderr)
+            return 1
+
+    from services.daemon_client import DaemonClient, DaemonError
+
+    client = DaemonClient()
+    if not client.available():
+        print(f"ℹ️  Демон не запущен ({client.socket_path}) — команды выполняются локально")
+        return 3 if parsed.action == "status" else 1
+
+    try:
+        if parsed.action == "status":
+            status = client.status()
+            catalog = status["catalog"]
+            print(f"\n🛰️  ib_1c daemon: pid {status['pid']}, работает {status['uptime_sec'] // 3600}ч "
+                  f"{status['uptime_sec'] % 3600 // 60}м")
+            print("=" * 70)
+            print(format_job(status["running"]) if status["running"] else "   💤 Задание не выполняется")
+            print(f"   ⏳ В очереди: {status['queued']}")
+            print(f"   📦 Каталог: {catalog['ib']} ИБ, {catalog['backups']} бэкап(ов), "
+                  f"{format_size(catalog['size_bytes'])}")
+        elif parsed.action == "jobs":
+            listed = client.jobs(active_only=not parsed.all)
+            if not listed:
+                print("✅ Очередь пуста")
+            for job in reversed(listed):
+                print(format_job(job))
+        else:
+            state = client.cancel(parsed.job_id)
+            if state in ("cancelled", "running"):
+                print(f"⏹️  Задание #{parsed.job_id}: "
+                      + ("снято с очереди" if state == "cancelled" else "отменяется, движки завершаются"))
+            else:
+                print(f"ℹ️  Задание #{parsed.job_id} уже завершено ({state})")
+    except DaemonError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    except OSError as e:
+        print(f"❌ Нет связи с демоном: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
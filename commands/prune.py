@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+prune.py — CLI-интерфейс ротации бэкапов по правилам GFS (дневные/недельные/месячные)
+Вызывается через ib_1c prune ... (единая точка входа)
+План считается по каталогу бэкапов (services.retention_service); --dry-run только показывает его.
+"""
+
+import sys
+import argparse
+from core.config import (RETENTION_DAILY, RETENTION_WEEKLY, RETENTION_MONTHLY, RETENTION_MIN_VERIFIED,
+                         RETENTION_WORKERS, RETENTION_IO_LIMIT_MB_S)
+
+REASONS = {
+    "latest": "последний",
+    "daily": "день",
+    "weekly": "неделя",
+    "monthly": "месяц",
+    "verified": "проверен",
+    "unknown": "не метка",
+}
+
+
+def format_size(bytes_size: int) -> str:
+    if bytes_size == 0:
+        return "0B"
+    for unit in ["B", "K", "M", "G", "T"]:
+        if bytes_size < 1024:
+            return f"{bytes_size:.1f}{unit}"
+        bytes_size /= 1024
+    return f"{bytes_size:.1f}P"
+
+
+def print_plan(plans, verbose: bool = False) -> None:
+    """План по ИБ: что остаётся (и почему), что удаляется и сколько места вернётся"""
+    for plan in plans:
+        policy = plan["policy"]
+        print(f"\n📦 {plan['ib_name']} (дней {policy['daily']}, недель {policy['weekly']}, "
+              f"месяцев {policy['monthly']}, проверенных ≥ {policy['min_verified']})")
+        if verbose:
+            for backup in plan["keep"]:
+                reasons = ", ".join(REASONS.get(r, r) for r in backup["reasons"])
+                print(f"   ✅ {backup['label']}  {format_size(backup['size_bytes']):>9}  ({reasons})")
+        for backup in plan["delete"]:
+            # Для дедупликации вернётся не больше: общие куски остаются у других бэкапов
+            bound = "≤" if backup["dedup"] else " "
+            print(f"   🗑️  {backup['label']}  {bound}{format_size(backup['size_bytes']):>9}")
+        if not plan["delete"]:
+            print(f"   ✅ Нечего удалять ({len(plan['keep'])} бэкап(ов) по правилам)")
+        else:
+            print(f"   → остаётся {len(plan['keep'])}, удаляется {len(plan['delete'])}, "
+                  f"освободится ~{format_size(plan['reclaim_bytes'])}")
+
+    to_delete = sum(len(plan["delete"]) for plan in plans)
+    reclaim = sum(plan["reclaim_bytes"] for plan in plans)
+    print("\n" + "=" * 70)
+    print(f"ℹ️  ИБ: {len(plans)}, к удалению: {to_delete} бэкап(ов), ~{format_size(reclaim)}")
+
+
+def _print_deleted(event, plan, outcome):
+    if outcome["success"]:
+        print(f"   🗑️  {plan['ib_name']}/{outcome['label']} ({format_size(outcome['freed_bytes'])})", flush=True)
+    else:
+        print(f"   ⚠️  {plan['ib_name']}/{outcome['label']}: {outcome.get('error')}", file=sys.stderr, flush=True)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Ротация бэкапов по правилам GFS: последние дни, недели и месяцы",
+        epilog="""Примеры:
+  ib_1c prune --all --dry-run
+  ib_1c prune --ib artel_2025 --daily 14 --monthly 12 --dry-run --verbose
+  ib_1c prune --all --confirm --io-limit 200
+  ib_1c prune --all --confirm --background  # не ждать освобождения места
+
+Правила по ИБ — retention.conf: «ИМЯ_ИБ DAILY WEEKLY MONTHLY [MIN_VERIFIED]» (* — для всех)
+""",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--ib", nargs="+", metavar="ИМЯ", help="Имя ИБ (можно несколько)")
+    group.add_argument("--all", action="store_true", help="Все ИБ каталога бэкапов")
+    parser.add_argument("--daily", type=int, metavar="N", default=None,
+                        help=f"Хранить последние N дней с бэкапом (по умолчанию {RETENTION_DAILY} или retention.conf)")
+    parser.add_argument("--weekly", type=int, metavar="N", default=None,
+                        help=f"Хранить последние N недель (по умолчанию {RETENTION_WEEKLY})")
+    parser.add_argument("--monthly", type=int, metavar="N", default=None,
+                        help=f"Хранить последние N месяцев (по умолчанию {RETENTION_MONTHLY})")
+    parser.add_argument("--min-verified", type=int, metavar="N", default=None,
+                        help=f"Не удалять N последних бэкапов, прошедших storage --verify (по умолчанию {RETENTION_MIN_VERIFIED})")
+    parser.add_argument("--verbose", action="store_true", help="Показать и остающиеся бэкапы с причиной")
+    parser.add_argument("--workers", type=int, default=RETENTION_WORKERS,
+                        help=f"ИБ, чистящихся одновременно (по умолчанию {RETENTION_WORKERS})")
+    parser.add_argument("--io-limit", type=int, default=RETENTION_IO_LIMIT_MB_S, metavar="MB_S",
+                        help=f"Общий лимит очистки корзины, МБ/с; 0 — без лимита (по умолчанию {RETENTION_IO_LIMIT_MB_S})")
+    parser.add_argument("--background", action="store_true",
+                        help="Не ждать очистки корзины: место освободит фоновый процесс (ionice -c3)")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать план (не требует --confirm)")
+    parser.add_argument("--confirm", action="store_true", help="Подтверждение для реального удаления")
+    parsed = parser.parse_args(args)
+
+    overrides = {key: value for key, value in (("daily", parsed.daily), ("weekly", parsed.weekly),
+                                               ("monthly", parsed.monthly),
+                                               ("min_verified", parsed.min_verified))
+                 if value is not None}
+    if any(value < 0 for value in overrides.values()):
+        parser.error("--daily/--weekly/--monthly/--min-verified не могут быть отрицательными")
+    if parsed.workers < 1 or parsed.io_limit < 0:
+        parser.error("--workers должен быть ≥ 1, --io-limit ≥ 0")
+    if not parsed.dry_run and not parsed.confirm:
+        parser.error("требуется --confirm для удаления (или --dry-run для просмотра плана)")
+
+    from services.retention_service import apply_retention, plan_retention, reclaim
+
+    try:
+        plans = plan_retention(parsed.ib, overrides)
+    except Exception as e:
+        print(f"❌ Ошибка чтения каталога бэкапов: {e}", file=sys.stderr)
+        return 1
+    if parsed.ib:
+        for ib_name in sorted(set(parsed.ib) - {plan["ib_name"] for plan in plans}):
+            print(f"⚠️  ИБ '{ib_name}': бэкапов в каталоге нет", file=sys.stderr)
+
+    print(f"\n🧹 Ротация бэкапов (GFS){' — СИМУЛЯЦИЯ' if parsed.dry_run else ''}")
+    print("=" * 70)
+    print_plan(plans, verbose=parsed.verbose or parsed.dry_run)
+    if parsed.dry_run or not any(plan["delete"] for plan in plans):
+        return 0
+
+    print("\n🗑️  Удаление:")
+    try:
+        results = apply_retention(plans, workers=parsed.workers, on_event=_print_deleted)
+    except KeyboardInterrupt:
+        print("\n⚠️  Операция прервана пользователем", file=sys.stderr)
+        return 130
+
+    reclaimed = sum(r["freed_bytes"] for r in results)
+    deleted = sum(len(r["deleted"]) for r in results)
+    failed = [r for r in results if not r["success"]]
+    print("\n" + "=" * 70)
+    print(f"✅ Удалено: {deleted} бэкап(ов), освобождается {format_size(reclaimed)}")
+
+    # Бэкапы уже в корзине: прерванная очистка продолжится фоновым процессом
+    try:
+        stats = reclaim(parsed.io_limit, background=parsed.background)
+    except KeyboardInterrupt:
+        reclaim(parsed.io_limit, background=True)
+        print("\n⚠️  Очистка корзины продолжится в фоне", file=sys.stderr)
+        return 130
+    if stats is None:
+        print("♻️  Корзина очищается в фоне (ionice -c3)")
+    else:
+        print(f"♻️  Корзина очищена: {stats['entries']} элемент(ов), освобождено {format_size(stats['freed_bytes'])}")
+    for r in failed:
+        print(f"❌ {r['ib_name']}: не удалено {len(r['failed'])} бэкап(ов)", file=sys.stderr)
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
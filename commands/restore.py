@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+restore.py — CLI-интерфейс для восстановления ИБ 1С из бэкапа
+Вызывается через ib_1c restore ... (единая точка входа)
+"""
+
+import sys
+import argparse
+from utils.datetime_utils import parse_timestamp_arg, machine_to_human
+from commands.storage import format_size
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Восстановить информационную базу 1С из бэкапа",
+        epilog="""Примеры:
+  ib_1c restore --ib artel_2025 --timestamp 20260207_143022 --target-db artel_2025_check --confirm
+  ib_1c restore --ib artel_2025 --timestamp "07.02.2026 14:30:22" --jobs 8 --clean --confirm
+  ib_1c restore --ib artel_2025 --dry-run  # последний бэкап, только план
+""",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--ib", required=True, help="Имя ИБ, бэкап которой восстанавливается")
+    parser.add_argument("--timestamp", help="Метка бэкапа (ГГГГММДД_ЧЧММСС или 'дд.мм.гггг чч:мм:сс'; по умолчанию — последний)")
+    parser.add_argument("--target-db", help="База назначения (по умолчанию — одноимённая ИБ)")
+    parser.add_argument("--jobs", type=int, metavar="N", default=None,
+                        help="Потоков pg_restore для dump/dir (по умолчанию — по размеру бэкапа и свободным ядрам)")
+    parser.add_argument("--clean", action="store_true", help="Пересоздать базу назначения, если она существует")
+    parser.add_argument("--dry-run", action="store_true", help="Показать план без восстановления")
+    parser.add_argument("--confirm", action="store_true", help="Подтверждение для реального восстановления")
+
+    parsed = parser.parse_args(args)
+
+    from services.restore_service import restore_ib, find_artifact, list_backup_timestamps
+
+    if parsed.jobs is not None and parsed.jobs < 1:
+        parser.error("--jobs должен быть >= 1")
+
+    if parsed.timestamp:
+        try:
+            timestamp = parse_timestamp_arg(parsed.timestamp)
+        except ValueError as e:
+            print(f"❌ Ошибка формата --timestamp: {e}", file=sys.stderr)
+            return 1
+    else:
+        timestamps = list_backup_timestamps(parsed.ib)
+        if not timestamps:
+            print(f"❌ Нет бэкапов ИБ '{parsed.ib}'", file=sys.stderr)
+            return 1
+        timestamp = timestamps[0]
+        print(f"ℹ️  Метка не указана — последний бэкап: {timestamp} ({machine_to_human(timestamp)})")
+
+    artifact = find_artifact(parsed.ib, timestamp)
+    if artifact is None:
+        print(f"❌ Бэкап '{timestamp}' ИБ '{parsed.ib}' не найден", file=sys.stderr)
+        available = list_backup_timestamps(parsed.ib)[:5]
+        if available:
+            print(f"   Последние бэкапы: {', '.join(available)}", file=sys.stderr)
+        return 1
+
+    target_db = parsed.target_db or parsed.ib
+    if not parsed.dry_run and not parsed.confirm:
+        print(f"❌ Требуется --confirm для восстановления в базу '{target_db}'")
+        print(f"   Используйте --dry-run для просмотра плана.")
+        return 1
+
+    print(f"\n♻️  Восстановление ИБ {parsed.ib} ({machine_to_human(timestamp)}) → {target_db}")
+    print(f"   Артефакт: {artifact['name']} ({format_size(artifact['size_bytes'])})")
+    print("=" * 70)
+
+    result = restore_ib(
+        parsed.ib,
+        timestamp,
+        target_db=parsed.target_db,
+        jobs=parsed.jobs,
+        clean=parsed.clean,
+        dry_run=parsed.dry_run
+    )
+
+    if result["stdout"]:
+        print(result["stdout"].rstrip())
+    if not result["success"]:
+        print(f"❌ Ошибка: {result['stderr'] or 'Неизвестная ошибка'}", file=sys.stderr)
+        return 1
+
+    print("=" * 70)
+    if parsed.dry_run:
+        print(f"✅ Симуляция завершена (потоков pg_restore: {result['jobs']}, таймаут: {result['timeout'] // 60} мин)")
+    else:
+        print(f"✅ ИБ {parsed.ib} восстановлена в базу {result['target_db']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
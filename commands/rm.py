@@ -2,102 +2,128 @@
 """
 rm.py — CLI-интерфейс для удаления бэкапов ИБ 1С
 Вызывается через ib_1c rm ... (единая точка входа)
+Цели всех ИБ выбираются одним проходом по каталогу бэкапов и удаляются одним запуском rm.sh
+(services.rm_service: plan_removal + execute_removal).
 """
 
 import sys
 import argparse
-from services.rm_service import RmService
 from core.exceptions import OrchestratorError
-from utils.datetime_utils import parse_older_than_arg, parse_timestamp_arg
+from utils.datetime_utils import machine_to_human, parse_older_than_arg, parse_timestamp_arg
+
+
+def format_size(bytes_size: int) -> str:
+    if bytes_size == 0:
+        return "0B"
+    for unit in ["B", "K", "M", "G", "T"]:
+        if bytes_size < 1024:
+            return f"{bytes_size:.1f}{unit}"
+        bytes_size /= 1024
+    return f"{bytes_size:.1f}P"
+
+
+def print_plan(targets, dry_run: bool) -> None:
+    by_ib = {}
+    for target in targets:
+        by_ib.setdefault(target["ib_name"], []).append(target)
+    total = sum(t["size_bytes"] for t in targets)
+    print(f"\n🗑️  План удаления: {len(targets)} бэкап(ов) в {len(by_ib)} ИБ, {format_size(total)}"
+          f"{' — СИМУЛЯЦИЯ' if dry_run else ''}")
+    print("=" * 70)
+    for ib_name, ib_targets in by_ib.items():
+        print(f"\n📦 {ib_name}: {len(ib_targets)} бэкап(ов), {format_size(sum(t['size_bytes'] for t in ib_targets))}")
+        for target in ib_targets:
+            print(f"   → {target['label']}  {machine_to_human(target['label']):<19}  "
+                  f"{format_size(target['size_bytes']):>8}")
+
 
 def main(args=None):
     parser = argparse.ArgumentParser(
         description="Удалить бэкапы информационных баз 1С",
         epilog="""Примеры:
   ib_1c rm --ib artel_2025 --timestamp "07.02.2026 14:30:22" --confirm
-  ib_1c rm --ib artel_2025 --older-than "01.02.2026" --dry-run
+  ib_1c rm --ib artel_2025 oksana_2025 --older-than "01.02.2026" --dry-run
   ib_1c rm --ib artel_2025 --older-than "01.02" --confirm  # текущий год
   ib_1c rm --ib artel_2025 --dry-run  # симуляция удаления ВСЕХ бэкапов (без --confirm!)
-"""
+  ib_1c rm --all --older-than 20250101 --confirm
+""",
+        formatter_class=argparse.RawDescriptionHelpFormatter
     )
-    parser.add_argument("--ib", required=True, nargs="+", help="Имя ИБ (можно несколько)")
+    scope = parser.add_mutually_exclusive_group(required=True)
+    scope.add_argument("--ib", nargs="+", help="Имя ИБ (можно несколько)")
+    scope.add_argument("--all", action="store_true", help="Все ИБ хранилища")
     parser.add_argument("--timestamp", help="Метка времени бэкапа (ГГГГММДД_ЧЧММСС или 'дд.мм.гггг чч:мм:сс')")
     parser.add_argument("--older-than", help="Удалить бэкапы старше даты (ГГГГММДД или 'дд.мм.гггг' или 'дд.мм')")
     parser.add_argument("--dry-run", action="store_true", help="Симуляция без удаления (не требует --confirm)")
     parser.add_argument("--confirm", action="store_true", help="Подтверждение для реального удаления")
-    
+
     parsed = parser.parse_args(args)
-    
+
+    from services.rm_service import RmService
+
+    # Предварительная валидация аргументов дат
+    timestamp_machine = None
+    older_than_machine = None
+    if parsed.timestamp:
+        try:
+            timestamp_machine = parse_timestamp_arg(parsed.timestamp)
+        except ValueError as e:
+            print(f"❌ Ошибка формата --timestamp: {e}", file=sys.stderr)
+            return 1
+    if parsed.older_than:
+        older_than_machine = parse_older_than_arg(parsed.older_than)
+        if len(older_than_machine) != 8 or not older_than_machine.isdigit():
+            print(f"❌ Некорректная дата для --older-than: '{parsed.older_than}'", file=sys.stderr)
+            return 1
+
+    if not parsed.dry_run and not parsed.confirm:
+        what = "ВСЕХ бэкапов " + ("ВСЕХ ИБ" if parsed.all else "ИБ " + ", ".join(parsed.ib)) \
+            if not parsed.timestamp and not parsed.older_than else "бэкапов"
+        print(f"❌ Требуется --confirm для удаления {what}", file=sys.stderr)
+        print("   Используйте --dry-run для просмотра затронутых бэкапов.", file=sys.stderr)
+        return 1
+
     try:
         service = RmService()
-        errors = []
-        
-        # Предварительная валидация аргументов дат
-        timestamp_machine = None
-        older_than_machine = None
-        
-        if parsed.timestamp:
-            try:
-                timestamp_machine = parse_timestamp_arg(parsed.timestamp)
-            except ValueError as e:
-                print(f"❌ Ошибка формата --timestamp: {e}", file=sys.stderr)
-                return 1
-        
-        if parsed.older_than:
-            older_than_machine = parse_older_than_arg(parsed.older_than)
-            if len(older_than_machine) < 8:
-                print(f"❌ Некорректная дата для --older-than: '{parsed.older_than}'", file=sys.stderr)
-                return 1
-        
-        for ib_name in parsed.ib:
-            print(f"\n[ИБ: {ib_name}]")
-            
-            # Логика выбора операции с корректной обработкой --dry-run
-            if parsed.timestamp:
-                result = service.remove_backup(
-                    ib_name=ib_name,
-                    timestamp=timestamp_machine,
-                    dry_run=parsed.dry_run,
-                    confirm=parsed.confirm if not parsed.dry_run else True  # Для симуляции подтверждение не нужно
-                )
-            elif parsed.older_than:
-                result = service.remove_backup(
-                    ib_name=ib_name,
-                    older_than=older_than_machine,
-                    dry_run=parsed.dry_run,
-                    confirm=parsed.confirm if not parsed.dry_run else True
-                )
-            else:
-                # Удаление ВСЕХ бэкапов
-                if not parsed.dry_run and not parsed.confirm:
-                    print(f"❌ Требуется --confirm для удаления ВСЕХ бэкапов ИБ '{ib_name}'")
-                    print(f"   Используйте --dry-run для просмотра затронутых файлов.")
-                    errors.append(ib_name)
-                    continue
-                
-                result = service.remove_all_backups(
-                    ib_name=ib_name,
-                    confirm=(parsed.confirm or parsed.dry_run),  # Для --dry-run всегда разрешаем
-                    dry_run=parsed.dry_run
-                )
-            
-            if result["success"]:
-                output = result["stdout"].strip() or result["stderr"].strip()
-                if output:
-                    print(output)
+        plan = service.plan_removal(None if parsed.all else parsed.ib, timestamp_machine, older_than_machine)
+        errors = len(plan["missing_ib"]) + len(plan["missing_timestamp"])
+        for ib_name in plan["missing_ib"]:
+            print(f"❌ ИБ '{ib_name}' не найдена в хранилище", file=sys.stderr)
+        for ib_name in plan["missing_timestamp"]:
+            print(f"❌ Бэкап '{timestamp_machine}' ИБ '{ib_name}' не найден", file=sys.stderr)
+        if not parsed.all:
+            planned = {t["ib_name"] for t in plan["targets"]}
+            for ib_name in parsed.ib:
+                if ib_name not in planned and ib_name not in plan["missing_ib"] + plan["missing_timestamp"]:
+                    print(f"ℹ️  ИБ '{ib_name}': нечего удалять")
+
+        if not plan["targets"]:
+            print("\n✅ Бэкапов к удалению нет")
+            return 0 if not errors else 1
+        print_plan(plan["targets"], parsed.dry_run)
+        if parsed.dry_run:
+            return 0 if not errors else 1
+
+        result = service.execute_removal(plan["targets"])
+        failed = [r for r in result["results"] if not r["success"]]
+        if failed:
+            print("")
+        for outcome in failed:
+            error = outcome["error"] or "Неизвестная ошибка"
+            if "не найден" in error or "not found" in error:
+                print(f"❌ {outcome['ib_name']}/{outcome['label']}: бэкап не найден", file=sys.stderr)
+            elif "Отказано в доступе" in error or "Permission denied" in error:
+                print(f"❌ {outcome['ib_name']}/{outcome['label']}: ошибка прав доступа", file=sys.stderr)
             else:
-                stderr = result.get("stderr", "Неизвестная ошибка").strip()
-                if "не найден" in stderr or "not found" in stderr:
-                    print(f"❌ Бэкап не найден: {stderr}", file=sys.stderr)
-                elif "Отказано в доступе" in stderr or "Permission denied" in stderr:
-                    print(f"❌ Ошибка прав доступа: {stderr}", file=sys.stderr)
-                else:
-                    print(f"❌ Ошибка: {stderr}", file=sys.stderr)
-                errors.append(ib_name)
-        
-        print(f"\n✅ Успешно: {len(parsed.ib) - len(errors)}/{len(parsed.ib)} ИБ")
-        return 0 if not errors else 1
-        
+                print(f"❌ {outcome['ib_name']}/{outcome['label']}: {error}", file=sys.stderr)
+
+        done = len(result["results"]) - len(failed)
+        print(f"\n✅ Удалено: {done}/{len(result['results'])} бэкап(ов)")
+        if result["reclaimed_bytes"]:
+            print(f"♻️  Освобождается: {result['reclaimed_bytes'] / (1024 ** 3):.2f} ГБ "
+                  f"(бэкапы в корзине, очистка идёт в фоне)")
+        return 0 if not failed and not errors else 1
+
     except OrchestratorError as e:
         print(f"❌ {e.message}", file=sys.stderr)
         if e.details:
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+sessions.py — CLI-интерфейс завершения простаивающих сеансов 1С
+Вызывается через ib_1c sessions ... (единая точка входа); cron — через engines/cleanup.sh.
+Сеансы берутся одним вызовом rac на кластер и завершаются параллельно (services.session_service).
+"""
+
+import sys
+import argparse
+import time
+from core.config import SESSION_IDLE_MIN, SESSION_WORKERS
+
+
+def format_idle(minutes) -> str:
+    if minutes is None:
+        return "—"
+    if minutes >= 24 * 60:
+        return f"{minutes // (24 * 60)}д {minutes % (24 * 60) // 60}ч"
+    if minutes >= 60:
+        return f"{minutes // 60}ч {minutes % 60}м"
+    return f"{minutes}м"
+
+
+def format_session(session) -> str:
+    who = f"{session.get('user') or '?'}@{session.get('host') or '?'}"
+    return (f"{session['id']}  {who:<24} {session.get('app') or '':<13} "
+            f"простой {format_idle(session['idle_min']):>7} (порог {session['limit_min']}м)")
+
+
+def print_plan(plan, verbose: bool = False) -> None:
+    by_ib = {}
+    for session in plan["terminate"]:
+        by_ib.setdefault(session["ib_name"], ([], []))[0].append(session)
+    for session in plan["keep"]:
+        by_ib.setdefault(session["ib_name"], ([], []))[1].append(session)
+    for ib_name in sorted(by_ib, key=str):
+        terminate, keep = by_ib[ib_name]
+        if not terminate and not verbose:
+            continue
+        print(f"\n📦 {ib_name}: сеансов {len(terminate) + len(keep)}, к завершению {len(terminate)}")
+        for session in terminate:
+            print(f"   ⏹️  {format_session(session)}")
+        if verbose:
+            for session in keep:
+                print(f"   ✅ {format_session(session)}")
+
+
+def _print_done(session, error):
+    name = f"{session['ib_name']}/{session['id']} ({session.get('user') or '?'})"
+    if error is None:
+        print(f"   ⏹️  {name}: завершён после {format_idle(session['idle_min'])} простоя", flush=True)
+    else:
+        print(f"   ⚠️  {name}: {error}", file=sys.stderr, flush=True)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Завершение сеансов 1С, простаивающих дольше порога",
+        epilog=f"""Примеры:
+  ib_1c sessions --dry-run --verbose
+  ib_1c sessions --ib artel_2025 --idle-min 30 --confirm
+  ib_1c sessions --confirm                 # cron (engines/cleanup.sh)
+
+Пороги по ИБ — sessions.conf: «ИМЯ_ИБ МИНУТ» (* — для всех, 0 — не завершать);
+по умолчанию SESSION_IDLE_MIN ({SESSION_IDLE_MIN} мин).
+""",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--ib", nargs="+", metavar="ИМЯ", help="Только сеансы этих ИБ (по умолчанию — все ИБ кластера)")
+    parser.add_argument("--idle-min", type=int, metavar="МИН", default=None,
+                        help=f"Порог простоя для всех выбранных ИБ, мин (по умолчанию sessions.conf или {SESSION_IDLE_MIN})")
+    parser.add_argument("--workers", type=int, default=SESSION_WORKERS, metavar="N",
+                        help=f"Одновременных rac session terminate (по умолчанию {SESSION_WORKERS})")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Перечитать кластер и список ИБ, не глядя в кэш метаданных rac")
+    parser.add_argument("--verbose", action="store_true", help="Показать и остающиеся сеансы")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать, какие сеансы будут завершены")
+    parser.add_argument("--confirm", action="store_true", help="Подтверждение для завершения сеансов")
+    parsed = parser.parse_args(args)
+
+    if parsed.workers < 1 or (parsed.idle_min is not None and parsed.idle_min < 1):
+        parser.error("--workers и --idle-min должны быть ≥ 1")
+    if not parsed.dry_run and not parsed.confirm:
+        parser.error("требуется --confirm для завершения сеансов (или --dry-run для просмотра)")
+
+    from services.rac_metadata import invalidate
+    from services.session_service import RacError, cluster_id, list_sessions, plan_cleanup, terminate_sessions
+
+    started = time.monotonic()
+    if parsed.refresh:
+        invalidate()
+    try:
+        cluster = cluster_id()
+        sessions = list_sessions(cluster)
+    except RacError as e:
+        print(f"❌ Кластер 1С недоступен: {e}", file=sys.stderr)
+        return 1
+    plan = plan_cleanup(sessions, parsed.ib, parsed.idle_min)
+    if parsed.ib:
+        for ib_name in sorted(set(parsed.ib) - {s["ib_name"] for s in sessions}):
+            print(f"ℹ️  ИБ '{ib_name}': сеансов нет")
+
+    print(f"\n👥 Сеансы кластера {cluster}{' — СИМУЛЯЦИЯ' if parsed.dry_run else ''}")
+    print("=" * 70)
+    print_plan(plan, verbose=parsed.verbose)
+    print(f"\nℹ️  Сеансов: {len(plan['terminate']) + len(plan['keep'])}, к завершению: {len(plan['terminate'])} "
+          f"(список за {time.monotonic() - started:.1f}с)")
+    if parsed.dry_run or not plan["terminate"]:
+        return 0
+
+    print("\n⏹️  Завершение:")
+    try:
+        results = terminate_sessions(cluster, plan["terminate"], workers=parsed.workers, on_done=_print_done)
+    except KeyboardInterrupt:
+        print("\n⚠️  Операция прервана пользователем", file=sys.stderr)
+        return 130
+
+    failed = [r for r in results if not r["success"]]
+    print("\n" + "=" * 70)
+    print(f"✅ Завершено сеансов: {len(results) - len(failed)}/{len(results)} "
+          f"за {time.monotonic() - started:.1f}с")
+    if failed:
+        print(f"❌ Не завершено: {len(failed)}", file=sys.stderr)
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,16 +2,20 @@
 """
 storage.py — мониторинг хранилища бэкапов 1С
 Фильтрует артефакты: системные директории (lost+found), виртуальные ИБ (all), опечатки
+Данные берутся из каталога бэкапов (без обхода диска); --reindex перестраивает каталог
+--verify сверяет бэкапы с их manifest.json (параллельно по ИБ, с лимитом чтения)
+--format json|ndjson|tsv выводит бэкапы для мониторинга потоком, по мере чтения каталога
 """
 
+import re
 import sys
 import argparse
 import shutil
-from datetime import datetime
-from pathlib import Path
-from utils.datetime_utils import machine_to_human
+from typing import NamedTuple
+from core.config import BACKUP_ROOT, VERIFY_WORKERS, VERIFY_IO_LIMIT_MB_S
 
-BACKUP_ROOT = Path("/var/backups/1c")
+# Сервисы (каталог, манифесты, хранилище кусков) и разбор дат импортируются по месту:
+# `ib_1c storage` вызывается мониторингом раз в минуту, --help не должен их грузить
 
 # Чёрный список: системные и виртуальные директории
 IB_BLACKLIST = {
@@ -21,49 +25,69 @@ IB_BLACKLIST = {
     ".", ".."                      # Специальные ссылки
 }
 
-def get_backups_for_ib(ib_name: str):
+TIMESTAMP_RE = re.compile(r"20[0-9]{2}[01][0-9][0-3][0-9]_[0-2][0-9][0-5][0-9][0-5][0-9]")
+
+FORMATS = ("table", "json", "ndjson", "tsv")
+
+
+class LabelBackup(NamedTuple):
+    """Бэкап ИБ (все артефакты одной метки времени) в индексе load_backup_index"""
+    timestamp: str
+    size_bytes: int
+
+    @property
+    def human_time(self) -> str:
+        from utils.datetime_utils import machine_to_human
+        return machine_to_human(self.timestamp)
+
+
+def open_catalog(reindex: bool = False, log=None):
+    """Каталог $BACKUP_ROOT/.catalog.jsonl; при reindex=True или его отсутствии — перестроить с диска"""
+    from services.catalog_service import BackupCatalog
+
+    log = log or sys.stdout
+    catalog = BackupCatalog(BACKUP_ROOT)
+    if reindex or not catalog.exists():
+        if not reindex:
+            print("ℹ️  Каталог бэкапов не найден — строим с диска (однократно)", file=log)
+        count = catalog.reindex()
+        print(f"🔄 Каталог перестроен: {count} артефакт(ов)", file=log)
+    return catalog
+
+
+def load_backup_index(reindex: bool = False) -> dict:
+    """Сгруппировать каталог бэкапов по ИБ за один проход: {ИБ: [LabelBackup, новые первыми]}
+
+    Читается журнал $BACKUP_ROOT/.catalog.jsonl (см. services/catalog_service.py);
+    при reindex=True или отсутствии каталога он перестраивается с диска.
+    """
+    index = {}
+    # Поток каталога отсортирован по (ИБ, метка): артефакты одной метки идут подряд
+    for record in open_catalog(reindex).stream():
+        backups = index.setdefault(record.ib_name, [])
+        if not TIMESTAMP_RE.fullmatch(record.label):
+            continue  # ИБ с артефактами вне каталогов меток
+        if backups and backups[-1].timestamp == record.label:
+            backups[-1] = LabelBackup(record.label, backups[-1].size_bytes + record.size_bytes)
+        else:
+            backups.append(LabelBackup(record.label, record.size_bytes))
+    for backups in index.values():
+        backups.reverse()
+    return index
+
+def get_backups_for_ib(ib_name: str, index: dict):
     """Получить список бэкапов ИБ с метаданными"""
-    ib_dir = BACKUP_ROOT / ib_name
-    if not ib_dir.exists():
-        return []
-    
-    backups = []
-    try:
-        for entry in sorted(ib_dir.glob("20[0-9][0-9][01][0-9][0-3][0-9]_[0-2][0-9][0-5][0-9][0-5][0-9]"), reverse=True):
-            if entry.is_dir():
-                total_size = sum(f.stat().st_size for f in entry.glob("*") if f.is_file())
-                backups.append({
-                    "timestamp": entry.name,
-                    "human_time": machine_to_human(entry.name),
-                    "size_bytes": total_size,
-                    "path": entry
-                })
-    except PermissionError:
-        pass  # Игнорируем директории без прав
-    return backups
-
-def is_valid_ib(ib_name: str) -> bool:
-    """Проверить, является ли имя ИБ реальной базой 1С"""
+    return index.get(ib_name, [])
+
+def is_ib_name(ib_name: str) -> bool:
+    """Имя похоже на ИБ 1С, а не на системный/виртуальный каталог"""
     if ib_name in IB_BLACKLIST:
         return False
-    if ib_name.startswith(".") and ib_name not in {".", ".."}:
-        return False
-    
-    ib_dir = BACKUP_ROOT / ib_name
-    if not ib_dir.is_dir():
-        return False
-    
-    try:
-        next(ib_dir.iterdir(), None)
-    except PermissionError:
-        return False
-    
-    valid_backups = list(ib_dir.glob("20[0-9][0-9][01][0-9][0-3][0-9]_[0-2][0-9][0-5][0-9][0-5][0-9]"))
-    if not valid_backups:
-        has_files = any(f for f in ib_dir.iterdir() if f.is_file())
-        return has_files
-    
-    return True
+    return not (ib_name.startswith(".") and ib_name not in {".", ".."})
+
+def is_valid_ib(ib_name: str, index: dict) -> bool:
+    """Проверить, является ли имя ИБ реальной базой 1С"""
+    return is_ib_name(ib_name) and ib_name in index
 
 def format_size(bytes_size: int) -> str:
     if bytes_size == 0:
@@ -75,6 +99,7 @@ def format_size(bytes_size: int) -> str:
     return f"{bytes_size:.1f}P"
 
 def format_age(timestamp: str) -> str:
+    from datetime import datetime
     try:
         dt = datetime.strptime(timestamp, "%Y%m%d_%H%M%S")
         age = datetime.now() - dt
@@ -107,27 +132,48 @@ def print_disk_usage():
     except Exception as e:
         print(f"⚠️  Ошибка получения информации о диске: {e}\n")
 
-def print_summary_table(ibs_to_show):
+def print_summary_table(ibs_to_show, index):
     print("📊 Статистика по ИБ:")
     print("┌──────────────────────────┬─────────────┬──────────────────────────┬────────────────────┬──────────────┐")
     print("│ ИБ                       │ Бэкапов     │ Последний                │ Последний размер   │ Всего        │")
     print("├──────────────────────────┼─────────────┼──────────────────────────┼────────────────────┼──────────────┤")
     
     for ib_name in sorted(ibs_to_show):
-        backups = get_backups_for_ib(ib_name)
+        backups = get_backups_for_ib(ib_name, index)
         if not backups:
             continue
         
         last = backups[0]
-        total_size = sum(b["size_bytes"] for b in backups)
-        last_human = machine_to_human(last["timestamp"])
+        total_size = sum(b.size_bytes for b in backups)
+        last_human = last.human_time
         
-        print(f"│ {ib_name:<24} │ {len(backups):<11} │ {last_human:<24} │ {format_size(last['size_bytes']):<18} │ {format_size(total_size):<12} │")
+        print(f"│ {ib_name:<24} │ {len(backups):<11} │ {last_human:<24} │ {format_size(last.size_bytes):<18} │ {format_size(total_size):<12} │")
     
     print("└──────────────────────────┴─────────────┴──────────────────────────┴────────────────────┴──────────────┘\n")
+    print_dedup_summary(ibs_to_show, index)
 
-def print_detailed_backups(ib_name):
-    backups = get_backups_for_ib(ib_name)
+def print_dedup_summary(ibs_to_show, index):
+    """Логический и физический объём для ИБ с дедуплицирующим хранилищем"""
+    from services.catalog_service import BackupCatalog
+    from services.chunk_store import STORE_DIR
+    from services.storage_service import physical_sizes
+
+    dedup_ibs = sorted(ib for ib in ibs_to_show if (BACKUP_ROOT / ib / STORE_DIR).is_dir())
+    if not dedup_ibs:
+        return
+    physical = physical_sizes(
+        (b for b in BackupCatalog(BACKUP_ROOT).stream() if b.ib_name in dedup_ibs), BACKUP_ROOT
+    )
+    print("🧩 Дедупликация (логический объём / на диске):")
+    for ib_name in dedup_ibs:
+        logical = sum(b.size_bytes for b in get_backups_for_ib(ib_name, index))
+        on_disk = physical.get(ib_name, 0)
+        ratio = f" (×{logical / on_disk:.1f})" if on_disk else ""
+        print(f"   {ib_name:<24} {format_size(logical):>10} / {format_size(on_disk):<10}{ratio}")
+    print()
+
+def print_detailed_backups(ib_name, index):
+    backups = get_backups_for_ib(ib_name, index)
     if not backups:
         print(f"⚠️  ИБ '{ib_name}' не найдена или нет бэкапов\n")
         return 1
@@ -138,26 +184,139 @@ def print_detailed_backups(ib_name):
     print("├──────────────────────┼──────────────┼──────────────────────────┼──────────────┤")
     
     for b in backups:
-        ts = b['timestamp']
-        size = format_size(b['size_bytes'])
-        human = b['human_time']
+        ts = b.timestamp
+        size = format_size(b.size_bytes)
+        human = b.human_time
         age = format_age(ts)
         print(f"│ {ts:<20} │ {size:<12} │ {human:<24} │ {age:<12} │")
     
     print("└──────────────────────┴──────────────┴──────────────────────────┴──────────────┘\n")
     
-    total_size = sum(b["size_bytes"] for b in backups)
+    total_size = sum(b.size_bytes for b in backups)
     print(f"ℹ️  Всего: {len(backups)} бэкап(ов), общий размер: {format_size(total_size)}\n")
     return 0
 
+VERIFY_STATUS = {
+    "ok": "✅ OK",
+    "mismatch": "❌ Ошибка",
+    "missing": "❌ Нет файла",
+    "no_manifest": "⚪ Без манифеста",
+}
+
+def print_verify_results(results) -> int:
+    """Таблица результатов проверки; код возврата 1, если есть повреждённые бэкапы"""
+    if not results:
+        print("⚠️  Нет бэкапов для проверки\n")
+        return 0
+
+    print("🔍 Проверка целостности бэкапов:")
+    print("┌──────────────────────────┬──────────────────────┬──────────────┬──────────────────┬──────────┐")
+    print("│ ИБ                       │ Метка                │ Размер       │ Статус           │ Время    │")
+    print("├──────────────────────────┼──────────────────────┼──────────────┼──────────────────┼──────────┤")
+    for r in sorted(results, key=lambda r: (r["ib_name"], r["timestamp"])):
+        status = VERIFY_STATUS.get(r["status"], r["status"])
+        print(f"│ {r['ib_name']:<24} │ {r['timestamp']:<20} │ {format_size(r['size_bytes']):<12} │ {status:<16} │ {r['seconds']:>6.1f}с  │")
+    print("└──────────────────────────┴──────────────────────┴──────────────┴──────────────────┴──────────┘\n")
+
+    failed = [r for r in results if r["status"] in ("mismatch", "missing")]
+    for r in failed:
+        print(f"❌ {r['ib_name']}/{r['timestamp']}: {r['error']}")
+    no_manifest = sum(1 for r in results if r["status"] == "no_manifest")
+    checked_bytes = sum(r["size_bytes"] for r in results if r["status"] != "no_manifest")
+    print(f"ℹ️  Проверено: {len(results) - no_manifest}, повреждено: {len(failed)}, "
+          f"без манифеста: {no_manifest}, объём: {format_size(checked_bytes)}\n")
+    return 1 if failed else 0
+
+def write_backups(fmt: str, ib_name: str = None, reindex: bool = False, out=None) -> int:
+    """
+    Вывести бэкапы для мониторинга потоком: запись пишется в out сразу по прочтении.
+
+    ndjson — объект на строку; tsv — столбцы list_backups.sh (+ label) с заголовком;
+    json — один документ {"backup_root", "backups": [...], "stats": [...], "timestamp"},
+    где stats считаются по ходу вывода. В памяти — только итоги по ИБ.
+    Сообщения (перестройка каталога, ошибки) — в stderr, чтобы не ломать разбор stdout.
+    """
+    import json
+    from datetime import datetime
+    from services.catalog_service import BackupRecord
+
+    out = out or sys.stdout
+    try:
+        records = open_catalog(reindex, log=sys.stderr).stream()
+    except Exception as e:
+        print(f"❌ Ошибка чтения каталога бэкапов: {e}", file=sys.stderr)
+        return 1
+
+    totals = {}
+    if fmt == "json":
+        out.write(f'{{"backup_root": {json.dumps(str(BACKUP_ROOT), ensure_ascii=False)}, "backups": [')
+    elif fmt == "tsv":
+        out.write("\t".join(BackupRecord._fields) + "\n")
+    for record in records:
+        if not is_ib_name(record.ib_name) or (ib_name and record.ib_name != ib_name):
+            continue
+        files, size = totals.get(record.ib_name, (0, 0))
+        if fmt == "json":
+            out.write(("\n  " if not totals else ",\n  ") + json.dumps(record._asdict(), ensure_ascii=False))
+        elif fmt == "ndjson":
+            out.write(json.dumps(record._asdict(), ensure_ascii=False) + "\n")
+        else:
+            out.write("\t".join(map(str, record)) + "\n")
+        totals[record.ib_name] = (files + 1, size + record.size_bytes)
+    if fmt == "json":
+        stats = [{"ib_name": name, "total_files": files, "total_size_bytes": size}
+                 for name, (files, size) in sorted(totals.items())]
+        out.write(f'\n], "stats": {json.dumps(stats, ensure_ascii=False)}, '
+                  f'"timestamp": {int(datetime.now().timestamp())}}}\n')
+    out.flush()
+
+    if ib_name and not totals:
+        print(f"❌ ИБ '{ib_name}' не найдена в {BACKUP_ROOT}", file=sys.stderr)
+        return 1
+    return 0
+
 def main(args=None):
     parser = argparse.ArgumentParser(description="Мониторинг хранилища бэкапов 1С")
     parser.add_argument("--ib", help="Показать детальный список бэкапов для указанной ИБ")
+    parser.add_argument("--reindex", action="store_true",
+                        help="Перестроить каталог бэкапов с диска (после ручных изменений в хранилище)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Проверить бэкапы по manifest.json (хэш BLAKE2b); с --ib — только эту ИБ")
+    parser.add_argument("--workers", type=int, default=VERIFY_WORKERS,
+                        help=f"ИБ, проверяемых одновременно (по умолчанию {VERIFY_WORKERS})")
+    parser.add_argument("--io-limit", type=int, default=VERIFY_IO_LIMIT_MB_S, metavar="MB_S",
+                        help=f"Общий лимит чтения при проверке, МБ/с; 0 — без лимита (по умолчанию {VERIFY_IO_LIMIT_MB_S})")
+    parser.add_argument("--format", choices=FORMATS, default="table",
+                        help="Вывод: table — таблицы (по умолчанию); json, ndjson, tsv — все бэкапы "
+                             "(с --ib — одной ИБ) потоком для мониторинга")
     parsed = parser.parse_args(args)
+
+    if parsed.format != "table":
+        if parsed.verify:
+            parser.error("--format не сочетается с --verify")
+        try:
+            return write_backups(parsed.format, parsed.ib, reindex=parsed.reindex)
+        except BrokenPipeError:
+            # Читатель закрыл канал (… | head): молча выходим, не роняя интерпретатор при сбросе stdout
+            import os
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 1
+
+    if parsed.verify:
+        if parsed.workers < 1 or parsed.io_limit < 0:
+            print("❌ --workers должен быть ≥ 1, --io-limit ≥ 0", file=sys.stderr)
+            return 1
+        from services.manifest_service import verify_manifests
+        try:
+            results = verify_manifests(parsed.ib, workers=parsed.workers, io_limit_mb_s=parsed.io_limit)
+        except Exception as e:
+            print(f"❌ Ошибка проверки бэкапов: {e}", file=sys.stderr)
+            return 1
+        return print_verify_results(results)
     
     try:
-        all_entries = [d.name for d in BACKUP_ROOT.glob("*") if d.is_dir()]
-        all_ibs = [name for name in all_entries if is_valid_ib(name)]
+        index = load_backup_index(reindex=parsed.reindex)
+        all_ibs = [name for name in index if is_valid_ib(name, index)]
     except Exception as e:
         print(f"❌ Ошибка чтения каталога бэкапов: {e}", file=sys.stderr)
         return 1
@@ -169,13 +328,13 @@ def main(args=None):
             print(f"❌ ИБ '{parsed.ib}' не найдена в {BACKUP_ROOT}", file=sys.stderr)
             print(f"   Доступные ИБ: {', '.join(sorted(all_ibs))}", file=sys.stderr)
             return 1
-        return print_detailed_backups(parsed.ib)
+        return print_detailed_backups(parsed.ib, index)
     
     if not all_ibs:
         print("⚠️  Нет валидных ИБ для отображения\n")
         return 0
     
-    print_summary_table(all_ibs)
+    print_summary_table(all_ibs, index)
     return 0
 
 if __name__ == "__main__":
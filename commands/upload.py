@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+upload.py — CLI-интерфейс выгрузки бэкапов в облако
+Вызывается через ib_1c upload ... (единая точка входа)
+Выгружаются только бэкапы, которых ещё нет в журнале выгрузок (services.upload_service).
+"""
+
+import sys
+import argparse
+from core.config import CLOUD_CHUNK_SIZE_MB, CLOUD_REMOTE, CLOUD_TRANSFERS
+
+
+def format_size(bytes_size: int) -> str:
+    if bytes_size == 0:
+        return "0B"
+    for unit in ["B", "K", "M", "G", "T"]:
+        if bytes_size < 1024:
+            return f"{bytes_size:.1f}{unit}"
+        bytes_size /= 1024
+    return f"{bytes_size:.1f}P"
+
+
+def _print_event(event, item, result):
+    if event != "upload_done":
+        return
+    name = f"{item['ib_name']}/{item['label']}"
+    if result["success"]:
+        print(f"   ☁️  {name}  {format_size(result['size_bytes']):>9}  за {result['seconds']:.0f}с "
+              f"({result['throughput_mb_s']:.1f} МБ/с)", flush=True)
+    else:
+        print(f"   ❌ {name}: {result['error']}", file=sys.stderr, flush=True)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Выгрузка новых бэкапов в облако (rclone) или в локальный каталог",
+        epilog=f"""Примеры:
+  ib_1c upload --all --dry-run
+  ib_1c upload --ib artel_2025 --transfers 2
+  ib_1c upload --all --remote /mnt/nas/1c_backups
+
+Удалённое хранилище по умолчанию — CLOUD_REMOTE ({CLOUD_REMOTE});
+что уже выгружено, помнит $BACKUP_ROOT/.upload_state.jsonl.
+""",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--ib", nargs="+", metavar="ИМЯ", help="Имя ИБ (можно несколько)")
+    group.add_argument("--all", action="store_true", help="Все ИБ каталога бэкапов")
+    parser.add_argument("--remote", default=None, metavar="REMOTE",
+                        help="rclone «имя:путь» или локальный каталог (по умолчанию CLOUD_REMOTE)")
+    parser.add_argument("--transfers", type=int, default=CLOUD_TRANSFERS, metavar="N",
+                        help=f"Бэкапов, выгружаемых одновременно (по умолчанию {CLOUD_TRANSFERS})")
+    parser.add_argument("--chunk-size", type=int, default=CLOUD_CHUNK_SIZE_MB, metavar="МБ",
+                        help=f"Размер части multipart-загрузки (по умолчанию {CLOUD_CHUNK_SIZE_MB})")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет выгружено")
+    parsed = parser.parse_args(args)
+
+    if parsed.transfers < 1 or parsed.chunk_size < 1:
+        parser.error("--transfers и --chunk-size должны быть ≥ 1")
+    remote = parsed.remote or CLOUD_REMOTE
+
+    from services.upload_service import Uploader, find_pending
+
+    try:
+        pending, skipped = find_pending(parsed.ib, remote)
+    except Exception as e:
+        print(f"❌ Ошибка чтения каталога бэкапов: {e}", file=sys.stderr)
+        return 1
+
+    print(f"\n☁️  Выгрузка в {remote}{' — СИМУЛЯЦИЯ' if parsed.dry_run else ''}")
+    print("=" * 70)
+    for backup in skipped:
+        print(f"   ⏭️  {backup['ib_name']}/{backup['label']}: пропущен ({backup['reason']})")
+    if not pending:
+        print("✅ Все бэкапы уже выгружены")
+        return 0
+    total = sum(item["size_bytes"] for item in pending)
+    print(f"ℹ️  К выгрузке: {len(pending)} бэкап(ов), {format_size(total)}")
+    if parsed.dry_run:
+        for item in pending:
+            print(f"   📦 {item['ib_name']}/{item['label']}  {item['artifact']}  {format_size(item['size_bytes']):>9}")
+        return 0
+
+    uploader = Uploader(remote, parsed.transfers, parsed.chunk_size, on_event=_print_event)
+    try:
+        for item in pending:
+            uploader.submit(item)
+        results = uploader.wait()
+    except KeyboardInterrupt:
+        print("\n⚠️  Операция прервана пользователем (выгруженное сохранено в журнале)", file=sys.stderr)
+        return 130
+
+    done = [r for r in results if r["success"]]
+    print("\n" + "=" * 70)
+    print(f"✅ Выгружено: {len(done)}/{len(results)} бэкап(ов), {format_size(sum(r['size_bytes'] for r in done))}")
+    failed = len(results) - len(done)
+    if failed:
+        print(f"❌ Не выгружено: {failed} (будут повторены при следующем запуске)", file=sys.stderr)
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
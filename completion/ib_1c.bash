@@ -0,0 +1,85 @@
+# completion/ib_1c.bash — автодополнение ib_1c для bash
+# Подключение: source /opt/1cv8/scripts/completion/ib_1c.bash
+#          или: ln -s /opt/1cv8/scripts/completion/ib_1c.bash /etc/bash_completion.d/ib_1c
+#
+# Только статические данные и файлы — Python не запускается:
+#   команды и флаги — из этого файла (сверка с commands/ — benchmarks/bench_startup.py),
+#   имена ИБ — из ib_list.conf, метки бэкапов — каталоги $BACKUP_ROOT/<ИБ>/.
+
+_IB_1C_SCRIPTS_DIR="${IB_1C_SCRIPTS_DIR:-/opt/1cv8/scripts}"
+
+_IB_1C_COMMANDS="backup daemon prune restore rm sessions storage upload"
+_IB_1C_FLAGS_backup="--format --ib --all --dry-run --plan --parallel --per-host --jobs --compress --level --dedup --no-dedup --make-room --no-make-room --upload --no-upload --stream-upload --no-stream-upload --bench-compress --help"
+_IB_1C_FLAGS_daemon="run status jobs cancel --socket --http --all --help"
+_IB_1C_FLAGS_prune="--ib --all --daily --weekly --monthly --min-verified --verbose --workers --io-limit --background --dry-run --confirm --help"
+_IB_1C_FLAGS_restore="--ib --timestamp --target-db --jobs --clean --dry-run --confirm --help"
+_IB_1C_FLAGS_rm="--ib --all --timestamp --older-than --dry-run --confirm --help"
+_IB_1C_FLAGS_sessions="--ib --idle-min --workers --refresh --verbose --dry-run --confirm --help"
+_IB_1C_FLAGS_storage="--ib --reindex --verify --workers --io-limit --format --help"
+_IB_1C_FLAGS_upload="--ib --all --remote --transfers --chunk-size --dry-run --help"
+
+_ib_1c_ib_names() {
+  local ib_file="$_IB_1C_SCRIPTS_DIR/ib_list.conf"
+  [[ -r "$ib_file" ]] || return 0
+  # Строки без комментариев и пустых
+  sed -e 's/#.*//' -e 's/[[:space:]]//g' -e '/^$/d' "$ib_file"
+}
+
+_ib_1c_timestamps() {
+  local ib_name="$1" dir
+  [[ -n "$ib_name" ]] || return 0
+  for dir in "${BACKUP_ROOT:-/var/backups/1c}/$ib_name"/20*_*/; do
+    [[ -d "$dir" ]] && basename "$dir"
+  done
+}
+
+_ib_1c() {
+  local cur prev command ib_name i
+  cur="${COMP_WORDS[COMP_CWORD]}"
+  prev="${COMP_WORDS[COMP_CWORD-1]}"
+
+  if [[ $COMP_CWORD -eq 1 ]]; then
+    COMPREPLY=($(compgen -W "$_IB_1C_COMMANDS --help" -- "$cur"))
+    return 0
+  fi
+
+  command="${COMP_WORDS[1]}"
+  # Первая ИБ после --ib — для дополнения --timestamp
+  for ((i = 2; i < COMP_CWORD; i++)); do
+    if [[ "${COMP_WORDS[i]}" == "--ib" ]]; then
+      ib_name="${COMP_WORDS[i+1]}"
+      break
+    fi
+  done
+
+  case "$prev" in
+    --format)
+      if [[ "$command" == "storage" ]]; then
+        COMPREPLY=($(compgen -W "table json ndjson tsv" -- "$cur"))
+      else
+        COMPREPLY=($(compgen -W "dump sql dir" -- "$cur"))
+      fi
+      return 0 ;;
+    --compress)  COMPREPLY=($(compgen -W "gzip pigz zstd none" -- "$cur")); return 0 ;;
+    --timestamp) COMPREPLY=($(compgen -W "$(_ib_1c_timestamps "$ib_name")" -- "$cur")); return 0 ;;
+    --bench-compress) COMPREPLY=($(compgen -f -- "$cur")); return 0 ;;
+    --parallel|--per-host|--jobs|--level|--workers|--io-limit|--older-than|--target-db) return 0 ;;
+    --daily|--weekly|--monthly|--min-verified|--transfers|--chunk-size|--idle-min) return 0 ;;
+    --remote) COMPREPLY=($(compgen -d -- "$cur")); return 0 ;;
+  esac
+
+  # --ib принимает несколько имён (backup, prune, rm, sessions, upload): дополняем ИБ, пока не начат новый флаг
+  if [[ "$cur" != -* ]]; then
+    for ((i = COMP_CWORD - 1; i >= 2; i--)); do
+      case "${COMP_WORDS[i]}" in
+        --ib) COMPREPLY=($(compgen -W "$(_ib_1c_ib_names)" -- "$cur")); return 0 ;;
+        -*) break ;;
+      esac
+    done
+  fi
+
+  local flags_var="_IB_1C_FLAGS_${command}"
+  COMPREPLY=($(compgen -W "${!flags_var}" -- "$cur"))
+}
+
+complete -F _ib_1c ib_1c
@@ -5,7 +5,7 @@
 
 import os
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -21,6 +21,75 @@ SCRIPTS_DIR = Path("/opt/1cv8/scripts/engines")
 LOG_FILE = Path("/var/log/1c_orchestrator.log")
 BACKUP_USER = os.getenv("BACKUP_USER", "usr1cv8")
 
+# === PostgreSQL / Parallel Backup Configuration ===
+PG_HOST = os.getenv("PG_HOST", "10.129.0.27")
+PG_PORT = os.getenv("PG_PORT", "5432")
+BACKUP_MAX_PARALLEL = int(os.getenv("BACKUP_MAX_PARALLEL", "4"))  # одновременных pg_dump всего
+BACKUP_MAX_PER_HOST = int(os.getenv("BACKUP_MAX_PER_HOST", "2"))  # одновременных pg_dump на один PG_HOST
+DUMP_JOBS_MAX = int(os.getenv("DUMP_JOBS_MAX", "8"))              # потолок pg_dump -j для формата dir
+DUMP_JOBS_GB_PER_JOB = 2                                          # один поток на каждые 2 ГБ данных
+SQL_COMPRESS = os.getenv("SQL_COMPRESS", "gzip")                  # кодек для --format sql: gzip, pigz, zstd, none
+BACKUP_DEDUP = os.getenv("BACKUP_DEDUP", "0") == "1"              # dump по умолчанию в дедуплицирующее хранилище
+SIZE_CACHE_TTL = int(os.getenv("SIZE_CACHE_TTL", "600"))          # кэш размеров баз ($BACKUP_ROOT/.db_sizes.json), с
+
+# === Backup History / Timeout Model (services/history_service.py) ===
+BACKUP_HISTORY_WINDOW = int(os.getenv("BACKUP_HISTORY_WINDOW", "20"))            # последних бэкапов ИБ в модели
+BACKUP_HISTORY_MIN_SAMPLES = int(os.getenv("BACKUP_HISTORY_MIN_SAMPLES", "3"))   # меньше — прежняя формула
+BACKUP_TIMEOUT_PERCENTILE = int(os.getenv("BACKUP_TIMEOUT_PERCENTILE", "10"))    # перцентиль скорости для таймаута
+BACKUP_TIMEOUT_MARGIN = float(os.getenv("BACKUP_TIMEOUT_MARGIN", "2.0"))         # множитель запаса таймаута
+BACKUP_TIMEOUT_HISTORY_MINIMUM = int(os.getenv("BACKUP_TIMEOUT_HISTORY_MINIMUM", "60"))  # минимум таймаута по истории, с
+
+# === Disk Space Admission (services/space_planner.py) ===
+SPACE_CHECK = os.getenv("SPACE_CHECK", "1") == "1"                          # допуск бэкапов по свободному месту
+SPACE_MIN_FREE_GB = float(os.getenv("SPACE_MIN_FREE_GB", "5"))              # неприкосновенный запас на диске, ГБ
+SPACE_MARGIN = float(os.getenv("SPACE_MARGIN", "1.2"))                      # множитель запаса к оценке артефакта
+SPACE_AUTO_PRUNE = os.getenv("SPACE_AUTO_PRUNE", "0") == "1"                # удалять самые старые бэкапы, если места нет
+SPACE_PRUNE_KEEP_LAST = int(os.getenv("SPACE_PRUNE_KEEP_LAST", "3"))        # бэкапов ИБ, которые ротация не трогает
+
+# === Retention (GFS, services/retention_service.py; по ИБ — retention.conf) ===
+RETENTION_DAILY = int(os.getenv("RETENTION_DAILY", "7"))                    # последних дней с бэкапом
+RETENTION_WEEKLY = int(os.getenv("RETENTION_WEEKLY", "4"))                  # последних недель
+RETENTION_MONTHLY = int(os.getenv("RETENTION_MONTHLY", "6"))                # последних месяцев
+RETENTION_MIN_VERIFIED = int(os.getenv("RETENTION_MIN_VERIFIED", "1"))      # проверенных бэкапов ИБ, которые не удаляются
+RETENTION_WORKERS = int(os.getenv("RETENTION_WORKERS", "2"))                # ИБ, чистящихся одновременно
+RETENTION_IO_LIMIT_MB_S = int(os.getenv("RETENTION_IO_LIMIT_MB_S", "1024"))  # общий бюджет удаления, МБ/с (0 — без лимита)
+
+# === Cloud Offload (services/upload_service.py, ib_1c upload) ===
+CLOUD_REMOTE = os.getenv("CLOUD_REMOTE", "mailru:1c_backups")          # rclone-удалённый «имя:путь» или локальный каталог
+CLOUD_TRANSFERS = int(os.getenv("CLOUD_TRANSFERS", "4"))               # артефактов, выгружаемых одновременно
+CLOUD_CHUNK_SIZE_MB = int(os.getenv("CLOUD_CHUNK_SIZE_MB", "64"))      # размер части multipart-загрузки, МБ
+CLOUD_UPLOAD_AFTER_BACKUP = os.getenv("CLOUD_UPLOAD_AFTER_BACKUP", "0") == "1"  # выгружать сразу после бэкапа
+CLOUD_MIN_SPEED_MB_S = float(os.getenv("CLOUD_MIN_SPEED_MB_S", "1"))   # для таймаута выгрузки: медленнее — ошибка
+CLOUD_STREAM = os.getenv("CLOUD_STREAM", "0") == "1"                    # выгружать потоком во время дампа (dump/sql)
+CLOUD_STREAM_BUFFER_MB = int(os.getenv("CLOUD_STREAM_BUFFER_MB", "256"))  # очередь потоковой выгрузки в памяти, МБ
+
+# === Daemon (ib_1c daemon: очередь заданий и API) ===
+DAEMON_SOCKET = os.getenv("DAEMON_SOCKET", "/run/ib_1c/daemon.sock")   # Unix-сокет API демона
+DAEMON_HTTP = os.getenv("DAEMON_HTTP", "")                              # «host:port» — ещё и HTTP по TCP (пусто — нет)
+DAEMON_TOKEN = os.getenv("DAEMON_TOKEN", "")                            # секрет API по TCP (Authorization: Bearer); без него TCP не слушается
+DAEMON_DB = Path(os.getenv("DAEMON_DB", str(BACKUP_ROOT / ".daemon.sqlite")))  # очередь заданий (SQLite)
+DAEMON_KEEP_DAYS = int(os.getenv("DAEMON_KEEP_DAYS", "30"))             # хранить завершённые задания и их вывод, дней
+
+# === 1C Cluster (services/rac_metadata.py) и сеансы (services/session_service.py; по ИБ — sessions.conf) ===
+RAC_PATH = os.getenv("RAC_PATH", "")                                   # путь к rac (пусто — /opt/1cv8/x86_64/<.version>/rac)
+RAS_HOST = os.getenv("RAS_HOST", "localhost:1545")                     # сервер администрирования (ras)
+RAC_CLUSTER = os.getenv("RAC_CLUSTER", "")                             # UUID кластера (пусто — первый из rac cluster list)
+RAC_CACHE_TTL = int(os.getenv("RAC_CACHE_TTL", "3600"))               # кэш кластеров и ИБ ($BACKUP_ROOT/.rac_cache.json), с
+RAC_IB_USER = os.getenv("RAC_IB_USER", "")                             # администратор ИБ для rac infobase info (база ИБ)
+RAC_IB_PWD = os.getenv("RAC_IB_PWD", "")
+SESSION_IDLE_MIN = int(os.getenv("SESSION_IDLE_MIN", "60"))            # простой сеанса, после которого он завершается, мин
+SESSION_WORKERS = int(os.getenv("SESSION_WORKERS", "8"))               # одновременных rac session terminate
+
+# === Verify Configuration (storage --verify) ===
+VERIFY_WORKERS = int(os.getenv("VERIFY_WORKERS", "4"))               # ИБ, проверяемых одновременно
+VERIFY_IO_LIMIT_MB_S = int(os.getenv("VERIFY_IO_LIMIT_MB_S", "200"))  # общий бюджет чтения, МБ/с (0 — без лимита)
+
+# === Metrics (core/metrics.py) ===
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_TEXTFILE = Path(os.getenv("METRICS_TEXTFILE", "/var/lib/prometheus/node-exporter/ib_1c.prom"))  # textfile node-exporter
+METRICS_HISTORY = Path(os.getenv("METRICS_HISTORY", "/var/log/1c-admin/metrics.jsonl"))               # журнал всех запусков
+METRICS_HISTORY_MAX_MB = int(os.getenv("METRICS_HISTORY_MAX_MB", "50"))                               # ротация журнала в .1
+
 
 # === Функции загрузки ===
 def load_version() -> str:
@@ -47,6 +116,94 @@ def load_ib_list() -> List[str]:
     return ib_list
 
 
+def load_ib_hosts() -> Dict[str, str]:
+    """Загрузить привязку ИБ к серверам PostgreSQL из ib_hosts.conf
+
+    Формат: «ИМЯ_ИБ ХОСТ» на строку, комментарии через #.
+    ИБ, не указанные в файле, живут на PG_HOST по умолчанию.
+    """
+    hosts_file = BASE_DIR / "ib_hosts.conf"
+    hosts = {}
+    try:
+        with open(hosts_file, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split("#", 1)[0].split()
+                if len(parts) >= 2:
+                    hosts[parts[0]] = parts[1]
+    except FileNotFoundError:
+        pass
+    return hosts
+
+
+def get_pg_host(ib_name: str) -> str:
+    """Сервер PostgreSQL, на котором лежит база ИБ"""
+    return load_ib_hosts().get(ib_name, PG_HOST)
+
+
+def load_retention_policies() -> Dict[str, Dict[str, int]]:
+    """Загрузить правила хранения по ИБ из retention.conf
+
+    Формат: «ИМЯ_ИБ DAILY WEEKLY MONTHLY [MIN_VERIFIED]» на строку, комментарии через #.
+    Строка с именем * задаёт правило по умолчанию вместо RETENTION_*.
+    """
+    policies_file = BASE_DIR / "retention.conf"
+    policies = {}
+    try:
+        with open(policies_file, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split("#", 1)[0].split()
+                if len(parts) < 4:
+                    continue
+                try:
+                    counts = [int(p) for p in parts[1:5]]
+                except ValueError:
+                    continue
+                policy = dict(zip(("daily", "weekly", "monthly", "min_verified"), counts))
+                policies[parts[0]] = policy
+    except FileNotFoundError:
+        pass
+    return policies
+
+
+def get_retention_policy(ib_name: str, policies: Optional[Dict[str, Dict[str, int]]] = None) -> Dict[str, int]:
+    """Правило хранения ИБ: retention.conf (строка ИБ, затем *), иначе RETENTION_*"""
+    policies = load_retention_policies() if policies is None else policies
+    policy = {
+        "daily": RETENTION_DAILY,
+        "weekly": RETENTION_WEEKLY,
+        "monthly": RETENTION_MONTHLY,
+        "min_verified": RETENTION_MIN_VERIFIED
+    }
+    policy.update(policies.get("*", {}))
+    policy.update(policies.get(ib_name, {}))
+    return policy
+
+
+def load_session_thresholds() -> Dict[str, int]:
+    """Загрузить пороги простоя сеансов по ИБ из sessions.conf
+
+    Формат: «ИМЯ_ИБ МИНУТ» на строку, комментарии через #.
+    Строка с именем * задаёт порог по умолчанию вместо SESSION_IDLE_MIN; 0 — сеансы ИБ не завершать.
+    """
+    thresholds_file = BASE_DIR / "sessions.conf"
+    thresholds = {}
+    try:
+        with open(thresholds_file, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split("#", 1)[0].split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    thresholds[parts[0]] = int(parts[1])
+    except FileNotFoundError:
+        pass
+    return thresholds
+
+
+def get_session_idle_min(ib_name: str, thresholds: Optional[Dict[str, int]] = None) -> int:
+    """Порог простоя сеансов ИБ, мин: sessions.conf (строка ИБ, затем *), иначе SESSION_IDLE_MIN"""
+    thresholds = load_session_thresholds() if thresholds is None else thresholds
+    return thresholds.get(ib_name, thresholds.get("*", SESSION_IDLE_MIN))
+
+
 def get_backup_dir(ib_name: str) -> Path:
     """Путь к директории бэкапов для ИБ"""
     return BACKUP_ROOT / ib_name
@@ -70,7 +227,57 @@ class Config:
     SCRIPTS_DIR = SCRIPTS_DIR
     LOG_FILE = LOG_FILE
     BACKUP_USER = BACKUP_USER
-    BACKUP_TIMEOUT_MINUTES_PER_GB = 5  # минут на каждый ГБ данных
+    PG_HOST = PG_HOST
+    PG_PORT = PG_PORT
+    BACKUP_MAX_PARALLEL = BACKUP_MAX_PARALLEL
+    BACKUP_MAX_PER_HOST = BACKUP_MAX_PER_HOST
+    DUMP_JOBS_MAX = DUMP_JOBS_MAX
+    DUMP_JOBS_GB_PER_JOB = DUMP_JOBS_GB_PER_JOB
+    SQL_COMPRESS = SQL_COMPRESS
+    BACKUP_DEDUP = BACKUP_DEDUP
+    SIZE_CACHE_TTL = SIZE_CACHE_TTL
+    SPACE_CHECK = SPACE_CHECK
+    SPACE_MIN_FREE_GB = SPACE_MIN_FREE_GB
+    SPACE_MARGIN = SPACE_MARGIN
+    SPACE_AUTO_PRUNE = SPACE_AUTO_PRUNE
+    SPACE_PRUNE_KEEP_LAST = SPACE_PRUNE_KEEP_LAST
+    RETENTION_DAILY = RETENTION_DAILY
+    RETENTION_WEEKLY = RETENTION_WEEKLY
+    RETENTION_MONTHLY = RETENTION_MONTHLY
+    RETENTION_MIN_VERIFIED = RETENTION_MIN_VERIFIED
+    RETENTION_WORKERS = RETENTION_WORKERS
+    RETENTION_IO_LIMIT_MB_S = RETENTION_IO_LIMIT_MB_S
+    CLOUD_REMOTE = CLOUD_REMOTE
+    CLOUD_TRANSFERS = CLOUD_TRANSFERS
+    CLOUD_CHUNK_SIZE_MB = CLOUD_CHUNK_SIZE_MB
+    CLOUD_UPLOAD_AFTER_BACKUP = CLOUD_UPLOAD_AFTER_BACKUP
+    CLOUD_MIN_SPEED_MB_S = CLOUD_MIN_SPEED_MB_S
+    CLOUD_STREAM = CLOUD_STREAM
+    CLOUD_STREAM_BUFFER_MB = CLOUD_STREAM_BUFFER_MB
+    DAEMON_SOCKET = DAEMON_SOCKET
+    DAEMON_HTTP = DAEMON_HTTP
+    DAEMON_TOKEN = DAEMON_TOKEN
+    DAEMON_DB = DAEMON_DB
+    DAEMON_KEEP_DAYS = DAEMON_KEEP_DAYS
+    RAC_PATH = RAC_PATH
+    RAS_HOST = RAS_HOST
+    RAC_CLUSTER = RAC_CLUSTER
+    RAC_CACHE_TTL = RAC_CACHE_TTL
+    RAC_IB_USER = RAC_IB_USER
+    RAC_IB_PWD = RAC_IB_PWD
+    SESSION_IDLE_MIN = SESSION_IDLE_MIN
+    SESSION_WORKERS = SESSION_WORKERS
+    VERIFY_WORKERS = VERIFY_WORKERS
+    VERIFY_IO_LIMIT_MB_S = VERIFY_IO_LIMIT_MB_S
+    BACKUP_HISTORY_WINDOW = BACKUP_HISTORY_WINDOW
+    BACKUP_HISTORY_MIN_SAMPLES = BACKUP_HISTORY_MIN_SAMPLES
+    BACKUP_TIMEOUT_PERCENTILE = BACKUP_TIMEOUT_PERCENTILE
+    BACKUP_TIMEOUT_MARGIN = BACKUP_TIMEOUT_MARGIN
+    BACKUP_TIMEOUT_HISTORY_MINIMUM = BACKUP_TIMEOUT_HISTORY_MINIMUM
+    METRICS_ENABLED = METRICS_ENABLED
+    METRICS_TEXTFILE = METRICS_TEXTFILE
+    METRICS_HISTORY = METRICS_HISTORY
+    BACKUP_TIMEOUT_MINUTES_PER_GB = 5  # минут на каждый ГБ данных (без истории)
     BACKUP_TIMEOUT_MINIMUM = 300  # минимум 5 минут даже для маленьких ИБ
     
     @classmethod
@@ -2,110 +2,388 @@
 """
 Универсальный запуск bash-скриптов из engines/
 Поддерживает как захват вывода (для парсинга), так и потоковый вывод (для прогресса).
+
+Основа — asyncio (run_engine_async): построчная передача stdout/stderr в колбэки,
+несколько движков одновременно (run_engines_async), при таймауте или отмене (Ctrl+C)
+завершается вся группа процессов — вместе с pg_dump за sudo/script.
+Синхронный run_engine — тонкая обёртка над run_engine_async.
 """
 
-from pathlib import Path
+import asyncio
+import os
+import shlex
+import signal
 import subprocess
 import sys
-from typing import List, Dict, Optional
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from core.metrics import record_engine
 
 SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "engines"
 
+# Сколько ждать выхода после SIGTERM, прежде чем послать SIGKILL
+KILL_GRACE_SECONDS = 10
 
-def run_engine(
+# Сколько дочитывать вывод после выхода скрипта (если потомок держит трубу открытой)
+DRAIN_SECONDS = 5
+
+# Строка длиннее — передаётся в колбэк частями (прогресс без перевода строки)
+MAX_LINE_BYTES = 64 * 1024
+
+LineCallback = Callable[[str], None]
+
+# Запущенные движки: pid лидера группы → имя скрипта (для terminate_engines)
+_running: Dict[int, str] = {}
+_running_lock = threading.Lock()
+
+
+def _build_command(script_path: Path, args: List[str], user: Optional[str], tty: bool) -> List[str]:
+    """Команда запуска: sudo -u user, при выводе в терминал — в обёртке script"""
+    cmd = []
+    if user:
+        cmd.extend(["sudo", "-u", user])
+    cmd.extend([str(script_path)] + args)
+    if user and tty:
+        # При смене пользователя — оборачиваем в `script` для изолированного TTY
+        # (иначе `pv` получит [Errno 1] из-за отсутствия прав на терминал владельца)
+        cmd = ["script", "-q", "-c", shlex.join(cmd), "/dev/null"]
+    return cmd
+
+
+def _descendants(pid: int) -> List[int]:
+    """Все потомки процесса по /proc — в том числе ушедшие в свою сессию (script → pty)"""
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Поле comm в скобках может содержать пробелы — ppid идёт сразу после ')'
+        ppid = int(stat[stat.rindex(b")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def _signal_tree(pid: int, sig: int) -> None:
+    """Послать сигнал группе процессов движка и всем его потомкам"""
+    targets = _descendants(pid)
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+    for child in targets:
+        try:
+            os.kill(child, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def terminate_engines(sig: int = signal.SIGTERM) -> int:
+    """
+    Завершить все запущенные движки (группы процессов) этого процесса.
+
+    Нужна потокам-исполнителям (BackupScheduler): Ctrl+C получает только главный поток,
+    а движки работают в своих сессиях и сигнал терминала до них не доходит.
+    Возвращает число затронутых движков.
+    """
+    with _running_lock:
+        pids = list(_running)
+    for pid in pids:
+        _signal_tree(pid, sig)
+    return len(pids)
+
+
+async def _wait_process(pid: int):
+    """Дождаться выхода процесса без блокировки цикла: (status, rusage) из os.wait4"""
+    loop = asyncio.get_running_loop()
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        # Нет pidfd (старое ядро) — блокирующий wait4 в пуле потоков
+        _, status, usage = await loop.run_in_executor(None, os.wait4, pid, 0)
+        return status, usage
+    exited = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+    try:
+        await exited
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+    _, status, usage = os.wait4(pid, 0)
+    return status, usage
+
+
+async def _pump(pipe, callback: Optional[LineCallback], sink: Optional[List[str]]) -> None:
+    """Читать трубу построчно: каждая строка — в колбэк и (при захвате) в буфер"""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=MAX_LINE_BYTES)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+
+    def emit(data: bytes) -> None:
+        text = data.decode("utf-8", errors="replace")
+        if sink is not None:
+            sink.append(text)
+        if callback:
+            callback(text.rstrip("\n"))
+
+    while True:
+        try:
+            line = await reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                emit(e.partial)
+            return
+        except asyncio.LimitOverrunError as e:
+            line = await reader.readexactly(e.consumed)
+        emit(line)
+
+
+async def _terminate(pid: int, waiter: asyncio.Future) -> None:
+    """SIGTERM всему дереву движка, через KILL_GRACE_SECONDS — SIGKILL"""
+    _signal_tree(pid, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(asyncio.shield(waiter), KILL_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        _signal_tree(pid, signal.SIGKILL)
+
+
+def _result(success: bool, returncode: int, stdout: str = "", stderr: str = "",
+            timed_out: bool = False, wall: float = 0.0, usage=None,
+            script_name: str = "", ib_name: Optional[str] = None) -> Dict[str, any]:
+    return {
+        "success": success,
+        "returncode": returncode,
+        "stdout": stdout,
+        "stderr": stderr,
+        "timed_out": timed_out,
+        "wall_seconds": wall,
+        "user_seconds": usage.ru_utime if usage else 0.0,
+        "sys_seconds": usage.ru_stime if usage else 0.0,
+        "script": script_name,
+        "ib_name": ib_name
+    }
+
+
+async def _run_engine_async(
     script_name: str,
     args: List[str],
     timeout: int = 300,
     user: Optional[str] = None,
-    capture_output: bool = True
+    capture_output: bool = True,
+    on_stdout: Optional[LineCallback] = None,
+    on_stderr: Optional[LineCallback] = None,
+    ib_name: Optional[str] = None,
+    input_text: Optional[str] = None
 ) -> Dict[str, any]:
     """
-    Выполнить bash-скрипт из engines/
-    
+    Выполнить bash-скрипт из engines/ (asyncio).
+
     Args:
         script_name: имя скрипта (например, 'backup.sh')
         args: аргументы для скрипта
         timeout: таймаут выполнения в секундах
         user: пользователь для выполнения (если требуется)
-        capture_output: True — захватить вывод для парсинга
-                        False — проксировать вывод напрямую в терминал (для прогресса)
-    
+        capture_output: True — накопить вывод в stdout/stderr результата
+                        False — не накапливать; без колбэков вывод идёт прямо в терминал
+        on_stdout, on_stderr: колбэки, получают вывод построчно по мере появления
+        ib_name: имя ИБ, над которой работает движок (для сообщений и результата)
+        input_text: данные для stdin скрипта (например, список целей rm.sh --stdin)
+
     Returns:
-        dict с ключами: returncode, stdout, stderr, success
+        dict с ключами: returncode, stdout, stderr, success, timed_out,
+        wall_seconds, user_seconds, sys_seconds (процессорное время всего дерева процессов),
+        script, ib_name
+
+    При отмене задачи (Ctrl+C в asyncio.run) группа процессов завершается,
+    CancelledError пробрасывается дальше.
     """
     script_path = SCRIPTS_DIR / script_name
-    
     if not script_path.exists():
-        return {
-            "success": False,
-            "returncode": -1,
-            "stdout": "",
-            "stderr": f"Скрипт не найден: {script_path}"
-        }
-    
-    # Формирование команды
-    cmd = []
-    if user:
-        cmd.extend(["sudo", "-u", user])
-    cmd.extend([str(script_path)] + args)
-    
+        return _result(False, -1, stderr=f"Скрипт не найден: {script_path}",
+                       script_name=script_name, ib_name=ib_name)
+
+    if not capture_output:
+        # sys.stdout/stderr подменены (задание ib_1c daemon) — вывод движка туда же, построчно
+        if on_stdout is None and sys.stdout is not sys.__stdout__:
+            on_stdout = lambda line, out=sys.stdout: print(line, file=out, flush=True)
+        if on_stderr is None and sys.stderr is not sys.__stderr__:
+            on_stderr = lambda line, err=sys.stderr: print(line, file=err, flush=True)
+
+    # Поток без захвата и без колбэка не перехватывается — идёт прямо в терминал
+    pipe_out = capture_output or on_stdout is not None
+    pipe_err = capture_output or on_stderr is not None
+    piped = pipe_out or pipe_err
+    cmd = _build_command(script_path, args, user, tty=not piped)
+    out_lines: Optional[List[str]] = [] if capture_output else None
+    err_lines: Optional[List[str]] = [] if capture_output else None
+
+    stdin = subprocess.DEVNULL if piped else None
+    if input_text is not None:
+        # Через временный файл, а не трубу: запись не ждёт, пока скрипт прочитает, и не мешает выводу
+        stdin = tempfile.TemporaryFile()
+        stdin.write(input_text.encode("utf-8"))
+        stdin.seek(0)
+
+    started = time.monotonic()
+    try:
+        # Своя сессия = своя группа процессов: сигнал группе доходит до sudo, bash и pg_dump
+        process = subprocess.Popen(
+            cmd,
+            cwd=SCRIPTS_DIR,
+            stdin=stdin,
+            stdout=subprocess.PIPE if pipe_out else None,
+            stderr=subprocess.PIPE if pipe_err else None,
+            start_new_session=True
+        )
+    except OSError as e:
+        return _result(False, -1, stderr=str(e), script_name=script_name, ib_name=ib_name)
+    finally:
+        if input_text is not None:
+            stdin.close()
+
+    with _running_lock:
+        _running[process.pid] = script_name
+
+    pumps = []
+    if pipe_out:
+        pumps.append(asyncio.ensure_future(_pump(process.stdout, on_stdout, out_lines)))
+    if pipe_err:
+        pumps.append(asyncio.ensure_future(_pump(process.stderr, on_stderr, err_lines)))
+    waiter = asyncio.ensure_future(_wait_process(process.pid))
+    timed_out = False
+    try:
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            await _terminate(process.pid, waiter)
+        except asyncio.CancelledError:
+            await _terminate(process.pid, waiter)
+            raise
+        status, usage = await waiter
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if pumps:
+            # Потомок (например, фоновая очистка) может держать трубу — не ждём его вечно
+            _, stuck = await asyncio.wait(pumps, timeout=DRAIN_SECONDS)
+            for pump in stuck:
+                pump.cancel()
+    finally:
+        with _running_lock:
+            _running.pop(process.pid, None)
+        for pump in pumps:
+            pump.cancel()
+        if process.returncode is None and waiter.done() and not waiter.cancelled():
+            process.returncode = os.waitstatus_to_exitcode(waiter.result()[0])
+        for pipe in (process.stdout, process.stderr):
+            if pipe:
+                pipe.close()
+
+    wall = time.monotonic() - started
+    stdout = "".join(out_lines) if out_lines is not None else ""
+    stderr = "".join(err_lines) if err_lines is not None else ""
+    if timed_out:
+        target = f" (ИБ «{ib_name}»)" if ib_name else ""
+        stderr = (f"⏱️ Таймаут: {script_name}{target} не завершился за {timeout} с — "
+                  f"группа процессов остановлена\n" + stderr)
+    return _result(process.returncode == 0 and not timed_out, process.returncode,
+                   stdout, stderr, timed_out, wall, usage, script_name, ib_name)
+
+
+async def run_engine_async(
+    script_name: str,
+    args: List[str],
+    timeout: int = 300,
+    user: Optional[str] = None,
+    capture_output: bool = True,
+    on_stdout: Optional[LineCallback] = None,
+    on_stderr: Optional[LineCallback] = None,
+    ib_name: Optional[str] = None,
+    input_text: Optional[str] = None
+) -> Dict[str, any]:
+    """Выполнить движок (см. _run_engine_async) и записать метрики запуска (core.metrics)"""
+    result = await _run_engine_async(script_name, args, timeout, user, capture_output,
+                                     on_stdout, on_stderr, ib_name, input_text)
+    record_engine(result, timeout)
+    return result
+
+
+async def run_engines_async(runs: List[Dict[str, any]],
+                            max_parallel: Optional[int] = None) -> List[Dict[str, any]]:
+    """
+    Выполнить несколько движков одновременно (не более max_parallel сразу).
+
+    runs — список dict с аргументами run_engine_async (script_name, args, timeout, ...).
+    Результаты — в порядке runs. Отмена прерывает все запущенные движки.
+    """
+    limit = asyncio.Semaphore(max(1, max_parallel or len(runs) or 1))
+
+    async def run_one(run: Dict[str, any]) -> Dict[str, any]:
+        async with limit:
+            return await run_engine_async(**run)
+
+    return list(await asyncio.gather(*(run_one(run) for run in runs)))
+
+
+def _run_sync(coro):
+    """asyncio.run, в том числе из потока, где уже крутится цикл событий"""
     try:
-        if capture_output:
-            # Режим захвата вывода (для парсинга: disk_usage, list_backups)
-            result = subprocess.run(
-                cmd,
-                cwd=SCRIPTS_DIR,
-                capture_output=True,
-                text=True,
-                timeout=timeout
-            )
-            return {
-                "success": result.returncode == 0,
-                "returncode": result.returncode,
-                "stdout": result.stdout,
-                "stderr": result.stderr
-            }
-        else:
-            # Режим потокового вывода (для прогресса: backup, rm больших файлов)
-            # При смене пользователя — оборачиваем в `script` для изолированного TTY
-            # (иначе `pv` получит [Errno 1] из-за отсутствия прав на терминал владельца)
-            if user:
-                cmd_str = ' '.join(cmd)
-                cmd_wrapper = ['script', '-q', '-c', cmd_str, '/dev/null']
-                process = subprocess.Popen(
-                    cmd_wrapper,
-                    cwd=SCRIPTS_DIR,
-                    stdout=sys.stdout,
-                    stderr=sys.stderr
-                )
-            else:
-                process = subprocess.Popen(
-                    cmd,
-                    cwd=SCRIPTS_DIR,
-                    stdout=sys.stdout,
-                    stderr=sys.stderr
-                )
-            try:
-                process.wait(timeout=timeout)
-                return {
-                    "success": process.returncode == 0,
-                    "returncode": process.returncode,
-                    "stdout": "",
-                    "stderr": ""
-                }
-            except subprocess.TimeoutExpired:
-                process.kill()
-                # Пробрасываем кастомное исключение — оно будет обработано в backup_service.py
-                from core.exceptions import BackupTimeoutError
-                raise BackupTimeoutError(
-                    ib_name=script_name.replace('.sh', ''),  # Упрощённо — в реальности нужно передавать имя ИБ
-                    timeout_seconds=timeout
-                )
-    
-    except Exception as e:
-        return {
-            "success": False,
-            "returncode": -1,
-            "stdout": "",
-            "stderr": str(e)
-        }
\ No newline at end of file
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+def run_engine(
+    script_name: str,
+    args: List[str],
+    timeout: int = 300,
+    user: Optional[str] = None,
+    capture_output: bool = True,
+    on_stdout: Optional[LineCallback] = None,
+    on_stderr: Optional[LineCallback] = None,
+    ib_name: Optional[str] = None,
+    input_text: Optional[str] = None
+) -> Dict[str, any]:
+    """
+    Выполнить bash-скрипт из engines/ (синхронная обёртка над run_engine_async)
+
+    Args:
+        script_name: имя скрипта (например, 'backup.sh')
+        args: аргументы для скрипта
+        timeout: таймаут выполнения в секундах
+        user: пользователь для выполнения (если требуется)
+        capture_output: True — захватить вывод для парсинга
+                        False — проксировать вывод напрямую в терминал (для прогресса)
+        on_stdout, on_stderr: построчные колбэки вывода
+        ib_name: имя ИБ (попадает в сообщение о таймауте и в результат)
+        input_text: данные для stdin скрипта
+
+    Returns:
+        dict с ключами: returncode, stdout, stderr, success, timed_out,
+        wall_seconds, user_seconds, sys_seconds
+    """
+    return _run_sync(run_engine_async(script_name, args, timeout, user, capture_output,
+                                      on_stdout, on_stderr, ib_name, input_text))
+
+
+def run_engines(runs: List[Dict[str, any]], max_parallel: Optional[int] = None) -> List[Dict[str, any]]:
+    """Синхронная обёртка над run_engines_async"""
+    return _run_sync(run_engines_async(runs, max_parallel))
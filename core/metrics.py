@@ -0,0 +1,235 @@
+# core/metrics.py
+"""
+Метрики операций: длительность, код выхода, записанные байты, скорость,
+размер ИБ, свободное место до и после.
+
+Каждая запись дописывается в журнал METRICS_HISTORY (JSON lines), а последние
+значения и счётчики запусков — в textfile для node-exporter (METRICS_TEXTFILE),
+который переписывается атомарно (временный файл + os.replace).
+
+Виды записей (kind):
+  command   — команда ib_1c целиком (orchestrator.py)
+  operation — операция над ИБ (бэкап, удаление)
+  engine    — каждый запуск движка через core.engine.run_engine_async
+Ошибки записи метрик никогда не прерывают саму операцию.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from core.config import (
+    BACKUP_ROOT, METRICS_ENABLED, METRICS_HISTORY, METRICS_HISTORY_MAX_MB, METRICS_TEXTFILE
+)
+
+PREFIX = "ib1c"
+
+# Поле записи → (имя gauge без префикса вида, описание, множитель)
+GAUGES = {
+    "duration_sec": ("last_duration_seconds", "Длительность последнего запуска, с", 1),
+    "exit_code": ("last_exit_code", "Код выхода последнего запуска", 1),
+    "bytes_written": ("last_bytes_written", "Записано байт последним запуском", 1),
+    "bytes_freed": ("last_bytes_freed", "Освобождено байт последним запуском", 1),
+    "throughput_mb_s": ("last_throughput_bytes_per_second", "Скорость записи последнего запуска, байт/с", 1024 * 1024),
+    "ib_size_bytes": ("last_ib_size_bytes", "Размер базы ИБ при последнем запуске, байт", 1),
+    "queue_sec": ("last_queue_seconds", "Ожидание в очереди перед последним запуском, с", 1),
+    "cpu_sec": ("last_cpu_seconds", "Процессорное время последнего запуска (всё дерево процессов), с", 1),
+    "disk_free_before": ("last_disk_free_before_bytes", "Свободно на диске бэкапов до запуска, байт", 1),
+    "disk_free_after": ("last_disk_free_after_bytes", "Свободно на диске бэкапов после запуска, байт", 1),
+    "finished_at": ("last_run_timestamp_seconds", "Время окончания последнего запуска (unix)", 1),
+}
+
+# Метки серий для каждого вида записей
+LABELS = {
+    "command": ("command",),
+    "operation": ("operation", "ib"),
+    "engine": ("script", "ib"),
+}
+
+_lock = threading.Lock()
+
+
+def disk_free(path: Optional[Path] = None) -> Optional[int]:
+    """Свободное место (байт, доступно непривилегированному пользователю) на разделе path"""
+    try:
+        st = os.statvfs(path or BACKUP_ROOT)
+    except OSError:
+        return None
+    return st.f_bavail * st.f_frsize
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(labels: Dict[str, str], **extra: str) -> str:
+    """Метки серии в формате Prometheus: {a="1",b="2"}"""
+    pairs = dict(labels, **extra)
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs.items()) + "}"
+
+
+def _state_path() -> Path:
+    return METRICS_HISTORY.with_name(METRICS_HISTORY.stem + ".state.json")
+
+
+def _load_state() -> Dict[str, Dict]:
+    try:
+        with open(_state_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def _update_state(state: Dict[str, Dict], entry: Dict) -> None:
+    """Последние значения gauge и счётчики запусков/таймаутов по серии записи"""
+    kind = entry["kind"]
+    labels = {name: entry.get(name) or "" for name in LABELS[kind]}
+    series = _series(labels)
+    families = state.setdefault("families", {})
+
+    def put(name: str, help_text: str, metric_type: str, key: str, value: float, add: bool = False):
+        family = families.setdefault(f"{PREFIX}_{kind}_{name}", {"help": help_text, "type": metric_type, "series": {}})
+        family["series"][key] = (family["series"].get(key, 0) + value) if add else value
+
+    for field, (name, help_text, scale) in GAUGES.items():
+        if entry.get(field) is not None:
+            put(name, help_text, "gauge", series, entry[field] * scale)
+
+    result = "ok" if entry.get("exit_code") == 0 else "error"
+    put("runs_total", "Запусков всего (result — ok/error)", "counter", _series(labels, result=result), 1, add=True)
+    if entry.get("timed_out"):
+        put("timeouts_total", "Запусков, прерванных по таймауту", "counter", series, 1, add=True)
+
+
+def _render(state: Dict[str, Dict]) -> str:
+    lines = []
+    for name, family in sorted(state.get("families", {}).items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for series, value in sorted(family["series"].items()):
+            lines.append(f"{name}{series} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _rotate_history() -> None:
+    """Журнал больше METRICS_HISTORY_MAX_MB — переименовать в .1 (предыдущий .1 удаляется)"""
+    try:
+        if METRICS_HISTORY.stat().st_size > METRICS_HISTORY_MAX_MB * 1024 * 1024:
+            os.replace(METRICS_HISTORY, METRICS_HISTORY.with_name(METRICS_HISTORY.name + ".1"))
+    except OSError:
+        pass
+
+
+def record(kind: str, **fields) -> Optional[Dict]:
+    """
+    Записать метрики одного запуска: строка в журнал + обновление textfile.
+
+    kind — command, operation или engine (см. LABELS); fields — метки и значения
+    (поля из GAUGES попадают в Prometheus, остальные — только в журнал).
+    Возвращает записанную запись (None — метрики выключены).
+    """
+    if not METRICS_ENABLED:
+        return None
+    entry = {"at": int(time.time()), "kind": kind}
+    entry.update({k: v for k, v in fields.items() if v is not None})
+    entry.setdefault("finished_at", entry["at"])
+
+    try:
+        with _lock:
+            METRICS_HISTORY.parent.mkdir(parents=True, exist_ok=True)
+            with open(METRICS_HISTORY.with_name(METRICS_HISTORY.name + ".lock"), "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    _rotate_history()
+                    with open(METRICS_HISTORY, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+                    state = _load_state()
+                    _update_state(state, entry)
+                    _atomic_write(_state_path(), json.dumps(state, ensure_ascii=False))
+                    # Каталог textfile-коллектора нет — node-exporter не установлен
+                    if METRICS_TEXTFILE.parent.is_dir():
+                        _atomic_write(METRICS_TEXTFILE, _render(state))
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+    except OSError:
+        pass
+    return entry
+
+
+def record_engine(result: Dict[str, any], timeout: Optional[int] = None) -> None:
+    """Метрики запуска движка по результату run_engine_async"""
+    record(
+        "engine",
+        script=result.get("script"),
+        ib=result.get("ib_name"),
+        exit_code=result.get("returncode"),
+        duration_sec=round(result.get("wall_seconds", 0.0), 3),
+        cpu_sec=round(result.get("user_seconds", 0.0) + result.get("sys_seconds", 0.0), 3),
+        timed_out=result.get("timed_out", False),
+        timeout=timeout
+    )
+
+
+class Operation:
+    """
+    Замер операции: with track("command", command="backup") as op: ...; op.set(exit_code=rc)
+
+    На входе — свободное место, на выходе — длительность, свободное место после,
+    скорость (если задан bytes_written). Без явного exit_code: 0, при исключении — 1
+    (130 при Ctrl+C). enabled=False — замер без записи (например, для --dry-run).
+    """
+
+    def __init__(self, kind: str, path: Optional[Path] = None, enabled: bool = True, **fields):
+        self.kind = kind
+        self.path = path
+        self.enabled = enabled
+        self.fields = dict(fields)
+
+    def set(self, **fields) -> None:
+        self.fields.update(fields)
+
+    def __enter__(self) -> "Operation":
+        self.started = time.monotonic()
+        self.fields["disk_free_before"] = disk_free(self.path)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if not self.enabled:
+            return False
+        duration = time.monotonic() - self.started
+        if "exit_code" not in self.fields:
+            if exc_type is None:
+                self.fields["exit_code"] = 0
+            elif issubclass(exc_type, SystemExit):
+                # sys.exit / parser.error внутри команды
+                code = exc.code if exc is not None else 1
+                self.fields["exit_code"] = code if isinstance(code, int) else (0 if code is None else 1)
+            else:
+                self.fields["exit_code"] = 130 if issubclass(exc_type, KeyboardInterrupt) else 1
+        self.fields["duration_sec"] = round(duration, 3)
+        self.fields["disk_free_after"] = disk_free(self.path)
+        written = self.fields.get("bytes_written")
+        if written and duration > 0:
+            self.fields["throughput_mb_s"] = round(written / 1024 / 1024 / duration, 2)
+        try:
+            record(self.kind, **self.fields)
+        except Exception:
+            pass  # Метрики не должны маскировать исход операции
+        return False
+
+
+def track(kind: str, path: Optional[Path] = None, enabled: bool = True, **fields) -> Operation:
+    """Контекстный менеджер замера операции (см. Operation)"""
+    return Operation(kind, path, enabled, **fields)
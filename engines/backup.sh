@@ -1,6 +1,9 @@
 #!/bin/bash
 # /opt/1cv8/scripts/engines/backup.sh
 # Создание бэкапа ИБ через pg_dump (удалённое подключение к 10.129.0.27)
+# Форматы: dump (-Fc), dir (-Fd -j N, каталог backup.dir), sql (.sql.gz / .sql.zst / .sql)
+# --dedup (только dump): куски в <ИБ>/.chunks, в каталоге метки — индекс backup.dump.idx
+# --stream-to REMOTE (dump/sql): выгрузка в облако тем же проходом, что и запись на диск
 set -euo pipefail
 
 # === Определение директории скрипта ===
@@ -8,21 +11,132 @@ SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 CONFIG_PATH="$SCRIPT_DIR/config/db_config.sh"
 [[ -f "$CONFIG_PATH" ]] || { echo "❌ Конфиг не найден: $CONFIG_PATH" >&2; exit 1; }
 source "$CONFIG_PATH"
+source "$SCRIPT_DIR/catalog.sh"
+source "$SCRIPT_DIR/dedup.sh"
 
 # === Явные пути к утилитам PostgreSQL 15 ===
-PG_DUMP="/usr/lib/postgresql/15/bin/pg_dump"
-PSQL="/usr/lib/postgresql/15/bin/psql"
+# Переопределяются в db_config.sh или окружении (benchmarks/fake_pg_dump.py — замеры без СУБД)
+PG_DUMP="${PG_DUMP:-/usr/lib/postgresql/15/bin/pg_dump}"
+PSQL="${PSQL:-/usr/lib/postgresql/15/bin/psql}"
 
 # === Логирование ===
 log() {
   echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1"
 }
 
+# === Запись артефакта с контрольной суммой «на лету» ===
+# tee пишет поток в файл и одновременно отдаёт копию в b2sum (BLAKE2b-512):
+# хэш готов к концу дампа, повторно читать файл с диска не нужно
+# С --stream-to поток за тот же проход уходит и в удалённое хранилище (stream_upload.py):
+# локальная запись облако не ждёт, отставшая выгрузка догоняет из артефакта,
+# а fanout возвращается по концу локальной записи — выгрузка доходит в фоне
+write_artifact() {
+  local artifact="$1"
+  if [[ -n "$STREAM_TO" ]]; then
+    python3 "$STREAM_UPLOAD_PY" fanout --artifact "$artifact" --hash-file "$BACKUP_DIR/.hash" \
+      --remote "$STREAM_TO" --path "$IB_NAME/$TIMESTAMP/$(basename "$artifact")" \
+      --buffer-mb "$STREAM_BUFFER_MB" --status-file "$BACKUP_DIR/.stream"
+    return
+  fi
+  tee "$artifact" | b2sum | cut -d' ' -f1 > "$BACKUP_DIR/.hash"
+}
+
+# === manifest.json рядом с артефактом: размер, хэш, длительность, скорость ===
+write_manifest() {
+  local artifact="$1"
+  local end size hash duration throughput listing files_json="" stream_json=""
+  end=$(date +%s.%N)
+
+  if [[ "$artifact" == *.idx ]]; then
+    # Индекс дедупликации: размер — логический (из заголовка), хэш — самого индекса
+    size=$(head -n 1 "$artifact" | sed -n 's/.*"size_bytes":\([0-9]*\).*/\1/p')
+    size="${size:-0}"
+    hash=$(b2sum "$artifact" | cut -d' ' -f1)
+  elif [[ -d "$artifact" ]]; then
+    # pg_dump -Fd пишет файлы сам — хэши каталога считаются после дампа (повторное чтение)
+    size=$(find "$artifact" -type f -printf '%s\n' 2>/dev/null | awk '{s+=$1} END {printf "%.0f\n", s}')
+    listing=$(dir_listing "$artifact")
+    # Хэш каталога — хэш от отсортированного списка «хэш имя» его файлов
+    hash=$(printf '%s\n' "$listing" | b2sum | cut -d' ' -f1)
+    files_json=$(while read -r file_hash file_name; do
+        printf ',\n    "%s": {"size": %s, "hash": "%s"}' \
+          "$(_catalog_json_str "$file_name")" "$(stat -c %s "$artifact/$file_name")" "$file_hash"
+      done <<< "$listing")
+    files_json=",
+  \"files\": {${files_json#,}
+  }"
+  else
+    size=$(stat -c %s "$artifact" 2>/dev/null || echo "0")
+    hash=$(cat "$BACKUP_DIR/.hash" 2>/dev/null || echo "")
+  fi
+  rm -f "$BACKUP_DIR/.hash"
+  # Выгрузка потоком ещё идёт (её процесс отделён от backup.sh): итог — streamed_to
+  # или stream_error — stream_upload.py пишет в .stream_status, манифест не трогает
+  if [[ -f "$BACKUP_DIR/.stream" ]]; then
+    local stream_remote stream_pid
+    { read -r stream_remote; read -r stream_pid || true; } < "$BACKUP_DIR/.stream"
+    [[ "$stream_pid" =~ ^[0-9]+$ ]] || stream_pid=0
+    stream_json=",
+  \"streaming_to\": \"$(_catalog_json_str "$stream_remote")\",
+  \"stream_pid\": $stream_pid"
+    rm -f "$BACKUP_DIR/.stream"
+  fi
+
+  duration=$(awk -v s="$START_TS" -v e="$end" 'BEGIN {printf "%.3f", e - s}')
+  throughput=$(awk -v b="$size" -v d="$duration" 'BEGIN {printf "%.2f", (d > 0 ? b / 1048576 / d : 0)}')
+
+  # Через временный файл и mv: читатели (upload, storage --verify) не видят половину манифеста
+  cat > "$BACKUP_DIR/.manifest.json.tmp" <<MANIFEST
+{
+  "ib_name": "$(_catalog_json_str "$IB_NAME")",
+  "timestamp": "$TIMESTAMP",
+  "format": "$FORMAT",
+  "artifact": "$(basename "$artifact")",
+  "size_bytes": $size,
+  "hash_algo": "blake2b",
+  "hash": "$hash",
+  "started_at": ${START_TS%.*},
+  "duration_sec": $duration,
+  "throughput_mb_s": $throughput$files_json$stream_json
+}
+MANIFEST
+  mv -f "$BACKUP_DIR/.manifest.json.tmp" "$BACKUP_DIR/manifest.json"
+}
+
+# === Завершение: манифест, запись в каталог бэкапов, выход ===
+finish_backup() {
+  local artifact="$1"
+  local size
+  write_manifest "$artifact"
+  rm -f "$BACKUP_DIR/.run_id"
+  size=$(du -sh "$artifact" 2>/dev/null | cut -f1 || echo "N/A")
+  catalog_add "$IB_NAME" "$TIMESTAMP" "$artifact"
+  FINISHED=true
+  log "✅ Завершён: $artifact ($size)"
+  exit 0
+}
+
 # === Парсинг аргументов ===
+PROGRESS=true
+DEDUP=false
+STREAM_TO=""
+STREAM_BUFFER_MB=256
+COMPRESS_CMD=()
 while [[ $# -gt 0 ]]; do
   case "$1" in
     --ib) IB_NAME="$2"; shift 2 ;;
     --format) FORMAT="$2"; shift 2 ;;
+    --jobs) JOBS="$2"; shift 2 ;;            # потоков pg_dump для формата dir
+    --compress-cmd) read -ra COMPRESS_CMD <<< "$2"; shift 2 ;;  # команда сжатия sql (слова через пробел)
+    --sql-suffix) SQL_SUFFIX="$2"; shift 2 ;;  # суффикс сжатого sql: .gz, .zst или пусто
+    --level) LEVEL="$2"; shift 2 ;;          # уровень сжатия (для dump/dir — pg_dump -Z)
+    --no-progress) PROGRESS=false; shift ;;  # без pv (параллельный запуск из backup_scheduler)
+    --dedup) DEDUP=true; shift ;;            # дедуплицирующее хранилище (только dump)
+    --db-size) DB_SIZE="$2"; shift 2 ;;      # размер базы, байт (для pv; уже известен оркестратору)
+    --stream-to) STREAM_TO="$2"; shift 2 ;;  # выгружать потоком во время дампа (dump/sql)
+    --stream-buffer) STREAM_BUFFER_MB="$2"; shift 2 ;;  # очередь выгрузки в памяти, МБ
+    --label) LABEL="$2"; shift 2 ;;          # метка (каталог) бэкапа — выбирает оркестратор
+    --run-id) RUN_ID="$2"; shift 2 ;;        # отметка «каталог создан этим запуском» (.run_id)
     *) echo "❌ Неизвестный аргумент: $1" >&2; exit 1 ;;
   esac
 done
@@ -30,51 +144,132 @@ done
 # === Валидация ===
 [[ -z "${IB_NAME:-}" ]] && { echo "❌ --ib не указан" >&2; exit 1; }
 [[ -z "${FORMAT:-}" ]] && { echo "❌ --format не указан" >&2; exit 1; }
-[[ "$FORMAT" != "dump" && "$FORMAT" != "sql" ]] && { echo "❌ Формат должен быть: dump или sql" >&2; exit 1; }
+[[ "$FORMAT" != "dump" && "$FORMAT" != "sql" && "$FORMAT" != "dir" ]] && { echo "❌ Формат должен быть: dump, sql или dir" >&2; exit 1; }
+JOBS="${JOBS:-1}"
+[[ "$JOBS" =~ ^[1-9][0-9]*$ ]] || { echo "❌ --jobs должен быть положительным числом" >&2; exit 1; }
+SQL_SUFFIX="${SQL_SUFFIX:-}"
+[[ -z "$SQL_SUFFIX" || "$SQL_SUFFIX" =~ ^\.[a-z0-9]+$ ]] || { echo "❌ --sql-suffix: .расширение или пусто" >&2; exit 1; }
+LEVEL="${LEVEL:-}"
+[[ -z "$LEVEL" || "$LEVEL" =~ ^[0-9]+$ ]] || { echo "❌ --level должен быть числом" >&2; exit 1; }
+DB_SIZE="${DB_SIZE:-}"
+[[ -z "$DB_SIZE" || "$DB_SIZE" =~ ^[0-9]+$ ]] || { echo "❌ --db-size должен быть числом байт" >&2; exit 1; }
+LABEL="${LABEL:-}"
+[[ -z "$LABEL" || "$LABEL" =~ ^[0-9]{8}_[0-9]{6}$ ]] || { echo "❌ --label должен быть ГГГГММДД_ЧЧММСС" >&2; exit 1; }
+RUN_ID="${RUN_ID:-}"
+[[ -z "$RUN_ID" || "$RUN_ID" =~ ^[A-Za-z0-9_-]+$ ]] || { echo "❌ --run-id: только буквы, цифры, _ и -" >&2; exit 1; }
+if [[ "$DEDUP" == true ]]; then
+  [[ "$FORMAT" == "dump" ]] || { echo "❌ --dedup поддерживается только для формата dump" >&2; exit 1; }
+  [[ -z "$LEVEL" ]] || { echo "❌ --dedup несовместим с --level (дамп пишется без сжатия)" >&2; exit 1; }
+fi
+
+if [[ -n "$STREAM_TO" ]]; then
+  [[ "$FORMAT" != "dir" && "$DEDUP" != true ]] || { echo "❌ --stream-to поддерживается для dump и sql (без --dedup)" >&2; exit 1; }
+  [[ "$STREAM_BUFFER_MB" =~ ^[1-9][0-9]*$ ]] || { echo "❌ --stream-buffer должен быть положительным числом" >&2; exit 1; }
+  STREAM_UPLOAD_PY="${STREAM_UPLOAD_PY:-$(cd "$SCRIPT_DIR/.." && pwd)/services/stream_upload.py}"
+fi
+
+# Уровень сжатия pg_dump для dump/dir (пусто — встроенный по умолчанию)
+PG_DUMP_Z=()
+[[ -n "$LEVEL" && "$FORMAT" != "sql" ]] && PG_DUMP_Z=(-Z "$LEVEL")
+
+# Команду сжатия для формата sql с уровнем и суффикс файла собирает backup_service
+# из CODECS (services/compression.py); без --compress-cmd SQL пишется несжатым
+if [[ "$FORMAT" == "sql" && ${#COMPRESS_CMD[@]} -gt 0 ]]; then
+  command -v "${COMPRESS_CMD[0]}" >/dev/null 2>&1 || { echo "❌ Не установлен ${COMPRESS_CMD[0]}" >&2; exit 1; }
+fi
 
 # === Создание директории бэкапа ===
-TIMESTAMP="$(date +%Y%m%d_%H%M%S)"
+TIMESTAMP="${LABEL:-$(date +%Y%m%d_%H%M%S)}"
 BACKUP_DIR="$BACKUP_ROOT/$IB_NAME/$TIMESTAMP"
-mkdir -p "$BACKUP_DIR" || { echo "❌ Не удалось создать $BACKUP_DIR" >&2; exit 1; }
+# mkdir без -p: каталог метки, уже занятый другим запуском, не становится общим
+mkdir -p "$BACKUP_ROOT/$IB_NAME" && mkdir "$BACKUP_DIR" || { echo "❌ Не удалось создать $BACKUP_DIR (метка занята?)" >&2; exit 1; }
+# По отметке оркестратор после SIGKILL удаляет только свой каталог (space_planner.remove_partial)
+[[ -n "$RUN_ID" ]] && echo "$RUN_ID" > "$BACKUP_DIR/.run_id"
+
+# === Недописанный бэкап не должен занимать место ===
+# Ошибка pg_dump, нехватка места, SIGTERM по таймауту — каталог метки удаляется
+# (куски дедупликации без индекса убирает сборка мусора rm.sh)
+FINISHED=false
+cleanup_partial() {
+  if [[ "$FINISHED" != true ]]; then
+    rm -rf "$BACKUP_DIR"
+    log "🧹 Недописанный бэкап удалён: $BACKUP_DIR" >&2
+  fi
+}
+trap cleanup_partial EXIT
+trap 'exit 143' TERM
+trap 'exit 130' INT
 log "📁 Директория: $BACKUP_DIR"
+START_TS=$(date +%s.%N)
 
 # === Бэкап в формате .dump ===
 if [[ "$FORMAT" == "dump" ]]; then
+  if [[ "$DEDUP" == true ]]; then
+    log "💾 Бэкап ИБ: $IB_NAME (формат: dump, дедупликация)"
+    # Без сжатия (-Z0): сжатый поток меняется целиком и не дедуплицируется;
+    # новые куски сжимает chunk_store.py
+    PGPASSFILE="$PGPASS_FILE" $PG_DUMP -Fc -Z0 -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" "$IB_NAME" 2>/dev/null | \
+      python3 "$CHUNK_STORE_PY" put --index "$BACKUP_DIR/backup.dump.idx" --format dump
+    finish_backup "$BACKUP_DIR/backup.dump.idx"
+  fi
+
   log "💾 Бэкап ИБ: $IB_NAME (формат: dump)"
   
-  # Получаем размер БД для прогресс-бара (явная передача PGPASSFILE)
-  DB_SIZE=$(PGPASSFILE="$PGPASS_FILE" $PSQL -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" -d "$IB_NAME" -tAc "SELECT pg_database_size('$IB_NAME');" 2>/dev/null || echo "")
-  DB_SIZE="${DB_SIZE//[[:space:]]/}"
-  [[ "$DB_SIZE" =~ ^[0-9]+$ ]] || DB_SIZE=""
+  if [[ "$PROGRESS" == false ]]; then
+    # Без прогресс-бара: вывод нескольких параллельных pv перетирал бы друг друга
+    PGPASSFILE="$PGPASS_FILE" $PG_DUMP -Fc "${PG_DUMP_Z[@]}" -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" "$IB_NAME" 2>/dev/null | \
+      write_artifact "$BACKUP_DIR/backup.dump"
+    finish_backup "$BACKUP_DIR/backup.dump"
+  fi
+
+  # Размер БД для прогресс-бара: обычно передан через --db-size (кэш размеров оркестратора),
+  # иначе — отдельный запрос (явная передача PGPASSFILE)
+  if [[ -z "$DB_SIZE" ]]; then
+    DB_SIZE=$(PGPASSFILE="$PGPASS_FILE" $PSQL -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" -d "$IB_NAME" -tAc "SELECT pg_database_size('$IB_NAME');" 2>/dev/null || echo "")
+    DB_SIZE="${DB_SIZE//[[:space:]]/}"
+    [[ "$DB_SIZE" =~ ^[0-9]+$ ]] || DB_SIZE=""
+  fi
   
   # Выполняем pg_dump с прогрессом (явная передача PGPASSFILE)
   if [[ -n "$DB_SIZE" && "$DB_SIZE" -gt 0 ]]; then
-    PGPASSFILE="$PGPASS_FILE" $PG_DUMP -Fc -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" "$IB_NAME" 2>/dev/null | \
+    PGPASSFILE="$PGPASS_FILE" $PG_DUMP -Fc "${PG_DUMP_Z[@]}" -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" "$IB_NAME" 2>/dev/null | \
       pv -f -s "$DB_SIZE" | \
-      cat > "$BACKUP_DIR/backup.dump"
+      write_artifact "$BACKUP_DIR/backup.dump"
   else
-    PGPASSFILE="$PGPASS_FILE" $PG_DUMP -Fc -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" "$IB_NAME" 2>/dev/null | \
+    PGPASSFILE="$PGPASS_FILE" $PG_DUMP -Fc "${PG_DUMP_Z[@]}" -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" "$IB_NAME" 2>/dev/null | \
       pv -f | \
-      cat > "$BACKUP_DIR/backup.dump"
+      write_artifact "$BACKUP_DIR/backup.dump"
   fi
   
   echo ""
-  SIZE=$(du -h "$BACKUP_DIR/backup.dump" 2>/dev/null | cut -f1 || echo "N/A")
-  log "✅ Завершён: $BACKUP_DIR/backup.dump ($SIZE)"
-  exit 0
+  finish_backup "$BACKUP_DIR/backup.dump"
 fi
 
-# === Бэкап в формате .sql.gz ===
+# === Бэкап в формате каталога (pg_dump -Fd -j N) ===
+# Каталог backup.dir — ОДИН артефакт (toc.dat + файлы таблиц), восстанавливается pg_restore -j
+if [[ "$FORMAT" == "dir" ]]; then
+  log "💾 Бэкап ИБ: $IB_NAME (формат: dir, потоков: $JOBS)"
+
+  PGPASSFILE="$PGPASS_FILE" $PG_DUMP -Fd -j "$JOBS" "${PG_DUMP_Z[@]}" -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" \
+    -f "$BACKUP_DIR/backup.dir" "$IB_NAME" 2>/dev/null
+
+  finish_backup "$BACKUP_DIR/backup.dir"
+fi
+
+# === Бэкап в формате .sql[.gz|.zst] ===
 if [[ "$FORMAT" == "sql" ]]; then
-  log "💾 Бэкап ИБ: $IB_NAME (формат: sql.gz)"
+  SQL_FILE="$BACKUP_DIR/backup.sql$SQL_SUFFIX"
+  log "💾 Бэкап ИБ: $IB_NAME (формат: sql$SQL_SUFFIX, сжатие: ${COMPRESS_CMD[*]:-нет})"
   
-  PGPASSFILE="$PGPASS_FILE" $PG_DUMP -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" "$IB_NAME" --no-owner --no-privileges 2>/dev/null | \
-    gzip -c | \
-    cat > "$BACKUP_DIR/backup.sql.gz"
+  if [[ ${#COMPRESS_CMD[@]} -gt 0 ]]; then
+    PGPASSFILE="$PGPASS_FILE" $PG_DUMP -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" "$IB_NAME" --no-owner --no-privileges 2>/dev/null | \
+      "${COMPRESS_CMD[@]}" | write_artifact "$SQL_FILE"
+  else
+    PGPASSFILE="$PGPASS_FILE" $PG_DUMP -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" "$IB_NAME" --no-owner --no-privileges 2>/dev/null | \
+      write_artifact "$SQL_FILE"
+  fi
   
-  SIZE=$(du -h "$BACKUP_DIR/backup.sql.gz" 2>/dev/null | cut -f1 || echo "N/A")
-  log "✅ Завершён: $BACKUP_DIR/backup.sql.gz ($SIZE)"
-  exit 0
+  finish_backup "$SQL_FILE"
 fi
 
 echo "❌ Неизвестная ошибка" >&2
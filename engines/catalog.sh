@@ -0,0 +1,81 @@
+#!/bin/bash
+# engines/catalog.sh — журнал-каталог бэкапов (подключается через source)
+# Формат: JSON-lines в $BACKUP_ROOT/.catalog.jsonl, одна операция на строку:
+#   {"op":"add","ib":"ИБ","ts":"ГГГГММДД_ЧЧММСС","type":"postgres_dump","size":123,"mtime":1700000000,"path":"..."}
+#   {"op":"del","ib":"ИБ","ts":"ГГГГММДД_ЧЧММСС"}
+# Запись — под flock, одной строкой; перестройка/сжатие журнала — services/catalog_service.py
+# ВНИМАНИЕ: функции НЕ вызывают exit — ошибка каталога не должна ломать бэкап/удаление
+
+CATALOG_FILE="${CATALOG_FILE:-${BACKUP_ROOT:-/var/backups/1c}/.catalog.jsonl}"
+CATALOG_LOCK="${CATALOG_FILE}.lock"
+
+# Тип артефакта по имени (те же правила, что в list_backups.sh)
+artifact_type() {
+    local path="$1"
+    local name
+    name="$(basename "$path")"
+    if [[ -d "$path" ]]; then
+        echo "postgres_dir"
+    elif [[ "$name" == *.dump.idx ]]; then
+        echo "dedup_index"
+    elif [[ "$name" == *.dump ]]; then
+        echo "postgres_dump"
+    elif [[ "$name" == *.dt ]]; then
+        echo "1c_dt"
+    elif [[ "$name" == *.sql.gz ]]; then
+        echo "sql_gz"
+    elif [[ "$name" == *.sql.zst ]]; then
+        echo "sql_zst"
+    elif [[ "$name" == *.sql ]]; then
+        echo "sql"
+    else
+        echo "unknown"
+    fi
+}
+
+# Список «хэш  имя» файлов каталога pg_dump -Fd — из него хэш каталога в manifest.json.
+# Порядок побайтовый (LC_ALL=C), как sorted() в manifest_service._verify_dir: sudo сохраняет
+# LANG, а sort по локали ru_RU/en_US ставит 4123.dat.gz и 41234.dat.gz в другом порядке
+dir_listing() {
+    (cd "$1" && find . -type f -printf '%P\0' | LC_ALL=C sort -z | xargs -0 -r b2sum)
+}
+
+# Экранирование строки для JSON (имена ИБ и пути — без управляющих символов)
+_catalog_json_str() {
+    local s="${1//\\/\\\\}"
+    echo -n "${s//\"/\\\"}"
+}
+
+# Атомарное добавление строки в журнал
+_catalog_append() {
+    local line="$1"
+    (
+        flock -w 30 9 || exit 1
+        echo "$line" >> "$CATALOG_FILE"
+    ) 9>>"$CATALOG_LOCK" 2>/dev/null || echo "⚠️  Не удалось обновить каталог: $CATALOG_FILE" >&2
+    return 0
+}
+
+# Зарегистрировать созданный артефакт: catalog_add ИБ МЕТКА ПУТЬ
+catalog_add() {
+    local ib="$1" ts="$2" path="$3"
+    local type size mtime
+    type="$(artifact_type "$path")"
+    if [[ -d "$path" ]]; then
+        size=$(find "$path" -type f -printf '%s\n' 2>/dev/null | awk '{s+=$1} END {printf "%.0f\n", s}')
+    elif [[ "$type" == "dedup_index" ]]; then
+        # Логический размер дампа — из заголовка индекса (куски общие для всех бэкапов ИБ)
+        size=$(head -n 1 "$path" 2>/dev/null | sed -n 's/.*"size_bytes":\([0-9]*\).*/\1/p')
+        size="${size:-0}"
+    else
+        size=$(stat -c %s "$path" 2>/dev/null || echo "0")
+    fi
+    mtime=$(stat -c %Y "$path" 2>/dev/null || date +%s)
+    _catalog_append "{\"op\":\"add\",\"ib\":\"$(_catalog_json_str "$ib")\",\"ts\":\"$ts\",\"type\":\"$type\",\"size\":$size,\"mtime\":$mtime,\"path\":\"$(_catalog_json_str "$path")\"}"
+}
+
+# Отметить удаление бэкапа (всего каталога метки времени): catalog_del ИБ МЕТКА
+catalog_del() {
+    local ib="$1" ts="$2"
+    _catalog_append "{\"op\":\"del\",\"ib\":\"$(_catalog_json_str "$ib")\",\"ts\":\"$ts\"}"
+}
@@ -1,8 +1,71 @@
 #!/bin/bash
-CLOUD_REMOTE="mailru"
-CLOUD_PATH="1c_backups"
-LOCAL_DIR="/var/backups/1c"
+# cloud_upload.sh — выгрузка бэкапа в облако через rclone
+# Вызывается из services/upload_service.py (ib_1c upload) для одного бэкапа:
+#   cloud_upload.sh --src КАТАЛОГ_МЕТКИ --artifact ИМЯ --dest REMOTE:ПУТЬ [--chunk-size МБ] [--streams N]
+# Артефакт выгружается первым, manifest.json — последним (признак полной выгрузки).
+# --manifest-only — артефакт уже выгружен потоком во время бэкапа (stream_upload.py).
+# Без аргументов — прежний режим: rclone copy всего $BACKUP_ROOT (для старых заданий cron).
 
-echo "[$(date)] Начало отправки в облако..."
-rclone copy "$LOCAL_DIR" "$CLOUD_REMOTE:$CLOUD_PATH/" --log-file=/var/log/rclone_1c.log
-echo "[$(date)] Отправка завершена."
+CLOUD_REMOTE="${CLOUD_REMOTE:-mailru:1c_backups}"
+LOCAL_DIR="${BACKUP_ROOT:-/var/backups/1c}"
+LOG_FILE="${CLOUD_LOG_FILE:-/var/log/rclone_1c.log}"
+
+if [[ $# -eq 0 ]]; then
+  echo "[$(date)] Начало отправки в облако..."
+  rclone copy "$LOCAL_DIR" "$CLOUD_REMOTE/" --exclude "/.trash/**" --log-file="$LOG_FILE"
+  echo "[$(date)] Отправка завершена."
+  exit 0
+fi
+
+SRC=""
+ARTIFACT=""
+DEST=""
+CHUNK_SIZE_MB=64
+STREAMS=4
+MANIFEST_ONLY=false
+
+while [[ $# -gt 0 ]]; do
+  case "$1" in
+    --src) SRC="$2"; shift 2 ;;
+    --artifact) ARTIFACT="$2"; shift 2 ;;
+    --dest) DEST="$2"; shift 2 ;;
+    --chunk-size) CHUNK_SIZE_MB="$2"; shift 2 ;;
+    --streams) STREAMS="$2"; shift 2 ;;
+    --manifest-only) MANIFEST_ONLY=true; shift ;;
+    *) echo "❌ Неизвестный аргумент: $1" >&2; exit 1 ;;
+  esac
+done
+
+if [[ -z "$SRC" || -z "$ARTIFACT" || -z "$DEST" ]]; then
+  echo "❌ Нужны --src, --artifact и --dest" >&2
+  exit 1
+fi
+if [[ ! -e "$SRC/$ARTIFACT" || ! -f "$SRC/manifest.json" ]]; then
+  echo "❌ Нет артефакта или manifest.json в $SRC" >&2
+  exit 1
+fi
+if ! command -v rclone >/dev/null 2>&1; then
+  echo "❌ rclone не установлен" >&2
+  exit 1
+fi
+
+# Крупный файл — частями в несколько потоков; каталог (формат dir) — файлами параллельно
+RCLONE_OPTS=(
+  --multi-thread-streams "$STREAMS"
+  --multi-thread-chunk-size "${CHUNK_SIZE_MB}M"
+  --multi-thread-cutoff "${CHUNK_SIZE_MB}M"
+  --transfers "$STREAMS"
+  --log-file="$LOG_FILE"
+)
+
+UPLOADED=0
+if [[ "$MANIFEST_ONLY" != true ]]; then
+  if [[ -d "$SRC/$ARTIFACT" ]]; then
+    rclone copy "$SRC/$ARTIFACT" "$DEST/$ARTIFACT" "${RCLONE_OPTS[@]}" || exit 1
+  else
+    rclone copyto "$SRC/$ARTIFACT" "$DEST/$ARTIFACT" "${RCLONE_OPTS[@]}" || exit 1
+  fi
+  UPLOADED=$(find "$SRC/$ARTIFACT" -type f -printf '%s\n' | awk '{s+=$1} END {printf "%.0f\n", s}')
+fi
+rclone copyto "$SRC/manifest.json" "$DEST/manifest.json" --log-file="$LOG_FILE" || exit 1
+echo "uploaded_bytes=$UPLOADED"
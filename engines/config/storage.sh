@@ -1 +1 @@
-BACKUP_DIR="/var/backups/1c"
+BACKUP_DIR="${BACKUP_ROOT:-/var/backups/1c}"
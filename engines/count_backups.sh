@@ -12,8 +12,9 @@ source "$CONFIG"
 # Проверяем существование каталога
 [[ ! -d "$BACKUP_DIR" ]] && { echo "error=Каталог $BACKUP_DIR не существует" >&2; exit 1; }
 
-# Заголовок (TSV)
-echo -e "ib_name\ttotal_files\ttotal_size_bytes"
+# Заголовок (TSV): total_size_bytes — логический объём бэкапов,
+# physical_size_bytes — занято на диске (с учётом общего хранилища кусков .chunks)
+echo -e "ib_name\ttotal_files\ttotal_size_bytes\tphysical_size_bytes"
 
 # Проходим по подкаталогам ИБ
 for ib_dir in "$BACKUP_DIR"/*/; do
@@ -23,25 +24,49 @@ for ib_dir in "$BACKUP_DIR"/*/; do
   [[ "$ib_name" == "lost+found" ]] && continue
   
   # Считаем файлы бэкапов
-  files=$(find "$ib_dir" -type f \( \
+  files=$(find "$ib_dir" -name ".chunks" -prune -o -type f \( \
     -name "*.dump" -o \
     -name "*.dt" -o \
     -name "*.sql.gz" -o \
+    -name "*.sql.zst" -o \
     -name "backup.dump" -o \
     -name "backup.sql*" \
-  \) 2>/dev/null | wc -l)
+  \) -print 2>/dev/null | wc -l)
+  
+  # Каталоги pg_dump -Fd считаются одним артефактом каждый
+  dirs=$(find "$ib_dir" -type d -name "backup.dir" -prune 2>/dev/null | wc -l)
+  # Индексы дедупликации — по одному на бэкап
+  idx_files=$(find "$ib_dir" -name ".chunks" -prune -o -type f -name "*.dump.idx" -print 2>/dev/null)
+  idx_count=0
+  [[ -n "$idx_files" ]] && idx_count=$(grep -c '^' <<< "$idx_files")
+  files=$((files + dirs + idx_count))
   
   # Пропускаем ИБ без бэкапов
   [[ "$files" -eq 0 ]] && continue
   
   # Суммируем размеры
-  size_bytes=$(find "$ib_dir" -type f \( \
+  size_bytes=$(find "$ib_dir" -name ".chunks" -prune -o -type f \( \
     -name "*.dump" -o \
     -name "*.dt" -o \
     -name "*.sql.gz" -o \
+    -name "*.sql.zst" -o \
     -name "backup.dump" -o \
     -name "backup.sql*" \
-  \) -exec stat -c %s {} + 2>/dev/null | awk '{s+=$1} END {print s+0}')
+  \) -exec stat -c %s {} + 2>/dev/null | awk '{s+=$1} END {printf "%.0f\n", s}')
+  if [[ "$dirs" -gt 0 ]]; then
+    dir_bytes=$(find "$ib_dir" -path "*/backup.dir/*" -type f -printf '%s\n' 2>/dev/null | awk '{s+=$1} END {printf "%.0f\n", s}')
+    size_bytes=$((size_bytes + dir_bytes))
+  fi
+  physical_bytes="$size_bytes"
+  if [[ "$idx_count" -gt 0 ]]; then
+    # Логический размер — из заголовков индексов; физический — сами индексы + куски
+    idx_logical=$(while IFS= read -r idx; do head -n 1 "$idx"; done <<< "$idx_files" | \
+      sed -n 's/.*"size_bytes":\([0-9]*\).*/\1/p' | awk '{s+=$1} END {printf "%.0f\n", s}')
+    idx_physical=$( { tr '\n' '\0' <<< "$idx_files" | xargs -0 stat -c %s; \
+      find "$ib_dir/.chunks" -type f -printf '%s\n'; } 2>/dev/null | awk '{s+=$1} END {printf "%.0f\n", s}')
+    size_bytes=$((size_bytes + idx_logical))
+    physical_bytes=$((physical_bytes + idx_physical))
+  fi
   
-  echo -e "${ib_name}\t${files}\t${size_bytes}"
+  echo -e "${ib_name}\t${files}\t${size_bytes}\t${physical_bytes}"
 done
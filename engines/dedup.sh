@@ -0,0 +1,15 @@
+#!/bin/bash
+# engines/dedup.sh — дедуплицирующее хранилище бэкапов (подключается через source)
+# Куски дампов ИБ лежат в $BACKUP_ROOT/<ИБ>/.chunks, в каталоге метки — индекс backup.dump.idx
+# Резка на куски, сборка и сборка мусора — services/chunk_store.py
+# ВНИМАНИЕ: dedup_gc НЕ вызывает exit — ошибка GC не должна ломать удаление
+
+CHUNK_STORE_PY="${CHUNK_STORE_PY:-$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)/services/chunk_store.py}"
+
+# Удалить куски, на которые больше не ссылается ни один индекс: dedup_gc КАТАЛОГ_ИБ
+dedup_gc() {
+    local store="$1/.chunks"
+    [[ -d "$store" ]] || return 0
+    python3 "$CHUNK_STORE_PY" gc --store "$store" 2>&1 || echo "⚠️  Сборка мусора не выполнена: $store" >&2
+    return 0
+}
@@ -15,14 +15,18 @@ source "$CONFIG"
 # Заголовок (TSV)
 echo -e "ib_name\ttimestamp\tfile_type\tsize_bytes\tpath"
 
-# Ищем файлы бэкапов
-find "$BACKUP_DIR" -type f \( \
+# Ищем файлы бэкапов и каталоги pg_dump -Fd (backup.dir — один артефакт, внутрь не заходим)
+# .chunks — хранилище кусков дедупликации: бэкапы в нём представлены индексами *.dump.idx
+# .trash — корзина удалённых бэкапов (очищается в фоне, services/trash_store.py)
+find "$BACKUP_DIR" \( -type d \( -name ".chunks" -o -name ".trash" \) -prune \) -o \( -type d -name "backup.dir" -prune -print \) -o \( -type f \( \
   -name "*.dump" -o \
+  -name "*.dump.idx" -o \
   -name "*.dt" -o \
   -name "*.sql.gz" -o \
+  -name "*.sql.zst" -o \
   -name "backup.dump" -o \
   -name "backup.sql*" \
-\) 2>/dev/null | while IFS= read -r filepath; do
+\) -print \) 2>/dev/null | while IFS= read -r filepath; do
   # Извлекаем имя ИБ из пути
   ib_name=$(echo "$filepath" | sed -n "s|^$BACKUP_DIR/\([^/]*\)/.*|\1|p")
   [[ -z "$ib_name" || "$ib_name" == "lost+found" ]] && continue
@@ -32,18 +36,34 @@ find "$BACKUP_DIR" -type f \( \
   
   # Определяем тип файла
   filename=$(basename "$filepath")
-  if [[ "$filename" == *.dump || "$filename" == backup.dump ]]; then
+  if [[ -d "$filepath" ]]; then
+    file_type="postgres_dir"
+  elif [[ "$filename" == *.dump.idx ]]; then
+    file_type="dedup_index"
+  elif [[ "$filename" == *.dump || "$filename" == backup.dump ]]; then
     file_type="postgres_dump"
   elif [[ "$filename" == *.dt ]]; then
     file_type="1c_dt"
-  elif [[ "$filename" == *.sql.gz || "$filename" == backup.sql* ]]; then
+  elif [[ "$filename" == *.sql.gz ]]; then
     file_type="sql_gz"
+  elif [[ "$filename" == *.sql.zst ]]; then
+    file_type="sql_zst"
+  elif [[ "$filename" == *.sql || "$filename" == backup.sql* ]]; then
+    file_type="sql"
   else
     file_type="unknown"
   fi
   
-  # Размер в байтах
-  size_bytes=$(stat -c %s "$filepath" 2>/dev/null || echo "0")
+  # Размер в байтах (для каталога — суммарный размер всех файлов внутри,
+  # для индекса дедупликации — логический размер дампа из заголовка)
+  if [[ -d "$filepath" ]]; then
+    size_bytes=$(find "$filepath" -type f -printf '%s\n' 2>/dev/null | awk '{s+=$1} END {printf "%.0f\n", s}')
+  elif [[ "$file_type" == "dedup_index" ]]; then
+    size_bytes=$(head -n 1 "$filepath" 2>/dev/null | sed -n 's/.*"size_bytes":\([0-9]*\).*/\1/p')
+    size_bytes="${size_bytes:-0}"
+  else
+    size_bytes=$(stat -c %s "$filepath" 2>/dev/null || echo "0")
+  fi
   
   # Вывод в TSV
   echo -e "${ib_name}\t${timestamp}\t${file_type}\t${size_bytes}\t${filepath}"
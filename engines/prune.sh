@@ -11,6 +11,9 @@ CONFIG_PATH="$SCRIPT_DIR/config/db_config.sh"
 
 [[ -f "$CONFIG_PATH" ]] || { echo "❌ Конфиг не найден: $CONFIG_PATH"; exit 1; }
 source "$CONFIG_PATH"
+source "$SCRIPT_DIR/catalog.sh"
+source "$SCRIPT_DIR/dedup.sh"
+source "$SCRIPT_DIR/trash.sh"
 
 # === Логирование ===
 log() {
@@ -42,7 +45,12 @@ delete_backup() {
         echo "  🧪 Симуляция: удалить $dir"
     else
         log "🗑️ Удаление: $dir"
-        rm -rf "$dir" 2>/dev/null || echo "  ⚠️ Не удалось удалить: $dir"
+        # В корзину (мгновенно); место освобождает фоновая очистка
+        if trash_move "$dir"; then
+            catalog_del "$(basename "$(dirname "$dir")")" "$(basename "$dir")"
+        else
+            echo "  ⚠️ Не удалось удалить: $dir"
+        fi
     fi
 }
 
@@ -63,6 +71,9 @@ if [[ -n "$IB_NAME" ]]; then
         delete_backup "$dir"
     done
     
+    # Куски дедупликации, на которые больше не ссылается ни один индекс
+    [[ "$DRY_RUN" == true ]] || dedup_gc "$BACKUP_PATH"
+    
     log "✅ Ротация завершена для: $IB_NAME"
 else
     # Ротация для всех ИБ в $BACKUP_ROOT
@@ -72,7 +83,7 @@ else
         echo "  🧪 Симуляция режима (--dry-run)"
     fi
     
-    find "$BACKUP_ROOT" -mindepth 1 -maxdepth 1 -type d ! -name 'lost+found' 2>/dev/null | \
+    find "$BACKUP_ROOT" -mindepth 1 -maxdepth 1 -type d ! -name 'lost+found' ! -name '.*' 2>/dev/null | \
     while IFS= read -r ib_dir; do
         IB_NAME=$(basename "$ib_dir")
         echo ""
@@ -82,9 +93,13 @@ else
         while IFS= read -r dir; do
             delete_backup "$dir"
         done
+        
+        [[ "$DRY_RUN" == true ]] || dedup_gc "$ib_dir"
     done
     
     log "✅ Ротация завершена для всех ИБ"
 fi
 
+[[ "$DRY_RUN" == true ]] || trash_purge_background
+
 exit 0
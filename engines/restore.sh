@@ -0,0 +1,120 @@
+#!/bin/bash
+# /opt/1cv8/scripts/engines/restore.sh
+# Восстановление ИБ из бэкапа: pg_restore -j для dump/dir, потоковая распаковка .sql.gz/.sql.zst в psql
+# Дедуплицированный бэкап (backup.dump.idx) собирается из кусков потоком в pg_restore
+set -euo pipefail
+
+# === Определение директории скрипта ===
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+CONFIG_PATH="$SCRIPT_DIR/config/db_config.sh"
+[[ -f "$CONFIG_PATH" ]] || { echo "❌ Конфиг не найден: $CONFIG_PATH" >&2; exit 1; }
+source "$CONFIG_PATH"
+source "$SCRIPT_DIR/dedup.sh"
+
+# === Явные пути к утилитам PostgreSQL 15 ===
+PG_RESTORE="/usr/lib/postgresql/15/bin/pg_restore"
+PSQL="/usr/lib/postgresql/15/bin/psql"
+
+# === Логирование ===
+log() {
+  echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1"
+}
+
+# === Парсинг аргументов ===
+JOBS=1
+CLEAN=false
+DRY_RUN=false
+while [[ $# -gt 0 ]]; do
+  case "$1" in
+    --ib) IB_NAME="$2"; shift 2 ;;
+    --timestamp) TIMESTAMP="$2"; shift 2 ;;
+    --target-db) TARGET_DB="$2"; shift 2 ;;   # база назначения (по умолчанию — имя ИБ)
+    --jobs) JOBS="$2"; shift 2 ;;             # потоков pg_restore для dump/dir
+    --clean) CLEAN=true; shift ;;             # пересоздать базу назначения, если она есть
+    --dry-run) DRY_RUN=true; shift ;;
+    *) echo "❌ Неизвестный аргумент: $1" >&2; exit 1 ;;
+  esac
+done
+
+# === Валидация ===
+[[ -z "${IB_NAME:-}" ]] && { echo "❌ --ib не указан" >&2; exit 1; }
+[[ -z "${TIMESTAMP:-}" ]] && { echo "❌ --timestamp не указан" >&2; exit 1; }
+[[ "$TIMESTAMP" =~ ^20[0-9]{6}_[0-9]{6}$ ]] || { echo "❌ Неверная метка времени: $TIMESTAMP" >&2; exit 1; }
+[[ "$JOBS" =~ ^[1-9][0-9]*$ ]] || { echo "❌ --jobs должен быть положительным числом" >&2; exit 1; }
+TARGET_DB="${TARGET_DB:-$IB_NAME}"
+[[ "$TARGET_DB" =~ ^[A-Za-z0-9_]+$ ]] || { echo "❌ Недопустимое имя базы назначения: $TARGET_DB" >&2; exit 1; }
+
+BACKUP_DIR="$BACKUP_ROOT/$IB_NAME/$TIMESTAMP"
+[[ -d "$BACKUP_DIR" ]] || { echo "❌ Бэкап не найден: $BACKUP_DIR" >&2; exit 1; }
+
+# === Артефакт бэкапа (в порядке предпочтения) ===
+ARTIFACT=""
+for name in backup.dir backup.dump backup.dump.idx backup.sql.zst backup.sql.gz backup.sql; do
+  if [[ -e "$BACKUP_DIR/$name" ]]; then
+    ARTIFACT="$BACKUP_DIR/$name"
+    break
+  fi
+done
+[[ -n "$ARTIFACT" ]] || { echo "❌ В $BACKUP_DIR нет артефакта бэкапа" >&2; exit 1; }
+
+psql_admin() {
+  PGPASSFILE="$PGPASS_FILE" $PSQL -h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" -d postgres -v ON_ERROR_STOP=1 -tAc "$1"
+}
+
+# === План восстановления ===
+case "$ARTIFACT" in
+  *.dir|*.dump) METHOD="pg_restore -j $JOBS" ;;
+  *.idx) METHOD="chunk_store.py cat | pg_restore (поток, без -j)" ;;
+  *.sql.zst) METHOD="zstd -dc | psql" ;;
+  *.sql.gz) METHOD="gzip -dc | psql" ;;
+  *) METHOD="psql -f" ;;
+esac
+log "♻️  Восстановление ИБ: $IB_NAME ($TIMESTAMP) → база $TARGET_DB"
+log "📦 Артефакт: $ARTIFACT"
+log "⚙️  Метод: $METHOD"
+
+if [[ "$DRY_RUN" == true ]]; then
+  log "🧪 Симуляция (--dry-run): база $TARGET_DB не изменена"
+  exit 0
+fi
+
+# === Подготовка базы назначения ===
+EXISTS=$(psql_admin "SELECT 1 FROM pg_database WHERE datname = '$TARGET_DB'" 2>/dev/null || echo "")
+if [[ "$EXISTS" == "1" ]]; then
+  [[ "$CLEAN" == true ]] || { echo "❌ База $TARGET_DB уже существует (укажите --clean или другую --target-db)" >&2; exit 1; }
+  log "🗑️ Пересоздание базы $TARGET_DB"
+  psql_admin "DROP DATABASE \"$TARGET_DB\" WITH (FORCE)" >/dev/null
+fi
+psql_admin "CREATE DATABASE \"$TARGET_DB\"" >/dev/null
+
+# === Восстановление ===
+RESTORE_OPTS=(-h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" -d "$TARGET_DB" --no-owner --no-privileges --exit-on-error)
+PSQL_OPTS=(-h "$PG_HOST" -p "$PG_PORT" -U "$PG_USER" -d "$TARGET_DB" -v ON_ERROR_STOP=1 -q)
+
+case "$ARTIFACT" in
+  *.dir|*.dump)
+    PGPASSFILE="$PGPASS_FILE" $PG_RESTORE -j "$JOBS" "${RESTORE_OPTS[@]}" "$ARTIFACT"
+    ;;
+  *.idx)
+    # pg_restore -j требует файла с произвольным доступом — из потока только в один поток
+    python3 "$CHUNK_STORE_PY" cat --index "$ARTIFACT" | \
+      PGPASSFILE="$PGPASS_FILE" $PG_RESTORE "${RESTORE_OPTS[@]}"
+    ;;
+  *.sql.zst)
+    zstd -q -dc "$ARTIFACT" | PGPASSFILE="$PGPASS_FILE" $PSQL "${PSQL_OPTS[@]}" >/dev/null
+    ;;
+  *.sql.gz)
+    # pigz распаковывает быстрее (чтение/запись/CRC в отдельных потоках), иначе gzip
+    if command -v pigz >/dev/null 2>&1; then
+      pigz -dc "$ARTIFACT" | PGPASSFILE="$PGPASS_FILE" $PSQL "${PSQL_OPTS[@]}" >/dev/null
+    else
+      gzip -dc "$ARTIFACT" | PGPASSFILE="$PGPASS_FILE" $PSQL "${PSQL_OPTS[@]}" >/dev/null
+    fi
+    ;;
+  *)
+    PGPASSFILE="$PGPASS_FILE" $PSQL "${PSQL_OPTS[@]}" -f "$ARTIFACT" >/dev/null
+    ;;
+esac
+
+log "✅ Восстановлено: $IB_NAME ($TIMESTAMP) → $TARGET_DB"
+exit 0
@@ -1,8 +1,13 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
-BACKUP_ROOT="/var/backups/1c"
-LOG_FILE="/var/backups/1c/rm.log"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+BACKUP_ROOT="${BACKUP_ROOT:-/var/backups/1c}"
+LOG_FILE="$BACKUP_ROOT/rm.log"
+LABEL_RE='^20[0-9]{2}[01][0-9][0-3][0-9]_[0-2][0-9][0-5][0-9][0-5][0-9]$'
+source "$SCRIPT_DIR/catalog.sh"
+source "$SCRIPT_DIR/dedup.sh"
+source "$SCRIPT_DIR/trash.sh"
 DRY_RUN=false
 CONFIRMED=false
 
@@ -19,6 +24,8 @@ usage() {
   --timestamp <метка>  Удалить конкретный бэкап (формат: ГГГГММДД_ЧЧММСС)
   --older-than <дата>  Удалить бэкапы старше даты (формат: ГГГГММДД)
   --all                Удалить ВСЕ бэкапы всех ИБ
+  --stdin              Удалить бэкапы по списку из stdin: строка «ИБ/МЕТКА» (rm_service.py);
+                       на каждую цель — строка «target<TAB>ok|error<TAB>ИБ/МЕТКА<TAB>байт|ошибка»
   --dry-run            Симуляция без фактического удаления (без подтверждения!)
   --confirm            Обязательное подтверждение перед удалением (только для реальных операций)
   --help               Показать эту справку
@@ -26,10 +33,24 @@ usage() {
 Примеры:
   $0 --ib artel_2025 --dry-run
   $0 --ib artel_2025 --timestamp 20260203_205027 --confirm
+  $0 --ib artel_2025 --older-than 20260201 --confirm
+  printf 'artel_2025/20260203_205027\n' | $0 --stdin --confirm
 USAGE
     exit 1
 }
 
+# Итог для rm_service.py: место, которое освободит фоновая очистка корзины
+finish_removal() {
+    trash_purge_background
+    log "♻️  Освобождается: $(numfmt --to=iec "$TRASH_RECLAIMED" 2>/dev/null || echo "$TRASH_RECLAIMED B") (фоновая очистка корзины)"
+    echo "reclaimed_bytes=$TRASH_RECLAIMED"
+}
+
+# Бэкап попадает под --older-than (дата метки раньше ГГГГММДД); без --older-than — любой
+older_than_match() {
+    [[ -z "${OLDER_THAN:-}" || "${1:0:8}" < "$OLDER_THAN" ]]
+}
+
 validate_ib_name() {
     [[ -d "$BACKUP_ROOT/$1" ]] || { log "❌ ИБ '$1' не найдена в $BACKUP_ROOT"; exit 1; }
 }
@@ -52,6 +73,7 @@ while [[ $# -gt 0 ]]; do
         --timestamp) TIMESTAMP="$2"; shift 2 ;;
         --older-than) OLDER_THAN="$2"; shift 2 ;;
         --all) REMOVE_ALL=true; shift ;;
+        --stdin) FROM_STDIN=true; shift ;;
         --dry-run) DRY_RUN=true; shift ;;
         --confirm) CONFIRMED=true; shift ;;
         --help) usage ;;
@@ -59,18 +81,79 @@ while [[ $# -gt 0 ]]; do
     esac
 done
 
+[[ -n "${OLDER_THAN:-}" && ! "$OLDER_THAN" =~ ^[0-9]{8}$ ]] && { log "❌ --older-than: ожидается ГГГГММДД, получено '$OLDER_THAN'"; exit 1; }
+
+# Пакетное удаление: цели уже выбраны вызывающим (RmService.plan_removal) — без поиска по дискам
+if [[ "${FROM_STDIN:-false}" == true ]]; then
+    # stdin занят списком целей — спросить подтверждение нечем
+    [[ "$DRY_RUN" == true || "$CONFIRMED" == true ]] || { log "❌ --stdin требует --confirm или --dry-run"; exit 1; }
+    [[ "$DRY_RUN" == true ]] && log "🔍 Симуляция: файлы НЕ будут удалены"
+    declare -A AFFECTED_IB=()
+    FAILED=0
+    while IFS= read -r target || [[ -n "$target" ]]; do
+        [[ -z "$target" ]] && continue
+        ib="${target%%/*}"
+        label="${target#*/}"
+        dir="$BACKUP_ROOT/$ib/$label"
+        # Только «ИБ/МЕТКА» внутри $BACKUP_ROOT: без «..», служебных каталогов и вложенных путей
+        if [[ "$target" != */* || -z "$ib" || "$ib" == .* || "$label" == */* || ! "$label" =~ $LABEL_RE ]]; then
+            printf 'target\terror\t%s\tнедопустимая цель\n' "$target"; FAILED=$((FAILED + 1)); continue
+        fi
+        if [[ ! -d "$dir" ]]; then
+            printf 'target\terror\t%s\tне найден\n' "$target"; FAILED=$((FAILED + 1)); continue
+        fi
+        if [[ "$DRY_RUN" == true ]]; then
+            log "  → $dir/"
+            printf 'target\tok\t%s\t%s\n' "$target" \
+                "$(find "$dir" -type f -printf '%s\n' 2>/dev/null | awk '{s+=$1} END {printf "%.0f\n", s}')"
+            continue
+        fi
+        before=$TRASH_RECLAIMED
+        if trash_move "$dir"; then
+            log "✅ Удалён: $dir/"
+            catalog_del "$ib" "$label"
+            AFFECTED_IB["$ib"]=1
+            printf 'target\tok\t%s\t%s\n' "$target" "$((TRASH_RECLAIMED - before))"
+        else
+            log "⚠️  Не удалён (права?): $dir/"
+            printf 'target\terror\t%s\tОтказано в доступе\n' "$target"; FAILED=$((FAILED + 1))
+        fi
+    done
+    if [[ "$DRY_RUN" != true ]]; then
+        for ib in "${!AFFECTED_IB[@]}"; do
+            dedup_gc "$BACKUP_ROOT/$ib"
+        done
+        finish_removal
+    fi
+    [[ $FAILED -eq 0 ]] || exit 2
+    exit 0
+fi
+
 # Удаление всех ИБ
 if [[ "${REMOVE_ALL:-false}" == true ]]; then
     confirm_action "УДАЛЕНИЕ ВСЕХ БЭКАПОВ ВСЕХ ИБ из $BACKUP_ROOT"
     [[ "$DRY_RUN" == true ]] && log "🔍 Симуляция: файлы НЕ будут удалены"
     
-    find "$BACKUP_ROOT" -mindepth 2 -maxdepth 2 -type d -name "20[0-9][0-9][01][0-9][0-3][0-9]_[0-2][0-9][0-5][0-9][0-5][0-9]" 2>/dev/null | sort | while read -r dir; do
+    # Без конвейера в while: TRASH_RECLAIMED должен остаться в этом процессе
+    while read -r dir; do
+        older_than_match "$(basename "$dir")" || continue
         if [[ "$DRY_RUN" == true ]]; then
             log "  → $dir/"
         else
-            rm -rf "$dir" && log "✅ Удалён: $dir/" || log "⚠️  Не удалён (права?): $dir/"
+            if trash_move "$dir"; then
+                log "✅ Удалён: $dir/"
+                catalog_del "$(basename "$(dirname "$dir")")" "$(basename "$dir")"
+            else
+                log "⚠️  Не удалён (права?): $dir/"
+            fi
         fi
-    done
+    done < <(find "$BACKUP_ROOT" -mindepth 2 -maxdepth 2 -type d -name "20[0-9][0-9][01][0-9][0-3][0-9]_[0-2][0-9][0-5][0-9][0-5][0-9]" 2>/dev/null | sort)
+    if [[ "$DRY_RUN" != true ]]; then
+        for ib_dir in "$BACKUP_ROOT"/*/; do
+            dedup_gc "${ib_dir%/}"
+        done
+        finish_removal
+    fi
     exit 0
 fi
 
@@ -94,24 +177,43 @@ if [[ -n "${TIMESTAMP:-}" ]]; then
         log "Целевой бэкап: $TARGET_DIR"
         find "$TARGET_DIR" -type f 2>/dev/null | while read -r f; do log "  → $f"; done
     else
-        rm -rf "$TARGET_DIR" && log "✅ Удалён: $TARGET_DIR" || log "⚠️  Ошибка удаления (права?): $TARGET_DIR"
+        if trash_move "$TARGET_DIR"; then
+            log "✅ Удалён: $TARGET_DIR"
+            catalog_del "$IB_NAME" "$TIMESTAMP"
+            dedup_gc "$BACKUP_DIR"
+            finish_removal
+        else
+            log "⚠️  Ошибка удаления (права?): $TARGET_DIR"
+        fi
     fi
     exit 0
 fi
 
-# Удаление всех бэкапов ИБ
-confirm_action "УДАЛЕНИЕ ВСЕХ бэкапов ИБ '$IB_NAME'"
+# Удаление всех бэкапов ИБ (с --older-than — только меток старше даты)
+if [[ -n "${OLDER_THAN:-}" ]]; then
+    confirm_action "Удаление бэкапов ИБ '$IB_NAME' старше $OLDER_THAN"
+else
+    confirm_action "УДАЛЕНИЕ ВСЕХ бэкапов ИБ '$IB_NAME'"
+fi
 [[ "$DRY_RUN" == true ]] && log "🔍 Симуляция: файлы НЕ будут удалены"
 
 if [[ "$DRY_RUN" == true ]]; then
     log "Будут удалены директории в: $BACKUP_DIR"
     find "$BACKUP_DIR" -maxdepth 1 -type d -name "20[0-9][0-9][01][0-9][0-3][0-9]_[0-2][0-9][0-5][0-9][0-5][0-9]" 2>/dev/null | sort | while read -r dir; do
-        log "  → $dir/"
+        older_than_match "$(basename "$dir")" && log "  → $dir/"
     done
 else
-    find "$BACKUP_DIR" -maxdepth 1 -type d -name "20[0-9][0-9][01][0-9][0-3][0-9]_[0-2][0-9][0-5][0-9][0-5][0-9]" 2>/dev/null | sort | while read -r dir; do
-        rm -rf "$dir" && log "✅ Удалён: $dir/" || log "⚠️  Не удалён (права?): $dir/"
-    done
+    while read -r dir; do
+        older_than_match "$(basename "$dir")" || continue
+        if trash_move "$dir"; then
+            log "✅ Удалён: $dir/"
+            catalog_del "$IB_NAME" "$(basename "$dir")"
+        else
+            log "⚠️  Не удалён (права?): $dir/"
+        fi
+    done < <(find "$BACKUP_DIR" -maxdepth 1 -type d -name "20[0-9][0-9][01][0-9][0-3][0-9]_[0-2][0-9][0-5][0-9][0-5][0-9]" 2>/dev/null | sort)
+    dedup_gc "$BACKUP_DIR"
+    finish_removal
 fi
 
 log "✅ Операция завершена"
@@ -0,0 +1,41 @@
+#!/bin/bash
+# engines/trash.sh — быстрое удаление бэкапов через корзину (подключается через source)
+# Каталог метки переименовывается в $BACKUP_ROOT/.trash (мгновенно, атомарно),
+# место освобождает фоновая очистка services/trash_store.py (ionice -c3, шаги truncate)
+# ВНИМАНИЕ: функции НЕ вызывают exit — вызывающий решает, что делать при ошибке
+
+TRASH_STORE_PY="${TRASH_STORE_PY:-$(cd "$(dirname "${BASH_SOURCE[0]}")/.." && pwd)/services/trash_store.py}"
+TRASH_RECLAIMED=0
+
+# Переместить каталог бэкапа в корзину: trash_move КАТАЛОГ (код возврата 1 — не удалось)
+# Размер каталога прибавляется к TRASH_RECLAIMED
+trash_move() {
+    local dir="$1"
+    local trash="${BACKUP_ROOT:-/var/backups/1c}/.trash"
+    local ib label entry size
+    ib="$(basename "$(dirname "$dir")")"
+    label="$(basename "$dir")"
+    entry="${ib}__${label}__$(date +%s%N)"
+    mkdir -p "$trash" || return 1
+    # find — только метаданные ФС; метаданные пишутся до переименования,
+    # чтобы очиститель не увидел элемент без них
+    size=$(find "$dir" -type f -printf '%s\n' 2>/dev/null | awk '{s+=$1} END {printf "%.0f\n", s}')
+    echo "{\"entry\":\"$entry\",\"ib\":\"$ib\",\"label\":\"$label\",\"size_bytes\":$size,\"trashed_at\":$(date +%s)}" \
+        > "$trash/$entry.json"
+    # На другой ФС mv скопировал бы данные вместо rename — тогда удаляем на месте
+    if [[ "$(stat -c %d "$dir")" != "$(stat -c %d "$trash")" ]] || ! mv -T "$dir" "$trash/$entry" 2>/dev/null; then
+        rm -f "$trash/$entry.json"
+        rm -rf "$dir" || return 1
+    fi
+    TRASH_RECLAIMED=$((TRASH_RECLAIMED + size))
+    return 0
+}
+
+# Запустить фоновую очистку корзины (если уже идёт — новый процесс сразу выйдет)
+trash_purge_background() {
+    local root="${BACKUP_ROOT:-/var/backups/1c}"
+    [[ -d "$root/.trash" ]] || return 0
+    python3 "$TRASH_STORE_PY" purge --root "$root" --background 2>&1 || \
+        echo "⚠️  Фоновая очистка корзины не запущена: $root/.trash" >&2
+    return 0
+}
@@ -26,7 +26,7 @@ else
     warnings+=("Не найдено каталогов информационных баз в $BACKUP_DIR")
   fi
   
-  zero_list=$(find "$BACKUP_DIR" -type f \( -name "*.dump" -o -name "*.dt" -o -name "*.sql.gz" -o -name "backup.dump" -o -name "backup.sql*" \) -size 0 2>/dev/null || true)
+  zero_list=$(find "$BACKUP_DIR" -type f \( -name "*.dump" -o -name "*.dt" -o -name "*.sql.gz" -o -name "*.sql.zst" -o -name "backup.dump" -o -name "backup.sql*" \) -size 0 2>/dev/null || true)
   zero_size=$(echo "$zero_list" | grep -c '^' || echo "0")
   if [[ "$zero_size" -gt 0 ]]; then
     warnings+=("Найдено $zero_size файлов нулевого размера")
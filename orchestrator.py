@@ -2,72 +2,186 @@
 """
 orchestrator.py — ВНУТРЕННЯЯ точка маршрутизации
 Вызывается через симлинк ib_1c как единая команда администрирования 1С.
+
+Быстрый старт: команда известна из реестра commands.COMMANDS — модуль импортируется
+сразу, без argparse, чтения help_examples.txt и обхода commands/. Полный разбор
+аргументов — только для справки ib_1c и неизвестных команд.
+`ib_1c КОМАНДА --help` отдаётся из кэша справки без импорта модуля команды.
 """
 
+import os
 import sys
-import argparse
 import importlib
-from pathlib import Path
 
-SCRIPTS_DIR = Path(__file__).resolve().parent
-sys.path.insert(0, str(SCRIPTS_DIR))
+# Без pathlib: на горячем пути (справка из кэша) его импорт дороже всего остального
+SCRIPTS_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+
+from commands import COMMANDS, DAEMON_COMMANDS
+
+HELP_FLAGS = {"-h", "--help"}
+
+# Переменные окружения, от которых зависят значения по умолчанию в справке команд
+HELP_ENV_PREFIXES = ("BACKUP_", "CLOUD_", "DAEMON_", "DUMP_", "METRICS_", "PG_", "RAC_", "RAS_", "RETENTION_", "SESSION_", "SIZE_", "SPACE_", "SQL_", "VERIFY_")
+
+HELP_CACHE_DIR = os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "ib_1c", "help")
+
 
 def get_available_commands():
-    """Динамически получить список доступных команд из commands/"""
-    cli_dir = SCRIPTS_DIR / "commands"
-    commands = []
-    if cli_dir.exists():
-        for f in cli_dir.glob("*.py"):
-            if f.name != "__init__.py" and not f.name.startswith("_"):
-                commands.append(f.stem)
-    return sorted(commands)
-
-def main():
+    """Список доступных команд (реестр commands.COMMANDS)"""
+    return sorted(COMMANDS)
+
+
+def build_parser():
+    """Парсер верхнего уровня: справка ib_1c со списком команд и примерами"""
+    import argparse
+
     available_commands = get_available_commands()
-    
+
     # Чтение примеров из файла
-    examples_file = SCRIPTS_DIR / "docs" / "help_examples.txt"
-    examples_text = examples_file.read_text() if examples_file.exists() else "Примеры:\n  ib_1c backup --format dump --ib ИМЯ_ИБ"
+    examples_file = os.path.join(SCRIPTS_DIR, "docs", "help_examples.txt")
+    examples_text = open(examples_file).read() if os.path.exists(examples_file) else "Примеры:\n  ib_1c backup --format dump --ib ИМЯ_ИБ"
+    commands_text = "\n".join(f"  {name:<10} {COMMANDS[name]}" for name in available_commands)
 
     parser = argparse.ArgumentParser(
         prog="ib_1c",
         description="Единая команда администрирования 1С",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog=f"""
-Доступные команды: {', '.join(available_commands) if available_commands else 'нет'}
+Доступные команды:
+{commands_text}
 
 {examples_text}
         """
     )
     
-    parser.add_argument("command", choices=available_commands or ["backup", "rm"], 
-                       help="Операция над ИБ (динамически определяется из commands/)")
+    parser.add_argument("command", choices=available_commands,
+                       help="Операция над ИБ (реестр commands.COMMANDS)")
     parser.add_argument("args", nargs=argparse.REMAINDER, help="Аргументы операции")
-    
-    args = parser.parse_args()
-    
+    return parser
+
+
+# Каталоги, из которых справка команд берёт тексты и значения по умолчанию
+HELP_SOURCE_DIRS = ("commands", "core", "services", "utils")
+
+
+def _help_cache_key(command: str) -> str:
+    """Ключ кэша справки: исходники команд и сервисов, окружение, имя и ширина терминала"""
+    # Справка собирается и из сервисов (варианты сжатия, умолчания хранения), поэтому
+    # учитываются все модули: время изменения каталога (добавление/удаление файла)
+    # и самое позднее время изменения .py в нём
+    mtimes = []
+    for name in HELP_SOURCE_DIRS:
+        path = os.path.join(SCRIPTS_DIR, name)
+        try:
+            latest = os.stat(path).st_mtime_ns
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.name.endswith(".py"):
+                        latest = max(latest, entry.stat().st_mtime_ns)
+        except OSError:
+            latest = 0
+        mtimes.append(latest)
+    columns = os.environ.get("COLUMNS")
+    if not columns:
+        try:
+            columns = os.get_terminal_size(sys.__stdout__.fileno()).columns
+        except (AttributeError, ValueError, OSError):
+            columns = 80
+    env = sorted((k, v) for k, v in os.environ.items() if k.startswith(HELP_ENV_PREFIXES))
+    prog = os.path.basename(sys.argv[0])  # usage: ib_1c … или orchestrator.py …
+    return repr((sys.version_info[:2], prog, mtimes, columns, env))
+
+
+def print_command_help(command: str, module=None) -> int:
+    """
+    Справка команды из кэша; при промахе — вызвать main(["--help"]) и сохранить вывод.
+    """
+    cache_path = os.path.join(HELP_CACHE_DIR, f"{command}.txt")
+    key = _help_cache_key(command)
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached_key, _, text = f.read().partition("\n")
+        if cached_key == key:
+            sys.stdout.write(text)
+            return 0
+    except (OSError, ValueError):
+        pass
+
+    import contextlib
+    import io
+
+    module = module or importlib.import_module(f"commands.{command}")
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        try:
+            module.main(["--help"])
+        except SystemExit:
+            pass
+    text = buffer.getvalue()
+    sys.stdout.write(text)
+    try:
+        os.makedirs(HELP_CACHE_DIR, exist_ok=True)
+        tmp_path = os.path.join(HELP_CACHE_DIR, f".{command}.txt.{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(f"{key}\n{text}")
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # Нет доступа к кэшу — справка всё равно напечатана
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    if not argv or argv[0] not in COMMANDS:
+        # Справка, пустой вызов или неизвестная команда — argparse печатает и выходит
+        parsed = build_parser().parse_args(argv)
+        argv = [parsed.command] + parsed.args
+    command, command_args = argv[0], argv[1:]
+    if len(command_args) == 1 and command_args[0] in HELP_FLAGS:
+        return print_command_help(command)
+
+    if command in DAEMON_COMMANDS:
+        # Запущен ib_1c daemon — команда встаёт в его очередь, здесь только её вывод
+        from services.daemon_client import run_via_daemon
+
+        exit_code = run_via_daemon(command, command_args)
+        if exit_code is not None:
+            return exit_code
+
     # Динамическая маршрутизация через импорт
     try:
-        module_path = f"commands.{args.command}"
+        module_path = f"commands.{command}"
         module = importlib.import_module(module_path)
         
         if not hasattr(module, "main"):
-            print(f"❌ Модуль '{args.command}' не содержит функции main()", file=sys.stderr)
+            print(f"❌ Модуль '{command}' не содержит функции main()", file=sys.stderr)
             return 1
-        
-        return module.main(args.args)
+
+        if HELP_FLAGS & set(command_args):
+            # Справка вместе с другими аргументами — без кэша и без метрик
+            return module.main(command_args)
+
+        from core.metrics import track
+
+        # Метрики команды целиком: длительность, код выхода, свободное место до/после
+        with track("command", command=command) as op:
+            exit_code = module.main(command_args)
+            op.set(exit_code=exit_code if isinstance(exit_code, int) else 0)
+        return exit_code
         
     except ModuleNotFoundError as e:
-        cli_dir = SCRIPTS_DIR / "commands"
-        print(f"❌ Команда '{args.command}' не найдена", file=sys.stderr)
-        print(f"   Доступные команды: {', '.join(available_commands)}", file=sys.stderr)
-        print(f"   Для добавления новой команды создайте: {cli_dir}/{args.command}.py", file=sys.stderr)
+        cli_dir = os.path.join(SCRIPTS_DIR, "commands")
+        print(f"❌ Команда '{command}' не найдена", file=sys.stderr)
+        print(f"   Доступные команды: {', '.join(get_available_commands())}", file=sys.stderr)
+        print(f"   Для добавления новой команды создайте: {cli_dir}/{command}.py", file=sys.stderr)
         return 1
     except KeyboardInterrupt:
         print("\n⚠️  Операция прервана пользователем", file=sys.stderr)
         return 130
     except Exception as e:
-        print(f"❌ Критическая ошибка в команде '{args.command}': {type(e).__name__}: {e}", file=sys.stderr)
+        print(f"❌ Критическая ошибка в команде '{command}': {type(e).__name__}: {e}", file=sys.stderr)
         return 1
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+"""
+backup_scheduler.py — параллельный планировщик бэкапов
+Запускает несколько pg_dump одновременно с общим лимитом и лимитом на PG_HOST.
+Крупные ИБ стартуют первыми (LPT), чтобы «хвост» ночного окна был короче.
+Необязательный допуск (admission, см. SpacePlanner) откладывает задания,
+под которые сейчас нет свободного места.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional
+
+from core.engine import terminate_engines
+
+
+class BackupScheduler:
+    """Планировщик заданий бэкапа с лимитами параллельности"""
+
+    def __init__(self, max_parallel: int, max_per_host: int,
+                 on_event: Optional[Callable[[str, Dict, Optional[Dict]], None]] = None,
+                 admission=None):
+        """
+        Args:
+            max_parallel: максимум одновременных заданий всего
+            max_per_host: максимум одновременных заданий на один сервер PostgreSQL
+            on_event: колбэк прогресса (событие 'start'/'done'/'defer', задание, результат;
+                      backup_multiple добавляет 'output' — строка вывода в result['line'])
+            admission: допуск заданий в run — объект с admit(job, idle) / release(job) /
+                       reject(job) (SpacePlanner); None — без проверки
+        """
+        self.max_parallel = max(1, max_parallel)
+        self.max_per_host = max(1, max_per_host)
+        self.on_event = on_event
+        self.admission = admission
+
+    def _notify(self, event: str, job: Dict, result: Optional[Dict] = None) -> None:
+        if self.on_event:
+            self.on_event(event, job, result)
+
+    def _next_job(self, pending: List[Dict], per_host: Dict[str, int]) -> Optional[Dict]:
+        """Первое (самое крупное) задание, для хоста которого есть свободный слот"""
+        for job in pending:
+            if per_host.get(job["host"], 0) < self.max_per_host:
+                return job
+        return None
+
+    def _next_admitted(self, pending: List[Dict], per_host: Dict[str, int],
+                       idle: bool) -> Optional[Dict]:
+        """Как _next_job, но пропуская задания, которым admission не дал места"""
+        if self.admission is None:
+            return self._next_job(pending, per_host)
+        for job in pending:
+            if per_host.get(job["host"], 0) >= self.max_per_host:
+                continue
+            if self.admission.admit(job, idle=idle):
+                return job
+            if not idle and not job.get("deferred"):
+                job["deferred"] = True
+                self._notify("defer", job)
+        return None
+
+    def simulate(self, jobs: List[Dict], durations: List[float]) -> List[Dict]:
+        """
+        Прогнать расписание без запуска: те же правила, что у run (LPT, лимиты на хост).
+
+        durations[i] — ожидаемая длительность jobs[i] в секундах.
+        Возвращает копии заданий в ИСХОДНОМ порядке с ключами start_sec / end_sec.
+        """
+        planned = [dict(job, index=i, duration_sec=durations[i]) for i, job in enumerate(jobs)]
+        pending = sorted(planned, key=lambda j: j.get("size_bytes") or 0, reverse=True)
+        per_host: Dict[str, int] = {}
+        running: List[Dict] = []
+        now = 0.0
+
+        while pending or running:
+            while len(running) < self.max_parallel:
+                job = self._next_job(pending, per_host)
+                if job is None:
+                    break
+                pending.remove(job)
+                per_host[job["host"]] = per_host.get(job["host"], 0) + 1
+                job["start_sec"] = now
+                job["end_sec"] = now + job["duration_sec"]
+                running.append(job)
+
+            # Следующее событие — завершение самого раннего из идущих заданий
+            finished = min(running, key=lambda j: j["end_sec"])
+            running.remove(finished)
+            per_host[finished["host"]] -= 1
+            now = finished["end_sec"]
+
+        return sorted(planned, key=lambda j: j["index"])
+
+    def run(self, jobs: List[Dict], runner: Callable[[Dict], Dict]) -> List[Dict]:
+        """
+        Выполнить задания и вернуть результаты в ИСХОДНОМ порядке jobs.
+
+        Каждое задание — dict с ключами ib_name, host, size_bytes.
+        runner(job) должен вернуть dict результата (как backup_ib).
+        """
+        queued_at = time.monotonic()
+        for index, job in enumerate(jobs):
+            job["index"] = index
+            job["queued_at"] = queued_at
+        pending = sorted(jobs, key=lambda j: j.get("size_bytes") or 0, reverse=True)
+        results: List[Optional[Dict]] = [None] * len(jobs)
+        per_host: Dict[str, int] = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as pool:
+            try:
+                while pending or running:
+                    while len(running) < self.max_parallel:
+                        job = self._next_admitted(pending, per_host, idle=not running)
+                        if job is None:
+                            break
+                        pending.remove(job)
+                        per_host[job["host"]] = per_host.get(job["host"], 0) + 1
+                        job["started_at"] = time.monotonic()
+                        self._notify("start", job)
+                        running[pool.submit(runner, job)] = job
+
+                    if not running:
+                        # Ничего не идёт и ни одно задание не допущено — места не прибавится
+                        for job in pending:
+                            result = self.admission.reject(job)
+                            result["duration_sec"] = 0.0
+                            results[job["index"]] = result
+                            self._notify("done", job, result)
+                        break
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job = running.pop(future)
+                        per_host[job["host"]] -= 1
+                        if self.admission:
+                            self.admission.release(job)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            result = {
+                                "success": False,
+                                "ib_name": job["ib_name"],
+                                "stdout": "",
+                                "stderr": f"{type(e).__name__}: {e}",
+                                "returncode": -1
+                            }
+                        result["duration_sec"] = time.monotonic() - job["started_at"]
+                        results[job["index"]] = result
+                        self._notify("done", job, result)
+            except KeyboardInterrupt:
+                # Ctrl+C получает только главный поток: движки в своих сессиях
+                # останавливаем явно, иначе выход из пула ждал бы конца pg_dump
+                terminate_engines()
+                raise
+
+        return results
@@ -3,99 +3,168 @@
 Чистая бизнес-логика бэкапов — без зависимости от интерфейса (CLI/Web/Telegram)
 """
 
-from typing import List, Dict, Optional
+from pathlib import Path
+from typing import List, Dict, Optional, Callable
 from core.engine import run_engine
-from core.config import Config
-import subprocess
-import sys
+from core.config import Config, get_pg_host
+from core.metrics import track
+from services.compression import CODECS, artifact_name, compress_command
+from services.manifest_service import load_manifest
+from services.history_service import BackupHistory, predict_backup
+from services.size_probe import get_db_size, get_db_sizes
+from services.space_planner import SpacePlanner, new_label, remove_partial
 import os
+import time
+import uuid
 
 
 def get_ib_size(ib_name: str) -> Optional[int]:
     """
-    Получить размер ИБ в байтах через запрос к PostgreSQL.
-    Возвращает None при ошибке подключения.
+    Получить размер ИБ в байтах (services.size_probe: один запрос на сервер, кэш с TTL).
+    Возвращает None, если размер неизвестен.
     """
-    config = Config.load()
-    
-    # Ключ -H устанавливает домашнюю директорию usr1cv8 для поиска .pgpass
-    cmd = [
-        "sudo", "-u", config.BACKUP_USER, "-H",
-        "/usr/lib/postgresql/15/bin/psql",
-        "-h", "10.129.0.27",
-        "-p", "5432",
-        "-U", "postgres",
-        "-d", ib_name,
-        "-tAc", f"SELECT pg_database_size('{ib_name}')"
-    ]
-    
-    # Явно указываем PGPASSFILE для надёжности
-    env = os.environ.copy()
-    env["PGPASSFILE"] = f"/home/{config.BACKUP_USER}/.pgpass"
-    
-    try:
-        result = subprocess.run(
-            cmd,
-            env=env,
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        if result.returncode == 0:
-            size_str = result.stdout.strip().replace(' ', '').replace(',', '')
-            return int(size_str) if size_str.isdigit() else None
-        else:
-            print(f"[DEBUG] Ошибка размера ИБ '{ib_name}': {result.stderr.strip()[:100]}", file=sys.stderr)
-            return None
-    except Exception as e:
-        print(f"[DEBUG] Исключение размера ИБ '{ib_name}': {e}", file=sys.stderr)
-        return None
-
-
-def estimate_backup_timeout(ib_name: str, size_bytes: Optional[int] = None) -> int:
+    return get_db_size(ib_name)
+
+
+def estimate_backup_timeout(ib_name: str, size_bytes: Optional[int] = None,
+                            format_type: str = "dump", compress: Optional[str] = None,
+                            concurrency: int = 1) -> int:
     """
     Рассчитать адаптивный таймаут для бэкапа ИБ.
     
-    Формула: 5 минут на каждый ГБ данных + 5 минут запаса.
-    Если размер неизвестен — используем 1 ГБ как минимум.
+    По истории бэкапов ИБ (services.history_service.predict_backup): скорость
+    BACKUP_TIMEOUT_PERCENTILE-перцентиля × BACKUP_TIMEOUT_MARGIN.
+    Истории мало — прежняя формула: 5 минут на каждый ГБ данных + 5 минут запаса.
+    Размер не передан — берётся из кэша размеров; неизвестен — используем 1 ГБ как минимум.
+    """
+    if size_bytes is None:
+        size_bytes = get_db_size(ib_name)
+    return predict_backup(ib_name, size_bytes, format_type, compress, concurrency)["timeout"]
+
+
+def choose_dump_jobs(size_bytes: Optional[int], concurrent_backups: int = 1) -> int:
+    """
+    Подобрать число потоков pg_dump -j для формата dir.
+
+    Один поток на каждые DUMP_JOBS_GB_PER_JOB ГБ данных, но не больше свободных ядер
+    (ядра минус текущая нагрузка), поделённых между одновременно идущими бэкапами,
+    и не больше DUMP_JOBS_MAX.
     """
     config = Config.load()
-    
-    if size_bytes is None or size_bytes == 0:
-        # Эвристика: минимум 1 ГБ для неопределённых ИБ
-        size_gb = 1.0
+
+    if size_bytes:
+        by_size = int(size_bytes / (1024 ** 3) / config.DUMP_JOBS_GB_PER_JOB) + 1
     else:
-        size_gb = size_bytes / (1024 ** 3)
-    
-    timeout_minutes = config.BACKUP_TIMEOUT_MINUTES_PER_GB * (size_gb + 1)
-    return max(config.BACKUP_TIMEOUT_MINIMUM, int(timeout_minutes * 60))
+        by_size = 1
 
+    cores = os.cpu_count() or 1
+    try:
+        load = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        load = 0.0
+    free_cores = max(1, int(cores - load)) // max(1, concurrent_backups)
 
-def backup_ib(ib_name: str, format_type: str, dry_run: bool = False) -> Dict[str, any]:
+    return max(1, min(by_size, free_cores, config.DUMP_JOBS_MAX))
+
+
+def backup_ib(ib_name: str, format_type: str, dry_run: bool = False,
+              size_bytes: Optional[int] = None, progress: bool = True,
+              jobs: Optional[int] = None, compress: Optional[str] = None,
+              level: Optional[int] = None, dedup: Optional[bool] = None,
+              on_output: Optional[Callable[[str], None]] = None,
+              concurrency: int = 1, queue_sec: Optional[float] = None,
+              stream_to: Optional[str] = None) -> Dict[str, any]:
     """
     Создать бэкап одной информационной базы с адаптивным таймаутом.
+
+    size_bytes — уже известный размер ИБ (чтобы не опрашивать PostgreSQL повторно).
+    progress=False — без прогресс-бара pv и с захватом вывода (для параллельного режима,
+    где несколько pv перетирали бы друг друга в терминале).
+    jobs — потоки pg_dump для формата dir (None — подобрать по размеру ИБ и свободным ядрам).
+    compress/level — кодек и уровень сжатия для формата sql (для dump/dir level → pg_dump -Z).
+    dedup — дедуплицирующее хранилище для формата dump (None — по BACKUP_DEDUP).
+    on_output — колбэк, получает вывод backup.sh построчно по мере выполнения.
+    concurrency — сколько бэкапов идёт одновременно (для прогноза и истории).
+    queue_sec — сколько задание ждало в очереди планировщика (для метрик).
+    stream_to — выгружать артефакт в это удалённое хранилище тем же проходом, что и запись
+    на диск (services/stream_upload.py; только dump/sql без дедупликации — иначе игнорируется).
+    Таймаут и прогноз длительности (predicted_sec) — по истории бэкапов ИБ;
+    каждый реальный бэкап дописывается в историю.
     """
     config = Config.load()
     cmd = ["--ib", ib_name, "--format", format_type]
+    if dedup is None:
+        dedup = config.BACKUP_DEDUP and format_type == "dump" and level is None
+    if dedup:
+        cmd.append("--dedup")
+    if format_type == "sql":
+        # Команда сжатия и суффикс — из CODECS: своей таблицы кодеков у backup.sh нет
+        compress = compress or config.SQL_COMPRESS
+        compress_cmd = compress_command(compress, level)
+        if compress_cmd:
+            cmd.extend(["--compress-cmd", " ".join(compress_cmd), "--sql-suffix", CODECS[compress]["suffix"]])
+    else:
+        compress = None
+        if level is not None:
+            cmd.extend(["--level", str(level)])
+    if not progress:
+        cmd.append("--no-progress")
+    if stream_to and format_type != "dir" and not dedup:
+        cmd.extend(["--stream-to", stream_to, "--stream-buffer", str(config.CLOUD_STREAM_BUFFER_MB)])
+    else:
+        stream_to = None
 
+    prediction = {"eta_sec": None, "source": None}
     if dry_run:
         timeout = 300
         capture = True
     else:
-        size_bytes = get_ib_size(ib_name)
-        timeout = estimate_backup_timeout(ib_name, size_bytes)
-        capture = False
-
-    result = run_engine(
-        "backup.sh",
-        cmd,
-        timeout=timeout,
-        user=config.BACKUP_USER,
-        capture_output=capture
-    )
+        if size_bytes is None:
+            size_bytes = get_ib_size(ib_name)
+        prediction = predict_backup(ib_name, size_bytes, format_type, compress, concurrency)
+        # С stream_to таймаут не растёт: backup.sh не ждёт выгрузку (stream_upload.py)
+        timeout = prediction["timeout"]
+        capture = not progress
+
+    if format_type == "dir":
+        if jobs is None:
+            jobs = choose_dump_jobs(size_bytes)
+        cmd.extend(["--jobs", str(jobs)])
+    if size_bytes:
+        # Размер для pv — чтобы backup.sh не подключался к PostgreSQL повторно
+        cmd.extend(["--db-size", str(size_bytes)])
+
+    label = run_id = None
+    if not dry_run:
+        # Метку выбираем сами: при сбое удаляется ровно каталог этого запуска
+        label, run_id = new_label(ib_name), uuid.uuid4().hex
+        cmd.extend(["--label", label, "--run-id", run_id])
+
+    with track("operation", enabled=not dry_run, operation="backup", ib=ib_name,
+               format=format_type, compress=compress, dedup=dedup, jobs=jobs,
+               concurrency=concurrency, ib_size_bytes=size_bytes, queue_sec=queue_sec) as op:
+        result = run_engine(
+            "backup.sh",
+            cmd,
+            timeout=timeout,
+            user=config.BACKUP_USER,
+            capture_output=capture,
+            on_stdout=on_output,
+            on_stderr=on_output,
+            ib_name=ib_name
+        )
+        # Размер артефакта — из manifest.json, который backup.sh пишет в конце
+        manifest = (load_manifest(Path(config.BACKUP_ROOT) / ib_name / label)
+                    if result["success"] and not dry_run else None)
+        op.set(exit_code=result["returncode"], timed_out=result["timed_out"],
+               bytes_written=manifest.get("size_bytes") if manifest else None)
+
+    if not result["success"] and not dry_run:
+        # Недописанный артефакт (ошибка, таймаут) не должен занимать место и попадать в список бэкапов
+        remove_partial(ib_name, label, run_id)
 
     # Улучшаем диагностику при таймауте — используем ПРАВИЛЬНОЕ имя ИБ (ib_name)
-    if not result["success"] and "Timeout expired" in result.get("stderr", ""):
+    if result["timed_out"]:
         size_gb = (size_bytes / (1024 ** 3)) if size_bytes else 0
         size_info = f" (~{size_gb:.1f} ГБ)" if size_bytes and size_bytes > 0 else " (размер не определён)"
         timeout_min = timeout // 60
@@ -103,24 +172,198 @@ def backup_ib(ib_name: str, format_type: str, dry_run: bool = False) -> Dict[str
         result["stderr"] = (
             f"❌ Прервано по таймауту: бэкап ИБ «{ib_name}»{size_info} не завершился за {timeout_min} мин\n"
             f"   → Проверьте: нет ли запроса пароля при sudo/psql?\n"
-            f"   → Для очень больших ИБ увеличьте BACKUP_TIMEOUT_MINUTES_PER_GB в конфигурации"
+            f"   → Для очень больших ИБ увеличьте BACKUP_TIMEOUT_MARGIN (или BACKUP_TIMEOUT_MINUTES_PER_GB) в конфигурации"
+        )
+
+    if not dry_run:
+        BackupHistory().record(
+            ib_name, format_type, size_bytes, result["wall_seconds"], result["success"],
+            compress=compress, level=level, dedup=dedup, jobs=jobs,
+            concurrency=concurrency, timed_out=result["timed_out"],
+            predicted_sec=prediction["eta_sec"],
+            artifact_bytes=manifest.get("size_bytes") if manifest else None
         )
 
     return {
         "success": result["success"],
         "ib_name": ib_name,  # ← КРИТИЧЕСКИ ВАЖНО: сохраняем правильное имя ИБ
         "format": format_type,
+        "compress": compress,
+        "artifact": artifact_name(format_type, compress, dedup),
+        "dedup": dedup,
+        "streamed_to": manifest.get("streamed_to") if manifest else None,
+        "jobs": jobs,
+        "size_bytes": size_bytes,
         "stdout": result["stdout"],
         "stderr": result["stderr"],
-        "returncode": result["returncode"]
+        "returncode": result["returncode"],
+        "timed_out": result["timed_out"],
+        "wall_seconds": result["wall_seconds"],
+        "user_seconds": result["user_seconds"],
+        "sys_seconds": result["sys_seconds"],
+        "timeout": timeout,
+        "bytes_written": manifest.get("size_bytes") if manifest else None,
+        "predicted_sec": prediction["eta_sec"],
+        "prediction_source": prediction["source"]
     }
 
 
-def backup_multiple(ib_list: List[str], format_type: str, dry_run: bool = False) -> List[Dict[str, any]]:
+def backup_multiple(ib_list: List[str], format_type: str, dry_run: bool = False,
+                    max_parallel: Optional[int] = None, max_per_host: Optional[int] = None,
+                    on_event: Optional[Callable] = None,
+                    jobs: Optional[int] = None, compress: Optional[str] = None,
+                    level: Optional[int] = None, dedup: Optional[bool] = None,
+                    make_room: Optional[bool] = None,
+                    upload: Optional[bool] = None,
+                    stream: Optional[bool] = None) -> List[Dict[str, any]]:
+    """
+    Создать бэкапы для списка информационных баз.
+
+    При max_parallel > 1 задания выполняет BackupScheduler: крупные ИБ первыми,
+    не более max_per_host одновременных pg_dump на один сервер PostgreSQL.
+    Результаты возвращаются в порядке ib_list.
+    jobs — потоки pg_dump для формата dir (None — автоматически для каждой ИБ).
+    compress/level/dedup — сжатие и дедупликация (см. backup_ib).
+    При SPACE_CHECK задание стартует, только если его артефакт помещается на диск
+    (SpacePlanner); make_room — удалять самые старые бэкапы (None — по SPACE_AUTO_PRUNE).
+    Удалённые ради места бэкапы — в result["pruned"] задания, которому понадобилось место.
+    upload — выгружать каждый готовый бэкап в облако, пока снимаются следующие
+    (services.upload_service.Uploader; None — по CLOUD_UPLOAD_AFTER_BACKUP);
+    итог выгрузки — в result["upload"] (события upload_start/upload_done — в on_event).
+    stream — выгружать dump/sql потоком во время самого дампа (None — по CLOUD_STREAM);
+    после бэкапа остаётся догрузить манифест.
+    """
+    config = Config.load()
+    if max_parallel is None:
+        max_parallel = config.BACKUP_MAX_PARALLEL
+    if max_per_host is None:
+        max_per_host = config.BACKUP_MAX_PER_HOST
+
+    if dry_run:
+        return [backup_ib(ib_name, format_type, dry_run, jobs=jobs,
+                          compress=compress, level=level, dedup=dedup)
+                for ib_name in ib_list]
+
+    # Размеры всех ИБ — одним запросом на сервер PostgreSQL
+    sizes = get_db_sizes(ib_list)
+    scheduled = [
+        {"ib_name": ib_name, "host": get_pg_host(ib_name), "size_bytes": sizes.get(ib_name)}
+        for ib_name in ib_list
+    ]
+
+    if stream is None:
+        stream = config.CLOUD_STREAM
+    uploader = None
+    if stream or (upload if upload is not None else config.CLOUD_UPLOAD_AFTER_BACKUP):
+        from services.upload_service import Uploader
+        uploader = Uploader(on_event=on_event)
+    uploads = {}
+
+    def run_backup(job: Dict, **kwargs) -> Dict:
+        started_at = time.time()
+        result = backup_ib(job["ib_name"], format_type, size_bytes=job["size_bytes"],
+                           compress=compress, level=level, dedup=dedup,
+                           stream_to=uploader.remote if stream else None, **kwargs)
+        result["pruned"] = job.get("pruned", [])
+        if uploader and result["success"]:
+            from services.upload_service import upload_after_backup
+            uploads[job["ib_name"]] = upload_after_backup(uploader, job["ib_name"], started_at)
+        return result
+
+    def collect_uploads(results: List[Dict]) -> List[Dict]:
+        if uploader:
+            uploader.wait()
+            for result in results:
+                future = uploads.get(result["ib_name"])
+                result["upload"] = future.result() if future else None
+        return results
+
+    planner = None
+    if config.SPACE_CHECK:
+        planner = SpacePlanner(auto_prune=make_room)
+        effective_compress = (compress or config.SQL_COMPRESS) if format_type == "sql" else compress
+        effective_dedup = dedup
+        if effective_dedup is None:
+            effective_dedup = config.BACKUP_DEDUP and format_type == "dump" and level is None
+        for job in scheduled:
+            job["space_bytes"] = planner.estimate(job["ib_name"], job["size_bytes"], format_type,
+                                                  effective_compress, effective_dedup)
+
+    if max_parallel <= 1 or len(ib_list) <= 1:
+        results = []
+        for job in scheduled:
+            if planner and not planner.admit(job, idle=True):
+                results.append(planner.reject(job))
+                continue
+            try:
+                result = run_backup(job, jobs=jobs)
+            finally:
+                if planner:
+                    planner.release(job)
+            results.append(result)
+        return collect_uploads(results)
+
+    from services.backup_scheduler import BackupScheduler
+    concurrent_backups = min(max_parallel, len(ib_list))
+
+    def run_job(job: Dict) -> Dict:
+        dump_jobs = jobs
+        if format_type == "dir" and dump_jobs is None:
+            # Свободные ядра делятся между одновременно идущими бэкапами
+            dump_jobs = choose_dump_jobs(job["size_bytes"], concurrent_backups)
+        on_output = None
+        if on_event:
+            # Вывод backup.sh построчно, по мере выполнения — а не одним куском в конце
+            on_output = lambda line: on_event("output", job, {"line": line})
+        return run_backup(job, progress=False, jobs=dump_jobs, on_output=on_output,
+                          concurrency=concurrent_backups,
+                          queue_sec=time.monotonic() - job["queued_at"])
+
+    scheduler = BackupScheduler(max_parallel, max_per_host, on_event=on_event, admission=planner)
+    return collect_uploads(scheduler.run(scheduled, run_job))
+
+
+def plan_backups(ib_list: List[str], format_type: str, max_parallel: Optional[int] = None,
+                 max_per_host: Optional[int] = None,
+                 compress: Optional[str] = None) -> Dict[str, any]:
     """
-    Создать бэкапы для списка информационных баз (последовательно)
+    Ожидаемое окно бэкапа списка ИБ при заданной параллельности (без запуска pg_dump).
+
+    Длительности — прогноз по истории (predict_backup); для ИБ без истории берётся
+    таймаут по формуле как верхняя оценка. Расписание — BackupScheduler.simulate.
+    Возвращает dict: jobs (ib_name, host, size_bytes, duration_sec, source, start_sec,
+    end_sec — в порядке ib_list), window_sec, max_parallel, max_per_host.
     """
-    results = []
+    from services.backup_scheduler import BackupScheduler
+
+    config = Config.load()
+    if max_parallel is None:
+        max_parallel = config.BACKUP_MAX_PARALLEL
+    if max_per_host is None:
+        max_per_host = config.BACKUP_MAX_PER_HOST
+    if format_type == "sql":
+        compress = compress or config.SQL_COMPRESS
+    concurrency = max(1, min(max_parallel, len(ib_list)))
+
+    sizes = get_db_sizes(ib_list)
+    history = BackupHistory()
+    jobs, durations = [], []
     for ib_name in ib_list:
-        results.append(backup_ib(ib_name, format_type, dry_run))
-    return results
\ No newline at end of file
+        prediction = predict_backup(ib_name, sizes.get(ib_name), format_type, compress,
+                                    concurrency, history=history)
+        jobs.append({
+            "ib_name": ib_name,
+            "host": get_pg_host(ib_name),
+            "size_bytes": sizes.get(ib_name),
+            "source": prediction["source"],
+            "samples": prediction["samples"]
+        })
+        durations.append(prediction["eta_sec"] or prediction["timeout"])
+
+    planned = BackupScheduler(max_parallel, max_per_host).simulate(jobs, durations)
+    return {
+        "jobs": planned,
+        "window_sec": max((j["end_sec"] for j in planned), default=0.0),
+        "max_parallel": max_parallel,
+        "max_per_host": max_per_host
+    }
@@ -0,0 +1,385 @@
+"""
+catalog_service.py — каталог бэкапов (журнал JSON-lines вместо повторных обходов диска)
+Журнал пополняют движки backup.sh / rm.sh / prune.sh (engines/catalog.sh),
+здесь — чтение, сжатие журнала и полная перестройка с диска (storage --reindex).
+Проигранный журнал запоминается в памяти процесса: долгоживущий процесс (ib_1c daemon)
+при следующем чтении дочитывает только дописанный хвост.
+Живые артефакты хранятся компактными записями BackupRecord (кортеж, общие строки ИБ и типа) —
+каталог на 100 тыс. бэкапов занимает десятки МБ, а не сотни, как словари.
+Разовым читателям (storage, отчёт StorageMonitor) — stream(): сжатый журнал отсортирован,
+поэтому его начало читается потоком, а в памяти держится только дописанный после сжатия хвост.
+"""
+
+import fcntl
+import heapq
+import json
+import os
+import shutil
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from core.config import BACKUP_ROOT, BACKUP_USER
+
+CATALOG_NAME = ".catalog.jsonl"
+
+# Сжимать журнал, когда «мёртвых» строк (удалённые/перезаписанные) больше, чем живых + запас
+COMPACT_SLACK = 100
+
+# Строк в хвосте журнала (после сжатия), после которых stream() сначала сжимает журнал
+STREAM_TAIL_MAX = 5000
+
+# Проигранные журналы: путь → (inode, смещение, группы, число строк)
+_replayed: Dict[str, Tuple[int, int, Dict, int]] = {}
+_replayed_lock = threading.Lock()
+
+
+class BackupRecord(NamedTuple):
+    """Артефакт бэкапа; _asdict() — запись в формате StorageMonitor.get_backups_list"""
+    ib_name: str
+    timestamp: int      # mtime артефакта, unix
+    file_type: str
+    size_bytes: int
+    path: str
+    label: str
+
+    @classmethod
+    def from_entry(cls, entry: Dict) -> "BackupRecord":
+        """Из строки журнала {"op":"add",...}; имя ИБ и тип — общие строки для всех записей"""
+        return cls(sys.intern(entry["ib"]), entry["mtime"], sys.intern(entry["type"]),
+                   entry["size"], entry["path"], entry["ts"])
+
+    @classmethod
+    def from_scan(cls, record: Dict) -> "BackupRecord":
+        """Из записи сканера (services.scanner) или list_backups.sh"""
+        return cls(sys.intern(record["ib_name"]), record["timestamp"], sys.intern(record["file_type"]),
+                   record["size_bytes"], record["path"], _backup_label(record["path"]))
+
+    def entry(self) -> Dict:
+        """Строка журнала для этой записи"""
+        return {"op": "add", "ib": self.ib_name, "ts": self.label, "type": self.file_type,
+                "size": self.size_bytes, "mtime": self.timestamp, "path": self.path}
+
+
+def _backup_label(path: str) -> str:
+    """Метка времени бэкапа = имя каталога, в котором лежит артефакт"""
+    return Path(path).parent.name
+
+
+def _record_order(record: BackupRecord) -> Tuple[str, str, str]:
+    """Порядок записей в сжатом журнале и в выдаче каталога"""
+    return record.ib_name, record.label, record.path
+
+
+class BackupCatalog:
+    """Каталог бэкапов поверх журнала $BACKUP_ROOT/.catalog.jsonl"""
+
+    def __init__(self, backup_root: Optional[Path] = None):
+        self.backup_root = Path(backup_root or BACKUP_ROOT)
+        self.path = self.backup_root / CATALOG_NAME
+        self.lock_path = self.backup_root / (CATALOG_NAME + ".lock")
+        # Отметка сжатия: {"inode", "size"} — сколько байт от начала журнала отсортировано
+        self.sorted_path = self.backup_root / (CATALOG_NAME + ".sorted")
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    @contextmanager
+    def _locked(self):
+        """Эксклюзивная блокировка — та же, что у flock в engines/catalog.sh"""
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _replay(self) -> Tuple[List[Tuple[BackupRecord, ...]], int]:
+        """
+        Проиграть журнал. Возвращает (артефакты по меткам в порядке (ИБ, метка), число строк).
+
+        Журнал только дописывается (сжатие — через rename, новый inode), поэтому при
+        том же inode проигрывается лишь хвост после прошлого чтения.
+        """
+        key = str(self.path)
+        with _replayed_lock:
+            try:
+                with open(self.path, "rb") as f:
+                    inode = os.fstat(f.fileno()).st_ino
+                    cached = _replayed.get(key)
+                    if cached and cached[0] == inode:
+                        _, offset, groups, lines = cached
+                    else:
+                        # (ИБ, метка) → артефакты метки: del снимает весь каталог метки времени разом
+                        offset, groups, lines = 0, {}, 0
+                    f.seek(offset)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break  # Строка дописывается прямо сейчас — дочитаем в следующий раз
+                        offset += len(line)
+                        lines += 1
+                        try:
+                            op = json.loads(line)
+                        except ValueError:
+                            continue  # Оборванная строка (например, при переполнении диска)
+                        if op.get("op") == "add":
+                            record = BackupRecord.from_entry(op)
+                            label_key = (record.ib_name, record.label)
+                            # Кортеж, а не dict: у метки почти всегда один артефакт
+                            groups[label_key] = tuple(r for r in groups.get(label_key, ())
+                                                      if r.path != record.path) + (record,)
+                        elif op.get("op") == "del":
+                            groups.pop((op.get("ib"), op.get("ts")), None)
+                _replayed[key] = (inode, offset, groups, lines)
+            except FileNotFoundError:
+                _replayed.pop(key, None)
+                groups, lines = {}, 0
+            # Снимок: кортежи неизменяемы, дочитывание хвоста другим потоком его не затронет
+            snapshot = [groups[label_key] for label_key in sorted(groups)]
+        return snapshot, lines
+
+    def _write(self, entries: Iterable[Dict], tail: Iterable[Dict] = ()) -> None:
+        """Атомарно переписать журнал (временный файл + rename). Вызывать под блокировкой
+
+        entries — живые записи в порядке _record_order, tail — операции без порядка
+        (дописанные во время перестройки); граница между ними — в отметке .sorted.
+        """
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            sorted_size = f.tell()
+            for entry in tail:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._chown(tmp_path)
+        os.replace(tmp_path, self.path)
+
+        mark_tmp = self.sorted_path.with_name(self.sorted_path.name + ".tmp")
+        with open(mark_tmp, "w", encoding="utf-8") as f:
+            json.dump({"inode": os.stat(self.path).st_ino, "size": sorted_size}, f)
+        self._chown(mark_tmp)
+        os.replace(mark_tmp, self.sorted_path)
+
+    @staticmethod
+    def _chown(path: Path) -> None:
+        try:
+            # Журнал дописывают движки от имени usr1cv8 — файл должен остаться его
+            shutil.chown(path, user=BACKUP_USER)
+        except (LookupError, OSError):
+            pass
+
+    def _sorted_size(self, st: os.stat_result) -> Optional[int]:
+        """Длина отсортированного начала журнала; None — отметки нет или она от другого файла"""
+        try:
+            with open(self.sorted_path, "r", encoding="utf-8") as f:
+                mark = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if mark.get("inode") != st.st_ino or not 0 <= mark.get("size", -1) <= st.st_size:
+            return None
+        return mark["size"]
+
+    def _merged(self, f, sorted_size: int) -> Tuple[Iterator[BackupRecord], int]:
+        """
+        Слить отсортированное начало журнала (читается лениво из f) с проигранным хвостом.
+
+        Возвращает (поток живых записей по _record_order, число строк хвоста).
+        Запись из начала журнала мертва, если в хвосте удалена её метка или перезаписан путь.
+        """
+        f.seek(sorted_size)
+        groups, deleted, lines = {}, set(), 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # Строка дописывается прямо сейчас
+            lines += 1
+            try:
+                op = json.loads(line)
+            except ValueError:
+                continue
+            if op.get("op") == "add":
+                record = BackupRecord.from_entry(op)
+                label_key = (record.ib_name, record.label)
+                groups[label_key] = tuple(r for r in groups.get(label_key, ())
+                                          if r.path != record.path) + (record,)
+            elif op.get("op") == "del":
+                label_key = (op.get("ib"), op.get("ts"))
+                groups.pop(label_key, None)
+                deleted.add(label_key)
+        tail = sorted((r for group in groups.values() for r in group), key=_record_order)
+        replaced = {r.path for r in tail}
+
+        def head() -> Iterator[BackupRecord]:
+            f.seek(0)
+            offset = 0
+            for line in f:
+                offset += len(line)
+                if offset > sorted_size:
+                    return
+                try:
+                    record = BackupRecord.from_entry(json.loads(line))
+                except (ValueError, KeyError):
+                    continue
+                if (record.ib_name, record.label) not in deleted and record.path not in replaced:
+                    yield record
+
+        return heapq.merge(head(), tail, key=_record_order), lines
+
+    def _live(self) -> Iterator[BackupRecord]:
+        """Живые записи по _record_order: потоком по отметке .sorted, без неё — проигрыванием журнала"""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            sorted_size = self._sorted_size(os.fstat(f.fileno()))
+            if sorted_size is not None:
+                yield from self._merged(f, sorted_size)[0]
+                return
+        groups, _ = self._replay()
+        for group in groups:
+            yield from sorted(group, key=_record_order) if len(group) > 1 else group
+
+    def records(self) -> Iterator[BackupRecord]:
+        """Все живые артефакты каталога по порядку (ИБ, метка, путь); журнал сжимается, если разросся
+        (и если есть права на запись — иначе читается как есть)
+
+        Проигранный журнал остаётся в памяти процесса (см. _replayed) — для ib_1c daemon.
+        """
+        groups, lines = self._replay()
+        live = sum(len(group) for group in groups)
+        if lines > 2 * live + COMPACT_SLACK:
+            try:
+                self.compact()
+            except OSError:
+                pass  # Нет прав на запись (каталог usr1cv8) — читаем несжатый журнал
+        for group in groups:
+            yield from sorted(group, key=_record_order) if len(group) > 1 else group
+
+    def stream(self) -> Iterator[BackupRecord]:
+        """
+        Все живые артефакты по порядку, как records(), но без загрузки каталога в память.
+
+        Для разовых читателей: в памяти — только хвост журнала после сжатия. Журнал без
+        отметки .sorted (старый) или с длинным хвостом сначала сжимается; нет прав
+        на сжатие — журнал проигрывается целиком, как в records().
+        """
+        for attempt in (1, 2):
+            try:
+                f = open(self.path, "rb")
+            except FileNotFoundError:
+                return
+            with f:
+                sorted_size = self._sorted_size(os.fstat(f.fileno()))
+                if sorted_size is not None:
+                    records, tail_lines = self._merged(f, sorted_size)
+                    if tail_lines <= STREAM_TAIL_MAX or attempt == 2:
+                        yield from records
+                        return
+            if attempt == 1:
+                try:
+                    self.compact()
+                except OSError:
+                    break
+        yield from self.records()
+
+    def entries(self) -> List[Dict]:
+        """Все живые записи каталога в формате журнала"""
+        return [record.entry() for record in self.records()]
+
+    def compact(self) -> int:
+        """Переписать журнал, оставив только живые записи (отсортированные, с отметкой .sorted)"""
+        count = 0
+
+        def live() -> Iterator[Dict]:
+            nonlocal count
+            for record in self._live():
+                count += 1
+                yield record.entry()
+
+        with self._locked():
+            self._write(live())
+        return count
+
+    def reindex(self) -> int:
+        """Перестроить каталог с диска (встроенный сканер, fallback — list_backups.sh).
+
+        Возвращает число артефактов.
+        """
+        # Операции, дописанные движками во время обхода диска, переносятся в новый журнал
+        try:
+            offset = self.path.stat().st_size
+        except FileNotFoundError:
+            offset = 0
+
+        from services.scanner import scan_backups
+
+        try:
+            records = [BackupRecord.from_scan(r) for r in scan_backups(self.backup_root)]
+        except Exception:
+            records = self._scan_engine()
+        records.sort(key=lambda r: (r.ib_name, r.label, r.path))
+
+        with self._locked():
+            tail = []
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    f.seek(offset)
+                    for line in f:
+                        try:
+                            tail.append(json.loads(line))
+                        except ValueError:
+                            continue
+            except FileNotFoundError:
+                pass
+            self._write((r.entry() for r in records), tail)
+        return len(records)
+
+    def _scan_engine(self) -> List[BackupRecord]:
+        """Обход диска через list_backups.sh (запасной путь); вывод разбирается построчно, без буфера"""
+        from core.engine import run_engine
+
+        records, errors = [], []
+
+        def on_line(line: str) -> None:
+            parts = line.split("\t")
+            if len(parts) < 5 or parts[0] == "ib_name":
+                return
+            try:
+                records.append(BackupRecord.from_scan({
+                    "ib_name": parts[0],
+                    "timestamp": int(parts[1]),
+                    "file_type": parts[2],
+                    "size_bytes": int(parts[3]),
+                    "path": parts[4]
+                }))
+            except ValueError:
+                pass
+
+        result = run_engine("list_backups.sh", ["--path", str(self.backup_root)], user=BACKUP_USER,
+                            capture_output=False, on_stdout=on_line, on_stderr=errors.append)
+        if result["returncode"] != 0:
+            raise RuntimeError(f"list_backups.sh failed: {'; '.join(errors[-5:])}")
+        return records
+
+    def add(self, ib_name: str, label: str, path: Path, file_type: str, size_bytes: int, mtime: int) -> None:
+        """Добавить артефакт (для Python-кода; движки пишут через catalog.sh)"""
+        self._append({"op": "add", "ib": ib_name, "ts": label, "type": file_type,
+                      "size": size_bytes, "mtime": mtime, "path": str(path)})
+
+    def remove(self, ib_name: str, label: str) -> None:
+        """Отметить удаление бэкапа ИБ с меткой label"""
+        self._append({"op": "del", "ib": ib_name, "ts": label})
+
+    def _append(self, op: Dict) -> None:
+        with self._locked():
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(op, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def backups(self) -> Iterator[Dict]:
+        """Записи в формате StorageMonitor.get_backups_list"""
+        for record in self.records():
+            yield record._asdict()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+chunk_store.py — дедуплицирующее хранилище бэкапов (content-defined chunking)
+Поток pg_dump -Fc -Z0 режется на куски по содержимому, каждый кусок хранится
+один раз в $BACKUP_ROOT/<ИБ>/.chunks, в каталоге метки времени — только индекс
+backup.dump.idx. Восстановление собирает дамп обратно потоком (cat).
+
+Модуль без зависимостей от core/: движки запускают его напрямую
+(python3 services/chunk_store.py put|cat|verify|gc|stats).
+
+Формат индекса: первая строка — JSON-заголовок (size_bytes — логический размер,
+hash — BLAKE2b-512 всего потока, как у b2sum), далее «хэш_куска размер» на строку.
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+STORE_DIR = ".chunks"
+LOCK_NAME = ".lock"
+
+# Границы кусков: минимум / средний / максимум
+CHUNK_MIN = 256 * 1024
+CHUNK_AVG = 1024 * 1024
+CHUNK_MAX = 4 * 1024 * 1024
+
+READ_SIZE = 8 * 1024 * 1024
+CHUNK_DIGEST_SIZE = 20          # BLAKE2b-160 — имя куска
+COMPRESS_LEVEL = 3              # zlib: дамп без сжатия (-Z0), сжимаются только новые куски
+WRITE_WORKERS = 4               # zlib и blake2b отпускают GIL — сжатие идёт в пуле потоков
+
+
+def iter_chunks(stream: BinaryIO, min_size: int = CHUNK_MIN, avg_size: int = CHUNK_AVG,
+                max_size: int = CHUNK_MAX) -> Iterator[bytes]:
+    """
+    Разрезать поток на куски по содержимому.
+
+    Граница ставится после строки (данные COPY в дампе — строки таблиц), если
+    crc32(строки) % avg_size < длины строки: вероятность границы пропорциональна
+    объёму, средний кусок ≈ avg_size. Вставка строк в таблицу меняет только
+    соседние куски — остальные совпадают с прошлым дампом. Строки длиннее
+    max_size (bytea) режутся на куски фиксированного размера.
+    """
+    pending = bytearray()
+    carry = b""
+    while True:
+        block = stream.read(READ_SIZE)
+        data = carry + block if carry else block
+        # Обрабатываем до последнего перевода строки, хвост — в следующий блок
+        limit = data.rfind(b"\n") + 1 if block else len(data)
+        if len(data) - limit > max_size:
+            limit = len(data)  # Длинная строка без переводов (bytea) — не копим её целиком
+        carry = data[limit:]
+
+        start = pos = 0  # start — начало ещё не выданных данных, pos — начало текущей строки
+        while pos < limit:
+            target = start + min_size - len(pending)
+            if target - 1 > pos:
+                # До минимального размера границы не ищем — сразу к строке, где он достигается
+                newline = data.find(b"\n", target - 1, limit)
+                if newline < 0:
+                    break
+                previous = data.rfind(b"\n", pos, newline)
+                if previous >= 0:
+                    pos = previous + 1
+            else:
+                newline = data.find(b"\n", pos, limit)
+            line_end = newline + 1 if newline >= 0 else limit
+
+            if len(pending) + line_end - start > max_size:
+                cut = start + max_size - len(pending)
+                pending += data[start:cut]
+                yield bytes(pending)
+                pending = bytearray()
+                start = pos = cut
+                continue
+
+            if zlib.crc32(data[pos:line_end]) % avg_size < line_end - pos:
+                pending += data[start:line_end]
+                yield bytes(pending)
+                pending = bytearray()
+                start = line_end
+            pos = line_end
+
+        pending += data[start:limit]
+        if not block:
+            break
+
+    if pending:
+        yield bytes(pending)
+
+
+def chunk_path(store: Path, chunk_hash: str) -> Path:
+    """Путь к куску: .chunks/ab/abcdef… (256 подкаталогов)"""
+    return store / chunk_hash[:2] / chunk_hash
+
+
+@contextmanager
+def store_lock(store: Path, exclusive: bool):
+    """Блокировка хранилища: запись (put) — разделяемая, сборка мусора (gc) — эксклюзивная"""
+    store.mkdir(parents=True, exist_ok=True)
+    with open(store / LOCK_NAME, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _store_chunk(store: Path, chunk_hash: str, data: bytes) -> int:
+    """Записать новый кусок (атомарно). Возвращает записанный объём на диске"""
+    path = chunk_path(store, chunk_hash)
+    path.parent.mkdir(exist_ok=True)
+    compressed = zlib.compress(data, COMPRESS_LEVEL)
+    tmp_path = path.with_name(f"{chunk_hash}.tmp.{os.getpid()}.{id(data)}")
+    with open(tmp_path, "wb") as f:
+        f.write(compressed)
+    os.replace(tmp_path, path)
+    return len(compressed)
+
+
+def put_stream(stream: BinaryIO, store: Path, index_path: Path,
+               format_type: str = "dump") -> Dict[str, int]:
+    """
+    Записать поток в хранилище кусков и создать индекс.
+
+    Возвращает статистику: size_bytes (логический), chunks, new_chunks, stored_bytes.
+    """
+    store = Path(store)
+    index_path = Path(index_path)
+    stream_hash = hashlib.blake2b()
+    entries: List[str] = []
+    stats = {"size_bytes": 0, "chunks": 0, "new_chunks": 0, "stored_bytes": 0}
+    seen = set()
+
+    with store_lock(store, exclusive=False), ThreadPoolExecutor(max_workers=WRITE_WORKERS) as pool:
+        futures = []
+        for data in iter_chunks(stream):
+            stream_hash.update(data)
+            chunk_hash = hashlib.blake2b(data, digest_size=CHUNK_DIGEST_SIZE).hexdigest()
+            entries.append(f"{chunk_hash} {len(data)}\n")
+            stats["size_bytes"] += len(data)
+            stats["chunks"] += 1
+
+            if chunk_hash in seen:
+                continue
+            seen.add(chunk_hash)
+            path = chunk_path(store, chunk_hash)
+            if path.exists():
+                # Кусок уже есть — обновляем mtime (видно, какие куски используются свежими бэкапами)
+                os.utime(path)
+                continue
+            stats["new_chunks"] += 1
+            futures.append(pool.submit(_store_chunk, store, chunk_hash, data))
+            # Не держим в памяти больше нескольких несжатых кусков
+            if len(futures) >= WRITE_WORKERS * 2:
+                stats["stored_bytes"] += futures.pop(0).result()
+        for future in futures:
+            stats["stored_bytes"] += future.result()
+
+        header = {
+            "version": INDEX_VERSION,
+            "kind": "dedup_index",
+            "format": format_type,
+            "size_bytes": stats["size_bytes"],
+            "hash_algo": "blake2b",
+            "hash": stream_hash.hexdigest(),
+            "chunk_hash": f"blake2b-{CHUNK_DIGEST_SIZE * 8}",
+            "compression": "zlib",
+            "chunks": stats["chunks"]
+        }
+        # Индекс появляется атомарно и только после записи всех кусков
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header, separators=(",", ":")) + "\n")
+            f.writelines(entries)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, index_path)
+    return stats
+
+
+def read_index_header(index_path: Path) -> Dict:
+    """Заголовок индекса (первая строка) — без чтения списка кусков"""
+    with open(index_path, "r", encoding="utf-8") as f:
+        return json.loads(f.readline())
+
+
+def read_index(index_path: Path) -> Tuple[Dict, List[Tuple[str, int]]]:
+    """Заголовок и список кусков (хэш, размер) индекса"""
+    chunks = []
+    with open(index_path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        for line in f:
+            chunk_hash, size = line.split()
+            chunks.append((chunk_hash, int(size)))
+    return header, chunks
+
+
+def iter_index_data(index_path: Path, store: Path,
+                    read_hook: Optional[Callable[[int], None]] = None) -> Iterator[bytes]:
+    """Собрать поток по индексу: куски по порядку, с проверкой хэша каждого"""
+    store = Path(store)
+    _, chunks = read_index(index_path)
+    for chunk_hash, size in chunks:
+        path = chunk_path(store, chunk_hash)
+        if read_hook:
+            read_hook(path.stat().st_size)
+        with open(path, "rb") as f:
+            data = zlib.decompress(f.read())
+        if len(data) != size or hashlib.blake2b(data, digest_size=CHUNK_DIGEST_SIZE).hexdigest() != chunk_hash:
+            raise ValueError(f"Кусок повреждён: {path}")
+        yield data
+
+
+def cat_index(index_path: Path, store: Path, out: BinaryIO) -> int:
+    """Записать восстановленный дамп в out (поток, без временного файла). Возвращает размер"""
+    total = 0
+    for data in iter_index_data(index_path, store):
+        out.write(data)
+        total += len(data)
+    out.flush()
+    return total
+
+
+def verify_index(index_path: Path, store: Path,
+                 read_hook: Optional[Callable[[int], None]] = None) -> Optional[str]:
+    """Проверить, что куски собираются в исходный поток. Возвращает текст ошибки или None"""
+    try:
+        header = read_index_header(index_path)
+        stream_hash = hashlib.blake2b()
+        total = 0
+        for data in iter_index_data(index_path, store, read_hook):
+            stream_hash.update(data)
+            total += len(data)
+    except FileNotFoundError as e:
+        return f"кусок не найден: {Path(e.filename).name}"
+    except (OSError, ValueError, zlib.error) as e:
+        return str(e)
+    if total != header.get("size_bytes"):
+        return "логический размер не совпадает с индексом"
+    if stream_hash.hexdigest() != header.get("hash"):
+        return "хэш потока не совпадает с индексом"
+    return None
+
+
+def store_for_index(index_path: Path) -> Path:
+    """Хранилище кусков ИБ для индекса <ИБ>/<метка>/backup.dump.idx"""
+    return Path(index_path).resolve().parent.parent / STORE_DIR
+
+
+def _iter_store_chunks(store: Path) -> Iterator[os.DirEntry]:
+    """Все файлы кусков хранилища"""
+    try:
+        with os.scandir(store) as top:
+            prefixes = [e.path for e in top if e.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        return
+    for prefix in prefixes:
+        with os.scandir(prefix) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def store_size(store: Path) -> int:
+    """Физический объём хранилища кусков, байт"""
+    return sum(e.stat(follow_symlinks=False).st_size for e in _iter_store_chunks(Path(store)))
+
+
+def gc_store(store: Path, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Удалить куски, на которые не ссылается ни один индекс ИБ.
+
+    Выполняется под эксклюзивной блокировкой: идущий бэкап (put) держит
+    разделяемую, поэтому его новые куски не будут приняты за мусор.
+    Возвращает: indexes, chunks, removed, freed_bytes.
+    """
+    store = Path(store)
+    ib_dir = store.parent
+    stats = {"indexes": 0, "chunks": 0, "removed": 0, "freed_bytes": 0}
+    if not store.is_dir():
+        return stats
+
+    with store_lock(store, exclusive=True):
+        referenced = set()
+        for index_path in ib_dir.glob(f"*/*{INDEX_SUFFIX}"):
+            stats["indexes"] += 1
+            _, chunks = read_index(index_path)
+            referenced.update(chunk_hash for chunk_hash, _ in chunks)
+
+        for entry in _iter_store_chunks(store):
+            stats["chunks"] += 1
+            name = entry.name
+            # Недописанные временные файлы упавших бэкапов — тоже мусор
+            if name in referenced:
+                continue
+            stats["removed"] += 1
+            stats["freed_bytes"] += entry.stat(follow_symlinks=False).st_size
+            if not dry_run:
+                os.unlink(entry.path)
+    return stats
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ["B", "K", "M", "G", "T"]:
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}P"
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(description="Дедуплицирующее хранилище бэкапов")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    put = sub.add_parser("put", help="Записать поток stdin в хранилище и создать индекс")
+    put.add_argument("--index", required=True, help="Путь к создаваемому индексу (backup.dump.idx)")
+    put.add_argument("--store", help="Каталог кусков (по умолчанию <ИБ>/.chunks)")
+    put.add_argument("--format", default="dump", help="Формат дампа в заголовке индекса")
+
+    for name, help_text in (("cat", "Собрать дамп по индексу в stdout"),
+                            ("verify", "Проверить целостность бэкапа по индексу")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--index", required=True)
+        p.add_argument("--store")
+
+    gc = sub.add_parser("gc", help="Удалить куски без ссылок из индексов")
+    gc.add_argument("--store", required=True)
+    gc.add_argument("--dry-run", action="store_true")
+
+    stats = sub.add_parser("stats", help="Логический и физический объём бэкапов ИБ")
+    stats.add_argument("--store", required=True)
+
+    parsed = parser.parse_args(args)
+
+    if parsed.action == "put":
+        index_path = Path(parsed.index)
+        store = Path(parsed.store) if parsed.store else index_path.absolute().parent.parent / STORE_DIR
+        result = put_stream(sys.stdin.buffer, store, index_path, parsed.format)
+        print(f"🧩 Кусков: {result['chunks']}, новых: {result['new_chunks']}, "
+              f"логически: {_format_bytes(result['size_bytes'])}, "
+              f"записано: {_format_bytes(result['stored_bytes'])}", file=sys.stderr)
+        return 0
+
+    if parsed.action in ("cat", "verify"):
+        store = Path(parsed.store) if parsed.store else store_for_index(parsed.index)
+        if parsed.action == "cat":
+            try:
+                cat_index(Path(parsed.index), store, sys.stdout.buffer)
+            except BrokenPipeError:
+                return 1
+            return 0
+        error = verify_index(Path(parsed.index), store)
+        if error:
+            print(f"❌ {parsed.index}: {error}", file=sys.stderr)
+            return 1
+        print(f"✅ {parsed.index}: OK")
+        return 0
+
+    if parsed.action == "gc":
+        result = gc_store(Path(parsed.store), dry_run=parsed.dry_run)
+        verb = "будет удалено" if parsed.dry_run else "удалено"
+        print(f"🧹 Куски {parsed.store}: всего {result['chunks']}, индексов {result['indexes']}, "
+              f"{verb} {result['removed']} ({_format_bytes(result['freed_bytes'])})")
+        return 0
+
+    if parsed.action == "stats":
+        store = Path(parsed.store)
+        logical = sum(read_index_header(p)["size_bytes"] for p in store.parent.glob(f"*/*{INDEX_SUFFIX}"))
+        print(f"logical_bytes={logical}")
+        print(f"physical_bytes={store_size(store)}")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
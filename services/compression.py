@@ -0,0 +1,133 @@
+"""
+compression.py — кодеки сжатия SQL-бэкапов
+Единое описание кодеков (команда, суффикс файла, допустимые уровни) и бенчмарк для выбора
+кодека по умолчанию. backup.sh своей таблицы кодеков не держит: готовую команду сжатия и суффикс
+передаёт backup_service (compress_command).
+"""
+
+import shutil
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Имя кодека → команда сжатия в stdout, суффикс, допустимые уровни и уровень по умолчанию
+CODECS = {
+    "gzip": {"cmd": ["gzip", "-c"], "suffix": ".gz", "levels": (1, 9), "default_level": 6},
+    "pigz": {"cmd": ["pigz", "-c"], "suffix": ".gz", "levels": (1, 9), "default_level": 6},
+    "zstd": {"cmd": ["zstd", "-q", "-c", "-T0"], "suffix": ".zst", "levels": (1, 19), "default_level": 3},
+    "none": {"cmd": None, "suffix": "", "levels": None, "default_level": None},
+}
+
+# Команды распаковки по суффиксу (для чтения сжатых образцов и восстановления)
+DECOMPRESSORS = {
+    ".gz": ["gzip", "-dc"],
+    ".zst": ["zstd", "-q", "-dc"],
+}
+
+
+def validate_level(codec: str, level: Optional[int]) -> None:
+    """Проверить уровень сжатия для кодека (ValueError при ошибке)"""
+    if codec not in CODECS:
+        raise ValueError(f"Неизвестный кодек '{codec}'. Доступны: {', '.join(CODECS)}")
+    if level is None:
+        return
+    levels = CODECS[codec]["levels"]
+    if levels is None:
+        raise ValueError(f"Кодек '{codec}' не поддерживает уровень сжатия")
+    if not levels[0] <= level <= levels[1]:
+        raise ValueError(f"Уровень для '{codec}' должен быть от {levels[0]} до {levels[1]}")
+
+
+def compress_command(codec: str, level: Optional[int] = None) -> Optional[List[str]]:
+    """Команда сжатия в stdout с уровнем (по умолчанию — default_level кодека); None — без сжатия"""
+    validate_level(codec, level)
+    spec = CODECS[codec]
+    if spec["cmd"] is None:
+        return None
+    return spec["cmd"] + [f"-{level if level is not None else spec['default_level']}"]
+
+
+def artifact_name(format_type: str, codec: Optional[str] = None, dedup: bool = False) -> str:
+    """Имя артефакта бэкапа в каталоге метки времени"""
+    if format_type == "dump":
+        return "backup.dump.idx" if dedup else "backup.dump"
+    if format_type == "dir":
+        return "backup.dir"
+    return "backup.sql" + CODECS[codec or "gzip"]["suffix"]
+
+
+def is_available(codec: str) -> bool:
+    """Установлена ли утилита кодека"""
+    cmd = CODECS[codec]["cmd"]
+    return cmd is None or shutil.which(cmd[0]) is not None
+
+
+def _read_sample(sample_path: Path, limit_bytes: int) -> bytes:
+    """Прочитать до limit_bytes несжатых данных образца (сжатые .gz/.zst распаковываются потоком)"""
+    decompress = DECOMPRESSORS.get(sample_path.suffix)
+    if decompress is None:
+        with open(sample_path, "rb") as f:
+            return f.read(limit_bytes)
+
+    process = subprocess.Popen(decompress + [str(sample_path)], stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+    try:
+        return process.stdout.read(limit_bytes)
+    finally:
+        process.kill()
+        process.wait()
+
+
+def benchmark_codecs(sample_path: Path, codecs: Optional[List[str]] = None,
+                     level: Optional[int] = None,
+                     sample_mb: int = 256) -> List[Dict[str, any]]:
+    """
+    Сжать образец дампа каждым кодеком и измерить скорость и степень сжатия.
+
+    Возвращает список dict: codec, level, input_bytes, output_bytes, seconds, mb_per_sec, ratio
+    (или error, если кодек не установлен / завершился с ошибкой).
+    """
+    data = _read_sample(sample_path, sample_mb * 1024 * 1024)
+    results = []
+
+    for codec in codecs or list(CODECS):
+        spec = CODECS[codec]
+        codec_level = level if level is not None and spec["levels"] else spec["default_level"]
+        row = {"codec": codec, "level": codec_level, "input_bytes": len(data)}
+
+        if not is_available(codec):
+            row["error"] = f"утилита {spec['cmd'][0]} не установлена"
+            results.append(row)
+            continue
+
+        if spec["cmd"] is None:
+            # Без сжатия — только запись как есть, скорость ограничена диском
+            row.update(output_bytes=len(data), seconds=0.0, mb_per_sec=None, ratio=1.0)
+            results.append(row)
+            continue
+
+        try:
+            cmd = compress_command(codec, codec_level)
+        except ValueError as e:
+            row["error"] = str(e)
+            results.append(row)
+            continue
+
+        started = time.monotonic()
+        result = subprocess.run(cmd, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        seconds = time.monotonic() - started
+
+        if result.returncode != 0:
+            row["error"] = result.stderr.decode(errors="replace").strip()[:200]
+        else:
+            output_bytes = len(result.stdout)
+            row.update(
+                output_bytes=output_bytes,
+                seconds=seconds,
+                mb_per_sec=(len(data) / (1024 ** 2)) / seconds if seconds > 0 else None,
+                ratio=len(data) / output_bytes if output_bytes else None
+            )
+        results.append(row)
+
+    return results
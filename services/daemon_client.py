@@ -0,0 +1,129 @@
+"""
+daemon_client.py — клиент API ib_1c daemon (HTTP через Unix-сокет, только stdlib)
+Если демон запущен, orchestrator.py ставит команды DAEMON_COMMANDS в его очередь
+и показывает их вывод, вместо того чтобы выполнять в своём процессе.
+Ctrl+C в клиенте отменяет задание. IB_1C_LOCAL=1 — выполнить команду без демона.
+"""
+
+import http.client
+import json
+import os
+import socket
+import sys
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from core.config import DAEMON_SOCKET
+
+# Флаги, с которыми команда ничего не меняет, — выполняются сразу, без очереди
+LOCAL_FLAGS = {"--dry-run", "--plan", "--bench-compress", "-h", "--help"}
+
+# Ожидание вывода за один запрос (long polling), с
+POLL_WAIT_SEC = 20
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = 60):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class DaemonError(Exception):
+    """Ответ демона с ошибкой (4xx/5xx)"""
+
+
+class DaemonClient:
+    def __init__(self, socket_path: Optional[str] = None):
+        self.socket_path = socket_path or DAEMON_SOCKET
+
+    def available(self) -> bool:
+        """Демон слушает сокет (файл сокета от упавшего демона — не считается)"""
+        if not os.path.exists(self.socket_path):
+            return False
+        try:
+            self.request("GET", "/status", timeout=5)
+            return True
+        except (OSError, DaemonError, ValueError):
+            return False
+
+    def request(self, method: str, path: str, payload: Optional[Dict] = None, timeout: float = 60):
+        conn = UnixHTTPConnection(self.socket_path, timeout=timeout)
+        try:
+            body = json.dumps(payload).encode("utf-8") if payload is not None else None
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = json.loads(response.read() or b"null")
+        finally:
+            conn.close()
+        if response.status >= 400:
+            raise DaemonError((data or {}).get("error") or f"HTTP {response.status}")
+        return data
+
+    def submit(self, command: str, args: List[str]) -> int:
+        client = f"{os.getenv('SUDO_USER') or os.getenv('USER') or '?'}@pid{os.getpid()}"
+        return self.request("POST", "/jobs", {"command": command, "args": args, "client": client})["id"]
+
+    def status(self) -> Dict:
+        return self.request("GET", "/status")
+
+    def jobs(self, active_only: bool = False) -> List[Dict]:
+        return self.request("GET", "/jobs" + ("?active=1" if active_only else ""))
+
+    def cancel(self, job_id: int) -> Optional[str]:
+        return self.request("POST", f"/jobs/{job_id}/cancel")["state"]
+
+    def output(self, job_id: int, after: int = 0, wait: float = 0) -> Tuple[Dict, List]:
+        data = self.request("GET", f"/jobs/{job_id}/output?after={after}&wait={wait}",
+                            timeout=wait + 30)
+        return data, data["lines"]
+
+    def follow(self, job_id: int, out: TextIO = sys.stdout, err: TextIO = sys.stderr) -> int:
+        """Показывать вывод задания до его завершения; возвращает код выхода"""
+        after = 0
+        while True:
+            data, lines = self.output(job_id, after, POLL_WAIT_SEC)
+            for seq, stream, line in lines:
+                print(line, file=err if stream == "stderr" else out, flush=True)
+                after = seq
+            if not lines and data["state"] in ("done", "failed", "cancelled"):
+                if data["exit_code"] is not None:
+                    return data["exit_code"]
+                return 130 if data["state"] == "cancelled" else 1
+
+
+def run_via_daemon(command: str, args: List[str]) -> Optional[int]:
+    """
+    Выполнить команду через очередь демона и вернуть её код выхода.
+    None — выполнять локально (демон не запущен, IB_1C_LOCAL=1 или команда ничего не меняет).
+    """
+    if os.getenv("IB_1C_LOCAL") == "1" or LOCAL_FLAGS & set(args):
+        return None
+    client = DaemonClient()
+    if not client.available():
+        return None
+    try:
+        job_id = client.submit(command, args)
+    except (OSError, DaemonError) as e:
+        print(f"⚠️  Демон не принял задание ({e}) — выполняю локально", file=sys.stderr)
+        return None
+    ahead = sum(1 for job in client.jobs(active_only=True) if job["id"] < job_id)
+    print(f"📨 Задание #{job_id} в очереди ib_1c daemon" + (f" (перед ним: {ahead})" if ahead else ""),
+          file=sys.stderr, flush=True)
+    try:
+        return client.follow(job_id)
+    except KeyboardInterrupt:
+        try:
+            client.cancel(job_id)
+            print(f"\n⚠️  Задание #{job_id} отменяется", file=sys.stderr)
+        except (OSError, DaemonError):
+            print(f"\n⚠️  Не удалось отменить задание #{job_id}: ib_1c daemon cancel {job_id}", file=sys.stderr)
+        return 130
+    except (OSError, DaemonError) as e:
+        print(f"❌ Связь с демоном потеряна: {e} (задание #{job_id} продолжается; "
+              f"ib_1c daemon jobs)", file=sys.stderr)
+        return 1
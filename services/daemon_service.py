@@ -0,0 +1,400 @@
+"""
+daemon_service.py — долгоживущий процесс ib_1c daemon: очередь заданий и локальный API
+Все изменяющие команды (backup, prune, rm, upload), запущенные из cron, вручную или
+через API, выполняются здесь по одной, в порядке постановки: ночной --all, ручной
+бэкап и ротация больше не идут одновременно и не делят один сервер PostgreSQL и диск
+без ведома друг друга. Параллельность внутри задания — прежняя (BackupScheduler,
+--parallel/--per-host, RETENTION_WORKERS, CLOUD_TRANSFERS).
+
+Задание — та же команда commands/<имя>.py с теми же аргументами: вывод команды
+пишется в очередь построчно, клиент (orchestrator.py → services/daemon_client.py)
+показывает его и завершается с кодом выхода задания. Каталог бэкапов и размеры баз
+живут в памяти процесса (catalog_service, size_probe) и дочитываются по изменению.
+
+API — HTTP с JSON через Unix-сокет DAEMON_SOCKET (и по TCP, если задан DAEMON_HTTP).
+Задания выполняются с правами демона (root), поэтому доступ к API — только у своих:
+сокет создаётся сразу с правами 0660 (umask на время bind), а по TCP каждый запрос
+несёт «Authorization: Bearer DAEMON_TOKEN» — без DAEMON_TOKEN TCP не поднимается.
+
+  GET  /status                     — демон, текущее задание, очередь, каталог
+  GET  /jobs[?active=1]            — задания, новые первыми
+  POST /jobs {command, args}       — поставить задание → {id}
+  GET  /jobs/ID                    — задание
+  GET  /jobs/ID/output?after=N&wait=S — вывод после строки N (ожидание до S секунд)
+  POST /jobs/ID/cancel             — отменить (в очереди — сразу, идущее — завершить движки)
+"""
+
+import contextlib
+import hmac
+import importlib
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from core.config import (BACKUP_ROOT, DAEMON_DB, DAEMON_HTTP, DAEMON_KEEP_DAYS, DAEMON_SOCKET,
+                         DAEMON_TOKEN, SIZE_CACHE_TTL, load_ib_list)
+from commands import DAEMON_COMMANDS
+from services.job_queue import FINAL_STATES, STATE_QUEUED, STATE_RUNNING, JobQueue
+
+# Как часто повторять завершение движков отменённого задания, с
+CANCEL_POLL_SEC = 1.0
+
+# Предел ожидания вывода в одном запросе /output (long polling), с
+MAX_WAIT_SEC = 30
+
+
+def _log(message: str) -> None:
+    """Журнал демона — в исходный stderr процесса (sys.stderr занят выводом задания)"""
+    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}", file=sys.__stderr__, flush=True)
+
+
+class JobOutput(io.TextIOBase):
+    """sys.stdout/sys.stderr на время задания: строки — в очередь (из любых потоков команды)"""
+
+    def __init__(self, daemon: "Daemon", job_id: int, stream: str):
+        self.daemon = daemon
+        self.job_id = job_id
+        self.stream = stream
+        self.partial = ""
+        self.lock = threading.Lock()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        with self.lock:
+            *lines, self.partial = (self.partial + text).split("\n")
+        for line in lines:
+            self.daemon.emit(self.job_id, self.stream, line)
+        return len(text)
+
+    def close_line(self) -> None:
+        with self.lock:
+            line, self.partial = self.partial, ""
+        if line:
+            self.daemon.emit(self.job_id, self.stream, line)
+
+
+class Daemon:
+    """Исполнитель очереди заданий и кэш состояния хранилища"""
+
+    def __init__(self, socket_path: Optional[str] = None, http: Optional[str] = None,
+                 db_path: Optional[Path] = None, backup_root: Optional[Path] = None,
+                 token: Optional[str] = None):
+        self.socket_path = socket_path or DAEMON_SOCKET
+        self.http = DAEMON_HTTP if http is None else http
+        self.token = DAEMON_TOKEN if token is None else token
+        self.backup_root = Path(backup_root or BACKUP_ROOT)
+        self.queue = JobQueue(db_path or DAEMON_DB)
+        self.started_at = time.time()
+        self.current: Optional[Dict] = None
+        self.stopping = threading.Event()
+        self.wakeup = threading.Event()
+        # Новые строки вывода и смена состояния заданий — для ожидающих /output
+        self.changed = threading.Condition()
+        self.servers = []
+
+    # === Очередь ===
+
+    def submit(self, command: str, args, client: Optional[str] = None) -> int:
+        if command not in DAEMON_COMMANDS:
+            raise ValueError(f"команда '{command}' не выполняется через демон "
+                             f"(доступны: {', '.join(DAEMON_COMMANDS)})")
+        if not isinstance(args, list) or not all(isinstance(a, str) for a in args):
+            raise ValueError("args — список строк")
+        job_id = self.queue.submit(command, args, client)
+        _log(f"📨 Задание #{job_id}: {command} {' '.join(args)}")
+        self.wakeup.set()
+        return job_id
+
+    def cancel(self, job_id: int) -> Optional[str]:
+        state = self.queue.cancel(job_id)
+        if state == STATE_RUNNING:
+            _log(f"⏹️  Задание #{job_id}: отмена, завершаем движки")
+            self._terminate_engines()
+        self._notify()
+        return state
+
+    def emit(self, job_id: int, stream: str, line: str) -> None:
+        self.queue.append_output(job_id, stream, line)
+        self._notify()
+
+    def _notify(self) -> None:
+        with self.changed:
+            self.changed.notify_all()
+
+    def wait_output(self, job_id: int, after: int, wait: float):
+        """Строки после after; если их нет и задание не завершено — ждать до wait секунд"""
+        deadline = time.monotonic() + min(wait, MAX_WAIT_SEC)
+        while True:
+            lines = self.queue.output(job_id, after)
+            job = self.queue.get(job_id)
+            remaining = deadline - time.monotonic()
+            if lines or job is None or job["state"] in FINAL_STATES or remaining <= 0:
+                return job, lines
+            with self.changed:
+                self.changed.wait(remaining)
+
+    @staticmethod
+    def _terminate_engines() -> None:
+        from core.engine import terminate_engines
+        terminate_engines()
+
+    # === Исполнитель ===
+
+    def _execute(self, job: Dict) -> int:
+        """Выполнить команду задания в этом процессе; вывод — в очередь"""
+        from core.metrics import track
+
+        stdout = JobOutput(self, job["id"], "stdout")
+        stderr = JobOutput(self, job["id"], "stderr")
+        exit_code = 1
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                module = importlib.import_module(f"commands.{job['command']}")
+                with track("command", command=job["command"], via="daemon") as op:
+                    result = module.main(job["args"])
+                    exit_code = result if isinstance(result, int) else 0
+                    op.set(exit_code=exit_code)
+            except SystemExit as e:
+                # parser.error и sys.exit внутри команды
+                exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            except Exception as e:
+                print(f"❌ Критическая ошибка в команде '{job['command']}': {type(e).__name__}: {e}",
+                      file=sys.stderr)
+                exit_code = 1
+            finally:
+                stdout.close_line()
+                stderr.close_line()
+        return exit_code
+
+    def _run_jobs(self) -> None:
+        while not self.stopping.is_set():
+            job = self.queue.claim_next()
+            if job is None:
+                self.wakeup.wait(timeout=5)
+                self.wakeup.clear()
+                continue
+            self.current = job
+            self._notify()
+            started = time.monotonic()
+            _log(f"▶️  Задание #{job['id']}: {job['command']} {' '.join(job['args'])}")
+            exit_code = self._execute(job)
+            state = self.queue.finish(job["id"], exit_code)
+            self.current = None
+            self._notify()
+            _log(f"{'✅' if state == 'done' else '❌'} Задание #{job['id']}: {state} "
+                 f"(код {exit_code}, {time.monotonic() - started:.0f}с)")
+
+    def _watch_cancel(self) -> None:
+        """Движки отменённого задания завершаются, пока задание не вернёт управление"""
+        while not self.stopping.wait(CANCEL_POLL_SEC):
+            job = self.current
+            if job and self.queue.cancel_requested(job["id"]):
+                self._terminate_engines()
+
+    def _maintain(self) -> None:
+        """Размеры баз — тёплыми в памяти (бэкапы стартуют без опроса PostgreSQL), чистка старых заданий"""
+        from services.size_probe import get_db_sizes
+
+        while True:
+            try:
+                removed = self.queue.purge(DAEMON_KEEP_DAYS)
+                if removed:
+                    _log(f"🧹 Удалено старых заданий: {removed}")
+                if self.current is None:
+                    get_db_sizes([ib for ib in load_ib_list() if ib])
+            except Exception as e:
+                _log(f"⚠️  Обслуживание: {type(e).__name__}: {e}")
+            if self.stopping.wait(max(60, SIZE_CACHE_TTL)):
+                return
+
+    # === Состояние ===
+
+    def status(self) -> Dict:
+        from services.catalog_service import BackupCatalog
+
+        catalog = BackupCatalog(self.backup_root)
+        ibs, labels, size_bytes = set(), set(), 0
+        for record in (catalog.records() if catalog.exists() else ()):
+            ibs.add(record.ib_name)
+            labels.add((record.ib_name, record.label))
+            size_bytes += record.size_bytes
+        return {
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "uptime_sec": round(time.time() - self.started_at),
+            "running": self.current,
+            "queued": self.queue.count(STATE_QUEUED),
+            "catalog": {
+                "ib": len(ibs),
+                "backups": len(labels),
+                "size_bytes": size_bytes
+            }
+        }
+
+    # === Серверы API ===
+
+    def _serve_unix(self) -> socketserver.BaseServer:
+        path = Path(self.socket_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            if _socket_alive(str(path)):
+                raise RuntimeError(f"демон уже запущен ({path})")
+            path.unlink()  # Сокет от упавшего демона
+        # Права — при создании: после bind и до chmod сокет был бы доступен всем
+        umask = os.umask(0o117)
+        try:
+            server = UnixHTTPServer(str(path), _Handler)
+        finally:
+            os.umask(umask)
+        return server
+
+    def _serve_tcp(self) -> socketserver.BaseServer:
+        host, _, port = self.http.rpartition(":")
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), _Handler)
+        server.token = self.token
+        return server
+
+    def serve_forever(self) -> int:
+        if self.http and not self.token:
+            raise RuntimeError("HTTP по TCP без DAEMON_TOKEN не поднимается: задания выполняются от root")
+        self.servers = [self._serve_unix()]
+        if self.http:
+            self.servers.append(self._serve_tcp())
+        for server in self.servers:
+            server.ib_daemon = self
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        recovered = self.queue.recover()
+        if recovered:
+            _log(f"♻️  Возвращены в очередь после перезапуска: {', '.join(f'#{i}' for i in recovered)}")
+
+        def stop(signum, frame):
+            _log("⏹️  Остановка: новые задания не берутся, движки текущего завершаются")
+            self.stopping.set()
+            self.wakeup.set()
+            if self.current:
+                self._terminate_engines()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        threading.Thread(target=self._watch_cancel, daemon=True).start()
+        threading.Thread(target=self._maintain, daemon=True).start()
+        _log(f"🚀 ib_1c daemon: {self.socket_path}" + (f", http://{self.http}" if self.http else "")
+             + f", очередь {self.queue.db_path}")
+        try:
+            self._run_jobs()
+        finally:
+            for server in self.servers:
+                server.shutdown()
+                server.server_close()
+            with contextlib.suppress(OSError):
+                os.unlink(self.socket_path)
+            self.queue.close()
+        return 0
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _socket_alive(path: str) -> bool:
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Маршруты API (см. докстринг модуля); ответы — JSON"""
+
+    server_version = "ib_1c-daemon"
+
+    def log_message(self, format, *args):
+        pass  # Каждый опрос /output в журнал демона не пишется
+
+    def address_string(self) -> str:
+        return "unix" if isinstance(self.client_address, (str, bytes)) else self.client_address[0]
+
+    def _reply(self, status: int, payload) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def _job_id(self, part: str) -> Optional[int]:
+        return int(part) if part.isdigit() else None
+
+    def _authorized(self) -> bool:
+        """Unix-сокет — по правам файла; TCP — по заголовку Authorization: Bearer DAEMON_TOKEN"""
+        token = getattr(self.server, "token", None)
+        if token is None:
+            return True
+        return hmac.compare_digest(self.headers.get("Authorization", "").encode(), f"Bearer {token}".encode())
+
+    def do_GET(self):
+        if not self._authorized():
+            return self._reply(401, {"error": "нужен заголовок Authorization: Bearer DAEMON_TOKEN"})
+        daemon: Daemon = self.server.ib_daemon
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["status"]:
+            return self._reply(200, daemon.status())
+        if parts == ["jobs"]:
+            active = query.get("active", ["0"])[0] == "1"
+            return self._reply(200, daemon.queue.list(active_only=active))
+        if len(parts) >= 2 and parts[0] == "jobs" and self._job_id(parts[1]) is not None:
+            job_id = self._job_id(parts[1])
+            if len(parts) == 2:
+                job = daemon.queue.get(job_id)
+                return self._reply(200, job) if job else self._reply(404, {"error": "нет задания"})
+            if parts[2:] == ["output"]:
+                after = int(query.get("after", ["0"])[0])
+                wait = float(query.get("wait", ["0"])[0])
+                job, lines = daemon.wait_output(job_id, after, wait)
+                if job is None:
+                    return self._reply(404, {"error": "нет задания"})
+                return self._reply(200, {"state": job["state"], "exit_code": job["exit_code"],
+                                         "lines": lines})
+        self._reply(404, {"error": f"нет маршрута {url.path}"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return self._reply(401, {"error": "нужен заголовок Authorization: Bearer DAEMON_TOKEN"})
+        daemon: Daemon = self.server.ib_daemon
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        try:
+            if parts == ["jobs"]:
+                body = self._body()
+                job_id = daemon.submit(body.get("command"), body.get("args", []), body.get("client"))
+                return self._reply(201, {"id": job_id})
+            if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel" and self._job_id(parts[1]):
+                state = daemon.cancel(self._job_id(parts[1]))
+                return self._reply(200, {"state": state}) if state else self._reply(404, {"error": "нет задания"})
+        except ValueError as e:
+            return self._reply(400, {"error": str(e)})
+        self._reply(404, {"error": f"нет маршрута {self.path}"})
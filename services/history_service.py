@@ -0,0 +1,215 @@
+"""
+history_service.py — история бэкапов и прогноз длительности по ней
+Каждый бэкап дописывает в $BACKUP_ROOT/.backup_history.jsonl размер, длительность,
+формат, сжатие и число одновременных бэкапов. Таймаут и ETA считаются по скорости
+прошлых бэкапов той же ИБ (перцентиль + запас) вместо фиксированных минут на ГБ.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from core.config import Config
+
+HISTORY_NAME = ".backup_history.jsonl"
+
+# Сжимать журнал, когда в нём больше строк, чем нужно модели, с запасом
+COMPACT_SLACK = 500
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Перцентиль с линейной интерполяцией (pct — от 0 до 100)"""
+    ordered = sorted(values)
+    if not ordered:
+        raise ValueError("percentile() от пустого списка")
+    pos = (len(ordered) - 1) * pct / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def estimate_timeout(size_bytes: Optional[int] = None) -> int:
+    """
+    Адаптивный таймаут операции над данными объёмом size_bytes (бэкап, восстановление).
+
+    BACKUP_TIMEOUT_MINUTES_PER_GB минут на ГБ + 1 ГБ запаса, не меньше BACKUP_TIMEOUT_MINIMUM.
+    """
+    config = Config.load()
+    
+    if size_bytes is None or size_bytes == 0:
+        # Эвристика: минимум 1 ГБ для неопределённых ИБ
+        size_gb = 1.0
+    else:
+        size_gb = size_bytes / (1024 ** 3)
+    
+    timeout_minutes = config.BACKUP_TIMEOUT_MINUTES_PER_GB * (size_gb + 1)
+    return max(config.BACKUP_TIMEOUT_MINIMUM, int(timeout_minutes * 60))
+
+
+class BackupHistory:
+    """История бэкапов поверх журнала $BACKUP_ROOT/.backup_history.jsonl"""
+
+    def __init__(self, backup_root: Optional[Path] = None):
+        self.backup_root = Path(backup_root or Config.BACKUP_ROOT)
+        self.path = self.backup_root / HISTORY_NAME
+        self.lock_path = self.backup_root / (HISTORY_NAME + ".lock")
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self) -> List[Dict]:
+        records = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue  # Оборванная строка
+        except FileNotFoundError:
+            pass
+        return records
+
+    def _write(self, records: List[Dict]) -> None:
+        """Атомарно переписать журнал. Вызывать под блокировкой"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        try:
+            shutil.chown(tmp_path, user=Config.BACKUP_USER)
+        except (LookupError, OSError):
+            pass
+        os.replace(tmp_path, self.path)
+
+    def record(self, ib_name: str, format_type: str, size_bytes: Optional[int],
+               duration_sec: float, success: bool, compress: Optional[str] = None,
+               level: Optional[int] = None, dedup: bool = False, jobs: Optional[int] = None,
+               concurrency: int = 1, timed_out: bool = False,
+               predicted_sec: Optional[float] = None, artifact_bytes: Optional[int] = None) -> None:
+        """Дописать бэкап в историю (ошибки записи не мешают бэкапу)"""
+        entry = {
+            "at": int(time.time()),
+            "ib": ib_name,
+            "format": format_type,
+            "compress": compress,
+            "level": level,
+            "dedup": dedup,
+            "jobs": jobs,
+            "concurrency": concurrency,
+            "size": size_bytes,
+            "artifact_bytes": artifact_bytes,
+            "duration": round(duration_sec, 3),
+            "predicted": round(predicted_sec, 3) if predicted_sec else None,
+            "success": success,
+            "timed_out": timed_out
+        }
+        try:
+            with self._locked():
+                created = not self.path.exists()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+                if created:
+                    try:
+                        shutil.chown(self.path, user=Config.BACKUP_USER)
+                    except (LookupError, OSError):
+                        pass
+        except OSError:
+            return
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        """Оставить по BACKUP_HISTORY_WINDOW последних бэкапов на ИБ и формат"""
+        window = Config.BACKUP_HISTORY_WINDOW
+        try:
+            with self._locked():
+                records = self._read()
+                groups: Dict[tuple, int] = {}
+                for r in records:
+                    key = (r.get("ib"), r.get("format"))
+                    groups[key] = groups.get(key, 0) + 1
+                if len(records) <= window * len(groups) + COMPACT_SLACK:
+                    return
+                kept, seen = [], {}
+                for r in reversed(records):
+                    key = (r.get("ib"), r.get("format"))
+                    seen[key] = seen.get(key, 0) + 1
+                    if seen[key] <= window:
+                        kept.append(r)
+                self._write(list(reversed(kept)))
+        except OSError:
+            pass
+
+    def records(self, ib_name: Optional[str] = None) -> List[Dict]:
+        """Записи истории (для ИБ или все), старые первыми"""
+        return [r for r in self._read() if ib_name is None or r.get("ib") == ib_name]
+
+    def throughputs(self, ib_name: Optional[str], format_type: str,
+                    compress: Optional[str] = None, concurrency: Optional[int] = None) -> List[float]:
+        """
+        Скорости (байт БД в секунду) последних успешных бэкапов — для модели.
+
+        Берутся бэкапы того же формата (и кодека для sql); если при той же
+        параллельности образцов достаточно — только они (при конкуренции за диск
+        и сеть скорость заметно ниже).
+        """
+        samples = []
+        for r in self._read():
+            if ib_name is not None and r.get("ib") != ib_name:
+                continue
+            if not r.get("success") or r.get("format") != format_type:
+                continue
+            if format_type == "sql" and compress and r.get("compress") != compress:
+                continue
+            if not r.get("size") or not r.get("duration"):
+                continue
+            samples.append((r.get("concurrency", 1), r["size"] / r["duration"]))
+        samples = samples[-Config.BACKUP_HISTORY_WINDOW:]
+
+        if concurrency is not None:
+            same = [t for c, t in samples if c == concurrency]
+            if len(same) >= Config.BACKUP_HISTORY_MIN_SAMPLES:
+                return same
+        return [t for _, t in samples]
+
+
+def predict_backup(ib_name: str, size_bytes: Optional[int], format_type: str = "dump",
+                   compress: Optional[str] = None, concurrency: int = 1,
+                   history: Optional[BackupHistory] = None) -> Dict[str, any]:
+    """
+    Прогноз длительности и таймаута бэкапа.
+
+    По истории ИБ (нет истории — по всем ИБ того же формата):
+      ETA     = размер / медианная скорость
+      таймаут = размер / BACKUP_TIMEOUT_PERCENTILE-перцентиль скорости × BACKUP_TIMEOUT_MARGIN,
+                не меньше BACKUP_TIMEOUT_HISTORY_MINIMUM (малым ИБ не нужен запас в 5 минут)
+    Образцов меньше BACKUP_HISTORY_MIN_SAMPLES или размер неизвестен — прежняя формула
+    (BACKUP_TIMEOUT_MINUTES_PER_GB минут на ГБ).
+
+    Возвращает dict: eta_sec, timeout, source (history_ib | history_all | formula), samples.
+    """
+    config = Config.load()
+    history = history or BackupHistory()
+
+    if size_bytes:
+        for source, ib in (("history_ib", ib_name), ("history_all", None)):
+            rates = history.throughputs(ib, format_type, compress, concurrency)
+            if len(rates) < config.BACKUP_HISTORY_MIN_SAMPLES:
+                continue
+            eta = size_bytes / percentile(rates, 50)
+            slow = size_bytes / percentile(rates, config.BACKUP_TIMEOUT_PERCENTILE)
+            timeout = max(config.BACKUP_TIMEOUT_HISTORY_MINIMUM, int(slow * config.BACKUP_TIMEOUT_MARGIN))
+            return {"eta_sec": eta, "timeout": timeout, "source": source, "samples": len(rates)}
+
+    return {"eta_sec": None, "timeout": estimate_timeout(size_bytes), "source": "formula", "samples": 0}
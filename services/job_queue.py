@@ -0,0 +1,190 @@
+"""
+job_queue.py — постоянная очередь заданий демона (SQLite, $BACKUP_ROOT/.daemon.sqlite)
+Задание — команда ib_1c с аргументами (backup, prune, rm, upload) и её вывод построчно.
+Состояния: queued → running → done | failed | cancelled. Очередь переживает перезапуск
+демона: задания, прерванные его падением (running), при старте возвращаются в очередь.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from core.config import DAEMON_DB
+
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+STATE_CANCELLED = "cancelled"
+FINAL_STATES = (STATE_DONE, STATE_FAILED, STATE_CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    command TEXT NOT NULL,
+    args TEXT NOT NULL,
+    state TEXT NOT NULL,
+    client TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    exit_code INTEGER,
+    cancel_requested INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+CREATE TABLE IF NOT EXISTS output (
+    job_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    stream TEXT NOT NULL,
+    line TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+JOB_FIELDS = ("id", "command", "args", "state", "client", "submitted_at", "started_at",
+              "finished_at", "exit_code", "cancel_requested")
+
+
+class JobQueue:
+    """Очередь заданий поверх SQLite (одно соединение на процесс, доступ под блокировкой)"""
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = Path(db_path or DAEMON_DB)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self._seq: Dict[int, int] = {}
+
+    @staticmethod
+    def _job(row) -> Optional[Dict]:
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        job["args"] = json.loads(job["args"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def submit(self, command: str, args: List[str], client: Optional[str] = None) -> int:
+        with self.lock:
+            cur = self.conn.execute(
+                "INSERT INTO jobs (command, args, state, client, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                (command, json.dumps(args, ensure_ascii=False), STATE_QUEUED, client, time.time()))
+            return cur.lastrowid
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?",
+                                    (job_id,)).fetchone()
+        return self._job(row)
+
+    def list(self, active_only: bool = False, limit: int = 50) -> List[Dict]:
+        """Задания, новые первыми (active_only — только в очереди и выполняющиеся)"""
+        where = f"WHERE state IN ('{STATE_QUEUED}', '{STATE_RUNNING}')" if active_only else ""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs {where} ORDER BY id DESC LIMIT ?",
+                (limit,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def count(self, state: str) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE state = ?", (state,)).fetchone()[0]
+
+    def claim_next(self) -> Optional[Dict]:
+        """Взять самое старое задание из очереди и отметить его выполняющимся"""
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE state = ? ORDER BY id LIMIT 1",
+                (STATE_QUEUED,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE jobs SET state = ?, started_at = ? WHERE id = ?",
+                              (STATE_RUNNING, time.time(), row[0]))
+        job = self._job(row)
+        job.update(state=STATE_RUNNING)
+        return job
+
+    def finish(self, job_id: int, exit_code: int) -> str:
+        """Завершить задание; успевшее завершиться успешно до отмены — done"""
+        with self.lock:
+            cancelled = self.conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?",
+                                          (job_id,)).fetchone()[0]
+            if exit_code == 0:
+                state = STATE_DONE
+            else:
+                state = STATE_CANCELLED if cancelled else STATE_FAILED
+            self.conn.execute("UPDATE jobs SET state = ?, exit_code = ?, finished_at = ? WHERE id = ?",
+                              (state, exit_code, time.time(), job_id))
+        self._seq.pop(job_id, None)
+        return state
+
+    def cancel(self, job_id: int) -> Optional[str]:
+        """
+        Отменить задание: из очереди — сразу, выполняющееся — пометить (движки
+        завершает демон). Возвращает состояние после запроса (None — задания нет).
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] == STATE_QUEUED:
+                self.conn.execute("UPDATE jobs SET state = ?, cancel_requested = 1, finished_at = ? WHERE id = ?",
+                                  (STATE_CANCELLED, time.time(), job_id))
+                return STATE_CANCELLED
+            if row[0] == STATE_RUNNING:
+                self.conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return row[0]
+
+    def cancel_requested(self, job_id: int) -> bool:
+        with self.lock:
+            row = self.conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def append_output(self, job_id: int, stream: str, line: str) -> int:
+        """Дописать строку вывода задания; возвращает её номер"""
+        with self.lock:
+            seq = self._seq.get(job_id)
+            if seq is None:
+                seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM output WHERE job_id = ?",
+                                        (job_id,)).fetchone()[0]
+            seq += 1
+            self._seq[job_id] = seq
+            self.conn.execute("INSERT INTO output (job_id, seq, stream, line) VALUES (?, ?, ?, ?)",
+                              (job_id, seq, stream, line))
+        return seq
+
+    def output(self, job_id: int, after: int = 0, limit: int = 1000) -> List[Tuple[int, str, str]]:
+        """Строки вывода после номера after: [(seq, stream, line)]"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT seq, stream, line FROM output WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (job_id, after, limit)).fetchall()
+
+    def recover(self) -> List[int]:
+        """После падения демона: выполнявшиеся задания — обратно в очередь"""
+        with self.lock:
+            ids = [row[0] for row in self.conn.execute(
+                "SELECT id FROM jobs WHERE state = ? ORDER BY id", (STATE_RUNNING,)).fetchall()]
+            self.conn.execute("UPDATE jobs SET state = ?, started_at = NULL WHERE state = ?",
+                              (STATE_QUEUED, STATE_RUNNING))
+        return ids
+
+    def purge(self, keep_days: int) -> int:
+        """Удалить завершённые задания старше keep_days вместе с выводом"""
+        cutoff = time.time() - keep_days * 86400
+        states = ", ".join(f"'{s}'" for s in FINAL_STATES)
+        with self.lock:
+            self.conn.execute(f"DELETE FROM output WHERE job_id IN (SELECT id FROM jobs "
+                              f"WHERE state IN ({states}) AND finished_at < ?)", (cutoff,))
+            return self.conn.execute(f"DELETE FROM jobs WHERE state IN ({states}) AND finished_at < ?",
+                                     (cutoff,)).rowcount
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
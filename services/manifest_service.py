@@ -0,0 +1,223 @@
+"""
+manifest_service.py — манифесты бэкапов и проверка целостности (storage --verify)
+manifest.json пишет backup.sh: размер, хэш BLAKE2b (считается потоком во время дампа),
+длительность и скорость. Здесь — чтение манифестов и сверка хэшей с диском.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from core.config import BACKUP_ROOT, BACKUP_USER, VERIFY_WORKERS, VERIFY_IO_LIMIT_MB_S
+from services.chunk_store import INDEX_SUFFIX, store_for_index, verify_index
+from services.scanner import list_ib_dirs
+
+MANIFEST_NAME = "manifest.json"
+
+# Размер блока чтения при хэшировании
+CHUNK_SIZE = 1024 * 1024
+
+
+class RateLimiter:
+    """Общий на все потоки лимит чтения (token bucket), байт/с"""
+
+    def __init__(self, bytes_per_sec: int):
+        self.rate = bytes_per_sec
+        # Ёмкость не меньше блока чтения, иначе при малом лимите блок не пройдёт никогда
+        self.capacity = float(max(bytes_per_sec, CHUNK_SIZE))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: int) -> None:
+        """Дождаться разрешения прочитать amount байт"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def load_manifest(backup_dir: Path) -> Optional[Dict]:
+    """Прочитать manifest.json каталога бэкапа (None — манифеста нет или он повреждён)"""
+    try:
+        with open(Path(backup_dir) / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def hash_file(path: Path, limiter: Optional[RateLimiter] = None) -> str:
+    """BLAKE2b-512 файла потоком (совпадает с b2sum из backup.sh)"""
+    digest = hashlib.blake2b()
+    with open(path, "rb") as f:
+        while True:
+            if limiter:
+                limiter.acquire(CHUNK_SIZE)
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _verify_dir(artifact: Path, manifest: Dict, limiter: Optional[RateLimiter]) -> Optional[str]:
+    """Сверить файлы каталога pg_dump -Fd. Возвращает текст ошибки или None"""
+    expected = manifest.get("files") or {}
+    actual = sorted(
+        str(p.relative_to(artifact)) for p in artifact.rglob("*") if p.is_file()
+    )
+    if actual != sorted(expected):
+        return "состав файлов не совпадает с манифестом"
+    listing = []
+    for name in actual:
+        file_hash = hash_file(artifact / name, limiter)
+        if file_hash != expected[name].get("hash"):
+            return f"хэш не совпадает: {name}"
+        listing.append(f"{file_hash}  {name}")
+    # Хэш каталога — как в backup.sh: b2sum от вывода «b2sum файлов»
+    dir_hash = hashlib.blake2b(("\n".join(listing) + "\n").encode()).hexdigest()
+    if dir_hash != manifest.get("hash"):
+        return "хэш каталога не совпадает"
+    return None
+
+
+def _record_verification(backup_dir: Path, manifest: Dict, ok: bool) -> None:
+    """Отметить в манифесте время и результат проверки (атомарная перезапись)"""
+    manifest["verified_at"] = int(time.time())
+    manifest["verified_ok"] = ok
+    path = Path(backup_dir) / MANIFEST_NAME
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        try:
+            shutil.chown(tmp_path, user=BACKUP_USER)
+        except (LookupError, OSError):
+            pass
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # Нет прав на запись — результат проверки всё равно возвращается
+
+
+def verify_backup(backup_dir: Path, limiter: Optional[RateLimiter] = None,
+                  record: bool = True) -> Dict[str, any]:
+    """
+    Проверить один бэкап по его манифесту.
+
+    Возвращает dict: ib_name, timestamp, artifact, size_bytes, status, error, seconds.
+    status: ok | mismatch | missing | no_manifest
+    """
+    backup_dir = Path(backup_dir)
+    result = {
+        "ib_name": backup_dir.parent.name,
+        "timestamp": backup_dir.name,
+        "artifact": None,
+        "size_bytes": 0,
+        "status": "ok",
+        "error": None,
+        "seconds": 0.0
+    }
+    started = time.monotonic()
+
+    manifest = load_manifest(backup_dir)
+    if manifest is None:
+        result.update(status="no_manifest", error="manifest.json не найден")
+        return result
+
+    artifact = backup_dir / manifest.get("artifact", "")
+    result["artifact"] = artifact.name
+    result["size_bytes"] = manifest.get("size_bytes", 0)
+
+    if not manifest.get("artifact") or not artifact.exists():
+        result.update(status="missing", error="артефакт не найден")
+    elif artifact.is_dir():
+        error = _verify_dir(artifact, manifest, limiter)
+        if error:
+            result.update(status="mismatch", error=error)
+    elif artifact.name.endswith(INDEX_SUFFIX):
+        # Дедупликация: хэш самого индекса + сборка потока из кусков (size_bytes — логический)
+        if hash_file(artifact, limiter) != manifest.get("hash"):
+            result.update(status="mismatch", error="хэш индекса не совпадает с манифестом")
+        else:
+            error = verify_index(artifact, store_for_index(artifact),
+                                 limiter.acquire if limiter else None)
+            if error:
+                result.update(status="mismatch", error=error)
+    elif artifact.stat().st_size != manifest.get("size_bytes"):
+        result.update(status="mismatch", error="размер не совпадает с манифестом")
+    elif hash_file(artifact, limiter) != manifest.get("hash"):
+        result.update(status="mismatch", error="хэш не совпадает с манифестом")
+
+    result["seconds"] = time.monotonic() - started
+    if record and result["status"] != "missing":
+        _record_verification(backup_dir, manifest, result["status"] == "ok")
+    return result
+
+
+def _backup_dirs(ib_path: Path) -> List[Path]:
+    """Каталоги меток времени внутри каталога ИБ"""
+    try:
+        return sorted(p for p in ib_path.iterdir() if p.is_dir() and not p.name.startswith("."))
+    except OSError:
+        return []
+
+
+def latest_manifest(ib_name: str, since: float = 0, backup_root: Optional[Path] = None) -> Optional[Dict]:
+    """Манифест последнего бэкапа ИБ, начатого не раньше since (unix-время), — для метрик"""
+    for backup_dir in reversed(_backup_dirs(Path(backup_root or BACKUP_ROOT) / ib_name)):
+        manifest = load_manifest(backup_dir)
+        if manifest is None:
+            continue  # Бэкап прерван до манифеста
+        return manifest if manifest.get("started_at", 0) >= int(since) else None
+    return None
+
+
+def _verify_ib(ib_path: Path, limiter: Optional[RateLimiter], record: bool) -> List[Dict]:
+    """Проверить бэкапы одной ИБ последовательно (один поток чтения на ИБ)"""
+    return [verify_backup(d, limiter, record) for d in _backup_dirs(ib_path)]
+
+
+def verify_manifests(ib_name: Optional[str] = None, workers: Optional[int] = None,
+                     io_limit_mb_s: Optional[int] = None, record: bool = True,
+                     backup_root: Optional[Path] = None) -> List[Dict[str, any]]:
+    """
+    Проверить бэкапы по манифестам: ИБ параллельно, с общим бюджетом чтения.
+
+    Args:
+        ib_name: только эта ИБ (None — все)
+        workers: сколько ИБ проверять одновременно (по умолчанию VERIFY_WORKERS)
+        io_limit_mb_s: общий лимит чтения, МБ/с (0 — без лимита, по умолчанию VERIFY_IO_LIMIT_MB_S)
+        record: записать verified_at / verified_ok в манифесты
+    """
+    root = Path(backup_root or BACKUP_ROOT)
+    workers = workers or VERIFY_WORKERS
+    io_limit = VERIFY_IO_LIMIT_MB_S if io_limit_mb_s is None else io_limit_mb_s
+    limiter = RateLimiter(io_limit * 1024 * 1024) if io_limit > 0 else None
+
+    if ib_name:
+        ib_paths = [root / ib_name] if (root / ib_name).is_dir() else []
+    else:
+        ib_paths = [Path(e.path) for e in list_ib_dirs(root)]
+    if not ib_paths:
+        return []
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(ib_paths)))) as pool:
+        for ib_results in pool.map(lambda p: _verify_ib(p, limiter, record), ib_paths):
+            results.extend(ib_results)
+    return results
@@ -0,0 +1,205 @@
+# services/rac_metadata.py
+"""
+Метаданные кластера 1С (rac) с кэшем на диске: кластеры, ИБ и их базы PostgreSQL.
+
+Раньше каждый вызов заново ходил в RAS: utils.sh держит cluster-id только в пределах
+одного процесса bash, validate_ib_exists делает полный `rac infobase list` на каждую ИБ,
+cleanup.sh хранил UUID кластера в коде. Здесь один опрос RAS даёт всё сразу —
+кластеры (`rac cluster list`), ИБ каждого кластера (`rac infobase summary list`) и
+базу каждой ИБ (`rac infobase info`, параллельно) — и результат живёт в
+$BACKUP_ROOT/.rac_cache.json RAC_CACHE_TTL секунд (по ключу RAS_HOST).
+invalidate() (ib_1c sessions --refresh) сбрасывает кэш; find_infobases перечитывает
+кластер сам, если в кэше нет запрошенной ИБ.
+
+rac вызывается через функцию-исполнитель (rac=...): её можно подменить записанным выводом.
+"""
+
+import json
+import os
+import pwd
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.config import (BACKUP_ROOT, BACKUP_USER, RAC_CACHE_TTL, RAC_CLUSTER, RAC_IB_PWD, RAC_IB_USER,
+                         RAC_PATH, RAS_HOST, SESSION_WORKERS, get_pg_host, load_version)
+
+RAC_CACHE_NAME = ".rac_cache.json"
+
+# Исполнитель rac: аргументы после адреса ras → stdout (при ошибке — RacError)
+RacRunner = Callable[[List[str]], str]
+
+RAC_TIMEOUT = 60
+
+
+class RacError(Exception):
+    """rac завершился с ошибкой или не найден"""
+
+
+def rac_path() -> str:
+    return RAC_PATH or f"/opt/1cv8/x86_64/{load_version()}/rac"
+
+
+def run_rac(args: List[str]) -> str:
+    """Вызвать rac от BACKUP_USER (как cleanup.sh и utils.sh) и вернуть stdout"""
+    cmd = [rac_path(), RAS_HOST] + args
+    if pwd.getpwuid(os.geteuid()).pw_name != BACKUP_USER:
+        cmd = ["sudo", "-u", BACKUP_USER] + cmd
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=RAC_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise RacError(f"rac {' '.join(args[:2])}: {e}")
+    if result.returncode != 0:
+        raise RacError(f"rac {' '.join(args[:2])}: {result.stderr.strip()[:200] or f'код {result.returncode}'}")
+    return result.stdout
+
+
+def parse_blocks(text: str, fields: Optional[Dict[str, str]] = None) -> Iterator[Dict[str, str]]:
+    """
+    Разобрать вывод rac («ключ : значение», объекты разделены пустой строкой) за один проход.
+    fields — оставить только эти ключи (и переименовать); без него — все ключи как есть.
+    """
+    record: Dict[str, str] = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition(":")
+        if not sep:
+            if record:
+                yield record
+                record = {}
+            continue
+        key = key.strip()
+        if fields is None:
+            record[key] = value.strip()
+        elif key in fields:
+            record[fields[key]] = value.strip().strip('"')
+    if record:
+        yield record
+
+
+# === Кэш на диске ===
+
+def _cache_path() -> Path:
+    return Path(BACKUP_ROOT) / RAC_CACHE_NAME
+
+
+def _load_cache() -> Dict[str, Dict]:
+    """Кэш: {RAS_HOST: {"probed_at": unix, "clusters": [uuid], "infobases": {имя: {...}}}}"""
+    try:
+        with open(_cache_path(), "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache: Dict[str, Dict]) -> None:
+    """Атомарная перезапись кэша (tmp + os.replace), владелец — BACKUP_USER"""
+    path = _cache_path()
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        try:
+            shutil.chown(tmp_path, user=BACKUP_USER)
+        except (LookupError, OSError):
+            pass
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # Кэш — только ускорение: без прав на запись работаем без него
+
+
+def invalidate() -> None:
+    """Сбросить кэш RAS_HOST: следующий запрос опросит кластер заново"""
+    cache = _load_cache()
+    if cache.pop(RAS_HOST, None) is not None:
+        _save_cache(cache)
+
+
+# === Опрос кластера ===
+
+def _database(cluster: str, infobase: Dict, rac: RacRunner) -> Dict:
+    """База ИБ из `rac infobase info`; без прав на ИБ — имя базы = имя ИБ, сервер — ib_hosts.conf"""
+    args = ["infobase", "info", f"--cluster={cluster}", f"--infobase={infobase['id']}"]
+    if RAC_IB_USER:
+        args += [f"--infobase-user={RAC_IB_USER}", f"--infobase-pwd={RAC_IB_PWD}"]
+    try:
+        info = next(parse_blocks(rac(args), {"db-server": "db_server", "db-name": "db_name"}), {})
+    except RacError:
+        info = {}
+    return {
+        "db_server": info.get("db_server") or get_pg_host(infobase["name"]),
+        "db_name": info.get("db_name") or infobase["name"],
+        "db_known": bool(info.get("db_name"))
+    }
+
+
+def probe_cluster(rac: RacRunner = run_rac) -> Dict:
+    """Один опрос RAS: кластеры, их ИБ и базы (infobase info — параллельно)"""
+    clusters = [RAC_CLUSTER] if RAC_CLUSTER else [
+        block["id"] for block in parse_blocks(rac(["cluster", "list"]), {"cluster": "id"}) if block.get("id")]
+    if not clusters:
+        raise RacError("rac cluster list не вернул ни одного кластера")
+    infobases = {}
+    for cluster in clusters:
+        blocks = parse_blocks(rac(["infobase", "summary", "list", f"--cluster={cluster}"]),
+                              {"infobase": "id", "name": "name", "descr": "descr"})
+        for block in blocks:
+            if block.get("id") and block.get("name"):
+                infobases[block["name"]] = {"id": block["id"], "name": block["name"], "cluster": cluster,
+                                            "descr": block.get("descr", "")}
+    with ThreadPoolExecutor(max_workers=max(1, SESSION_WORKERS)) as pool:
+        databases = pool.map(lambda ib: _database(ib["cluster"], ib, rac), list(infobases.values()))
+        for infobase, database in zip(list(infobases.values()), databases):
+            infobase.update(database)
+    return {"probed_at": int(time.time()), "clusters": clusters, "infobases": infobases}
+
+
+def get_metadata(rac: RacRunner = run_rac, max_age: Optional[int] = None, refresh: bool = False) -> Dict:
+    """
+    Метаданные кластера из кэша, если он моложе max_age (по умолчанию RAC_CACHE_TTL, 0 — без кэша),
+    иначе — опрос RAS. Если RAS недоступен — последние известные данные (даже устаревшие).
+    """
+    ttl = RAC_CACHE_TTL if max_age is None else max_age
+    cache = _load_cache() if ttl > 0 else {}
+    entry = cache.get(RAS_HOST)
+    if entry and not refresh and time.time() - entry.get("probed_at", 0) < ttl:
+        return entry
+    try:
+        entry = probe_cluster(rac)
+    except RacError:
+        if entry:
+            return entry
+        raise
+    if ttl > 0:
+        cache[RAS_HOST] = entry
+        _save_cache(cache)
+    return entry
+
+
+def cluster_id(rac: RacRunner = run_rac) -> str:
+    """UUID кластера: RAC_CLUSTER или первый кластер RAS"""
+    return RAC_CLUSTER or get_metadata(rac)["clusters"][0]
+
+
+def infobase_names(cluster: Optional[str] = None, rac: RacRunner = run_rac) -> Dict[str, str]:
+    """UUID ИБ → имя (все кластеры или только cluster)"""
+    return {ib["id"]: name for name, ib in get_metadata(rac)["infobases"].items()
+            if cluster is None or ib["cluster"] == cluster}
+
+
+def find_infobases(names: Iterable[str], rac: RacRunner = run_rac) -> Tuple[Dict[str, Dict], List[str]]:
+    """
+    Найти ИБ по именам одним обращением к метаданным: ({имя: ИБ}, [не найденные]).
+    Если в кэше каких-то ИБ нет — кластер перечитывается (ИБ могли создать после опроса).
+    """
+    names = list(dict.fromkeys(names))
+    started = int(time.time())
+    metadata = get_metadata(rac)
+    if metadata["probed_at"] < started and any(name not in metadata["infobases"] for name in names):
+        metadata = get_metadata(rac, refresh=True)
+    infobases = metadata["infobases"]
+    return ({name: infobases[name] for name in names if name in infobases},
+            [name for name in names if name not in infobases])
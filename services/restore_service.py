@@ -0,0 +1,129 @@
+# services/restore_service.py
+"""
+Бизнес-логика восстановления ИБ из бэкапа — без зависимости от интерфейса.
+Восстановление выполняет движок engines/restore.sh.
+"""
+
+import re
+from typing import Dict, List, Optional
+
+from core.config import Config
+from core.engine import run_engine
+from services.backup_service import choose_dump_jobs
+from services.history_service import estimate_timeout
+from services.chunk_store import read_index_header
+from services.scanner import tree_size
+
+# Артефакты в каталоге метки времени — в том же порядке предпочтения, что и в restore.sh
+RESTORE_ARTIFACTS = ["backup.dir", "backup.dump", "backup.dump.idx",
+                     "backup.sql.zst", "backup.sql.gz", "backup.sql"]
+
+# Артефакты, которые pg_restore читает с произвольным доступом (-j N)
+PARALLEL_ARTIFACTS = {"backup.dir", "backup.dump"}
+
+TIMESTAMP_RE = re.compile(r"20[0-9]{6}_[0-9]{6}")
+
+
+def list_backup_timestamps(ib_name: str) -> List[str]:
+    """Метки времени бэкапов ИБ, новые первыми"""
+    ib_dir = Config.BACKUP_ROOT / ib_name
+    try:
+        return sorted((p.name for p in ib_dir.iterdir()
+                       if p.is_dir() and TIMESTAMP_RE.fullmatch(p.name)), reverse=True)
+    except FileNotFoundError:
+        return []
+
+
+def find_artifact(ib_name: str, timestamp: str) -> Optional[Dict[str, any]]:
+    """
+    Найти артефакт бэкапа ИБ с меткой timestamp.
+
+    Возвращает dict: path, name, size_bytes (для дедупликации — логический размер дампа)
+    или None, если бэкапа нет.
+    """
+    backup_dir = Config.BACKUP_ROOT / ib_name / timestamp
+    for name in RESTORE_ARTIFACTS:
+        path = backup_dir / name
+        if not path.exists():
+            continue
+        if path.is_dir():
+            size = tree_size(str(path))
+        elif name.endswith(".idx"):
+            size = read_index_header(path).get("size_bytes", 0)
+        else:
+            size = path.stat().st_size
+        return {"path": path, "name": name, "size_bytes": size}
+    return None
+
+
+def restore_ib(ib_name: str, timestamp: str, target_db: Optional[str] = None,
+               jobs: Optional[int] = None, clean: bool = False,
+               dry_run: bool = False) -> Dict[str, any]:
+    """
+    Восстановить ИБ из бэкапа с адаптивным таймаутом.
+
+    target_db — база назначения (None — одноимённая ИБ).
+    jobs — потоки pg_restore для dump/dir (None — по размеру артефакта и свободным ядрам).
+    clean — пересоздать базу назначения, если она существует.
+    Таймаут считается по размеру артефакта так же, как для бэкапа (estimate_timeout).
+    """
+    config = Config.load()
+    artifact = find_artifact(ib_name, timestamp)
+    if artifact is None:
+        return {
+            "success": False,
+            "ib_name": ib_name,
+            "timestamp": timestamp,
+            "target_db": target_db or ib_name,
+            "stdout": "",
+            "stderr": f"Бэкап не найден: {Config.BACKUP_ROOT / ib_name / timestamp}",
+            "returncode": 1
+        }
+
+    if artifact["name"] in PARALLEL_ARTIFACTS:
+        if jobs is None:
+            jobs = choose_dump_jobs(artifact["size_bytes"])
+    else:
+        jobs = 1  # Поток (psql / сборка из кусков) pg_restore -j не поддерживает
+
+    cmd = ["--ib", ib_name, "--timestamp", timestamp, "--jobs", str(jobs)]
+    if target_db:
+        cmd.extend(["--target-db", target_db])
+    if clean:
+        cmd.append("--clean")
+    if dry_run:
+        cmd.append("--dry-run")
+
+    timeout = 300 if dry_run else estimate_timeout(artifact["size_bytes"])
+    result = run_engine(
+        "restore.sh",
+        cmd,
+        timeout=timeout,
+        user=config.BACKUP_USER,
+        capture_output=dry_run,
+        ib_name=ib_name
+    )
+
+    if result["timed_out"]:
+        size_gb = artifact["size_bytes"] / (1024 ** 3)
+        result["stderr"] = (
+            f"❌ Прервано по таймауту: восстановление ИБ «{ib_name}» (~{size_gb:.1f} ГБ) "
+            f"не завершилось за {timeout // 60} мин\n"
+            f"   → Для очень больших ИБ увеличьте BACKUP_TIMEOUT_MINUTES_PER_GB в конфигурации"
+        )
+
+    return {
+        "success": result["success"],
+        "ib_name": ib_name,
+        "timestamp": timestamp,
+        "target_db": target_db or ib_name,
+        "artifact": artifact["name"],
+        "size_bytes": artifact["size_bytes"],
+        "jobs": jobs,
+        "timeout": timeout,
+        "stdout": result["stdout"],
+        "stderr": result["stderr"],
+        "returncode": result["returncode"],
+        "timed_out": result["timed_out"],
+        "wall_seconds": result["wall_seconds"]
+    }
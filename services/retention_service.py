@@ -0,0 +1,248 @@
+"""
+retention_service.py — ротация бэкапов по правилам GFS (дед-отец-сын)
+План удаления считается за один проход по каталогу бэкапов (.catalog.jsonl):
+у каждой ИБ остаются последние бэкапы DAILY дней, WEEKLY недель и MONTHLY месяцев
+(из нескольких бэкапов периода — самый новый), самый новый бэкап и не меньше
+MIN_VERIFIED бэкапов, прошедших storage --verify. Правила по ИБ — retention.conf.
+Удаление — через корзину (services/trash_store.py): rename сразу, место освобождается
+очисткой с общим бюджетом МБ/с (не забивать диск под ночными бэкапами).
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from core.config import (BACKUP_ROOT, BACKUP_USER, RETENTION_IO_LIMIT_MB_S, RETENTION_WORKERS,
+                         get_retention_policy, load_retention_policies)
+from core.metrics import track
+from services.catalog_service import BackupCatalog
+from services.manifest_service import load_manifest
+from services.trash_store import (MB, TRUNCATE_STEP_MB, Pacer, move_to_trash, purge, purge_tree,
+                                 set_idle_io, spawn_purge)
+
+LABEL_FORMAT = "%Y%m%d_%H%M%S"
+
+# Ключ периода для каждого правила: бэкапы с одинаковым ключом — один период
+PERIODS = {
+    "daily": lambda dt: dt.date(),
+    "weekly": lambda dt: dt.isocalendar()[:2],
+    "monthly": lambda dt: (dt.year, dt.month),
+}
+
+REASON_LATEST = "latest"
+REASON_VERIFIED = "verified"
+
+
+def _parse_label(label: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(label, LABEL_FORMAT)
+    except ValueError:
+        return None
+
+
+def gfs_keep(labels: List[str], policy: Dict[str, int]) -> Dict[str, List[str]]:
+    """
+    Метки, которые оставляет правило GFS: {метка: [причины]}.
+
+    Период без бэкапов не расходует счётчик: daily=7 — семь последних дней,
+    в которые бэкап был, а не семь календарных дней назад от сегодня.
+    """
+    dated = sorted(((label, _parse_label(label)) for label in labels),
+                   key=lambda item: item[0], reverse=True)
+    keep: Dict[str, List[str]] = {}
+    if dated:
+        keep[dated[0][0]] = [REASON_LATEST]
+    for rule, period_of in PERIODS.items():
+        count = policy.get(rule, 0)
+        seen = set()
+        for label, dt in dated:
+            if len(seen) >= count:
+                break
+            if dt is None:
+                continue
+            period = period_of(dt)
+            if period in seen:
+                continue
+            seen.add(period)
+            keep.setdefault(label, []).append(rule)
+    # Метки не в формате backup.sh (ручные каталоги) правило не трогает
+    for label, dt in dated:
+        if dt is None:
+            keep.setdefault(label, []).append("unknown")
+    return keep
+
+
+def _is_verified(backup_dir: Path) -> bool:
+    manifest = load_manifest(backup_dir)
+    return bool(manifest and manifest.get("verified_ok") is True)
+
+
+def plan_ib(ib_name: str, labels: Dict[str, Dict], policy: Dict[str, int],
+            backup_root: Optional[Path] = None) -> Dict[str, any]:
+    """
+    План ротации одной ИБ.
+
+    labels — {метка: {"size_bytes", "dedup"}} из каталога.
+    Возвращает dict: ib_name, policy, keep / delete (списки {label, size_bytes, dedup,
+    reasons / path}, новые первыми), reclaim_bytes.
+    """
+    ib_path = Path(backup_root or BACKUP_ROOT) / ib_name
+    keep = gfs_keep(list(labels), policy)
+    delete = sorted((label for label in labels if label not in keep), reverse=True)
+
+    # Не меньше min_verified проверенных бэкапов: манифесты читаются только при нехватке
+    min_verified = policy.get("min_verified", 0)
+    if min_verified > 0:
+        verified = sum(1 for label in keep if _is_verified(ib_path / label))
+        for label in list(delete):
+            if verified >= min_verified:
+                break
+            if _is_verified(ib_path / label):
+                keep[label] = [REASON_VERIFIED]
+                delete.remove(label)
+                verified += 1
+
+    return {
+        "ib_name": ib_name,
+        "policy": policy,
+        "keep": [dict(labels[label], label=label, reasons=keep[label])
+                 for label in sorted(keep, reverse=True)],
+        "delete": [dict(labels[label], label=label, path=ib_path / label) for label in delete],
+        "reclaim_bytes": sum(labels[label]["size_bytes"] for label in delete)
+    }
+
+
+def plan_retention(ib_names: Optional[List[str]] = None,
+                   overrides: Optional[Dict[str, int]] = None,
+                   backup_root: Optional[Path] = None) -> List[Dict[str, any]]:
+    """
+    План ротации по каталогу бэкапов (один проход по журналу, без обхода диска).
+
+    ib_names — только эти ИБ (None — все ИБ каталога); overrides — правила поверх
+    retention.conf / RETENTION_* (например, {"daily": 14} из аргументов CLI).
+    """
+    root = Path(backup_root or BACKUP_ROOT)
+    catalog = BackupCatalog(root)
+    if not catalog.exists():
+        catalog.reindex()
+
+    by_ib: Dict[str, Dict[str, Dict]] = {}
+    for backup in catalog.backups():
+        if ib_names is not None and backup["ib_name"] not in ib_names:
+            continue
+        labels = by_ib.setdefault(backup["ib_name"], {})
+        entry = labels.setdefault(backup["label"], {"size_bytes": 0, "dedup": False})
+        entry["size_bytes"] += backup["size_bytes"]
+        entry["dedup"] = entry["dedup"] or backup["file_type"] == "dedup_index"
+
+    policies = load_retention_policies()
+    plans = []
+    for ib_name in sorted(by_ib):
+        policy = get_retention_policy(ib_name, policies)
+        policy.update(overrides or {})
+        plans.append(plan_ib(ib_name, by_ib[ib_name], policy, root))
+    return plans
+
+
+# === Выполнение плана ===
+
+def _delete_label(ib_name: str, backup: Dict, catalog: BackupCatalog) -> Dict[str, any]:
+    """
+    Убрать один бэкап в корзину (rename — мгновенно); место освобождает reclaim.
+    Без прав на каталог — через rm.sh от BACKUP_USER.
+    """
+    try:
+        meta = move_to_trash(backup["path"], catalog.backup_root, ib_name, backup["label"])
+        if meta is None:
+            # Каталог ИБ на другой ФС, чем корзина, — удаляем на месте
+            freed = purge_tree(Path(backup["path"]), TRUNCATE_STEP_MB * MB, Pacer(0))
+        else:
+            freed = meta["size_bytes"]
+        catalog.remove(ib_name, backup["label"])
+        return {"label": backup["label"], "success": True, "freed_bytes": freed}
+    except FileNotFoundError:
+        catalog.remove(ib_name, backup["label"])  # Уже удалён вручную — только каталог
+        return {"label": backup["label"], "success": True, "freed_bytes": 0}
+    except PermissionError:
+        from core.engine import run_engine
+
+        result = run_engine("rm.sh", ["--ib", ib_name, "--timestamp", backup["label"], "--confirm"],
+                            user=BACKUP_USER, ib_name=ib_name)
+        return {"label": backup["label"], "success": result["success"],
+                "freed_bytes": backup["size_bytes"] if result["success"] else 0,
+                "error": None if result["success"] else (result["stderr"] or result["stdout"]).strip()}
+    except OSError as e:
+        return {"label": backup["label"], "success": False, "freed_bytes": 0, "error": str(e)}
+
+
+def _apply_ib(plan: Dict, root: Path, on_event: Optional[Callable[[str, Dict, Dict], None]]) -> Dict[str, any]:
+    """Удалить бэкапы одной ИБ по плану (последовательно) и собрать мусор дедупликации"""
+    from services.chunk_store import gc_store
+
+    ib_name = plan["ib_name"]
+    catalog = BackupCatalog(root)
+    started = time.monotonic()
+    deleted = []
+    with track("operation", path=root, operation="prune", ib=ib_name) as op:
+        for backup in plan["delete"]:
+            outcome = _delete_label(ib_name, backup, catalog)
+            deleted.append(outcome)
+            if on_event:
+                on_event("deleted", plan, outcome)
+        gc_freed = 0
+        if any(b["dedup"] for b in plan["delete"]):
+            gc_freed = gc_store(root / ib_name / ".chunks")["freed_bytes"]
+        freed = sum(d["freed_bytes"] for d in deleted) + gc_freed
+        failed = [d for d in deleted if not d["success"]]
+        op.set(exit_code=1 if failed else 0, bytes_freed=freed)
+    return {
+        "ib_name": ib_name,
+        "success": not failed,
+        "deleted": [d for d in deleted if d["success"]],
+        "failed": failed,
+        "freed_bytes": freed,
+        "gc_freed_bytes": gc_freed,
+        "duration_sec": time.monotonic() - started
+    }
+
+
+def apply_retention(plans: List[Dict], workers: Optional[int] = None,
+                    on_event: Optional[Callable[[str, Dict, Dict], None]] = None,
+                    backup_root: Optional[Path] = None) -> List[Dict[str, any]]:
+    """
+    Выполнить план: бэкапы уходят в корзину, ИБ параллельно (workers, по умолчанию
+    RETENTION_WORKERS) — каталог и сборка мусора дедупликации по ИБ. Место на диске
+    освобождает reclaim (или фоновая очистка корзины).
+
+    on_event("deleted", план ИБ, {label, success, freed_bytes[, error]}) — после каждого бэкапа.
+    Результаты — в порядке plans (только ИБ, где есть что удалять).
+    """
+    root = Path(backup_root or BACKUP_ROOT)
+    plans = [plan for plan in plans if plan["delete"]]
+    if not plans:
+        return []
+    workers = workers or RETENTION_WORKERS
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(plans)))) as pool:
+        return list(pool.map(lambda plan: _apply_ib(plan, root, on_event), plans))
+
+
+def reclaim(io_limit_mb_s: Optional[int] = None, background: bool = False,
+            backup_root: Optional[Path] = None) -> Optional[Dict[str, int]]:
+    """
+    Очистить корзину: крупные файлы укорачиваются шагами, общий бюджет io_limit_mb_s
+    (по умолчанию RETENTION_IO_LIMIT_MB_S, 0 — без лимита).
+
+    background=True — запустить фоновый очиститель (ionice -c3) и вернуть None.
+    Если очистка уже идёт в другом процессе — дождаться её и дочистить остаток.
+    Возвращает: entries, freed_bytes, failed.
+    """
+    root = Path(backup_root or BACKUP_ROOT)
+    io_limit = RETENTION_IO_LIMIT_MB_S if io_limit_mb_s is None else io_limit_mb_s
+    if background:
+        spawn_purge(root, io_limit)
+        return None
+    set_idle_io()
+    return purge(root, io_limit_mb_s=io_limit, wait=True)
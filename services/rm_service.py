@@ -1,98 +1,113 @@
 """
 rm_service.py — бизнес-логика удаления бэкапов
-Прямой вызов скрипта /opt/1cv8/scripts/engines/rm.sh через subprocess
+rm.sh (core.engine.run_engine от BACKUP_USER) переносит бэкапы в корзину (мгновенно)
+и запускает фоновую очистку; освобождаемый объём движок сообщает строкой reclaimed_bytes=N
+
+Пакетное удаление (ib_1c rm): plan_removal выбирает цели всех ИБ за один проход
+по каталогу бэкапов, execute_removal удаляет их одним запуском rm.sh --stdin
+(список «ИБ/МЕТКА» — в stdin, результат — строка target на каждую цель).
 """
 
-import subprocess
-import sys
+import re
 from pathlib import Path
-from core.exceptions import RmError, PermissionError, NotFoundError
+from typing import Dict, Iterable, List, Optional
+from core.config import BACKUP_ROOT, BACKUP_USER
+from core.metrics import track
+
+RECLAIMED_RE = re.compile(r"^reclaimed_bytes=(\d+)$", re.M)
+TARGET_RE = re.compile(r"^target\t(ok|error)\t([^\t/]+)/([^\t]+)\t(.*)$", re.M)
+LABEL_RE = re.compile(r"^20\d{2}[01]\d[0-3]\d_[0-2]\d[0-5]\d[0-5]\d$")
+
+# Таймаут пакетного rm.sh: базовый + на каждую цель (rename и find по каталогу метки)
+RM_TIMEOUT = 300
+RM_TIMEOUT_PER_TARGET = 5
+
 
 class RmService:
     """Сервис удаления бэкапов ИБ"""
     
     def __init__(self):
-        self.backup_root = Path("/var/backups/1c")
-        self.rm_script = Path("/opt/1cv8/scripts/engines/rm.sh")
-    
-    def _validate_ib(self, ib_name: str) -> None:
-        """Проверить существование ИБ в хранилище"""
-        ib_path = self.backup_root / ib_name
-        if not ib_path.exists():
-            raise NotFoundError(
-                message=f"ИБ '{ib_name}' не найдена в хранилище",
-                details=f"Путь: {ib_path}"
-            )
-        if not ib_path.is_dir():
-            raise NotFoundError(
-                message=f"'{ib_name}' не является директорией ИБ",
-                details=f"Путь: {ib_path}"
-            )
-    
-    def remove_backup(self, ib_name: str, timestamp: str = None, 
-                     older_than: str = None, dry_run: bool = False, 
-                     confirm: bool = False) -> dict:
+        self.backup_root = Path(BACKUP_ROOT)
+
+    def plan_removal(self, ib_names: Optional[Iterable[str]] = None, timestamp: Optional[str] = None,
+                     older_than: Optional[str] = None) -> Dict[str, List]:
         """
-        Удалить бэкап(ы) ИБ через скрипт rm.sh
-        
-        Для --dry-run передаём --confirm в скрипт — он сам решит, нужно ли подтверждение
-        (внутри скрипта: при DRY_RUN=true подтверждение пропускается)
+        Выбрать бэкапы к удалению за один проход по каталогу (без обхода дисков по ИБ).
+
+        ib_names — ИБ (None — все ИБ каталога); timestamp — только эта метка;
+        older_than (ГГГГММДД) — метки раньше даты; без обоих — все бэкапы ИБ.
+        Возвращает {"targets": [{"ib_name", "label", "size_bytes", "files"}],
+        "missing_ib": [ИБ без каталога], "missing_timestamp": [ИБ без метки timestamp]}.
         """
-        try:
-            self._validate_ib(ib_name)
-            
-            # Формируем аргументы для скрипта
-            args = ["sudo", "-u", "usr1cv8", str(self.rm_script), "--ib", ib_name]
-            if timestamp:
-                args.extend(["--timestamp", timestamp])
-            if older_than:
-                args.extend(["--older-than", older_than])
-            if dry_run:
-                args.append("--dry-run")
-            if confirm or dry_run:  # ← КЛЮЧ: для --dry-run передаём --confirm чтобы разблокировать скрипт
-                args.append("--confirm")
-            
-            # Вызов скрипта напрямую через subprocess
-            print(f"DEBUG ARGS: {args}", file=sys.stderr)
-            result = subprocess.run(
-                args,
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 минут на операцию
-            )
-            
-            # Обработка результата
-            if result.returncode != 0:
-                stderr = result.stderr.strip() or result.stdout.strip()
-                if "не найден" in stderr or "not found" in stderr:
-                    raise NotFoundError("Бэкап не найден", stderr)
-                elif "Отказано в доступе" in stderr or "Permission denied" in stderr:
-                    raise PermissionError("Ошибка прав доступа при удалении бэкапа", stderr)
-                else:
-                    raise RmError("Ошибка при выполнении операции удаления", stderr)
-            
-            return {
-                "success": True,
-                "stdout": result.stdout,
-                "stderr": result.stderr
-            }
-            
-        except subprocess.TimeoutExpired:
-            return {
-                "success": False,
-                "stdout": "",
-                "stderr": "Таймаут операции удаления (300 сек)"
-            }
-        except Exception as e:
-            return {
-                "success": False,
-                "stdout": "",
-                "stderr": str(e)
-            }
-    
-    def remove_all_backups(self, ib_name: str, confirm: bool = False, 
-                          dry_run: bool = False) -> dict:
+        from services.catalog_service import BackupCatalog
+
+        catalog = BackupCatalog(self.backup_root)
+        if not catalog.exists():
+            catalog.reindex()
+        wanted = list(dict.fromkeys(ib_names)) if ib_names is not None else None
+        wanted_set = set(wanted) if wanted is not None else None
+
+        labels: Dict[str, Dict[str, Dict]] = {}
+        for backup in catalog.backups():
+            if wanted_set is not None and backup["ib_name"] not in wanted_set:
+                continue
+            label = backup["label"]
+            if not LABEL_RE.match(label):
+                continue
+            if timestamp and label != timestamp:
+                continue
+            if older_than and label[:8] >= older_than:
+                continue
+            target = labels.setdefault(backup["ib_name"], {}).setdefault(
+                label, {"ib_name": backup["ib_name"], "label": label, "size_bytes": 0, "files": 0})
+            target["size_bytes"] += backup["size_bytes"]
+            target["files"] += 1
+
+        names = wanted if wanted is not None else sorted(labels)
+        missing_ib = [name for name in names if not (self.backup_root / name).is_dir()]
+        return {
+            "targets": [labels[name][label] for name in names if name in labels for label in sorted(labels[name])],
+            "missing_ib": missing_ib,
+            "missing_timestamp": [name for name in names
+                                  if timestamp and name not in labels and name not in missing_ib]
+        }
+
+    def execute_removal(self, targets: List[Dict], dry_run: bool = False) -> Dict[str, any]:
         """
-        Удалить ВСЕ бэкапы ИБ
+        Удалить цели plan_removal одним запуском rm.sh --stdin от BACKUP_USER
+        (в корзину; сборка мусора дедупликации — один раз на затронутую ИБ).
+
+        Возвращает {"success", "results": [{"ib_name", "label", "success", "size_bytes", "error"}],
+        "reclaimed_bytes", "stderr"}; results — в порядке targets.
         """
-        return self.remove_backup(ib_name=ib_name, dry_run=dry_run, confirm=confirm)
+        from core.engine import run_engine
+
+        if not targets:
+            return {"success": True, "results": [], "reclaimed_bytes": 0, "stderr": ""}
+        ib_names = sorted({t["ib_name"] for t in targets})
+        args = ["--stdin", "--confirm"] + (["--dry-run"] if dry_run else [])
+        # Метка ib в Prometheus — одна ИБ или «*» для пакета: серии не плодятся по наборам ИБ
+        # (список — только в журнале, поле ibs)
+        with track("operation", path=self.backup_root, enabled=not dry_run, operation="rm",
+                   ib=ib_names[0] if len(ib_names) == 1 else "*", ibs=",".join(ib_names),
+                   targets=len(targets)) as op:
+            result = run_engine("rm.sh", args, timeout=RM_TIMEOUT + RM_TIMEOUT_PER_TARGET * len(targets),
+                                user=BACKUP_USER, input_text="".join(f"{t['ib_name']}/{t['label']}\n" for t in targets))
+            outcomes = {(m.group(2), m.group(3)): (m.group(1), m.group(4)) for m in TARGET_RE.finditer(result["stdout"])}
+            stderr = result["stderr"].strip()
+            results = []
+            for target in targets:
+                status, value = outcomes.get((target["ib_name"], target["label"]),
+                                             ("error", stderr.splitlines()[-1] if stderr else "не обработан"))
+                results.append({
+                    "ib_name": target["ib_name"],
+                    "label": target["label"],
+                    "success": status == "ok",
+                    "size_bytes": int(value) if status == "ok" else 0,
+                    "error": None if status == "ok" else value
+                })
+            match = RECLAIMED_RE.search(result["stdout"])
+            reclaimed = int(match.group(1)) if match else sum(r["size_bytes"] for r in results if not dry_run)
+            success = result["success"] and all(r["success"] for r in results)
+            op.set(exit_code=0 if success else 1, bytes_freed=reclaimed)
+        return {"success": success, "results": results, "reclaimed_bytes": reclaimed, "stderr": stderr}
@@ -0,0 +1,142 @@
+"""
+scanner.py — обход хранилища бэкапов в процессе Python (os.scandir)
+Замена list_backups.sh: без fork sed/stat/basename на каждый файл.
+Записи совпадают с TSV движка: ib_name, timestamp, file_type, size_bytes, path.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+from services.chunk_store import INDEX_SUFFIX, STORE_DIR, read_index_header
+
+# Системные каталоги в корне хранилища (как в list_backups.sh / count_backups.sh)
+SKIP_DIRS = {"lost+found", ".trash"}  # .trash — корзина удалённых бэкапов (trash_store.py)
+
+# Каталоги внутри ИБ, где нет артефактов (хранилище кусков дедупликации)
+SKIP_IB_DIRS = {STORE_DIR}
+
+# Каталог pg_dump -Fd — один артефакт, внутрь не заходим
+DIR_ARTIFACTS = {"backup.dir"}
+
+
+def artifact_type(name: str, is_dir: bool = False) -> str:
+    """Тип артефакта по имени (те же правила, что в list_backups.sh)"""
+    if is_dir:
+        return "postgres_dir"
+    if name.endswith(".dump" + INDEX_SUFFIX):
+        return "dedup_index"
+    if name.endswith(".dump"):
+        return "postgres_dump"
+    if name.endswith(".dt"):
+        return "1c_dt"
+    if name.endswith(".sql.gz"):
+        return "sql_gz"
+    if name.endswith(".sql.zst"):
+        return "sql_zst"
+    if name.endswith(".sql") or name.startswith("backup.sql"):
+        return "sql"
+    return "unknown"
+
+
+def is_backup_file(name: str) -> bool:
+    """Имя файла бэкапа (маски find из list_backups.sh)"""
+    return (name.endswith((".dump", ".dump" + INDEX_SUFFIX, ".dt", ".sql.gz", ".sql.zst"))
+            or name.startswith("backup.sql"))
+
+
+def tree_size(path: str) -> int:
+    """Суммарный размер файлов в каталоге (рекурсивно, без симлинков)"""
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            continue
+    return total
+
+
+def artifact_size(path: str, file_type: str, st: os.stat_result) -> int:
+    """Размер артефакта: для индекса дедупликации — логический размер дампа"""
+    if file_type == "dedup_index":
+        try:
+            return read_index_header(path).get("size_bytes", 0)
+        except (OSError, ValueError):
+            return 0
+    return st.st_size
+
+
+def scan_ib_dir(ib_name: str, ib_path: str) -> List[Dict[str, any]]:
+    """Все артефакты бэкапов внутри каталога одной ИБ"""
+    records = []
+    stack = [ib_path]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue  # Нет прав / каталог удалён во время обхода
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name in SKIP_IB_DIRS:
+                            continue
+                        if entry.name in DIR_ARTIFACTS:
+                            records.append({
+                                "ib_name": ib_name,
+                                "timestamp": int(entry.stat(follow_symlinks=False).st_mtime),
+                                "file_type": artifact_type(entry.name, is_dir=True),
+                                "size_bytes": tree_size(entry.path),
+                                "path": entry.path
+                            })
+                        else:
+                            stack.append(entry.path)
+                    elif is_backup_file(entry.name) and entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        file_type = artifact_type(entry.name)
+                        records.append({
+                            "ib_name": ib_name,
+                            "timestamp": int(st.st_mtime),
+                            "file_type": file_type,
+                            "size_bytes": artifact_size(entry.path, file_type, st),
+                            "path": entry.path
+                        })
+                except OSError:
+                    continue
+    return records
+
+
+def list_ib_dirs(backup_root: Path) -> List[os.DirEntry]:
+    """Каталоги ИБ в корне хранилища (без симлинков и системных каталогов)"""
+    try:
+        with os.scandir(backup_root) as it:
+            return [
+                e for e in it
+                if e.name not in SKIP_DIRS and e.is_dir(follow_symlinks=False)
+            ]
+    except FileNotFoundError:
+        return []
+
+
+def scan_backups(backup_root: Path, workers: int = 8) -> Iterator[Dict[str, any]]:
+    """
+    Обойти хранилище и выдавать записи о бэкапах по мере готовности.
+
+    Каталоги ИБ обходятся параллельно в пуле потоков (os.scandir отпускает GIL
+    на системных вызовах), записи одной ИБ выдаются пачкой по её завершении.
+    """
+    ib_dirs = list_ib_dirs(Path(backup_root))
+    if not ib_dirs:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(ib_dirs)))) as pool:
+        # Список futures не сохраняем: выданная пачка ИБ освобождается, не дожидаясь конца обхода
+        for future in as_completed([pool.submit(scan_ib_dir, e.name, e.path) for e in ib_dirs]):
+            yield from future.result()
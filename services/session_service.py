@@ -0,0 +1,111 @@
+"""
+session_service.py — завершение простаивающих сеансов 1С (ib_1c sessions, cron)
+Замена engines/cleanup.sh: тот на каждую строку `rac session list` запускал awk/cut/date
+и завершал сеансы по одному. Здесь вывод rac разбирается за один проход в компактные
+записи, простой считается в процессе, а `rac session terminate` идут параллельно
+(не больше SESSION_WORKERS одновременно). Порог простоя — по ИБ (sessions.conf).
+
+Кластер и имена ИБ — из кэша метаданных (services/rac_metadata.py). rac вызывается через
+функцию-исполнитель (rac=...), её можно подменить: например, разобрать записанный вывод
+`rac session list` без кластера.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from core.config import SESSION_WORKERS, get_session_idle_min, load_session_thresholds
+from core.metrics import track
+from services.rac_metadata import RacError, RacRunner, cluster_id, infobase_names, parse_blocks, run_rac
+
+# Поля сеанса, которые нужны для решения и отчёта: ключ rac → ключ записи
+SESSION_FIELDS = {
+    "session": "id",
+    "infobase": "infobase",
+    "user-name": "user",
+    "host": "host",
+    "app-id": "app",
+    "started-at": "started_at",
+    "last-active-at": "last_active_at",
+}
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    """Время rac (2026-02-07T14:30:22, местное) → unix; пустое или «not defined» → None"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def list_sessions(cluster: str, rac: RacRunner = run_rac, now: Optional[float] = None,
+                  names: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """
+    Сеансы кластера: компактные записи с именем ИБ и простоем в минутах
+    (idle_min — None, если rac не сообщил last-active-at).
+    """
+    names = infobase_names(cluster, rac) if names is None else names
+    now = time.time() if now is None else now
+    sessions = []
+    for record in parse_blocks(rac(["session", "list", f"--cluster={cluster}"]), SESSION_FIELDS):
+        if "id" not in record:
+            continue
+        last_active = _timestamp(record.get("last_active_at"))
+        record["ib_name"] = names.get(record.get("infobase"), record.get("infobase"))
+        record["idle_min"] = int((now - last_active) // 60) if last_active is not None else None
+        sessions.append(record)
+    return sessions
+
+
+def plan_cleanup(sessions: Iterable[Dict], ib_names: Optional[Iterable[str]] = None,
+                 idle_min: Optional[int] = None) -> Dict[str, List[Dict]]:
+    """
+    Разделить сеансы на завершаемые и остающиеся.
+    Порог — idle_min (из CLI) или sessions.conf / SESSION_IDLE_MIN; 0 — ИБ не трогать.
+    Сеанс завершается, если простаивает дольше порога (как в cleanup.sh: строго больше).
+    """
+    wanted = set(ib_names) if ib_names is not None else None
+    thresholds = load_session_thresholds()
+    terminate, keep = [], []
+    for session in sessions:
+        if wanted is not None and session["ib_name"] not in wanted:
+            continue
+        limit = idle_min if idle_min is not None else get_session_idle_min(session["ib_name"], thresholds)
+        session["limit_min"] = limit
+        idle = session["idle_min"]
+        (terminate if limit > 0 and idle is not None and idle > limit else keep).append(session)
+    terminate.sort(key=lambda s: (s["ib_name"] or "", -s["idle_min"]))
+    return {"terminate": terminate, "keep": keep}
+
+
+def terminate_sessions(cluster: str, sessions: List[Dict], workers: int = SESSION_WORKERS,
+                       rac: RacRunner = run_rac,
+                       on_done: Optional[Callable[[Dict, Optional[str]], None]] = None) -> List[Dict]:
+    """
+    Завершить сеансы параллельно (не больше workers вызовов rac одновременно).
+    Возвращает [{"session", "success", "error"}]; on_done(session, error) — по мере завершения
+    (вызовы on_done не пересекаются).
+    """
+    done_lock = threading.Lock()
+
+    def terminate(session: Dict) -> Dict:
+        error = None
+        try:
+            rac(["session", "terminate", f"--cluster={cluster}", f"--session={session['id']}"])
+        except RacError as e:
+            error = str(e)
+        if on_done:
+            with done_lock:
+                on_done(session, error)
+        return {"session": session, "success": error is None, "error": error}
+
+    with track("operation", operation="sessions", sessions=len(sessions), workers=workers) as op:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            results = list(pool.map(terminate, sessions))
+        failed = sum(1 for r in results if not r["success"])
+        op.set(exit_code=1 if failed else 0, terminated=len(results) - failed)
+    return results
@@ -0,0 +1,146 @@
+# services/size_probe.py
+"""
+Размеры баз ИБ одним запросом на сервер PostgreSQL — с кэшем на диске.
+
+Раньше размер запрашивался отдельным sudo+psql на каждую ИБ (и ещё раз в backup.sh
+для pv). Теперь один запрос к pg_database даёт размеры всех баз сервера, результат
+живёт в $BACKUP_ROOT/.db_sizes.json SIZE_CACHE_TTL секунд. Прочитанный файл
+запоминается в памяти процесса до его изменения (для ib_1c daemon).
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from core.config import Config, get_pg_host
+
+SIZE_CACHE_NAME = ".db_sizes.json"
+
+SIZE_QUERY = (
+    "SELECT datname, pg_database_size(datname) FROM pg_database "
+    "WHERE datallowconn AND NOT datistemplate"
+)
+
+
+def _cache_path() -> Path:
+    return Path(Config.BACKUP_ROOT) / SIZE_CACHE_NAME
+
+
+# Последний прочитанный кэш: (inode, mtime, размер файла) → содержимое
+_loaded: Dict[str, object] = {"stat": None, "cache": {}}
+
+
+def _load_cache() -> Dict[str, Dict]:
+    """Кэш размеров: {хост: {"probed_at": unix, "sizes": {база: байт}}}"""
+    try:
+        with open(_cache_path(), "r", encoding="utf-8") as f:
+            st = os.fstat(f.fileno())
+            stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if _loaded["stat"] != stat:
+                cache = json.load(f)
+                _loaded.update(stat=stat, cache=cache if isinstance(cache, dict) else {})
+        # Копия верхнего уровня: get_db_sizes подменяет записи хостов перед сохранением
+        return dict(_loaded["cache"])
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache: Dict[str, Dict]) -> None:
+    """Атомарная перезапись кэша (tmp + os.replace), владелец — BACKUP_USER"""
+    path = _cache_path()
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        try:
+            shutil.chown(tmp_path, user=Config.BACKUP_USER)
+        except (LookupError, OSError):
+            pass
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # Кэш — только ускорение: без прав на запись работаем без него
+
+
+def probe_host(host: str) -> Optional[Dict[str, int]]:
+    """
+    Размеры всех баз сервера одним запросом (одно подключение psql).
+    Возвращает {база: байт} или None при ошибке подключения.
+    """
+    config = Config.load()
+
+    # Ключ -H устанавливает домашнюю директорию usr1cv8 для поиска .pgpass
+    cmd = [
+        "sudo", "-u", config.BACKUP_USER, "-H",
+        "/usr/lib/postgresql/15/bin/psql",
+        "-h", host,
+        "-p", config.PG_PORT,
+        "-U", "postgres",
+        "-d", "postgres",
+        "-tA", "-F", "\t",
+        "-c", SIZE_QUERY
+    ]
+
+    # Явно указываем PGPASSFILE для надёжности
+    env = os.environ.copy()
+    env["PGPASSFILE"] = f"/home/{config.BACKUP_USER}/.pgpass"
+
+    try:
+        result = subprocess.run(cmd, env=env, capture_output=True, text=True, timeout=30)
+    except Exception as e:
+        print(f"[DEBUG] Исключение при опросе размеров баз на {host}: {e}", file=sys.stderr)
+        return None
+    if result.returncode != 0:
+        print(f"[DEBUG] Ошибка опроса размеров баз на {host}: {result.stderr.strip()[:100]}", file=sys.stderr)
+        return None
+
+    sizes = {}
+    for line in result.stdout.splitlines():
+        name, _, size = line.partition("\t")
+        if name and size.strip().isdigit():
+            sizes[name] = int(size)
+    return sizes
+
+
+def get_db_sizes(ib_names: Iterable[str], max_age: Optional[int] = None,
+                 refresh: bool = False) -> Dict[str, Optional[int]]:
+    """
+    Размеры баз для списка ИБ: по одному запросу на каждый сервер PostgreSQL.
+
+    max_age — срок годности кэша в секундах (по умолчанию SIZE_CACHE_TTL, 0 — без кэша).
+    refresh — опросить серверы заново, не глядя в кэш.
+    Если сервер недоступен — последние известные размеры из кэша (даже устаревшие).
+    Для ИБ, размер которой неизвестен, — None.
+    """
+    config = Config.load()
+    ttl = config.SIZE_CACHE_TTL if max_age is None else max_age
+    ib_names = list(ib_names)
+    hosts = {ib_name: get_pg_host(ib_name) for ib_name in ib_names}
+
+    cache = _load_cache() if ttl > 0 else {}
+    now = time.time()
+    changed = False
+    for host in sorted(set(hosts.values())):
+        entry = cache.get(host) or {}
+        fresh = not refresh and now - entry.get("probed_at", 0) < ttl
+        if fresh and all(ib in entry.get("sizes", {}) for ib, h in hosts.items() if h == host):
+            continue
+        sizes = probe_host(host)
+        if sizes is not None:
+            cache[host] = {"probed_at": int(now), "sizes": sizes}
+            changed = True
+
+    if changed and ttl > 0:
+        _save_cache(cache)
+
+    return {ib: (cache.get(host) or {}).get("sizes", {}).get(ib) for ib, host in hosts.items()}
+
+
+def get_db_size(ib_name: str, max_age: Optional[int] = None) -> Optional[int]:
+    """Размер базы одной ИБ в байтах (через общий кэш; None — неизвестен)"""
+    return get_db_sizes([ib_name], max_age).get(ib_name)
+
@@ -0,0 +1,239 @@
+"""
+space_planner.py — допуск бэкапов по свободному месту (pre-flight)
+Размер артефакта оценивается как размер ИБ × коэффициент сжатия этого формата
+по истории бэкапов (.backup_history.jsonl). Место резервируется на время бэкапа:
+задание стартует, только если его оценка помещается в свободное место за вычетом
+недописанного остатка уже идущих бэкапов и неприкосновенного запаса SPACE_MIN_FREE_GB.
+Не поместившиеся задания откладываются до освобождения места; когда ничего не идёт,
+можно удалить самые старые бэкапы (SPACE_AUTO_PRUNE / backup --make-room).
+Недописанные каталоги упавших бэкапов удаляются (remove_partial).
+"""
+
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from core.config import Config
+from core.metrics import disk_free
+from services.history_service import BackupHistory, percentile
+
+# Коэффициент «артефакт / размер базы» без истории — с запасом в большую сторону
+DEFAULT_RATIOS = {
+    "dump": 0.5,
+    "dir": 0.5,
+    "dump_dedup": 1.0,   # -Z0, новые куски сжимаются, но оценка — как без сжатия
+    "sql": 0.4,
+    "sql_none": 1.0,
+}
+
+# Перцентиль коэффициента сжатия по истории (берём «плохие» бэкапы, а не средние)
+RATIO_PERCENTILE = 90
+
+# Размер базы неизвестен и истории нет
+UNKNOWN_SIZE_BYTES = 1024 ** 3
+
+LABEL_FORMAT = "%Y%m%d_%H%M%S"
+
+GB = 1024 ** 3
+
+
+def _label(at: float) -> str:
+    return time.strftime(LABEL_FORMAT, time.localtime(at))
+
+
+def _run_dirs(ib_path: Path, since: float) -> List[Path]:
+    """Каталоги меток ИБ, созданные не раньше since (метка backup.sh ≥ метки времени старта)"""
+    start_label = _label(since)
+    try:
+        return [p for p in ib_path.iterdir()
+                if p.is_dir() and not p.name.startswith(".") and p.name >= start_label]
+    except OSError:
+        return []
+
+
+RUN_ID_FILE = ".run_id"
+
+
+def new_label(ib_name: str, backup_root: Optional[Path] = None) -> str:
+    """Метка (каталог) нового бэкапа ИБ: текущее время, при занятой метке — следующая секунда"""
+    ib_path = Path(backup_root or Config.BACKUP_ROOT) / ib_name
+    at = time.time()
+    while (ib_path / _label(at)).exists():
+        at += 1
+    return _label(at)
+
+
+def remove_partial(ib_name: str, label: str, run_id: str,
+                   backup_root: Optional[Path] = None) -> Optional[Path]:
+    """
+    Удалить недописанный каталог бэкапа label, созданный запуском backup.sh с run_id.
+
+    backup.sh сам убирает каталог при ошибке (trap EXIT), но не при SIGKILL по таймауту.
+    Удаляется только каталог без manifest.json и с отметкой .run_id этого запуска —
+    бэкапы той же ИБ, идущие в других процессах ib_1c, не затрагиваются.
+    Возвращает удалённый каталог (None — удалять нечего).
+    """
+    from services.manifest_service import MANIFEST_NAME
+
+    backup_dir = Path(backup_root or Config.BACKUP_ROOT) / ib_name / label
+    try:
+        owner = (backup_dir / RUN_ID_FILE).read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    if owner != run_id or (backup_dir / MANIFEST_NAME).exists():
+        return None
+    try:
+        shutil.rmtree(backup_dir)
+    except OSError:
+        return None
+    return backup_dir
+
+
+class SpacePlanner:
+    """
+    Резервирование места под бэкапы — для BackupScheduler (admit / release / reject)
+    и последовательного режима backup_multiple.
+    """
+
+    def __init__(self, backup_root: Optional[Path] = None, auto_prune: Optional[bool] = None,
+                 history: Optional[BackupHistory] = None):
+        config = Config.load()
+        self.backup_root = Path(backup_root or config.BACKUP_ROOT)
+        self.min_free = int(config.SPACE_MIN_FREE_GB * GB)
+        self.margin = config.SPACE_MARGIN
+        self.auto_prune = config.SPACE_AUTO_PRUNE if auto_prune is None else auto_prune
+        self.keep_last = config.SPACE_PRUNE_KEEP_LAST
+        self.history = history or BackupHistory(self.backup_root)
+        self.reservations: Dict[str, Dict] = {}
+        self.pruned: List[Dict] = []
+        self.lock = threading.Lock()
+
+    # === Оценка ===
+
+    def estimate(self, ib_name: str, size_bytes: Optional[int], format_type: str,
+                 compress: Optional[str] = None, dedup: bool = False) -> int:
+        """Ожидаемый размер артефакта с запасом SPACE_MARGIN, байт"""
+        records = [r for r in self.history.records(ib_name)
+                   if r.get("success") and r.get("format") == format_type
+                   and bool(r.get("dedup")) == bool(dedup)
+                   and (format_type != "sql" or r.get("compress") == compress)
+                   and r.get("artifact_bytes")]
+        if not size_bytes:
+            # Размер базы неизвестен — по последнему артефакту ИБ этого формата
+            artifact = records[-1]["artifact_bytes"] if records else UNKNOWN_SIZE_BYTES
+            return int(artifact * self.margin)
+
+        ratios = [r["artifact_bytes"] / r["size"] for r in records if r.get("size")]
+        if len(ratios) >= Config.BACKUP_HISTORY_MIN_SAMPLES:
+            ratio = percentile(ratios[-Config.BACKUP_HISTORY_WINDOW:], RATIO_PERCENTILE)
+        elif format_type == "sql":
+            ratio = DEFAULT_RATIOS["sql_none" if compress == "none" else "sql"]
+        else:
+            ratio = DEFAULT_RATIOS["dump_dedup" if dedup else format_type]
+        return int(size_bytes * ratio * self.margin)
+
+    # === Резервирование ===
+
+    def _remaining(self, reservation: Dict) -> int:
+        """Ещё не записанная часть резерва идущего бэкапа"""
+        from services.scanner import tree_size
+
+        written = sum(tree_size(str(d)) for d in
+                      _run_dirs(self.backup_root / reservation["ib_name"], reservation["since"]))
+        return max(0, reservation["bytes"] - written)
+
+    def available(self) -> int:
+        """Свободно под новые бэкапы: диск − остаток резервов − SPACE_MIN_FREE_GB"""
+        free = disk_free(self.backup_root)
+        if free is None:
+            return 0
+        reserved = sum(self._remaining(r) for r in self.reservations.values())
+        return free - reserved - self.min_free
+
+    def admit(self, job: Dict, idle: bool = False) -> bool:
+        """
+        Зарезервировать место под задание (ключи ib_name, space_bytes).
+
+        idle=True — других бэкапов не идёт: ждать освобождения места бессмысленно,
+        при SPACE_AUTO_PRUNE удаляются самые старые бэкапы (список — в job["pruned"]).
+        """
+        needed = job["space_bytes"]
+        with self.lock:
+            available = self.available()
+            if available < needed and idle and self.auto_prune:
+                already = len(self.pruned)
+                self._make_room(needed - available)
+                job["pruned"] = self.pruned[already:]
+                available = self.available()
+            job["space_available"] = available
+            if available < needed:
+                return False
+            self.reservations[job["ib_name"]] = {
+                "ib_name": job["ib_name"], "bytes": needed, "since": time.time()
+            }
+            return True
+
+    def release(self, job: Dict) -> None:
+        with self.lock:
+            self.reservations.pop(job["ib_name"], None)
+
+    def reject(self, job: Dict) -> Dict[str, any]:
+        """Результат (как у backup_ib) для задания, которому не хватило места"""
+        available = max(0, job.get("space_available", 0))
+        return {
+            "success": False,
+            "ib_name": job["ib_name"],
+            "stdout": "",
+            "stderr": (
+                f"❌ Недостаточно места для бэкапа ИБ «{job['ib_name']}»: нужно ~{job['space_bytes'] / GB:.1f} ГБ, "
+                f"доступно {available / GB:.1f} ГБ (с учётом запаса {self.min_free / GB:.0f} ГБ)\n"
+                f"   → Освободите место (ib_1c rm ...) или запустите с --make-room (удалить самые старые бэкапы)"
+            ),
+            "returncode": -1,
+            "no_space": True
+        }
+
+    # === Ротация ===
+
+    def _make_room(self, needed: int) -> int:
+        """
+        Удалять бэкапы от самых старых (по всем ИБ), пока не освободится needed байт.
+
+        У каждой ИБ остаются SPACE_PRUNE_KEEP_LAST последних бэкапов. Удаление — через rm.sh
+        (каталог бэкапов и сборка мусора дедупликации как при ручном rm); rm.sh лишь
+        переносит бэкапы в корзину, поэтому корзина дочищается здесь же — место нужно сейчас.
+        Возвращает освобождённые байты (по свободному месту на диске).
+        """
+        from core.engine import run_engine
+        from services.catalog_service import BackupCatalog
+        from services.rm_service import RECLAIMED_RE
+        from services.trash_store import purge
+
+        by_ib: Dict[str, Dict[str, int]] = {}
+        for backup in BackupCatalog(self.backup_root).backups():
+            labels = by_ib.setdefault(backup["ib_name"], {})
+            labels[backup["label"]] = labels.get(backup["label"], 0) + backup["size_bytes"]
+
+        candidates = []
+        for ib_name, labels in by_ib.items():
+            ordered = sorted(labels)
+            candidates.extend((label, ib_name, labels[label])
+                              for label in ordered[:max(0, len(ordered) - self.keep_last)])
+        candidates.sort()
+
+        start_free = disk_free(self.backup_root) or 0
+        reclaimed = 0
+        for label, ib_name, size in candidates:
+            if reclaimed >= needed:
+                break
+            result = run_engine("rm.sh", ["--ib", ib_name, "--timestamp", label, "--confirm"],
+                                user=Config.BACKUP_USER, ib_name=ib_name)
+            if result["success"]:
+                match = RECLAIMED_RE.search(result["stdout"])
+                reclaimed += int(match.group(1)) if match else size
+                self.pruned.append({"ib_name": ib_name, "label": label, "size_bytes": size})
+        if reclaimed:
+            purge(self.backup_root, io_limit_mb_s=0, wait=True)
+        return (disk_free(self.backup_root) or 0) - start_free
@@ -1,22 +1,72 @@
 """
 storage_service.py — бизнес-логика мониторинга хранилища резервных копий
 Отвечает за агрегацию данных из движков уровня 0 и расчёт метрик.
+Полный отчёт строится за один обход (get_full_report), движки — запасной путь.
+Внутри бэкапы идут потоком компактных записей BackupRecord (iter_backups): отчёт копит
+только итоги по ИБ, а не список всех бэкапов. Наружу (get_backups_list, scan_backups_list,
+get_full_report()["backups"]) — как и раньше, словари (BackupRecord._asdict()); функции,
+принимающие бэкапы, понимают и словари, и записи.
 """
 import os
 import re
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 from core.config import BACKUP_ROOT, load_ib_list
+from services.catalog_service import BackupCatalog, BackupRecord
+from services.chunk_store import STORE_DIR, store_size
+from services.scanner import scan_backups
+
+
+def _as_records(backups: Iterable) -> Iterator[BackupRecord]:
+    """Словари в формате get_backups_list → BackupRecord; записи — как есть"""
+    for b in backups:
+        yield b if isinstance(b, BackupRecord) else BackupRecord.from_scan(b)
+
+
+def _physical_size(b: BackupRecord) -> int:
+    """Место артефакта на диске: индекс дедупликации — только сам файл индекса"""
+    if b.file_type != "dedup_index":
+        return b.size_bytes
+    try:
+        return os.stat(b.path).st_size
+    except OSError:
+        return 0
+
+
+def physical_sizes(backups: Iterable, backup_root: Path) -> Dict[str, int]:
+    """Занятое на диске место по ИБ: для дедупликации — индексы + хранилище кусков .chunks"""
+    physical = {}
+    dedup_ibs = set()
+    for b in _as_records(backups):
+        if b.file_type == "dedup_index":
+            dedup_ibs.add(b.ib_name)
+        physical[b.ib_name] = physical.get(b.ib_name, 0) + _physical_size(b)
+    for ib_name in dedup_ibs:
+        physical[ib_name] += store_size(Path(backup_root) / ib_name / STORE_DIR)
+    return physical
 
 
 class StorageMonitor:
     """Сервис мониторинга хранилища бэкапов"""
     
-    def __init__(self):
+    def __init__(self, use_native_scanner: bool = True):
         self.backup_root = BACKUP_ROOT
         self.ib_list = load_ib_list()
+        self.catalog = BackupCatalog(self.backup_root)
+        self.use_native_scanner = use_native_scanner
+
+    def _run_engine_lines(self, script_name: str, args: List[str], on_line) -> None:
+        """Запуск движка с построчной обработкой stdout (вывод не копится в памяти)"""
+        from core.engine import run_engine
+        errors = []
+        result = run_engine(script_name, args, user="usr1cv8", capture_output=False,
+                            on_stdout=on_line, on_stderr=errors.append)
+        if result["returncode"] != 0:
+            raise RuntimeError(f"{script_name} failed: {'; '.join(errors[-5:])}")
 
     def _run_engine(self, script_name: str, args: List[str] = None) -> str:
         """Универсальный запуск движка уровня 0 через core.engine.run_engine"""
@@ -46,37 +96,49 @@ class StorageMonitor:
                 raise RuntimeError(f"{script_name} failed: {result.stderr or result.stdout}")
             return result.stdout
     
+    def iter_backups(self) -> Iterator[BackupRecord]:
+        """Бэкапы потоком: из каталога (без обхода диска), без каталога — обходом диска"""
+        if self.catalog.exists():
+            return self.catalog.stream()
+        return iter(self._scan_records())
+
     def get_backups_list(self) -> List[Dict[str, Any]]:
+        """Получить список всех бэкапов из каталога (без обхода диска)"""
+        return [b._asdict() for b in self.iter_backups()]
+
+    def scan_backups_list(self) -> List[Dict[str, Any]]:
+        """Обойти диск: встроенным сканером (os.scandir), при ошибке — через list_backups.sh"""
+        return [b._asdict() for b in self._scan_records()]
+
+    def _scan_records(self) -> List[BackupRecord]:
+        if self.use_native_scanner:
+            try:
+                return [BackupRecord.from_scan(r) for r in scan_backups(self.backup_root)]
+            except Exception:
+                pass  # Fallback на движок уровня 0
+        return self._get_backups_list_engine()
+
+    def _get_backups_list_engine(self) -> List[BackupRecord]:
         """Получить список всех бэкапов через list_backups.sh (TSV формат с Unix timestamp)"""
-        output = self._run_engine("list_backups.sh", ["--path", str(self.backup_root)])
         backups = []
-        lines = [l.strip() for l in output.strip().split("\n") if l.strip()]
-        if not lines:
-            return backups
-        
-        # Пропускаем заголовок
-        for line in lines[1:]:
-            if "\t" not in line:
-                continue
-            parts = line.split("\t")
-            if len(parts) < 4:
-                continue
+
+        def on_line(line: str) -> None:
+            parts = line.strip().split("\t")
+            # Заголовок и некорректные строки пропускаем
+            if len(parts) < 4 or parts[0] == "ib_name":
+                return
             try:
-                ib_name = parts[0].strip()
-                timestamp = int(parts[1].strip())  # Unix timestamp (уже число!)
-                file_type = parts[2].strip()
-                size_bytes = int(parts[3].strip())
-                path = parts[4].strip() if len(parts) > 4 else ""
-                
-                backups.append({
-                    "ib_name": ib_name,
-                    "timestamp": timestamp,
-                    "file_type": file_type,
-                    "size_bytes": size_bytes,
-                    "path": path
-                })
+                backups.append(BackupRecord.from_scan({
+                    "ib_name": parts[0].strip(),
+                    "timestamp": int(parts[1].strip()),  # Unix timestamp (уже число!)
+                    "file_type": parts[2].strip(),
+                    "size_bytes": int(parts[3].strip()),
+                    "path": parts[4].strip() if len(parts) > 4 else ""
+                }))
             except (ValueError, IndexError):
-                continue  # Пропускаем некорректные строки
+                pass
+
+        self._run_engine_lines("list_backups.sh", ["--path", str(self.backup_root)], on_line)
         return backups
     
     def get_disk_usage(self) -> Dict[str, Any]:
@@ -99,7 +161,16 @@ class StorageMonitor:
             data["free_gb"] = data["free_kb"] / (1024**2)
         return data   
     
-    def get_stats(self) -> List[Dict[str, Any]]:
+    def get_stats(self, backups: Iterable = None) -> List[Dict[str, Any]]:
+        """Получить агрегированную статистику по ИБ из каталога (или уже полученного списка)"""
+        if backups is None and not self.catalog.exists() and not self.use_native_scanner:
+            return self._get_stats_engine()
+        if backups is None:
+            backups = self.iter_backups()
+
+        return self._aggregate(_as_records(backups))["stats"]
+
+    def _get_stats_engine(self) -> List[Dict[str, Any]]:
         """Получить агрегированную статистику по ИБ через count_backups.sh"""
         output = self._run_engine("count_backups.sh", ["--path", str(self.backup_root)])
         stats = []
@@ -113,10 +184,12 @@ class StorageMonitor:
                 ib_name = parts[0].strip()
                 total_files = int(parts[1].strip())
                 total_size_bytes = int(parts[2].strip())
+                physical_size_bytes = int(parts[3].strip()) if len(parts) > 3 else total_size_bytes
                 stats.append({
                     "ib_name": ib_name,
                     "total_files": total_files,
-                    "total_size_bytes": total_size_bytes
+                    "total_size_bytes": total_size_bytes,
+                    "physical_size_bytes": physical_size_bytes
                 })
             except Exception as e:
                 continue
@@ -150,76 +223,196 @@ class StorageMonitor:
                 "warning_count": 0
             }
     
-    def calculate_growth_rate(self, backups: List[Dict[str, Any]], days: int = 7) -> float:
+    def calculate_growth_rate(self, backups: Iterable, days: int = 7) -> float:
         """Рассчитать средний темп роста хранилища (ГБ/день) за последние N дней"""
-        if not backups:
-            return 0.0
-        
-        cutoff = datetime.now() - timedelta(days=days)
-        cutoff_ts = int(cutoff.timestamp())
-        
-        recent_backups = [b for b in backups if b["timestamp"] >= cutoff_ts]
-        if len(recent_backups) < 2:
+        cutoff_ts = int((datetime.now() - timedelta(days=days)).timestamp())
+
+        # Первый и последний бэкап за период — за один проход, без сортировки списка
+        first = last = None
+        recent = 0
+        for b in _as_records(backups):
+            if b.timestamp < cutoff_ts:
+                continue
+            recent += 1
+            if first is None or b.timestamp < first.timestamp:
+                first = b
+            if last is None or b.timestamp >= last.timestamp:
+                last = b
+        if recent < 2:
             return 0.0
-        
-        # Сортируем по времени
-        recent_backups.sort(key=lambda x: x["timestamp"])
-        
-        # Берём первый и последний бэкап за период
-        first = recent_backups[0]
-        last = recent_backups[-1]
-        
-        size_diff_gb = (last["size_bytes"] - first["size_bytes"]) / (1024**3)
-        time_diff_days = (last["timestamp"] - first["timestamp"]) / 86400.0
+
+        size_diff_gb = (last.size_bytes - first.size_bytes) / (1024**3)
+        time_diff_days = (last.timestamp - first.timestamp) / 86400.0
         
         if time_diff_days <= 0:
             return 0.0
         
         return max(0.0, size_diff_gb / time_diff_days)
     
-    def get_full_report(self, ib_name: str = None) -> Dict[str, Any]:
-        """Получить полный отчёт по хранилищу (все метрики)"""
+    def _timed(self, timings: Dict[str, float], name: str, func, *args):
+        """Выполнить func и записать время выполнения в timings[name] (секунды)"""
+        started = time.perf_counter()
         try:
-            disk = self.get_disk_usage()
-        except Exception as e:
-            disk = {"error": f"Ошибка получения диска: {str(e)}"}
-        
-        try:
-            all_backups = self.get_backups_list()
-            if ib_name:
-                all_backups = [b for b in all_backups if b["ib_name"] == ib_name]
-        except Exception as e:
-            all_backups = []
-        
-        try:
-            stats = self.get_stats()
-            if ib_name:
-                stats = [s for s in stats if s["ib_name"] == ib_name]
-        except Exception as e:
-            stats = []
-        
-        try:
-            validation = self.validate_storage()
-        except Exception as e:
-            validation = {
-                "valid": False,
-                "errors": [f"Ошибка валидации: {str(e)}"],
-                "error_count": 1,
-                "warnings": [],
-                "warning_count": 0
-            }
-        
-        try:
-            growth_rate = self.calculate_growth_rate(all_backups)
-        except Exception as e:
-            growth_rate = 0.0
-        
+            return func(*args)
+        finally:
+            timings[name] = round(time.perf_counter() - started, 4)
+
+    def _probe_disk_usage(self) -> Dict[str, Any]:
+        """Статистика диска без df и sudo (os.statvfs), в формате get_disk_usage"""
+        st = os.statvfs(self.backup_root)
+        total_kb = st.f_blocks * st.f_frsize // 1024
+        free_kb = st.f_bavail * st.f_frsize // 1024
+        used_kb = (st.f_blocks - st.f_bfree) * st.f_frsize // 1024
+        used_percent = round(used_kb * 100 / (used_kb + free_kb)) if used_kb + free_kb else 0
         return {
+            "total_kb": total_kb,
+            "used_kb": used_kb,
+            "free_kb": free_kb,
+            "used_percent": used_percent,
+            "total_gb": total_kb / (1024 ** 2),
+            "used_gb": used_kb / (1024 ** 2),
+            "free_gb": free_kb / (1024 ** 2)
+        }
+
+    def _probe_mountpoint(self) -> Dict[str, Any]:
+        """Точка монтирования и устройство хранилища (вместо mountpoint/df)"""
+        path = os.path.realpath(self.backup_root)
+        mount_point = path
+        while not os.path.ismount(mount_point):
+            mount_point = os.path.dirname(mount_point)
+
+        filesystem = ""
+        try:
+            with open("/proc/mounts", "r") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) >= 2 and parts[1] == mount_point:
+                        filesystem = parts[0]
+        except OSError:
+            pass
+        return {"mount_point": mount_point, "filesystem": filesystem, "is_mountpoint": mount_point == path}
+
+    def _probe_read_access(self) -> bool:
+        """Есть ли у usr1cv8 права чтения хранилища (единственная проверка через sudo)"""
+        import subprocess
+        result = subprocess.run(
+            ["sudo", "-n", "-u", "usr1cv8", "test", "-r", str(self.backup_root)],
+            capture_output=True, timeout=10
+        )
+        return result.returncode == 0
+
+    def _aggregate(self, backups: Iterable[BackupRecord], ib_name: Optional[str] = None,
+                   growth_days: int = 7, keep: Optional[list] = None) -> Dict[str, Any]:
+        """Один проход по потоку бэкапов: статистика по ИБ, файлы нулевого размера, темп роста
+
+        total_size_bytes — логический объём бэкапов, physical_size_bytes — занято на диске
+        (меньше логического для ИБ с дедупликацией). Темп роста — по бэкапам ib_name
+        (или всем); keep — список, куда сложить сами записи (ib_name), если они нужны вызывающему.
+        """
+        totals = {}
+        dedup_ibs = set()
+        zero_size = []
+        cutoff_ts = int((datetime.now() - timedelta(days=growth_days)).timestamp())
+        recent = []  # Бэкапы за период темпа роста — их единицы на ИБ
+        for b in backups:
+            files, size, physical = totals.get(b.ib_name, (0, 0, 0))
+            totals[b.ib_name] = (files + 1, size + b.size_bytes, physical + _physical_size(b))
+            if b.file_type == "dedup_index":
+                dedup_ibs.add(b.ib_name)
+            if b.size_bytes == 0:
+                zero_size.append(b.path)
+            if ib_name and b.ib_name != ib_name:
+                continue
+            if keep is not None:
+                keep.append(b)
+            if b.timestamp >= cutoff_ts:
+                recent.append(b)
+        stats = []
+        for name, (files, size, physical) in sorted(totals.items()):
+            if name in dedup_ibs:
+                physical += store_size(Path(self.backup_root) / name / STORE_DIR)
+            stats.append({"ib_name": name, "total_files": files, "total_size_bytes": size,
+                          "physical_size_bytes": physical})
+        growth_rate = self.calculate_growth_rate(recent, days=growth_days)
+        return {"stats": stats, "zero_size": zero_size, "growth_rate": growth_rate}
+
+    def get_full_report(self, ib_name: str = None, with_backups: bool = True) -> Dict[str, Any]:
+        """
+        Получить полный отчёт по хранилищу (все метрики) за один обход.
+
+        Бэкапы читаются одним потоком (каталог или сканер), из него же считаются
+        статистика по ИБ, файлы нулевого размера и темп роста. Независимые проверки
+        (диск, точка монтирования, права usr1cv8) идут параллельно. Время каждой
+        метрики — в report["timings"] (секунды). with_backups=False — без списка
+        бэкапов в отчёте: память не зависит от числа бэкапов.
+        """
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        errors = []
+        warnings = []
+        backups = [] if with_backups else None
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            disk_future = pool.submit(self._timed, timings, "disk_usage", self._probe_disk_usage)
+            mount_future = pool.submit(self._timed, timings, "mountpoint", self._probe_mountpoint)
+            access_future = pool.submit(self._timed, timings, "read_access", self._probe_read_access)
+
+            try:
+                aggregate = self._timed(timings, "backups", self._aggregate,
+                                        self.iter_backups(), ib_name, 7, backups)
+            except Exception as e:
+                aggregate = {"stats": [], "zero_size": [], "growth_rate": 0.0}
+                backups = [] if with_backups else None
+                errors.append(f"Ошибка получения списка бэкапов: {str(e)}")
+
+            try:
+                disk = disk_future.result()
+            except Exception as e:
+                disk = {"error": f"Ошибка получения диска: {str(e)}"}
+                errors.append(f"Каталог {self.backup_root} недоступен: {str(e)}")
+
+            try:
+                mount = mount_future.result()
+                disk["mount_point"] = mount["mount_point"]
+                disk["filesystem"] = mount["filesystem"]
+                if not mount["is_mountpoint"]:
+                    warnings.append(f"Каталог {self.backup_root} не является точкой монтирования")
+            except Exception as e:
+                warnings.append(f"Не удалось определить точку монтирования: {str(e)}")
+
+            try:
+                if not access_future.result():
+                    warnings.append(f"Нет прав чтения для usr1cv8 в {self.backup_root}")
+            except Exception as e:
+                warnings.append(f"Не удалось проверить права usr1cv8: {str(e)}")
+
+        if not aggregate["stats"] and not errors:
+            warnings.append(f"Не найдено каталогов информационных баз в {self.backup_root}")
+        if aggregate["zero_size"]:
+            warnings.append(f"Найдено {len(aggregate['zero_size'])} файлов нулевого размера")
+
+        stats = aggregate["stats"]
+        if ib_name:
+            stats = [s for s in stats if s["ib_name"] == ib_name]
+
+        timings["total"] = round(time.perf_counter() - started, 4)
+
+        report = {
             "backup_root": str(self.backup_root),
             "disk": disk,
-            "backups": all_backups,
             "stats": stats,
-            "validation": validation,
-            "growth_rate_gb_per_day": growth_rate,
+            "validation": {
+                "valid": len(errors) == 0,
+                "errors": errors,
+                "error_count": len(errors),
+                "warnings": warnings,
+                "warning_count": len(warnings),
+                "zero_size_files": aggregate["zero_size"]
+            },
+            "growth_rate_gb_per_day": aggregate["growth_rate"],
+            "timings": timings,
             "timestamp": int(datetime.now().timestamp())
-        }
\ No newline at end of file
+        }
+        if with_backups:
+            report["backups"] = [b._asdict() for b in backups]
+        return report
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+stream_upload.py — бэкап с одновременной выгрузкой (backup --stream-upload)
+Поток pg_dump за один проход расходится на три приёмника: локальный артефакт,
+хэш BLAKE2b (как b2sum в write_artifact) и приёмник выгрузки (sink). Повторно
+читать артефакт с диска для выгрузки не нужно, копия в облаке готова вместе с локальной.
+
+Локальная запись не ждёт облако: блоки для выгрузки идут через очередь ограниченного
+размера (--buffer-mb). Если облако медленнее и очередь полна, блок в неё не кладётся —
+выгрузка потом догоняет с диска, читая сам локальный артефакт (он и есть спул).
+Обратное давление на pg_dump — только от локального диска.
+Ошибка выгрузки не прерывает бэкап: локальный артефакт дописывается, выгрузку
+повторит ib_1c upload.
+
+Бэкап не ждёт и конца выгрузки: fanout делится на два процесса. Родитель стоит в
+конвейере backup.sh и выходит, как только закончена локальная запись, — backup.sh
+пишет манифест и завершается, таймаут и история бэкапа считают только локальную
+запись. Потомок уходит в свою сессию (сигнал группе движка его не задевает),
+догружает облако и пишет итог в .stream_status рядом с артефактом (атомарно):
+streamed_to — выгружено, stream_error — нет. manifest.json потомок не трогает —
+его пишут backup.sh и storage --verify. Пока выгрузка идёт, в манифесте
+streaming_to и stream_pid, а .stream_status ещё нет (load_stream_status).
+Прерванная локальная запись (ошибка, SIGTERM) отменяет выгрузку, обрезок в облако
+не попадает.
+
+Приёмники: LocalSink (каталог; для NFS/второго диска и для проверки) и RcloneSink
+(rclone rcat). Новый приёмник — класс с write/commit/abort и строка в SINKS.
+
+Модуль без зависимостей от core/: backup.sh запускает его напрямую
+(python3 services/stream_upload.py fanout ...).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional
+
+# Блок чтения потока pg_dump и размер очереди выгрузки по умолчанию
+BLOCK_SIZE = 1024 * 1024
+BUFFER_MB = int(os.getenv("CLOUD_STREAM_BUFFER_MB", "256"))
+
+MB = 1024 * 1024
+
+# Итог отделённой выгрузки в каталоге бэкапа (см. fanout_detached)
+STREAM_STATUS_NAME = ".stream_status"
+
+
+def is_local_remote(remote: str) -> bool:
+    """Локальный каталог, а не rclone-имя: абсолютный/относительный путь или нет «имя:»"""
+    return remote.startswith(("/", ".")) or ":" not in remote
+
+
+# === Приёмники выгрузки ===
+
+class LocalSink:
+    """Файл в локальном каталоге: пишется под временным именем, rename — при commit"""
+
+    def __init__(self, remote: str, path: str):
+        self.dest = Path(remote) / path
+        self.dest.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = self.dest.with_name(f".{self.dest.name}.part")
+        self.file = open(self.tmp, "wb")
+
+    def write(self, block: bytes) -> None:
+        self.file.write(block)
+
+    def commit(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp, self.dest)
+
+    def abort(self) -> None:
+        self.file.close()
+        try:
+            os.unlink(self.tmp)
+        except OSError:
+            pass
+
+
+class RcloneSink:
+    """rclone rcat: поток со stdin в remote:путь (multipart — средствами бэкенда rclone)"""
+
+    def __init__(self, remote: str, path: str):
+        if not shutil.which("rclone"):
+            raise OSError("rclone не установлен")
+        self.dest = f"{remote.rstrip('/')}/{path}"
+        # stderr — во временный файл: непрочитанный канал мог бы остановить rclone
+        self.log = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(["rclone", "rcat", self.dest], stdin=subprocess.PIPE,
+                                     stdout=subprocess.DEVNULL, stderr=self.log)
+
+    def write(self, block: bytes) -> None:
+        try:
+            self.proc.stdin.write(block)
+        except BrokenPipeError:
+            raise OSError(f"rclone rcat завершился: {self._stderr()}")
+
+    def commit(self) -> None:
+        self.proc.stdin.close()
+        if self.proc.wait() != 0:
+            raise OSError(f"rclone rcat {self.dest}: {self._stderr()}")
+
+    def abort(self) -> None:
+        self.proc.kill()
+        self.proc.wait()
+
+    def _stderr(self) -> str:
+        try:
+            self.proc.wait()
+            self.log.seek(0)
+            return self.log.read().decode(errors="replace").strip()[-500:]
+        except (OSError, ValueError):
+            return ""
+
+
+SINKS = {"local": LocalSink, "rclone": RcloneSink}
+
+
+def open_sink(remote: str, path: str):
+    """Приёмник по виду удалённого хранилища (см. is_local_remote)"""
+    return SINKS["local" if is_local_remote(remote) else "rclone"](remote, path)
+
+
+# === Выгрузка с очередью и догоном с диска ===
+
+class StreamUploader(threading.Thread):
+    """
+    Отправляет в sink всё, что записано в локальный артефакт, по порядку.
+
+    offer() никогда не блокирует: блок кладётся в очередь, только если она не
+    переполнится; иначе недостающее читается из артефакта (pread по смещению).
+    """
+
+    def __init__(self, sink, artifact: Path, buffer_bytes: int, block_size: int = BLOCK_SIZE):
+        super().__init__(daemon=True)
+        self.sink = sink
+        self.artifact = artifact
+        self.buffer_bytes = buffer_bytes
+        self.block_size = block_size
+        self.cond = threading.Condition()
+        self.queue = deque()
+        self.queued = 0
+        self.written = 0
+        self.sent = 0
+        self.spooled = 0
+        self.eof = False
+        self.cancelled = False
+        self.error: Optional[Exception] = None
+
+    def offer(self, offset: int, block: bytes) -> None:
+        with self.cond:
+            self.written = offset + len(block)
+            if self.error is None and self.queued + len(block) <= self.buffer_bytes:
+                self.queue.append((offset, block))
+                self.queued += len(block)
+            self.cond.notify()
+
+    def finish(self) -> None:
+        with self.cond:
+            self.eof = True
+            self.cond.notify()
+
+    def cancel(self) -> None:
+        """Локальная запись прервана — выгрузку не завершать, приёмник отменить"""
+        with self.cond:
+            self.cancelled = True
+            self.cond.notify()
+
+    def _next_block(self, reader: BinaryIO) -> Optional[bytes]:
+        with self.cond:
+            while self.sent >= self.written and not self.eof and not self.cancelled:
+                self.cond.wait()
+            if self.cancelled:
+                raise OSError("локальная запись прервана — выгрузка отменена")
+            if self.sent >= self.written:
+                return None
+            # Блоки, уже отправленные догоном с диска, больше не нужны
+            while self.queue and self.queue[0][0] < self.sent:
+                self.queued -= len(self.queue.popleft()[1])
+            if self.queue and self.queue[0][0] == self.sent:
+                offset, block = self.queue.popleft()
+                self.queued -= len(block)
+                return block
+            end = self.queue[0][0] if self.queue else self.written
+        # Очередь переполнялась — догоняем из локального артефакта
+        block = os.pread(reader.fileno(), min(self.block_size, end - self.sent), self.sent)
+        self.spooled += len(block)
+        return block
+
+    def run(self) -> None:
+        try:
+            with open(self.artifact, "rb") as reader:
+                while True:
+                    block = self._next_block(reader)
+                    if block is None:
+                        break
+                    self.sink.write(block)
+                    self.sent += len(block)
+            self.sink.commit()
+        except Exception as e:
+            self.error = e
+            with self.cond:
+                self.queue.clear()
+                self.queued = 0
+            try:
+                self.sink.abort()
+            except Exception:
+                pass
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def fanout(stream: BinaryIO, artifact: Path, sink=None, hash_file: Optional[Path] = None,
+           buffer_bytes: int = BUFFER_MB * MB, block_size: int = BLOCK_SIZE,
+           on_local_done: Optional[Callable[[], None]] = None) -> Dict[str, any]:
+    """
+    Записать поток в artifact, посчитать BLAKE2b и (при sink) выгрузить за один проход.
+    on_local_done вызывается, когда артефакт и хэш записаны, до ожидания выгрузки.
+
+    Возвращает dict: bytes, hash, seconds, uploaded (bool), spooled_bytes (догнано
+    с диска), upload_seconds (до конца выгрузки), error (ошибка выгрузки или None).
+    """
+    started = time.monotonic()
+    digest = hashlib.blake2b()
+    uploader = None
+    error = None
+    fd = os.open(artifact, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if sink is not None:
+            uploader = StreamUploader(sink, artifact, buffer_bytes, block_size)
+            uploader.start()
+        offset = 0
+        while True:
+            data = stream.read(block_size)
+            if not data:
+                break
+            _write_all(fd, data)
+            digest.update(data)
+            if uploader is not None:
+                uploader.offer(offset, data)
+            offset += len(data)
+    except BaseException:
+        # Обрезок не должен стать «готовой» копией в облаке
+        if uploader is not None:
+            uploader.cancel()
+            uploader.join()
+        raise
+    finally:
+        os.close(fd)
+    local_seconds = time.monotonic() - started
+    if hash_file is not None:
+        Path(hash_file).write_text(digest.hexdigest() + "\n")
+    if uploader is not None:
+        uploader.finish()
+    if on_local_done is not None:
+        on_local_done()
+    if uploader is not None:
+        uploader.join()
+        error = uploader.error
+    return {
+        "bytes": offset,
+        "hash": digest.hexdigest(),
+        "seconds": local_seconds,
+        "uploaded": uploader is not None and error is None,
+        "spooled_bytes": uploader.spooled if uploader is not None else 0,
+        "upload_seconds": time.monotonic() - started,
+        "error": str(error) if error else None
+    }
+
+
+def _exit_on_term(signum, frame) -> None:
+    raise SystemExit(128 + signum)
+
+
+def _detach() -> None:
+    """Уйти из сессии движка и отпустить его каналы: run_engine не ждёт выгрузку"""
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+
+def write_stream_status(backup_dir: Path, remote: str, stats: Dict[str, any]) -> bool:
+    """
+    Записать итог выгрузки в .stream_status (tmp + os.replace: читатель не увидит
+    половину файла). False — каталога бэкапа уже нет: бэкап не завершился.
+    """
+    status = {"remote": remote}
+    if stats["error"]:
+        status["stream_error"] = stats["error"]
+    else:
+        status["streamed_to"] = remote
+        status["stream_seconds"] = round(stats["upload_seconds"], 3)
+    path = Path(backup_dir) / STREAM_STATUS_NAME
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_text(json.dumps(status, ensure_ascii=False) + "\n")
+        os.replace(tmp, path)
+    except OSError:
+        return False
+    return True
+
+
+def load_stream_status(backup_dir: Path) -> Optional[Dict[str, any]]:
+    """Итог отделённой выгрузки бэкапа; None — выгрузки не было или она ещё идёт"""
+    try:
+        return json.loads((Path(backup_dir) / STREAM_STATUS_NAME).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def fanout_detached(parsed: argparse.Namespace) -> int:
+    """
+    fanout с выгрузкой, переживающей backup.sh (см. описание модуля).
+    Делимся до открытия приёмника и запуска потока выгрузки: rclone — потомок
+    того процесса, который его дождётся.
+    """
+    artifact = Path(parsed.artifact)
+    read_fd, write_fd = os.pipe()
+    if os.fork():
+        # Родитель: держит место в конвейере backup.sh до конца локальной записи
+        os.close(write_fd)
+        os.close(0)
+        return 0 if os.read(read_fd, 1) == b"0" else 1
+
+    os.close(read_fd)
+    signal.signal(signal.SIGTERM, _exit_on_term)
+    sink = None
+    try:
+        sink = open_sink(parsed.remote, parsed.path or artifact.name)
+    except OSError as e:
+        print(f"⚠️  Выгрузка потоком недоступна: {e} — только локальная копия", file=sys.stderr)
+
+    def local_done() -> None:
+        if sink is not None and parsed.status_file:
+            # backup.sh перенесёт в манифест: выгрузка ещё идёт, её процесс — этот
+            Path(parsed.status_file).write_text(f"{parsed.remote}\n{os.getpid()}\n")
+        if sink is not None:
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] ☁️  Локальная копия готова, "
+                  f"выгрузка в {parsed.remote} продолжается в фоне", file=sys.stderr)
+        os.write(write_fd, b"0")
+        os.close(write_fd)
+        _detach()
+
+    stats = fanout(sys.stdin.buffer, artifact, sink, parsed.hash_file, parsed.buffer_mb * MB,
+                   on_local_done=local_done)
+    if sink is not None:
+        write_stream_status(artifact.parent, parsed.remote, stats)
+    return 0
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(description="Поток бэкапа: локальный артефакт + хэш + выгрузка за один проход")
+    sub = parser.add_subparsers(dest="action", required=True)
+    fan = sub.add_parser("fanout", help="stdin → артефакт, BLAKE2b и удалённое хранилище")
+    fan.add_argument("--artifact", required=True, help="Локальный файл артефакта")
+    fan.add_argument("--hash-file", default=None, help="Куда записать хэш (как b2sum)")
+    fan.add_argument("--remote", default=None, help="rclone «имя:путь» или каталог (без него — только локально)")
+    fan.add_argument("--path", default=None, help="Путь артефакта в удалённом хранилище (ИБ/метка/файл)")
+    fan.add_argument("--buffer-mb", type=int, default=BUFFER_MB, help="Очередь выгрузки в памяти, МБ")
+    fan.add_argument("--status-file", default=None, help="Отметка для backup.sh: remote и PID идущей выгрузки")
+    parsed = parser.parse_args(args)
+
+    if parsed.remote:
+        return fanout_detached(parsed)
+    fanout(sys.stdin.buffer, Path(parsed.artifact), None, parsed.hash_file)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+trash_store.py — быстрое удаление бэкапов через корзину $BACKUP_ROOT/.trash
+Каталог бэкапа переименовывается в корзину (rename в пределах одной ФС — мгновенно
+и атомарно), место освобождает фоновая очистка: крупные файлы укорачиваются
+шагами (truncate), чтобы не было долгих остановок журнала ФС, с лимитом МБ/с
+и с низким приоритетом ввода-вывода (ionice -c3). Очередь — сама корзина:
+прерванная очистка продолжается со следующего запуска.
+
+Модуль без зависимостей от core/: движки запускают его напрямую
+(python3 services/trash_store.py move|purge|status).
+
+Рядом с каждым элементом корзины — <элемент>.json: ib, label, size_bytes, trashed_at.
+"""
+
+import argparse
+import errno
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+TRASH_DIR = ".trash"
+PURGE_LOCK = ".purge.lock"
+PURGE_LOG = ".purge.log"
+META_SUFFIX = ".json"
+
+# Метаданные без элемента старше этого — остаток прерванного move
+ORPHAN_META_SEC = 3600
+
+# Шаг укорачивания крупных файлов и общий бюджет очистки (0 — без лимита)
+TRUNCATE_STEP_MB = int(os.getenv("TRASH_TRUNCATE_STEP_MB", "256"))
+IO_LIMIT_MB_S = int(os.getenv("TRASH_IO_LIMIT_MB_S", "512"))
+
+MB = 1024 * 1024
+
+
+def trash_path(backup_root: Path) -> Path:
+    return Path(backup_root) / TRASH_DIR
+
+
+def tree_size(path: Path) -> int:
+    """Размер файлов каталога (или файла), без перехода по симлинкам"""
+    if not path.is_dir() or path.is_symlink():
+        try:
+            return path.lstat().st_size
+        except OSError:
+            return 0
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def move_to_trash(path: Path, backup_root: Path, ib_name: Optional[str] = None,
+                  label: Optional[str] = None) -> Optional[Dict]:
+    """
+    Переместить каталог бэкапа в корзину. Возвращает метаданные элемента
+    (entry, ib, label, size_bytes, trashed_at) или None, если rename невозможен
+    (каталог на другой ФС) — тогда удалять на месте.
+    """
+    path = Path(path)
+    trash = trash_path(backup_root)
+    trash.mkdir(exist_ok=True)
+    ib_name = ib_name or path.parent.name
+    label = label or path.name
+    meta = {
+        "entry": f"{ib_name}__{label}__{time.time_ns()}",
+        "ib": ib_name,
+        "label": label,
+        "size_bytes": tree_size(path),  # Только метаданные ФС — быстро даже для backup.dir
+        "trashed_at": int(time.time())
+    }
+    # Метаданные — до rename: очиститель не должен увидеть элемент без них
+    meta_path = trash / (meta["entry"] + META_SUFFIX)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    try:
+        os.rename(path, trash / meta["entry"])
+    except OSError as e:
+        meta_path.unlink()
+        if e.errno == errno.EXDEV:
+            return None
+        raise
+    return meta
+
+
+def pending(backup_root: Path) -> List[Dict]:
+    """Элементы корзины, ожидающие очистки (старые первыми)"""
+    trash = trash_path(backup_root)
+    items = []
+    try:
+        names = os.listdir(trash)
+    except FileNotFoundError:
+        return []
+    for name in names:
+        if name.startswith(".") or name.endswith(META_SUFFIX):
+            continue
+        meta = {"entry": name, "size_bytes": None, "trashed_at": 0}
+        try:
+            with open(trash / (name + META_SUFFIX), "r", encoding="utf-8") as f:
+                meta.update(json.load(f))
+        except (OSError, ValueError):
+            pass  # Метаданные потеряны — элемент всё равно удаляется
+        items.append(meta)
+    return sorted(items, key=lambda m: (m["trashed_at"], m["entry"]))
+
+
+class Pacer:
+    """Лимит скорости очистки, байт/с (одного потока — очистка последовательная)"""
+
+    def __init__(self, bytes_per_sec: int):
+        self.rate = bytes_per_sec
+        self.started = time.monotonic()
+        self.done = 0
+
+    def account(self, amount: int) -> None:
+        if self.rate <= 0:
+            return
+        self.done += amount
+        ahead = self.done / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def purge_file(path: str, step: int, pacer: Pacer) -> int:
+    """Укоротить файл шагами по step байт и удалить. Возвращает размер файла"""
+    size = os.lstat(path).st_size
+    if step > 0 and size > step:
+        remaining = size
+        with open(path, "r+b") as f:
+            while remaining > step:
+                remaining -= step
+                f.truncate(remaining)
+                pacer.account(step)
+        pacer.account(remaining)
+    else:
+        pacer.account(size)
+    os.unlink(path)
+    return size
+
+
+def purge_tree(path: Path, step: int, pacer: Pacer) -> int:
+    """Очистить элемент корзины снизу вверх. Возвращает освобождённые байты"""
+    if not path.is_dir() or path.is_symlink():
+        return purge_file(str(path), step, pacer)
+    freed = 0
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for name in filenames:
+            freed += purge_file(os.path.join(dirpath, name), step, pacer)
+        for name in dirnames:
+            full = os.path.join(dirpath, name)
+            if os.path.islink(full):
+                os.unlink(full)
+            else:
+                os.rmdir(full)
+    os.rmdir(path)
+    return freed
+
+
+def purge(backup_root: Path, step_mb: int = TRUNCATE_STEP_MB,
+          io_limit_mb_s: int = IO_LIMIT_MB_S, wait: bool = False) -> Optional[Dict[str, int]]:
+    """
+    Очистить корзину. Один очиститель на хранилище (flock): если очистка уже идёт,
+    возвращает None — новые элементы она подберёт сама; wait=True — дождаться её
+    и дочистить остаток (нужно, когда место требуется сейчас).
+    Возвращает: entries, freed_bytes, failed.
+    """
+    trash = trash_path(backup_root)
+    if not trash.is_dir():
+        return {"entries": 0, "freed_bytes": 0, "failed": 0}
+    stats = {"entries": 0, "freed_bytes": 0, "failed": 0}
+    pacer = Pacer(io_limit_mb_s * MB)
+    with open(trash / PURGE_LOCK, "a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        # Элементы, добавленные во время очистки, — в следующих проходах
+        failed = set()
+        while True:
+            items = [m for m in pending(backup_root) if m["entry"] not in failed]
+            if not items:
+                break
+            progressed = False
+            for meta in items:
+                entry = trash / meta["entry"]
+                try:
+                    stats["freed_bytes"] += purge_tree(entry, step_mb * MB, pacer)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"⚠️  Не удалось очистить {entry}: {e}", file=sys.stderr)
+                    failed.add(meta["entry"])
+                    stats["failed"] += 1
+                    continue
+                try:
+                    os.unlink(trash / (meta["entry"] + META_SUFFIX))
+                except FileNotFoundError:
+                    pass
+                stats["entries"] += 1
+                progressed = True
+            if not progressed:
+                break
+        _remove_orphan_meta(trash)
+    return stats
+
+
+def _remove_orphan_meta(trash: Path) -> None:
+    now = time.time()
+    for meta_path in trash.glob("*" + META_SUFFIX):
+        try:
+            if not meta_path.with_suffix("").exists() and now - meta_path.stat().st_mtime > ORPHAN_META_SEC:
+                meta_path.unlink()
+        except OSError:
+            continue
+
+
+def set_idle_io() -> None:
+    """Приоритет ввода-вывода idle (ionice -c3) для текущего процесса — очистка в переднем плане"""
+    if shutil.which("ionice"):
+        subprocess.run(["ionice", "-c3", "-p", str(os.getpid())],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+
+
+def spawn_purge(backup_root: Path, io_limit_mb_s: Optional[int] = None) -> None:
+    """Запустить очистку в фоне: отдельная сессия, idle-приоритет ввода-вывода, лог в корзине"""
+    cmd = [sys.executable, os.path.abspath(__file__), "purge", "--root", str(backup_root)]
+    if io_limit_mb_s is not None:
+        cmd.extend(["--io-limit", str(io_limit_mb_s)])
+    if shutil.which("ionice"):
+        cmd = ["ionice", "-c3"] + cmd
+    cmd = ["nice", "-n", "19"] + cmd
+    trash = trash_path(backup_root)
+    trash.mkdir(exist_ok=True)
+    with open(trash / PURGE_LOG, "a") as log:
+        subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                         start_new_session=True, close_fds=True)
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ["B", "K", "M", "G", "T"]:
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}P"
+
+
+def main(args=None) -> int:
+    parser = argparse.ArgumentParser(description="Корзина бэкапов: быстрое удаление и фоновая очистка")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    move = sub.add_parser("move", help="Переместить каталог бэкапа в корзину (печатает size_bytes=N)")
+    move.add_argument("--root", required=True, help="Корень хранилища ($BACKUP_ROOT)")
+    move.add_argument("--path", required=True, help="Каталог метки времени")
+
+    purge_parser = sub.add_parser("purge", help="Очистить корзину (укорачивание шагами, лимит МБ/с)")
+    purge_parser.add_argument("--root", required=True)
+    purge_parser.add_argument("--step-mb", type=int, default=TRUNCATE_STEP_MB)
+    purge_parser.add_argument("--io-limit", type=int, default=IO_LIMIT_MB_S, help="МБ/с, 0 — без лимита")
+    purge_parser.add_argument("--background", action="store_true", help="Запустить в фоне и выйти")
+
+    status = sub.add_parser("status", help="Что ждёт очистки")
+    status.add_argument("--root", required=True)
+
+    parsed = parser.parse_args(args)
+    root = Path(parsed.root)
+
+    if parsed.action == "move":
+        meta = move_to_trash(Path(parsed.path), root)
+        if meta is None:
+            print(f"❌ {parsed.path}: не на той же ФС, что {trash_path(root)}", file=sys.stderr)
+            return 1
+        print(f"size_bytes={meta['size_bytes']}")
+        return 0
+
+    if parsed.action == "purge":
+        if parsed.background:
+            spawn_purge(root, parsed.io_limit)
+            return 0
+        started = time.monotonic()
+        stats = purge(root, parsed.step_mb, parsed.io_limit)
+        if stats is None:
+            print("ℹ️  Очистка корзины уже идёт")
+            return 0
+        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] ♻️  Корзина: очищено {stats['entries']} "
+              f"({_format_bytes(stats['freed_bytes'])}) за {time.monotonic() - started:.0f}с"
+              + (f", ошибок: {stats['failed']}" if stats["failed"] else ""))
+        print(f"freed_bytes={stats['freed_bytes']}")
+        return 1 if stats["failed"] else 0
+
+    if parsed.action == "status":
+        items = pending(root)
+        print(f"entries={len(items)}")
+        print(f"pending_bytes={sum(m['size_bytes'] or 0 for m in items)}")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,339 @@
+"""
+upload_service.py — выгрузка бэкапов в облако (ib_1c upload) вместо полного rclone copy
+Что уже выгружено, помнит журнал $BACKUP_ROOT/.upload_state.jsonl (ключ — удалённое
+хранилище и хэш из manifest.json): каждый запуск выгружает только новые бэкапы,
+не сравнивая с облаком всё дерево. Артефакты выгружаются параллельно (CLOUD_TRANSFERS),
+крупные файлы — частями по CLOUD_CHUNK_SIZE_MB.
+
+Раскладка в хранилище: <удалённое>/<ИБ>/<метка>/<артефакт> + manifest.json, который
+выгружается последним — бэкап без манифеста в облаке не считается выгруженным.
+Бэкап, выгруженный потоком во время дампа (services/stream_upload.py, в манифесте —
+streamed_to), догружается одним манифестом; если потоковая выгрузка ещё идёт
+(streaming_to), её сначала дожидаемся.
+Удалённое хранилище — rclone-имя «remote:путь» (engines/cloud_upload.sh) или локальный
+каталог (копирование средствами Python — для NFS/второго диска и для проверки).
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.config import (BACKUP_ROOT, BACKUP_USER, CLOUD_CHUNK_SIZE_MB, CLOUD_MIN_SPEED_MB_S,
+                         CLOUD_REMOTE, CLOUD_TRANSFERS)
+from core.metrics import track
+from services.catalog_service import BackupCatalog
+from services.chunk_store import INDEX_SUFFIX
+from services.manifest_service import MANIFEST_NAME, load_manifest
+from services.stream_upload import is_local_remote, load_stream_status
+
+STATE_NAME = ".upload_state.jsonl"
+
+MB = 1024 * 1024
+
+# Запас таймаута выгрузки поверх CLOUD_MIN_SPEED_MB_S, с
+UPLOAD_TIMEOUT_BASE = 300
+
+# Как часто перечитывать манифест, пока идёт выгрузка потоком, с
+STREAM_POLL_SECONDS = 2
+
+
+class UploadState:
+    """Журнал выгруженных бэкапов $BACKUP_ROOT/.upload_state.jsonl"""
+
+    def __init__(self, backup_root: Optional[Path] = None):
+        self.backup_root = Path(backup_root or BACKUP_ROOT)
+        self.path = self.backup_root / STATE_NAME
+        self.lock_path = self.backup_root / (STATE_NAME + ".lock")
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def key(item: Dict) -> str:
+        """Ключ бэкапа: хэш из манифеста (без хэша — ИБ/метка/артефакт)"""
+        return item.get("hash") or f"{item['ib_name']}/{item['label']}/{item['artifact']}"
+
+    def uploaded(self, remote: str) -> Dict[str, Dict]:
+        """Что уже выгружено в remote: ключ → запись"""
+        done: Dict[str, Dict] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Оборванная строка
+                    if entry.get("remote") == remote:
+                        done[entry["key"]] = entry
+        except FileNotFoundError:
+            pass
+        return done
+
+    def record(self, remote: str, item: Dict, seconds: float) -> None:
+        entry = {
+            "remote": remote,
+            "key": self.key(item),
+            "ib": item["ib_name"],
+            "ts": item["label"],
+            "artifact": item["artifact"],
+            "size": item["size_bytes"],
+            "seconds": round(seconds, 3),
+            "uploaded_at": int(time.time())
+        }
+        with self._locked():
+            created = not self.path.exists()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+            if created:
+                try:
+                    shutil.chown(self.path, user=BACKUP_USER)
+                except (LookupError, OSError):
+                    pass
+
+
+def backup_item(backup_dir: Path, manifest: Optional[Dict] = None) -> Optional[Dict]:
+    """Описание бэкапа для выгрузки по его manifest.json (None — манифеста нет: бэкап прерван)"""
+    backup_dir = Path(backup_dir)
+    manifest = manifest or load_manifest(backup_dir)
+    if manifest is None:
+        return None
+    # Итог отделённой выгрузки потоком — в .stream_status; пока его нет, она идёт (streaming_to)
+    stream = load_stream_status(backup_dir) or {}
+    return {
+        "ib_name": manifest.get("ib_name") or backup_dir.parent.name,
+        "label": backup_dir.name,
+        "dir": backup_dir,
+        "artifact": manifest["artifact"],
+        "hash": manifest.get("hash", ""),
+        "size_bytes": manifest.get("size_bytes", 0),
+        "dedup": manifest["artifact"].endswith(INDEX_SUFFIX),
+        "streamed_to": stream.get("streamed_to") or manifest.get("streamed_to"),
+        "streaming_to": None if stream else manifest.get("streaming_to"),
+        "stream_pid": manifest.get("stream_pid"),
+        "stream_seconds": stream.get("stream_seconds") or manifest.get("duration_sec") or 0
+    }
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def await_stream(item: Dict, remote: str) -> Dict:
+    """
+    Дождаться выгрузки потоком, которая ещё идёт в remote после конца бэкапа
+    (streaming_to в манифесте, .stream_status ещё нет), и вернуть описание бэкапа с её итогом.
+    Процесс выгрузки не жив (перезагрузка, kill) или не уложился в CLOUD_MIN_SPEED_MB_S —
+    не ждём: без streamed_to бэкап выгрузится обычным путём.
+    """
+    deadline = time.monotonic() + UPLOAD_TIMEOUT_BASE + item["size_bytes"] / (CLOUD_MIN_SPEED_MB_S * MB)
+    while (item.get("streaming_to") == remote and _process_alive(item.get("stream_pid"))
+           and time.monotonic() < deadline):
+        time.sleep(STREAM_POLL_SECONDS)
+        item = backup_item(item["dir"]) or item
+    return item
+
+
+def find_pending(ib_names: Optional[List[str]] = None, remote: Optional[str] = None,
+                 backup_root: Optional[Path] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Бэкапы, ещё не выгруженные в remote: по каталогу бэкапов и журналу выгрузок,
+    без обхода дерева и без обращения к облаку.
+
+    Возвращает (к выгрузке — старые первыми, пропущенные — {ib_name, label, reason}).
+    Бэкапы дедупликации пропускаются: индекс без хранилища кусков бесполезен.
+    """
+    root = Path(backup_root or BACKUP_ROOT)
+    remote = remote or CLOUD_REMOTE
+    catalog = BackupCatalog(root)
+    if not catalog.exists():
+        catalog.reindex()
+    done = UploadState(root).uploaded(remote)
+
+    labels = sorted({(b["ib_name"], b["label"]) for b in catalog.backups()
+                     if ib_names is None or b["ib_name"] in ib_names},
+                    key=lambda pair: (pair[1], pair[0]))
+    pending, skipped = [], []
+    for ib_name, label in labels:
+        item = backup_item(root / ib_name / label)
+        if item is None:
+            skipped.append({"ib_name": ib_name, "label": label, "reason": "нет manifest.json"})
+        elif item["dedup"]:
+            skipped.append({"ib_name": ib_name, "label": label, "reason": "дедупликация"})
+        elif UploadState.key(item) not in done:
+            pending.append(item)
+    return pending, skipped
+
+
+# === Выгрузка одного бэкапа ===
+
+def _copy_file(src: Path, dest: Path, chunk: int) -> None:
+    """Копия под временным именем + rename: оборванная копия не выглядит готовой"""
+    tmp = dest.with_name(f".{dest.name}.part")
+    with open(src, "rb") as fin, open(tmp, "wb") as fout:
+        while True:
+            block = fin.read(chunk)
+            if not block:
+                break
+            fout.write(block)
+        fout.flush()
+        os.fsync(fout.fileno())
+    os.replace(tmp, dest)
+
+
+def _upload_local(item: Dict, remote: str, chunk_size_mb: int, manifest_only: bool) -> None:
+    dest_dir = Path(remote) / item["ib_name"] / item["label"]
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    src = Path(item["dir"]) / item["artifact"]
+    chunk = max(1, chunk_size_mb) * MB
+    if manifest_only:
+        pass
+    elif src.is_dir():
+        tmp = dest_dir / f".{item['artifact']}.part"
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.copytree(src, tmp, copy_function=lambda s, d: _copy_file(Path(s), Path(d), chunk))
+        shutil.rmtree(dest_dir / item["artifact"], ignore_errors=True)
+        os.replace(tmp, dest_dir / item["artifact"])
+    else:
+        _copy_file(src, dest_dir / item["artifact"], chunk)
+    _copy_file(Path(item["dir"]) / MANIFEST_NAME, dest_dir / MANIFEST_NAME, chunk)
+
+
+def _upload_rclone(item: Dict, remote: str, chunk_size_mb: int, streams: int,
+                   manifest_only: bool) -> Optional[str]:
+    """Выгрузка через cloud_upload.sh; возвращает текст ошибки или None"""
+    from core.engine import run_engine
+
+    args = ["--src", str(item["dir"]), "--artifact", item["artifact"],
+            "--dest", f"{remote.rstrip('/')}/{item['ib_name']}/{item['label']}",
+            "--chunk-size", str(chunk_size_mb), "--streams", str(streams)]
+    timeout = UPLOAD_TIMEOUT_BASE
+    if manifest_only:
+        args.append("--manifest-only")
+    else:
+        timeout += int(item["size_bytes"] / (CLOUD_MIN_SPEED_MB_S * MB))
+    result = run_engine("cloud_upload.sh", args, timeout=timeout, ib_name=item["ib_name"])
+    if result["success"]:
+        return None
+    if result["timed_out"]:
+        return f"таймаут {timeout // 60} мин (медленнее {CLOUD_MIN_SPEED_MB_S} МБ/с)"
+    return (result["stderr"] or result["stdout"]).strip() or f"код {result['returncode']}"
+
+
+def upload_backup(item: Dict, remote: Optional[str] = None, chunk_size_mb: Optional[int] = None,
+                  streams: Optional[int] = None, backup_root: Optional[Path] = None) -> Dict[str, any]:
+    """
+    Выгрузить один бэкап и отметить его в журнале выгрузок.
+    Артефакт, уже выгруженный потоком в этот remote, не выгружается повторно;
+    seconds тогда — длительность потоковой выгрузки (идущую — ждём, см. await_stream).
+
+    Возвращает dict: ib_name, label, artifact, success, size_bytes, seconds,
+    throughput_mb_s, error.
+    """
+    root = Path(backup_root or BACKUP_ROOT)
+    remote = remote or CLOUD_REMOTE
+    chunk_size_mb = chunk_size_mb or CLOUD_CHUNK_SIZE_MB
+    item = await_stream(item, remote)
+    streamed = item.get("streamed_to") == remote
+    started = time.monotonic()
+    error = None
+    with track("operation", path=root, operation="upload", ib=item["ib_name"], streamed=streamed) as op:
+        try:
+            if is_local_remote(remote):
+                _upload_local(item, remote, chunk_size_mb, manifest_only=streamed)
+            else:
+                error = _upload_rclone(item, remote, chunk_size_mb, streams or CLOUD_TRANSFERS,
+                                       manifest_only=streamed)
+        except OSError as e:
+            error = str(e)
+        op.set(exit_code=1 if error else 0,
+               bytes_written=None if error or streamed else item["size_bytes"])
+    seconds = time.monotonic() - started
+    if streamed:
+        seconds += item["stream_seconds"]
+    if error is None:
+        UploadState(root).record(remote, item, seconds)
+    return {
+        "ib_name": item["ib_name"],
+        "label": item["label"],
+        "artifact": item["artifact"],
+        "success": error is None,
+        "size_bytes": item["size_bytes"],
+        "seconds": seconds,
+        "throughput_mb_s": item["size_bytes"] / MB / seconds if error is None and seconds > 0 else None,
+        "error": error
+    }
+
+
+class Uploader:
+    """
+    Очередь выгрузок: до transfers бэкапов одновременно.
+    backup_multiple ставит сюда каждый готовый бэкап — выгрузка идёт, пока
+    снимаются следующие; wait() — дождаться всех и получить результаты.
+
+    on_event("upload_start" | "upload_done", item, result) — из рабочих потоков.
+    """
+
+    def __init__(self, remote: Optional[str] = None, transfers: Optional[int] = None,
+                 chunk_size_mb: Optional[int] = None,
+                 on_event: Optional[Callable[[str, Dict, Dict], None]] = None,
+                 backup_root: Optional[Path] = None):
+        self.remote = remote or CLOUD_REMOTE
+        self.transfers = max(1, transfers or CLOUD_TRANSFERS)
+        self.chunk_size_mb = chunk_size_mb or CLOUD_CHUNK_SIZE_MB
+        self.on_event = on_event
+        self.backup_root = backup_root
+        self.pool = ThreadPoolExecutor(max_workers=self.transfers)
+        self.futures: List[Future] = []
+
+    def _run(self, item: Dict) -> Dict:
+        if self.on_event:
+            self.on_event("upload_start", item, {})
+        result = upload_backup(item, self.remote, self.chunk_size_mb, streams=self.transfers,
+                               backup_root=self.backup_root)
+        if self.on_event:
+            self.on_event("upload_done", item, result)
+        return result
+
+    def submit(self, item: Dict) -> Future:
+        future = self.pool.submit(self._run, item)
+        self.futures.append(future)
+        return future
+
+    def wait(self) -> List[Dict]:
+        """Результаты в порядке постановки в очередь"""
+        self.pool.shutdown(wait=True)
+        return [future.result() for future in self.futures]
+
+
+def upload_after_backup(uploader: Uploader, ib_name: str, since: float) -> Optional[Future]:
+    """Поставить в очередь только что снятый бэкап ИБ (по его манифесту); None — нечего выгружать"""
+    from services.manifest_service import latest_manifest
+
+    root = Path(uploader.backup_root or BACKUP_ROOT)
+    manifest = latest_manifest(ib_name, since, root)
+    if manifest is None:
+        return None
+    item = backup_item(root / ib_name / manifest["timestamp"], manifest)
+    if item is None or item["dedup"]:
+        return None
+    return uploader.submit(item)
@@ -0,0 +1,16 @@
+"""
+Общее для тестов: корень проекта в sys.path (как у orchestrator.py) и метрики
+выключены — track() не пишет в /var/lib/prometheus и /var/log/1c-admin.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("METRICS_ENABLED", "0")
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
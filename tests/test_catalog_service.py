@@ -0,0 +1,33 @@
+"""
+services/catalog_service.py: разросшийся журнал читается и без прав на запись — prune/rm --dry-run,
+upload и /status демона от пользователя без прав на каталог usr1cv8 не падают на сжатии.
+"""
+
+import pytest
+
+from services.catalog_service import COMPACT_SLACK, BackupCatalog
+
+
+@pytest.fixture
+def grown_catalog(tmp_path):
+    catalog = BackupCatalog(tmp_path)
+    for i in range(COMPACT_SLACK + 10):
+        catalog.add("Buh", f"20260207_{i:06d}", tmp_path / "Buh" / f"{i}.dump", "dump", 100, 0)
+        catalog.remove("Buh", f"20260207_{i:06d}")
+    catalog.add("Buh", "20260208_010000", tmp_path / "Buh" / "last.dump", "dump", 100, 0)
+    return catalog
+
+
+def test_records_without_write_access(grown_catalog, monkeypatch):
+    def denied(self):
+        raise PermissionError(13, "Permission denied", str(self.path))
+
+    monkeypatch.setattr(BackupCatalog, "compact", denied)
+    assert [b["label"] for b in grown_catalog.backups()] == ["20260208_010000"]
+    assert [r.label for r in grown_catalog.stream()] == ["20260208_010000"]
+
+
+def test_records_compacts_grown_journal(grown_catalog):
+    assert [r.label for r in grown_catalog.records()] == ["20260208_010000"]
+    with open(grown_catalog.path, encoding="utf-8") as f:
+        assert sum(1 for _ in f) <= 1 + COMPACT_SLACK
@@ -0,0 +1,50 @@
+"""
+services/compression.py: команда сжатия и суффикс SQL-бэкапа берутся только из CODECS —
+backup_service передаёт их backup.sh готовыми (--compress-cmd, --sql-suffix).
+"""
+
+import pytest
+
+from services import backup_service
+from services.compression import CODECS, artifact_name, compress_command
+
+
+@pytest.fixture
+def engine_args(monkeypatch):
+    calls = []
+
+    def run_engine(script, args, **kwargs):
+        calls.append(args)
+        return {"success": True, "returncode": 0, "timed_out": False, "stdout": "", "stderr": "",
+                "wall_seconds": 0.0, "user_seconds": 0.0, "sys_seconds": 0.0}
+
+    monkeypatch.setattr(backup_service, "run_engine", run_engine)
+    return calls
+
+
+def option(args, name):
+    return args[args.index(name) + 1] if name in args else None
+
+
+def test_compress_command_levels():
+    assert compress_command("zstd") == CODECS["zstd"]["cmd"] + ["-3"]
+    assert compress_command("gzip", 9) == ["gzip", "-c", "-9"]
+    assert compress_command("none") is None
+    with pytest.raises(ValueError):
+        compress_command("zstd", 25)
+
+
+@pytest.mark.parametrize("codec,level", [("zstd", 6), ("pigz", None), ("gzip", 1)])
+def test_backup_sh_gets_codec_from_codecs(engine_args, codec, level):
+    result = backup_service.backup_ib("Buh", "sql", dry_run=True, size_bytes=1, compress=codec, level=level)
+    args = engine_args[-1]
+    assert option(args, "--compress-cmd").split() == compress_command(codec, level)
+    assert "backup.sql" + option(args, "--sql-suffix") == result["artifact"] == artifact_name("sql", codec)
+    assert "--compress" not in args and "--level" not in args
+
+
+def test_backup_sh_uncompressed_sql_and_dump_level(engine_args):
+    backup_service.backup_ib("Buh", "sql", dry_run=True, size_bytes=1, compress="none")
+    assert "--compress-cmd" not in engine_args[-1] and "--sql-suffix" not in engine_args[-1]
+    backup_service.backup_ib("Buh", "dump", dry_run=True, size_bytes=1, dedup=False, level=4)
+    assert option(engine_args[-1], "--level") == "4" and "--compress-cmd" not in engine_args[-1]
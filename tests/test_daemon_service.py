@@ -0,0 +1,75 @@
+"""
+services/daemon_service.py: доступ к API демона — сокет 0660 с момента создания,
+TCP только с DAEMON_TOKEN (задания выполняются от root).
+"""
+
+import http.client
+import json
+import os
+import stat
+import threading
+
+import pytest
+
+from services.daemon_service import Daemon
+
+
+@pytest.fixture
+def make_daemon(tmp_path):
+    daemons = []
+
+    def make(token="s3cret", http="127.0.0.1:0"):
+        daemon = Daemon(socket_path=str(tmp_path / "run" / "daemon.sock"), http=http,
+                        db_path=tmp_path / "daemon.sqlite", backup_root=tmp_path, token=token)
+        daemons.append(daemon)
+        return daemon
+
+    yield make
+    for daemon in daemons:
+        for server in daemon.servers:
+            if getattr(server, "started", False):
+                server.shutdown()  # shutdown() ждёт serve_forever — только для запущенных
+            server.server_close()
+        daemon.queue.close()
+
+
+def start(daemon, server):
+    server.ib_daemon = daemon
+    server.started = True
+    daemon.servers.append(server)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def request(server, method, path, token=None, body=None):
+    conn = http.client.HTTPConnection(*server.server_address[:2], timeout=10)
+    headers = {"Authorization": f"Bearer {token}"} if token is not None else {}
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_unix_socket_created_0660(make_daemon):
+    daemon = make_daemon()
+    server = daemon._serve_unix()
+    daemon.servers.append(server)
+    assert stat.S_IMODE(os.stat(daemon.socket_path).st_mode) == 0o660
+
+
+def test_tcp_requires_token(make_daemon):
+    daemon = make_daemon()
+    server = start(daemon, daemon._serve_tcp())
+    assert request(server, "GET", "/status")[0] == 401
+    assert request(server, "GET", "/status", token="wrong")[0] == 401
+    status, payload = request(server, "POST", "/jobs", body={"command": "rm", "args": ["--all", "--confirm"]})
+    assert status == 401 and "Authorization" in payload["error"]
+    assert daemon.queue.list() == []
+    status, payload = request(server, "GET", "/status", token="s3cret")
+    assert status == 200 and payload["queued"] == 0
+
+
+def test_tcp_without_token_refuses_to_start(make_daemon):
+    daemon = make_daemon(token="")
+    with pytest.raises(RuntimeError, match="DAEMON_TOKEN"):
+        daemon.serve_forever()
+    assert daemon.servers == []
@@ -0,0 +1,67 @@
+"""
+services/manifest_service.py: хэш каталога pg_dump -Fd, посчитанный как в backup.sh
+(dir_listing из engines/catalog.sh), проходит проверку storage --verify (_verify_dir).
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+
+import pytest
+
+from conftest import ROOT_DIR
+from services.manifest_service import verify_backup
+
+# Имена, порядок которых по локали и побайтово различается: dumpId из 4 и 5 цифр, регистр
+NAMES = ["toc.dat", "4123.dat.gz", "41234.dat.gz", "4124.dat.gz", "B.dat.gz", "a.dat.gz", "blob_1.toc"]
+
+
+def dir_listing(path, lang="ru_RU.UTF-8"):
+    """Список «хэш  имя» так, как его строит backup.sh (под sudo LANG сохраняется)"""
+    env = {k: v for k, v in os.environ.items() if not k.startswith("LC_")}
+    env["LANG"] = lang
+    return subprocess.run(["bash", "-c", 'source "$0" && dir_listing "$1"',
+                           str(ROOT_DIR / "engines" / "catalog.sh"), str(path)],
+                          env=env, capture_output=True, text=True, check=True).stdout.rstrip("\n")
+
+
+@pytest.fixture
+def dir_backup(tmp_path):
+    backup_dir = tmp_path / "Buh" / "20260207_010000"
+    artifact = backup_dir / "backup.dir"
+    artifact.mkdir(parents=True)
+    for i, name in enumerate(NAMES):
+        (artifact / name).write_bytes(os.urandom(1000 + i))
+    return backup_dir
+
+
+def write_manifest_like_backup_sh(backup_dir, listing):
+    artifact = backup_dir / "backup.dir"
+    files = {}
+    for line in listing.splitlines():
+        file_hash, name = line.split("  ", 1)
+        files[name] = {"size": (artifact / name).stat().st_size, "hash": file_hash}
+    # hash=$(printf '%s\n' "$listing" | b2sum)
+    manifest = {"ib_name": "Buh", "artifact": "backup.dir", "size_bytes": sum(f["size"] for f in files.values()),
+                "hash": hashlib.blake2b((listing + "\n").encode()).hexdigest(), "files": files}
+    (backup_dir / "manifest.json").write_text(json.dumps(manifest))
+
+
+def test_dir_listing_bytewise_order(dir_backup):
+    names = [line.split("  ", 1)[1] for line in dir_listing(dir_backup / "backup.dir").splitlines()]
+    assert names == sorted(NAMES)
+
+
+@pytest.mark.parametrize("lang", ["ru_RU.UTF-8", "en_US.UTF-8", "C.UTF-8"])
+def test_backup_sh_dir_hash_verifies(dir_backup, lang):
+    write_manifest_like_backup_sh(dir_backup, dir_listing(dir_backup / "backup.dir", lang))
+    result = verify_backup(dir_backup, record=False)
+    assert result["status"] == "ok", result["error"]
+
+
+def test_dir_hash_detects_changed_file(dir_backup):
+    write_manifest_like_backup_sh(dir_backup, dir_listing(dir_backup / "backup.dir"))
+    (dir_backup / "backup.dir" / "41234.dat.gz").write_bytes(b"changed")
+    result = verify_backup(dir_backup, record=False)
+    assert result["status"] == "mismatch" and "41234.dat.gz" in result["error"]
@@ -0,0 +1,60 @@
+"""
+services/rm_service.py: пакет целей удаляется одним rm.sh --stdin, а метка ib в метриках
+не зависит от набора ИБ (одна ИБ — её имя, несколько — «*»).
+"""
+
+import contextlib
+
+import pytest
+
+from core import engine
+from services import rm_service
+from services.rm_service import RmService
+
+
+@pytest.fixture
+def removal(monkeypatch, tmp_path):
+    calls, operations = [], []
+
+    def run_engine(script, args, input_text="", **kwargs):
+        calls.append((script, args, input_text))
+        targets = [line.split("/") for line in input_text.splitlines()]
+        stdout = "".join(f"target\tok\t{ib}/{label}\t100\n" for ib, label in targets)
+        return {"success": True, "stdout": stdout + f"reclaimed_bytes={100 * len(targets)}\n", "stderr": ""}
+
+    @contextlib.contextmanager
+    def track(kind, **fields):
+        operations.append(fields)
+
+        class Op:
+            def set(self, **more):
+                fields.update(more)
+
+        yield Op()
+
+    monkeypatch.setattr(engine, "run_engine", run_engine)
+    monkeypatch.setattr(rm_service, "track", track)
+    monkeypatch.setattr(rm_service, "BACKUP_ROOT", str(tmp_path))
+    return calls, operations
+
+
+def targets(*pairs):
+    return [{"ib_name": ib, "label": label} for ib, label in pairs]
+
+
+def test_batch_is_one_engine_run(removal):
+    calls, operations = removal
+    result = RmService().execute_removal(targets(("Buh", "20260207_010000"), ("Zup", "20260207_010000"),
+                                                 ("Buh", "20260208_010000")))
+    assert result["success"] and result["reclaimed_bytes"] == 300
+    assert [r["ib_name"] for r in result["results"]] == ["Buh", "Zup", "Buh"]
+    assert len(calls) == 1 and calls[0][0] == "rm.sh" and "--stdin" in calls[0][1]
+    assert operations[-1]["ib"] == "*" and operations[-1]["ibs"] == "Buh,Zup"
+    assert operations[-1]["bytes_freed"] == 300
+
+
+def test_single_ib_keeps_its_label(removal):
+    _, operations = removal
+    RmService().execute_removal(targets(("Buh", "20260207_010000"), ("Buh", "20260208_010000")))
+    assert operations[-1]["ib"] == "Buh"
+
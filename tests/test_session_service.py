@@ -0,0 +1,195 @@
+"""
+services/session_service.py и разбор вывода rac: записанный вывод `rac cluster list`,
+`rac infobase summary list` и `rac session list` (tests/fixtures/rac) подаётся через
+исполнитель rac=..., кластер не нужен.
+"""
+
+import threading
+from datetime import datetime
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from core import config
+from services import rac_metadata
+from services.rac_metadata import RacError, cluster_id, parse_blocks
+from services.session_service import SESSION_FIELDS, list_sessions, plan_cleanup, terminate_sessions
+
+RAC_DIR = FIXTURES_DIR / "rac"
+CLUSTER = "1c7e2b9a-4f0d-11ee-8c1a-0242ac120002"
+NOW = datetime.fromisoformat("2026-02-07T15:00:00").timestamp()
+
+
+def session_id(n: int) -> str:
+    return f"a0000000-0000-4000-8000-{n:012d}"
+
+
+class FakeRac:
+    """Исполнитель rac по записанному выводу; terminate запоминает, failing — завершаются с ошибкой"""
+
+    OUTPUTS = {
+        ("cluster", "list"): "cluster_list.txt",
+        ("infobase", "summary"): "infobase_summary_list.txt",
+        ("session", "list"): "session_list.txt",
+    }
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, args):
+        with self.lock:
+            self.calls.append(list(args))
+        if args[:2] == ["infobase", "info"]:
+            raise RacError("rac infobase info: нет прав на ИБ")
+        if args[:2] == ["session", "terminate"]:
+            if args[-1].split("=", 1)[1] in self.failing:
+                raise RacError("rac session terminate: сеанс не найден")
+            return ""
+        return (RAC_DIR / self.OUTPUTS[tuple(args[:2])]).read_text(encoding="utf-8")
+
+    def terminated(self):
+        return sorted(call[-1].split("=", 1)[1] for call in self.calls if call[:2] == ["session", "terminate"])
+
+
+@pytest.fixture
+def rac(tmp_path, monkeypatch):
+    # Кэш метаданных и sessions.conf — во временном каталоге, кластер — из `rac cluster list`
+    monkeypatch.setattr(rac_metadata, "BACKUP_ROOT", tmp_path)
+    monkeypatch.setattr(rac_metadata, "RAC_CLUSTER", "")
+    monkeypatch.setattr(config, "BASE_DIR", tmp_path)
+    return FakeRac()
+
+
+@pytest.fixture
+def sessions_conf(tmp_path):
+    (tmp_path / "sessions.conf").write_text(
+        "# Пороги простоя, мин\n"
+        "Buh   60\n"
+        "ZUP   0     # кадровики работают с долгими документами — не трогать\n"
+        "*     240\n", encoding="utf-8")
+
+
+def by_id(sessions):
+    return {s["id"]: s for s in sessions}
+
+
+# === parse_blocks ===
+
+def test_parse_blocks_splits_objects_on_blank_lines():
+    blocks = list(parse_blocks((RAC_DIR / "infobase_summary_list.txt").read_text(encoding="utf-8")))
+    assert [b["name"] for b in blocks] == ["Buh", "ZUP", "Trade"]
+    assert blocks[0]["infobase"] == "6b1c2e10-0a1b-4c2d-9e3f-000000000001"
+    # Без fields значения как есть (кавычки rac сохраняются), пустое значение — пустая строка
+    assert blocks[0]["descr"] == '"Бухгалтерия предприятия"'
+    assert blocks[2]["descr"] == ""
+
+
+def test_parse_blocks_keeps_and_renames_fields():
+    blocks = list(parse_blocks((RAC_DIR / "session_list.txt").read_text(encoding="utf-8"), SESSION_FIELDS))
+    assert len(blocks) == 7
+    assert set(blocks[0]) == set(SESSION_FIELDS.values())
+    assert blocks[0]["id"] == session_id(1)
+    assert blocks[0]["user"] == "Иванова А.С."
+    # Значение после первого «:» целиком — время с двоеточиями не режется
+    assert blocks[0]["last_active_at"] == "2026-02-07T14:30:22"
+    assert "last_active_at" not in blocks[3]
+
+
+def test_parse_blocks_last_block_without_trailing_blank_line():
+    text = "cluster : c1\nname : \"A\"\n\ncluster : c2\nname : \"B\""
+    assert list(parse_blocks(text, {"cluster": "id", "name": "name"})) == [
+        {"id": "c1", "name": "A"}, {"id": "c2", "name": "B"}]
+
+
+# === list_sessions ===
+
+def test_list_sessions_idle_and_ib_names(rac):
+    sessions = by_id(list_sessions(cluster_id(rac), rac, now=NOW))
+    assert len(sessions) == 7
+    assert sessions[session_id(1)]["ib_name"] == "Buh"
+    assert sessions[session_id(1)]["idle_min"] == 29  # 29 мин 38 с — целые минуты вниз
+    assert sessions[session_id(2)]["idle_min"] == 180
+    assert sessions[session_id(3)]["ib_name"] == "ZUP"
+    assert sessions[session_id(6)]["idle_min"] == 300
+    # ИБ нет в `infobase summary list` — вместо имени остаётся UUID
+    assert sessions[session_id(7)]["ib_name"] == "ffffffff-0000-4000-8000-000000000009"
+    assert [c[:2] for c in rac.calls].count(["session", "list"]) == 1
+    assert ["session", "list", f"--cluster={CLUSTER}"] in rac.calls
+
+
+def test_list_sessions_without_last_active(rac):
+    sessions = by_id(list_sessions(CLUSTER, rac, now=NOW))
+    assert sessions[session_id(4)]["idle_min"] is None  # last-active-at не выведен
+    assert sessions[session_id(5)]["idle_min"] is None  # «not defined»
+
+
+def test_list_sessions_uses_given_names(rac):
+    sessions = by_id(list_sessions(CLUSTER, rac, now=NOW, names={"6b1c2e10-0a1b-4c2d-9e3f-000000000001": "Бух"}))
+    assert sessions[session_id(1)]["ib_name"] == "Бух"
+    assert not any(call[:2] == ["infobase", "summary"] for call in rac.calls)
+
+
+# === plan_cleanup: пороги sessions.conf ===
+
+def test_plan_cleanup_per_ib_thresholds(rac, sessions_conf):
+    plan = plan_cleanup(list_sessions(CLUSTER, rac, now=NOW))
+    terminate = by_id(plan["terminate"])
+    keep = by_id(plan["keep"])
+    # Buh — 60 мин: 180 > 60 завершается, 29 остаётся
+    assert session_id(2) in terminate and session_id(1) in keep
+    assert terminate[session_id(2)]["limit_min"] == 60
+    # ZUP — 0: не завершается даже после 120 мин простоя
+    assert session_id(3) in keep and keep[session_id(3)]["limit_min"] == 0
+    # Остальные — строка «*» (240): 300 > 240, неизвестная ИБ с 50 мин остаётся
+    assert session_id(6) in terminate and terminate[session_id(6)]["limit_min"] == 240
+    assert session_id(7) in keep
+    # Без last-active-at простой неизвестен — сеанс не трогаем
+    assert session_id(4) in keep and session_id(5) in keep
+    assert sorted(terminate) == [session_id(2), session_id(6)]
+
+
+def test_plan_cleanup_threshold_is_strict(rac, tmp_path):
+    (tmp_path / "sessions.conf").write_text("Buh 180\n", encoding="utf-8")
+    plan = plan_cleanup(list_sessions(CLUSTER, rac, now=NOW), ib_names=["Buh"])
+    assert plan["terminate"] == []
+    assert {s["ib_name"] for s in plan["keep"]} == {"Buh"}
+
+
+def test_plan_cleanup_default_without_conf(rac):
+    plan = plan_cleanup(list_sessions(CLUSTER, rac, now=NOW))
+    assert {s["limit_min"] for s in plan["keep"] + plan["terminate"]} == {config.SESSION_IDLE_MIN}
+
+
+def test_plan_cleanup_cli_threshold_overrides_conf(rac, sessions_conf):
+    plan = plan_cleanup(list_sessions(CLUSTER, rac, now=NOW), ib_names=["ZUP", "Trade"], idle_min=100)
+    assert [s["id"] for s in plan["terminate"]] == [session_id(6), session_id(3)]  # по ИБ, затем по простою
+    assert session_id(1) not in by_id(plan["keep"])  # Buh не запрошена
+
+
+# === terminate_sessions ===
+
+def test_terminate_sessions_one_call_per_planned_session(rac, sessions_conf):
+    plan = plan_cleanup(list_sessions(CLUSTER, rac, now=NOW), idle_min=10)
+    done = []
+    results = terminate_sessions(CLUSTER, plan["terminate"], workers=3, rac=rac,
+                                 on_done=lambda session, error: done.append((session["id"], error)))
+    expected = sorted(s["id"] for s in plan["terminate"])
+    assert len(expected) == 5
+    assert rac.terminated() == expected
+    for call in rac.calls:
+        if call[:2] == ["session", "terminate"]:
+            assert call[2] == f"--cluster={CLUSTER}"
+    assert all(r["success"] for r in results)
+    assert sorted(session for session, _ in done) == expected
+
+
+def test_terminate_sessions_reports_failures(rac):
+    rac.failing.add(session_id(2))
+    sessions = [s for s in list_sessions(CLUSTER, rac, now=NOW) if s["id"] in (session_id(1), session_id(2))]
+    results = {r["session"]["id"]: r for r in terminate_sessions(CLUSTER, sessions, rac=rac)}
+    assert results[session_id(1)]["success"] and results[session_id(1)]["error"] is None
+    assert not results[session_id(2)]["success"]
+    assert "сеанс не найден" in results[session_id(2)]["error"]
+    assert rac.terminated() == [session_id(1), session_id(2)]
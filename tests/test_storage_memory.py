@@ -0,0 +1,67 @@
+"""
+Память потокового чтения каталога не зависит от числа бэкапов: `storage --format ndjson` и
+StorageMonitor.get_full_report(with_backups=False) на 100 тыс. бэкапов укладываются в
+бюджет benchmarks/bench_suite.py (RSS_BUDGET_MB). Каждый замер — в новом процессе,
+пиковая память — его ru_maxrss (os.wait4). Дерево строится один раз (~25 с).
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.bench_suite import RSS_BUDGET_MB
+from benchmarks.synthetic_tree import build_tree
+from conftest import ROOT_DIR
+from services.catalog_service import BackupCatalog
+
+IBS, LABELS = 50, 2000
+
+# ru_maxrss переходит от родителя через fork/exec, а pytest после build_tree велик —
+# замеряемый процесс запускает маленький посредник: «код возврата ru_maxrss_кБ» → argv[1]
+LAUNCHER = (
+    "import os, sys\n"
+    "pid = os.fork()\n"
+    "if pid == 0:\n"
+    "    os.execv(sys.executable, [sys.executable] + sys.argv[2:])\n"
+    "_, status, usage = os.wait4(pid, 0)\n"
+    "open(sys.argv[1], 'w').write(f'{os.waitstatus_to_exitcode(status)} {usage.ru_maxrss}')\n"
+)
+
+
+@pytest.fixture(scope="module")
+def big_root(tmp_path_factory):
+    root = tmp_path_factory.mktemp("storage_100k")
+    build_tree(root, ibs=IBS, labels=LABELS, size_mb=1)
+    # Как после storage --reindex: журнал отсортирован, stream() читает его лениво
+    assert BackupCatalog(root).reindex() == IBS * LABELS
+    return root
+
+
+def run_measured(args, root, tmp_path):
+    """Запустить Python с args от корня проекта → (пиковая память, МБ; файл stdout)"""
+    env = dict(os.environ, BACKUP_ROOT=str(root), METRICS_ENABLED="0", IB_1C_LOCAL="1")
+    out_path, err_path, usage_path = tmp_path / "stdout", tmp_path / "stderr", tmp_path / "usage"
+    with open(out_path, "wb") as out, open(err_path, "wb") as err:
+        subprocess.run([sys.executable, "-c", LAUNCHER, str(usage_path)] + args,
+                       cwd=ROOT_DIR, env=env, stdout=out, stderr=err, check=True)
+    code, maxrss_kb = map(int, usage_path.read_text().split())
+    assert code == 0, err_path.read_text(encoding="utf-8", errors="replace")
+    return maxrss_kb / 1024, out_path
+
+
+def test_storage_ndjson_rss(big_root, tmp_path):
+    rss_mb, out_path = run_measured(["orchestrator.py", "storage", "--format", "ndjson"], big_root, tmp_path)
+    with open(out_path, "rb") as f:
+        assert sum(1 for _ in f) == IBS * LABELS
+    assert rss_mb < RSS_BUDGET_MB["storage_ndjson"], f"storage --format ndjson: {rss_mb:.0f} МБ"
+
+
+def test_full_report_without_backups_rss(big_root, tmp_path):
+    code = ("import json; from services.storage_service import StorageMonitor; "
+            "report = StorageMonitor().get_full_report(with_backups=False); "
+            "print(json.dumps([sum(s['total_files'] for s in report['stats']), 'backups' in report]))")
+    rss_mb, out_path = run_measured(["-c", code], big_root, tmp_path)
+    assert out_path.read_text(encoding="utf-8").strip() == f"[{IBS * LABELS}, false]"
+    assert rss_mb < RSS_BUDGET_MB["storage_report"], f"get_full_report(with_backups=False): {rss_mb:.0f} МБ"
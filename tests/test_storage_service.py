@@ -0,0 +1,48 @@
+"""
+services/storage_service.py: внутри — поток BackupRecord, наружу — словари, как до перехода
+на записи (b["size_bytes"] у вызывающих не ломается). Хранилище — benchmarks/synthetic_tree.py.
+"""
+
+import pytest
+
+from benchmarks.synthetic_tree import build_tree
+from services import storage_service
+from services.catalog_service import BackupCatalog
+from services.storage_service import StorageMonitor, physical_sizes
+
+FIELDS = {"ib_name", "timestamp", "file_type", "size_bytes", "path", "label"}
+
+
+@pytest.fixture
+def monitor(tmp_path, monkeypatch):
+    build_tree(tmp_path, ibs=3, labels=5, size_mb=1)
+    BackupCatalog(tmp_path).reindex()
+    monkeypatch.setattr(storage_service, "BACKUP_ROOT", tmp_path)
+    return StorageMonitor()
+
+
+def test_backups_list_is_dicts(monitor):
+    backups = monitor.get_backups_list()
+    assert len(backups) == 15
+    assert all(type(b) is dict and set(b) == FIELDS for b in backups)
+    assert sum(b["size_bytes"] for b in backups) == sum(b.size_bytes for b in monitor.iter_backups())
+
+
+def test_scan_backups_list_is_dicts(monitor):
+    backups = monitor.scan_backups_list()
+    assert all(type(b) is dict for b in backups)
+    assert sorted(b["path"] for b in backups) == sorted(b["path"] for b in monitor.get_backups_list())
+
+
+def test_full_report_backups_are_dicts(monitor):
+    report = monitor.get_full_report()
+    assert len(report["backups"]) == 15
+    assert all(type(b) is dict for b in report["backups"])
+    assert "backups" not in monitor.get_full_report(with_backups=False)
+
+
+def test_functions_accept_dicts_and_records(monitor):
+    dicts = monitor.get_backups_list()
+    assert monitor.get_stats(dicts) == monitor.get_stats(monitor.iter_backups()) == monitor.get_stats()
+    assert monitor.calculate_growth_rate(dicts, days=30) == monitor.calculate_growth_rate(monitor.iter_backups(), days=30)
+    assert physical_sizes(dicts, monitor.backup_root) == physical_sizes(monitor.iter_backups(), monitor.backup_root)
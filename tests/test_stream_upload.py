@@ -0,0 +1,91 @@
+"""
+services/stream_upload.py: fanout в локальный приёмник и итог отделённой выгрузки
+(.stream_status), который upload_service читает поверх manifest.json.
+"""
+
+import io
+import json
+import os
+
+import pytest
+
+from services.stream_upload import (STREAM_STATUS_NAME, LocalSink, fanout, load_stream_status,
+                                    write_stream_status)
+from services.upload_service import await_stream, backup_item
+
+
+@pytest.fixture
+def backup_dir(tmp_path):
+    backup_dir = tmp_path / "root" / "Buh" / "20260207_010000"
+    backup_dir.mkdir(parents=True)
+    return backup_dir
+
+
+def write_manifest(backup_dir, **fields):
+    manifest = {"ib_name": "Buh", "artifact": "backup.dump", "hash": "h", "size_bytes": 3 * 1024 * 1024,
+                "duration_sec": 1.5, **fields}
+    (backup_dir / "manifest.json").write_text(json.dumps(manifest))
+
+
+def test_fanout_local_sink(backup_dir, tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    remote = tmp_path / "remote"
+    done = []
+    # Маленькая очередь — часть блоков выгрузка догоняет с диска
+    stats = fanout(io.BytesIO(data), backup_dir / "backup.dump", LocalSink(str(remote), "Buh/x/backup.dump"),
+                   backup_dir / ".hash", buffer_bytes=64 * 1024, block_size=64 * 1024,
+                   on_local_done=lambda: done.append(True))
+    assert done == [True]
+    assert stats["uploaded"] and stats["error"] is None and stats["bytes"] == len(data)
+    assert (remote / "Buh/x/backup.dump").read_bytes() == data
+    assert (backup_dir / ".hash").read_text().strip() == stats["hash"]
+
+
+def test_fanout_interrupted_local_write_aborts_sink(backup_dir, tmp_path):
+    class Broken(io.BytesIO):
+        def read(self, size=-1):
+            if self.tell() >= 128 * 1024:
+                raise OSError("pg_dump оборвался")
+            return super().read(size)
+
+    remote = tmp_path / "remote"
+    with pytest.raises(OSError):
+        fanout(Broken(os.urandom(512 * 1024)), backup_dir / "backup.dump",
+               LocalSink(str(remote), "Buh/x/backup.dump"), block_size=64 * 1024)
+    # Обрезок не стал «готовой» копией, временный файл приёмника удалён
+    assert list((remote / "Buh/x").iterdir()) == []
+
+
+def test_stream_status_overrides_manifest(backup_dir):
+    write_manifest(backup_dir, streaming_to="s3:", stream_pid=os.getpid())
+    item = backup_item(backup_dir)
+    assert item["streaming_to"] == "s3:" and item["streamed_to"] is None
+
+    assert write_stream_status(backup_dir, "s3:", {"error": None, "upload_seconds": 42.25})
+    assert load_stream_status(backup_dir) == {"remote": "s3:", "streamed_to": "s3:", "stream_seconds": 42.25}
+    item = backup_item(backup_dir)
+    assert item["streaming_to"] is None
+    assert item["streamed_to"] == "s3:" and item["stream_seconds"] == 42.25
+    # Манифест выгрузка не переписывает
+    assert json.loads((backup_dir / "manifest.json").read_text())["streaming_to"] == "s3:"
+    assert [p.name for p in backup_dir.iterdir() if p.name.endswith(".tmp")] == []
+
+
+def test_stream_error_falls_back_to_full_upload(backup_dir):
+    write_manifest(backup_dir, streaming_to="s3:", stream_pid=os.getpid())
+    write_stream_status(backup_dir, "s3:", {"error": "rclone rcat: 403", "upload_seconds": 1.0})
+    item = await_stream(backup_item(backup_dir), "s3:")  # итог есть — не ждём
+    assert item["streamed_to"] is None
+    assert load_stream_status(backup_dir)["stream_error"] == "rclone rcat: 403"
+
+
+def test_await_stream_skips_dead_process(backup_dir):
+    write_manifest(backup_dir, streaming_to="s3:", stream_pid=2 ** 22 + 1)
+    item = await_stream(backup_item(backup_dir), "s3:")
+    assert item["streamed_to"] is None
+
+
+def test_stream_status_without_backup_dir(tmp_path):
+    assert not write_stream_status(tmp_path / "gone", "s3:", {"error": None, "upload_seconds": 1.0})
+    assert load_stream_status(tmp_path / "gone") is None
+    assert STREAM_STATUS_NAME.startswith(".")